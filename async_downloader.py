@@ -0,0 +1,676 @@
+"""Asyncio download engine for Downloader (DOWNLOAD_ENGINE=asyncio).
+
+Runs the same download protocol as Downloader - .part resume, 416
+completion, stall detection, the no-progress retry budget, segmented byte
+ranges and adaptive concurrency degradation - as coroutines on one event
+loop over a small keep-alive HTTP/1.1 client, so each in-flight file or
+range costs a socket rather than a thread. ZIP validation and extraction
+are CPU-bound and still run in the loop's default executor.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import queue
+import ssl
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+from time import monotonic
+from typing import AsyncIterator, Callable, Iterator, List, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from tqdm import tqdm
+
+import downloader as downloader_module
+from downloader import (
+    MAX_RETRY_BACKOFF_SECONDS,
+    REFERENCE_FILES,
+    AdaptiveDownloadConcurrency,
+    Downloader,
+    DownloadIncompleteError,
+    DownloadStalledError,
+    ZipMember,
+    _SegmentState,
+)
+from zip_cache import zip_content_key
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class _Response:
+    """Status and headers of a response whose body is read on demand."""
+
+    def __init__(self, client: "_HttpClient", key: tuple, reader, writer, url: str, status_code: int, headers: dict):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self._client = client
+        self._key = key
+        self._reader = reader
+        self._writer = writer
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self._chunk_left = 0
+        length = headers.get("content-length")
+        self._remaining = int(length) if length is not None and not self._chunked else None
+        # Without a length the body runs until the server closes the connection
+        self._reusable = headers.get("connection", "").lower() != "close" and (
+            self._chunked or self._remaining is not None
+        )
+        self._done = self._remaining == 0 or status_code in (204, 304) or 100 <= status_code < 200
+        self._released = False
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+    async def iter_chunks(self, size: int, timeout: float) -> AsyncIterator[bytes]:
+        """Yield the body in pieces of at most size bytes; each read waits at most timeout."""
+        while not self._done:
+            data = await self._read_some(size, timeout)
+            if data:
+                yield data
+
+    async def read(self, timeout: float) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks(downloader_module.DOWNLOAD_CHUNK_BYTES, timeout)])
+
+    def release(self) -> None:
+        """Return the connection to the pool if the body was fully read, else close it."""
+        if not self._released:
+            self._released = True
+            self._client.release(self._key, self._reader, self._writer, self._done and self._reusable)
+
+    async def _read_some(self, size: int, timeout: float) -> bytes:
+        if self._chunked:
+            if self._chunk_left == 0:
+                line = await self._wait(self._reader.readline(), timeout)
+                chunk_size = int(line.split(b";")[0], 16) if line.strip() else None
+                if chunk_size is None:
+                    return self._closed_early()
+                if chunk_size == 0:
+                    while (await self._wait(self._reader.readline(), timeout)).strip():
+                        pass  # trailers
+                    self._done = True
+                    return b""
+                self._chunk_left = chunk_size
+            data = await self._wait(self._reader.read(min(size, self._chunk_left)), timeout)
+            if not data:
+                return self._closed_early()
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await self._wait(self._reader.readline(), timeout)
+            return data
+
+        want = size if self._remaining is None else min(size, self._remaining)
+        data = await self._wait(self._reader.read(want), timeout)
+        if not data:
+            # A short body is reported by the caller's size check, as with requests
+            return self._closed_early()
+        if self._remaining is not None:
+            self._remaining -= len(data)
+            self._done = self._remaining == 0
+        return data
+
+    def _closed_early(self) -> bytes:
+        self._reusable = False
+        self._done = True
+        return b""
+
+    async def _wait(self, read, timeout: float):
+        try:
+            return await asyncio.wait_for(read, timeout)
+        except TimeoutError as exc:
+            self._reusable = False
+            raise requests.exceptions.ReadTimeout(f"Read timed out after {timeout}s: {self.url}") from exc
+
+
+def _origin(url: str) -> tuple[str, str | None, int]:
+    """(scheme, host, port) of url, with the scheme's default port filled in."""
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+class _HttpClient:
+    """Minimal keep-alive HTTP/1.1 client on asyncio streams.
+
+    Covers what the Receita WebDAV share needs: Basic auth, Content-Length
+    and chunked bodies, redirects and per-host idle connection reuse.
+    Timeouts and HTTP errors raise the requests exceptions the threaded
+    engine raises, so callers see the same failures from either engine.
+    """
+
+    def __init__(self, auth: Tuple[str, str], connect_timeout: float):
+        token = base64.b64encode(f"{auth[0]}:{auth[1]}".encode()).decode()
+        self._authorization = f"Basic {token}"
+        self._connect_timeout = connect_timeout
+        self._idle: dict[tuple, list] = {}
+        self._ssl_context: ssl.SSLContext | None = None
+
+    async def request(self, method: str, url: str, headers: dict[str, str], timeout: float) -> _Response:
+        """Send a request and read its status and headers, waiting at most timeout per read.
+
+        Like requests, a redirect to another scheme, host or port drops the
+        Authorization header for the rest of the chain, so the share token
+        never reaches a host it wasn't issued for.
+        """
+        authorize = True
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._send(method, url, headers, timeout, authorize)
+            location = response.headers.get("location")
+            if response.status_code not in REDIRECT_STATUSES or not location:
+                return response
+            await response.read(timeout)
+            response.release()
+            redirect = urljoin(url, location)
+            authorize = authorize and _origin(redirect) == _origin(url)
+            url = redirect
+            if response.status_code == 303:
+                method = "GET"
+        raise requests.exceptions.TooManyRedirects(f"Exceeded {MAX_REDIRECTS} redirects for {url}")
+
+    def release(self, key: tuple, reader, writer, reuse: bool) -> None:
+        if reuse and not writer.is_closing():
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self) -> None:
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _send(
+        self, method: str, url: str, headers: dict[str, str], timeout: float, authorize: bool = True
+    ) -> _Response:
+        parts = urlsplit(url)
+        key = _origin(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {parts.netloc.rpartition('@')[2]}",
+            *([f"Authorization: {self._authorization}"] if authorize else []),
+            "User-Agent: cnpj-data-pipeline",
+            *(f"{name}: {value}" for name, value in headers.items()),
+        ]
+        message = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        while True:
+            reader, writer, reused = await self._connection(key)
+            try:
+                writer.write(message)
+                await writer.drain()
+                status_line = await asyncio.wait_for(reader.readline(), timeout)
+                if not status_line:
+                    raise ConnectionResetError(f"Connection closed before a response from {key[1]}")
+            except TimeoutError as exc:
+                writer.close()
+                raise requests.exceptions.ReadTimeout(f"Read timed out after {timeout}s: {url}") from exc
+            except OSError:
+                writer.close()
+                if reused:
+                    continue  # the server closed an idle keep-alive connection; retry on a fresh one
+                raise
+            break
+
+        try:
+            status_code = int(status_line.split(b" ", 2)[1])
+            response_headers = {}
+            while line := (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+        except TimeoutError as exc:
+            writer.close()
+            raise requests.exceptions.ReadTimeout(f"Read timed out after {timeout}s: {url}") from exc
+        except (ValueError, IndexError) as exc:
+            writer.close()
+            raise requests.exceptions.ConnectionError(f"Malformed HTTP response from {url}") from exc
+        return _Response(self, key, reader, writer, url, status_code, response_headers)
+
+    async def _connection(self, key: tuple):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        if scheme == "https" and self._ssl_context is None:
+            # Trust the same CA bundle requests uses for the threaded engine
+            self._ssl_context = ssl.create_default_context(cafile=requests.certs.where())
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    host,
+                    port,
+                    ssl=self._ssl_context if scheme == "https" else None,
+                    limit=downloader_module.DOWNLOAD_CHUNK_BYTES,
+                ),
+                self._connect_timeout,
+            )
+        except TimeoutError as exc:
+            raise requests.exceptions.ConnectTimeout(
+                f"Connection to {host}:{port} timed out after {self._connect_timeout}s"
+            ) from exc
+        return reader, writer, False
+
+
+class _Gate:
+    """Holders counted against a limit that may shrink mid-run (one event loop only)."""
+
+    def __init__(self, limit: Callable[[], int]):
+        self.limit = limit
+        self._held = 0
+        self._changed = asyncio.Event()
+
+    async def acquire(self) -> None:
+        while self._held >= self.limit():
+            self._changed.clear()
+            await self._changed.wait()
+        self._held += 1
+
+    def release(self) -> None:
+        self._held -= 1
+        self._changed.set()
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def drain(self) -> None:
+        while self._held:
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class AsyncDownloadEngine:
+    """Downloader.download_files and PROPFIND listing on an asyncio event loop."""
+
+    def __init__(self, downloader: Downloader):
+        self.downloader = downloader
+        self.config = downloader.config
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._files: _Gate | None = None
+
+    def propfind(self, url: str, depth: str = "1") -> bytes:
+        """Body of a PROPFIND, fetched on a short-lived event loop."""
+
+        async def fetch() -> bytes:
+            client = self._new_client()
+            try:
+                response = await client.request("PROPFIND", url, {"Depth": depth}, self.config.read_timeout)
+                body = await response.read(self.config.read_timeout)
+                response.release()
+                response.raise_for_status()
+                return body
+            finally:
+                client.close()
+
+        return asyncio.run(fetch())
+
+    def download_files(self, directory: str, files: List[str]) -> Iterator[Tuple[Path | ZipMember, str]]:
+        """Yield (csv_path, zip_filename) in the order and with the lookahead of Downloader.download_files.
+
+        The event loop runs in one background thread; a file's slot frees
+        when its CSVs are handed to the caller, so at most the current
+        concurrency of files are downloaded but not yet consumed.
+        """
+        results: queue.Queue = queue.Queue()
+        started = threading.Event()
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self._download_all(directory, files, results, started),),
+            name="async-downloader",
+            daemon=True,
+        )
+        thread.start()
+        started.wait()
+        try:
+            for _ in files:
+                item = results.get()
+                if isinstance(item, BaseException):
+                    raise item
+                filename, extracted_files = item
+                self._loop.call_soon_threadsafe(self._files.release)
+                for csv_path in extracted_files:
+                    yield csv_path, filename
+        finally:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                pass  # the loop already finished and closed
+            thread.join()
+
+    def _new_client(self) -> _HttpClient:
+        return _HttpClient(self.downloader.auth, self.config.connect_timeout)
+
+    async def _download_all(
+        self, directory: str, files: List[str], results: queue.Queue, started: threading.Event
+    ) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._adaptive = AdaptiveDownloadConcurrency(self.config.download_workers, self.config.stall_degrade_threshold)
+        self._streams = _Gate(lambda: self._adaptive.current_concurrency)
+        self._files = _Gate(lambda: 1)
+        started.set()
+
+        client = self._new_client()
+        tasks: set[asyncio.Task] = set()
+        try:
+            # Reference tables one at a time, all handed over before any data
+            # file starts, as Downloader.download_files does
+            reference_files = [f for f in files if f in REFERENCE_FILES]
+            data_files = [f for f in files if f not in REFERENCE_FILES]
+            for phase_files, limit in (
+                (reference_files, lambda: 1),
+                (data_files, lambda: self._adaptive.current_concurrency),
+            ):
+                self._files.limit = limit
+                for filename in phase_files:
+                    await self._files.acquire()
+                    tasks.add(asyncio.create_task(self._deliver(client, directory, filename, results)))
+                await self._files.drain()
+        except asyncio.CancelledError:
+            pass  # the caller stopped consuming
+        except Exception as exc:
+            results.put(exc)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            client.close()
+
+    async def _deliver(self, client: _HttpClient, directory: str, filename: str, results: queue.Queue) -> None:
+        try:
+            zip_path = await self._fetch_zip(client, directory, filename)
+            extracted_files = await asyncio.to_thread(self.downloader.extract_zip, zip_path)
+        except Exception as exc:
+            results.put(exc)
+            return
+        results.put((filename, extracted_files))
+
+    async def _fetch_zip(self, client: _HttpClient, directory: str, filename: str) -> Path:
+        url = f"{self.config.base_url}/{directory}/{filename}"
+        zip_path = self.downloader.temp_path / filename
+        log = logger.info if os.environ.get("TQDM_DISABLE") else logger.debug
+
+        if await asyncio.to_thread(self.downloader._restore_from_zip_cache, directory, filename, zip_path):
+            log(f"Using ZIP cache: {filename}")
+        elif (
+            self.downloader.zip_cache is None
+            and self.config.keep_files
+            and zip_path.exists()
+            and await asyncio.to_thread(self.downloader._cached_zip_is_valid, zip_path)
+        ):
+            log(f"Using cached: {filename}")
+        else:
+            self.downloader._manifest_path(zip_path).unlink(missing_ok=True)
+            await self._download_zip(client, url, directory, filename, zip_path, log)
+            await asyncio.to_thread(self.downloader._store_in_zip_cache, directory, filename, zip_path)
+        self.downloader._content_keys[(directory, filename)] = zip_content_key(zip_path)
+        return zip_path
+
+    async def _download_zip(
+        self,
+        client: _HttpClient,
+        url: str,
+        directory: str,
+        filename: str,
+        zip_path: Path,
+        log: Callable[[str], None],
+    ) -> None:
+        """Downloader._download_zip: same .part files, retry budget and backoff."""
+        slug = self.downloader._directory_slug(directory)
+        part_path = zip_path.with_name(f"{zip_path.name}.{slug}.part")
+        segment_path = zip_path.with_name(f"{zip_path.name}.seg.{slug}.part")
+        segment_state_path = zip_path.with_name(f"{zip_path.name}.segstate.{slug}.part")
+        segmented = segment_state_path.exists() or (self.config.download_segments > 1 and not part_path.exists())
+
+        if zip_path.exists():
+            zip_path.unlink()
+
+        def partial_bytes() -> int:
+            part_size = part_path.stat().st_size if part_path.exists() else 0
+            return part_size + _SegmentState.done_bytes_on_disk(segment_state_path)
+
+        progress_marker = partial_bytes()
+        failures_without_progress = 0
+        while True:
+            try:
+                log(f"Downloading {filename}...")
+                if segmented:
+                    segmented = await self._download_zip_segmented(
+                        client, url, filename, zip_path, segment_path, segment_state_path
+                    )
+                    if segmented:
+                        return
+                async with self._streams.hold():
+                    try:
+                        await self._download_zip_once(client, url, filename, zip_path, part_path)
+                    except (DownloadStalledError, requests.exceptions.ConnectTimeout):
+                        self._adaptive.record_stall()
+                        raise
+                return
+            except Exception as e:
+                if zip_path.exists():
+                    zip_path.unlink()
+
+                if not isinstance(e, DownloadStalledError):
+                    logger.warning(f"Download attempt failed: {e}")
+
+                part_size = partial_bytes()
+                if part_size > progress_marker:
+                    progress_marker = part_size
+                    failures_without_progress = 0
+                else:
+                    failures_without_progress += 1
+                if failures_without_progress >= self.config.retry_attempts:
+                    raise
+                backoff = self.config.retry_delay * (2 ** max(0, failures_without_progress - 1))
+                await asyncio.sleep(min(backoff, MAX_RETRY_BACKOFF_SECONDS))
+
+    async def _download_zip_once(
+        self, client: _HttpClient, url: str, filename: str, zip_path: Path, part_path: Path
+    ) -> None:
+        downloader = self.downloader
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        try:
+            response = await client.request("GET", url, headers, self.config.stall_timeout)
+        except requests.exceptions.ReadTimeout as exc:
+            raise downloader._stalled_error(filename, offset) from exc
+
+        try:
+            if offset and response.status_code == 416:
+                expected_total = downloader._unsatisfied_range_total(response.headers)
+                if expected_total == offset:
+                    logger.info(f"Completing previously downloaded partial ZIP: {filename}")
+                    part_path.replace(zip_path)
+                    await asyncio.to_thread(downloader._validate_zip_file, zip_path)
+                    return
+
+                reason = (
+                    "server did not report the remote size"
+                    if expected_total is None
+                    else f"local size {offset} differs from remote size {expected_total}"
+                )
+                logger.info(f"Discarding partial download for {filename}: {reason}")
+                part_path.unlink(missing_ok=True)
+                raise DownloadIncompleteError(f"Cannot resume {filename}: {reason}")
+
+            response.raise_for_status()
+            expected_total, write_offset = downloader._prepare_download_response(response, filename, part_path, offset)
+
+            tqdm_disabled = bool(os.environ.get("TQDM_DISABLE"))
+            progress_log_interval = self.config.progress_log_interval if tqdm_disabled else 0
+            downloaded_bytes = write_offset
+            last_log_at = monotonic()
+            last_log_bytes = downloaded_bytes
+            with (
+                tqdm(
+                    total=expected_total,
+                    initial=write_offset,
+                    unit="B",
+                    unit_scale=True,
+                    desc=f"Downloading {filename}",
+                    leave=False,
+                    disable=tqdm_disabled,
+                ) as pbar,
+                part_path.open("ab") as f,
+            ):
+                try:
+                    async for chunk in response.iter_chunks(
+                        downloader_module.DOWNLOAD_CHUNK_BYTES, self.config.stall_timeout
+                    ):
+                        f.write(chunk)
+                        downloaded_bytes += len(chunk)
+                        pbar.update(len(chunk))
+
+                        now = monotonic()
+                        if progress_log_interval and now - last_log_at >= progress_log_interval:
+                            rate = (downloaded_bytes - last_log_bytes) / (now - last_log_at)
+                            percent = downloaded_bytes / expected_total * 100 if expected_total else 0.0
+                            eta = "unknown" if rate <= 0 else f"{(expected_total - downloaded_bytes) / rate:.1f}s"
+                            logger.info(
+                                f"{filename} progress: {downloaded_bytes}/{expected_total} bytes "
+                                f"({percent:.1f}%), {rate:.1f} B/s, ETA {eta}"
+                            )
+                            last_log_at = now
+                            last_log_bytes = downloaded_bytes
+                except requests.exceptions.ReadTimeout as exc:
+                    raise downloader._stalled_error(filename, downloaded_bytes) from exc
+        finally:
+            response.release()
+
+        current_size = part_path.stat().st_size
+        if current_size > expected_total:
+            part_path.unlink(missing_ok=True)
+            raise DownloadIncompleteError(f"Downloaded {current_size} bytes for {filename}, expected {expected_total}")
+
+        if current_size != expected_total:
+            raise DownloadIncompleteError(f"Incomplete download for {filename}: {current_size}/{expected_total} bytes")
+
+        part_path.replace(zip_path)
+        await asyncio.to_thread(downloader._validate_zip_file, zip_path)
+
+    async def _download_zip_segmented(
+        self, client: _HttpClient, url: str, filename: str, zip_path: Path, data_path: Path, state_path: Path
+    ) -> bool:
+        """Downloader._download_zip_segmented with one coroutine per range."""
+        state = _SegmentState.load(data_path, state_path)
+        if state is None:
+            total = await self._probe_range_total(client, url, filename)
+            count = min(self.config.download_segments, (total or 0) // downloader_module.MIN_SEGMENT_BYTES)
+            if count < 2:
+                return False
+            state = _SegmentState.create(data_path, state_path, total, count)
+
+        done = sum(done for _, _, done in state.segments)
+        with tqdm(
+            total=state.total,
+            initial=done,
+            unit="B",
+            unit_scale=True,
+            desc=f"Downloading {filename} ({len(state.segments)} segments)",
+            leave=False,
+            disable=bool(os.environ.get("TQDM_DISABLE")),
+        ) as pbar:
+            outcomes = await asyncio.gather(
+                *(self._download_segment(client, url, filename, state, i, pbar) for i in state.pending),
+                return_exceptions=True,
+            )
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            raise errors[0]
+
+        state_path.unlink()
+        data_path.replace(zip_path)
+        await asyncio.to_thread(self.downloader._validate_zip_file, zip_path)
+        return True
+
+    async def _probe_range_total(self, client: _HttpClient, url: str, filename: str) -> int | None:
+        response = await client.request(
+            "GET", url, {"Accept-Encoding": "identity", "Range": "bytes=0-0"}, self.config.stall_timeout
+        )
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                return None
+            await response.read(self.config.stall_timeout)
+            return self.downloader._required_content_range(response.headers, filename)[2]
+        finally:
+            response.release()
+
+    async def _download_segment(
+        self, client: _HttpClient, url: str, filename: str, state: _SegmentState, index: int, pbar: tqdm
+    ) -> None:
+        downloader = self.downloader
+        start, end, done = state.segments[index]
+        offset = start + done
+        async with self._streams.hold():
+            try:
+                try:
+                    response = await client.request(
+                        "GET",
+                        url,
+                        {"Accept-Encoding": "identity", "Range": f"bytes={offset}-{end}"},
+                        self.config.stall_timeout,
+                    )
+                except requests.exceptions.ReadTimeout as exc:
+                    raise downloader._stalled_error(filename, offset) from exc
+
+                try:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise DownloadIncompleteError(f"Server ignored Range for segment {index} of {filename}")
+                    sent = downloader._required_content_range(response.headers, filename)
+                    if sent != (offset, end, state.total):
+                        state.discard()
+                        raise DownloadIncompleteError(
+                            f"Cannot resume segment {index} of {filename}: server sent bytes "
+                            f"{sent[0]}-{sent[1]}/{sent[2]}, expected {offset}-{end}/{state.total}"
+                        )
+
+                    saved = done
+                    with state.data_path.open("r+b") as f:
+                        f.seek(offset)
+                        try:
+                            async for chunk in response.iter_chunks(
+                                downloader_module.DOWNLOAD_CHUNK_BYTES, self.config.stall_timeout
+                            ):
+                                f.write(chunk[: end - start + 1 - done])
+                                done += len(chunk)
+                                pbar.update(len(chunk))
+                                if done - saved >= downloader_module.SEGMENT_STATE_INTERVAL:
+                                    f.flush()
+                                    state.update(index, done)
+                                    saved = done
+                        except requests.exceptions.ReadTimeout as exc:
+                            raise downloader._stalled_error(filename, start + done) from exc
+                        finally:
+                            f.flush()
+                            state.update(index, min(done, end - start + 1))
+                finally:
+                    response.release()
+
+                if start + done <= end:
+                    raise DownloadIncompleteError(
+                        f"Incomplete segment {index} of {filename}: {done}/{end - start + 1} bytes"
+                    )
+            except (DownloadStalledError, requests.exceptions.ConnectTimeout):
+                self._adaptive.record_stall()
+                raise
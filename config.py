@@ -7,6 +7,18 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+
+
+def parse_size(value: str) -> int:
+    """Bytes in a size such as "512MB" or "20GB" (binary units, like Postgres)."""
+    text = value.strip().upper()
+    number = text.rstrip("KMGTB")
+    unit = text[len(number) :]
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(number) * SIZE_UNITS[unit])
+
 
 @dataclass
 class Config:
@@ -14,6 +26,10 @@ class Config:
 
     database_url: str
     batch_size: int = 500000
+    # RAM for batches in flight, e.g. "4GB" (empty keeps batch_size for every
+    # file type). Shared across concurrent workers and sized per file type
+    # from its bytes per row, with batch_size as the upper bound.
+    memory_budget: str = ""
     temp_dir: str = "./temp"
     download_workers: int = 4
     process_workers: int = 1
@@ -26,8 +42,55 @@ class Config:
     stall_timeout: int = 30
     stall_degrade_threshold: int = 3
     progress_log_interval: int = 30
+    # Byte ranges fetched concurrently per ZIP (files of 32MB and up), so one
+    # large file is not limited to a single connection; 1 disables it.
+    download_segments: int = 1
+    # "asyncio" runs listing and download_files on one event loop (a coroutine
+    # per file or range instead of a thread); "thread" uses requests.
+    download_engine: str = "thread"  # "thread" or "asyncio"
+    # With process_workers > 1: "thread" runs whole files in threads;
+    # "process" transforms files in child processes and loads/writes here;
+    # "pipeline" overlaps download, extract, transform and load as stages
+    # with bounded queues (process_workers transform threads, one loader).
+    worker_mode: str = "thread"  # "thread", "process" or "pipeline"
     keep_files: bool = False
-    loading_strategy: str = "upsert"  # "upsert" or "replace"
+    # When true, PROPFIND listings are kept in temp_dir and revalidated
+    # next run with a Depth: 0 request against the collection's ETag.
+    listing_cache: bool = True
+    # Directory of a content-addressed ZIP cache shared across runs and
+    # months (empty disables it); ZIPs are keyed on their members' CRCs, so
+    # a file unchanged since another month is fetched once. The least
+    # recently used are evicted beyond zip_cache_size.
+    zip_cache_dir: str = ""
+    zip_cache_size: str = "20GB"
+    # When true, CSVs are parsed straight out of the downloaded ZIP instead
+    # of being extracted first; temp disk then peaks at the compressed size.
+    stream_from_zip: bool = False
+    # When true, download_files yields each ZIP's CSV while the ZIP is still
+    # downloading and inflates it as bytes arrive (CRC checked at the end),
+    # so parsing overlaps the download; no extracted copy or testzip pass.
+    extract_while_downloading: bool = False
+    # When true, a pending file whose content matches the previous month's
+    # (same ZIP content key) is marked processed without being loaded; under
+    # replace, swap and delta only when every file of its table matches.
+    skip_unchanged_files: bool = True
+    loading_strategy: str = "upsert"  # "upsert", "replace", "swap" or "delta"
+    # Under swap, SET LOGGED each table before it goes live. Off by default:
+    # it rewrites the table through WAL, and an UNLOGGED table is rebuilt
+    # from the RFB files anyway (emptied by a crash; reload with --force).
+    swap_set_logged: bool = False
+    processing_engine: str = "eager"  # "eager" or "streaming" (one LazyFrame plan per chunk)
+    # COPY wire format for Postgres loads. "binary" sends typed values and
+    # spares the server text parsing but costs more client CPU than "csv".
+    copy_format: str = "csv"  # "csv" or "binary"
+    # "auto" drops plain secondary indexes before a replace or first load and
+    # rebuilds them after the last dependency group; "never" keeps them live.
+    defer_indexes: str = "auto"  # "auto" or "never"
+    index_build_workers: int = 2  # indexes rebuilt at once, one connection each
+    index_build_memory: str = "512MB"  # maintenance_work_mem per index build
+    # max_parallel_maintenance_workers per index build: extra processes
+    # sorting for one CREATE INDEX, on top of INDEX_BUILD_WORKERS (0 = none)
+    index_build_parallel_workers: int = 2
     output_format: str = "postgres"  # "postgres" or "parquet"
     parquet_output_dir: str = "./parquet"
     # When true (opt-in for backward compatibility in v1.x), cast date and
@@ -36,6 +99,15 @@ class Config:
     # this flag exists to bring Parquet to parity. The default will flip
     # to true at the next major version bump.
     parquet_typed_output: bool = False
+    # Hive-partitioned tables, "table:col[,col];table:col" (e.g.
+    # "estabelecimentos:uf"); "source_month" partitions by the exported month.
+    parquet_partition_by: str = ""
+    # When true, each Parquet table is sorted by its key (cnpj_basico first)
+    # and written with page indexes and a cnpj_basico bloom filter.
+    parquet_sorted: bool = False
+    # When true, each worker thread writes its own part file per table
+    # (table/part-NNNN.parquet) so exports don't serialize on one writer.
+    parquet_part_per_worker: bool = False
     post_file_command: str = ""  # Command to run after each parquet file (receives file path as arg)
     base_url: str = "https://arquivos.receitafederal.gov.br/public.php/webdav"
     share_token: str = "YggdBLfdninEJX9"
@@ -46,6 +118,7 @@ class Config:
         return cls(
             database_url=os.getenv("DATABASE_URL", ""),
             batch_size=int(os.getenv("BATCH_SIZE", "500000")),
+            memory_budget=os.getenv("MEMORY_BUDGET", ""),
             temp_dir=os.getenv("TEMP_DIR", "./temp"),
             download_workers=int(os.getenv("DOWNLOAD_WORKERS", "4")),
             process_workers=int(os.getenv("PROCESS_WORKERS", "1")),
@@ -56,11 +129,30 @@ class Config:
             stall_timeout=int(os.getenv("STALL_TIMEOUT", "30")),
             stall_degrade_threshold=int(os.getenv("STALL_DEGRADE_THRESHOLD", "3")),
             progress_log_interval=int(os.getenv("PROGRESS_LOG_INTERVAL", "30")),
+            download_segments=int(os.getenv("DOWNLOAD_SEGMENTS", "1")),
+            download_engine=os.getenv("DOWNLOAD_ENGINE", "thread").lower(),
+            worker_mode=os.getenv("WORKER_MODE", "thread").lower(),
             keep_files=os.getenv("KEEP_DOWNLOADED_FILES", "false").lower() == "true",
+            listing_cache=os.getenv("LISTING_CACHE", "true").lower() == "true",
+            zip_cache_dir=os.getenv("ZIP_CACHE_DIR", ""),
+            zip_cache_size=os.getenv("ZIP_CACHE_SIZE", "20GB"),
+            stream_from_zip=os.getenv("STREAM_FROM_ZIP", "false").lower() == "true",
+            extract_while_downloading=os.getenv("EXTRACT_WHILE_DOWNLOADING", "false").lower() == "true",
+            skip_unchanged_files=os.getenv("SKIP_UNCHANGED_FILES", "true").lower() == "true",
             loading_strategy=os.getenv("LOADING_STRATEGY", "upsert").lower(),
+            swap_set_logged=os.getenv("SWAP_SET_LOGGED", "false").lower() == "true",
+            processing_engine=os.getenv("PROCESSING_ENGINE", "eager").lower(),
+            copy_format=os.getenv("COPY_FORMAT", "csv").lower(),
+            defer_indexes=os.getenv("DEFER_INDEXES", "auto").lower(),
+            index_build_workers=int(os.getenv("INDEX_BUILD_WORKERS", "2")),
+            index_build_memory=os.getenv("INDEX_BUILD_MEMORY", "512MB"),
+            index_build_parallel_workers=int(os.getenv("INDEX_BUILD_PARALLEL_WORKERS", "2")),
             output_format=os.getenv("OUTPUT_FORMAT", "postgres").lower(),
             parquet_output_dir=os.getenv("PARQUET_OUTPUT_DIR", "./parquet"),
             parquet_typed_output=os.getenv("PARQUET_TYPED_OUTPUT", "false").lower() == "true",
+            parquet_partition_by=os.getenv("PARQUET_PARTITION_BY", ""),
+            parquet_sorted=os.getenv("PARQUET_SORTED", "false").lower() == "true",
+            parquet_part_per_worker=os.getenv("PARQUET_PART_PER_WORKER", "false").lower() == "true",
             post_file_command=os.getenv("POST_FILE_COMMAND", ""),
             base_url=os.getenv("BASE_URL", "https://arquivos.receitafederal.gov.br/public.php/webdav"),
             share_token=os.getenv("SHARE_TOKEN", "YggdBLfdninEJX9"),
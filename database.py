@@ -1,29 +1,179 @@
 """PostgreSQL database operations with Polars for fast bulk loading."""
 
-import io
+import array
 import logging
 import os
+import queue
+import struct
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Set
+from typing import Dict, Iterable, Iterator, List, Mapping, Set
 
 import polars as pl
 import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
 
 logger = logging.getLogger(__name__)
 
+# COPY ... (FORMAT binary) framing: 11-byte signature, int32 flags, int32
+# header-extension length; the trailer is a field count of -1.
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + b"\x00\x00\x00\x00" + b"\x00\x00\x00\x00"
+_PGCOPY_TRAILER = b"\xff\xff"
+
+# Rows encoded per slice, so peak memory stays a fraction of the batch.
+COPY_SLICE_ROWS = 65536
+COPY_READ_BYTES = 1024 * 1024
+
+# LOADING_STRATEGY=swap loads into "<table>__next" and renames it over the
+# live table once its indexes are built.
+SHADOW_SUFFIX = "__next"
+
+# LOADING_STRATEGY=delta keeps one (PK, fingerprint) row per loaded row in
+# "<table>__fingerprints" and collects the next load's in "<table>__fp_new".
+FINGERPRINTS_SUFFIX = "__fingerprints"
+FP_NEW_SUFFIX = "__fp_new"
+# Polars only guarantees hash_rows output within one version, so stored
+# fingerprints are tagged with it and ignored after an upgrade.
+_ROW_HASHER = f"polars-{pl.__version__}-hash_rows"
+
+# Days between the Unix epoch and the Postgres epoch (2000-01-01).
+_PG_EPOCH_DAYS = 10957
+
+# Postgres types (as atttypid::regtype) sent in binary as raw UTF-8 bytes.
+_TEXT_TYPES = {"text", "character varying", "character"}
+_FIXED_TYPES = {
+    "date": (pl.Date, "i", 4),
+    "double precision": (pl.Float64, "d", 8),
+    "integer": (pl.Int32, "i", 4),
+}
+_BINARY_TYPES = _TEXT_TYPES | set(_FIXED_TYPES) | {"uuid"}
+
+
+def _big_endian(values: pa.Array, code: str, width: int) -> pa.Array:
+    """Fixed-width numbers as a binary array of their network-order bytes."""
+    data = array.array(code, bytes(values.buffers()[1]))
+    data.byteswap()
+    raw = pa.FixedSizeBinaryArray.from_buffers(
+        pa.binary(width), len(values), [values.buffers()[0], pa.py_buffer(data)], offset=values.offset
+    )
+    return raw.cast(pa.binary())
+
+
+def _encode_field(series: pl.Series, pg_type: str) -> tuple[pa.Array, pa.Array]:
+    """One column as binary COPY fields: (int32 lengths, values).
+
+    A NULL is length -1 with an empty value. String input is converted the
+    way the text COPY input functions would: YYYYMMDD dates, decimal-point
+    numbers, hyphenated UUIDs. Conversions are strict, so a value Postgres
+    would have rejected still fails the batch instead of loading as NULL.
+    """
+    if series.dtype == pl.Null:
+        series = series.cast(pl.Utf8)
+
+    if pg_type in _FIXED_TYPES:
+        dtype, code, width = _FIXED_TYPES[pg_type]
+        if series.dtype == pl.Utf8:
+            series = series.str.strip_chars()
+            series = series.str.to_date("%Y%m%d") if dtype == pl.Date else series.cast(dtype)
+        if dtype == pl.Date:
+            series = series.cast(pl.Date).cast(pl.Int32) - _PG_EPOCH_DAYS
+        values = _big_endian(series.cast(pl.Int32 if code == "i" else pl.Float64).rechunk().to_arrow(), code, width)
+        lengths = pl.repeat(width, len(series), dtype=pl.Int32, eager=True)
+    else:
+        if pg_type == "uuid":
+            values = series.cast(pl.Utf8).str.replace_all("-", "", literal=True).str.decode("hex")
+        else:
+            values = series.cast(pl.Utf8)
+            if values.str.contains("\x00", literal=True).any():
+                values = values.str.replace_all("\x00", "", literal=True)
+            values = values.cast(pl.Binary)
+        lengths = values.bin.size().cast(pl.Int32)
+        values = values.rechunk().to_arrow().cast(pa.binary())
+
+    if series.null_count():
+        lengths = lengths.set(series.is_null(), -1)
+        values = pc.fill_null(values, b"")
+    return _big_endian(lengths.rechunk().to_arrow(), "i", 4), values
+
+
+def _row_fingerprint(df: pl.DataFrame, columns: List[str]) -> pl.Series:
+    """64-bit hash of each row over columns, as Int64 to fit a bigint."""
+    return df.select(columns).hash_rows(seed=0, seed_1=1, seed_2=2, seed_3=3).reinterpret(signed=True)
+
+
+def _binary_copy_chunks(df: pl.DataFrame, pg_types: List[str]) -> Iterator[bytes]:
+    """Encode df as a COPY (FORMAT binary) stream, COPY_SLICE_ROWS rows at a time."""
+    yield _PGCOPY_HEADER
+    field_count = pa.scalar(struct.pack("!h", df.width), pa.binary())
+    for part in df.iter_slices(COPY_SLICE_ROWS):
+        fields = []
+        for i, pg_type in enumerate(pg_types):
+            fields.extend(_encode_field(part.to_series(i), pg_type))
+        rows = pc.binary_join_element_wise(field_count, *fields, b"")
+        # Row i's bytes sit at offsets[i]:offsets[i+1] of one data buffer,
+        # so the slice's stream is that buffer, no per-row join needed.
+        offsets = memoryview(rows.buffers()[1]).cast("i")
+        yield memoryview(rows.buffers()[2])[offsets[rows.offset] : offsets[rows.offset + len(rows)]]
+    yield _PGCOPY_TRAILER
+
+
+def _csv_copy_chunks(df: pl.DataFrame) -> Iterator[bytes]:
+    for part in df.iter_slices(COPY_SLICE_ROWS):
+        yield part.write_csv(include_header=False).encode("utf-8", errors="replace").replace(b"\x00", b"")
+
+
+class _ChunkStream:
+    """Read-only file over an iterator of byte chunks, for cursor.copy_expert.
+
+    Chunks are produced on demand, so only the slice being sent is held in
+    memory rather than the whole serialized batch.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            rest = bytes(self._buffer) + b"".join(bytes(chunk) for chunk in self._chunks)
+            self._buffer = memoryview(b"")
+            return rest
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._buffer = memoryview(chunk)
+        out = bytes(self._buffer[:size])
+        self._buffer = self._buffer[size:]
+        return out
+
 
 class Database:
     """PostgreSQL database handler with temp table upsert."""
 
     def __init__(
-        self, database_url: str, pre_truncated: set | None = None, retry_attempts: int = 3, retry_delay: int = 5
+        self,
+        database_url: str,
+        pre_truncated: set | None = None,
+        retry_attempts: int = 3,
+        retry_delay: int = 5,
+        copy_format: str = "csv",
     ):
         self.database_url = database_url
         self.retry_attempts = retry_attempts
         self.retry_delay = retry_delay
+        self.copy_format = copy_format
         self._pk_cache: dict = {}
+        self._column_type_cache: dict = {}
+        # Upsert statement PREPAREd on self.conn, by (temp, target, columns, pks)
+        self._prepared_upserts: dict = {}
         self._truncated_tables: set = set(pre_truncated) if pre_truncated else set()
+        self._delta_comparable: dict = {}
+        self._delta_stats: dict = {}
         self.conn = None
 
     def connect(self):
@@ -40,6 +190,7 @@ class Database:
             try:
                 self.conn = psycopg2.connect(self.database_url)
                 self.conn.autocommit = False
+                self._prepared_upserts.clear()
                 return
             except psycopg2.OperationalError:
                 if attempt == self.retry_attempts - 1:
@@ -51,6 +202,27 @@ class Database:
         if self.conn:
             self.conn.close()
             self.conn = None
+        self._prepared_upserts.clear()
+
+    def ping(self) -> bool:
+        """Check that an open connection still answers, before reusing it.
+
+        Rolls back first so a transaction left aborted by a failed caller
+        doesn't make a healthy connection look broken. True when there is
+        no connection yet (connect() runs lazily on first use).
+        """
+        if self.conn is None:
+            return True
+        if self.conn.closed:
+            return False
+        try:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            self.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
 
     def ensure_schema(self):
         """Apply initial.sql if the schema tables don't exist yet.
@@ -73,8 +245,13 @@ class Database:
             self.conn.rollback()
             raise
 
-    def get_processed_files(self, directory: str) -> Set[str]:
-        """Get all processed filenames for a directory."""
+    def get_processed_files(self, directory: str, versions: Mapping[str, str] | None = None) -> Set[str]:
+        """Get all processed filenames for a directory.
+
+        versions maps filenames to the server's current version token
+        (Downloader.get_file_versions); a file processed at a different
+        recorded version is left out so it is loaded again.
+        """
         self.connect()
         try:
             with self.conn.cursor() as cur:
@@ -82,13 +259,31 @@ class Database:
                     "SELECT filename FROM processed_files WHERE directory = %s",
                     (directory,),
                 )
-                return {row[0] for row in cur.fetchall()}
+                processed = {row[0] for row in cur.fetchall()}
+                if not versions:
+                    return processed
+
+                cur.execute("SELECT to_regclass('processed_file_versions')")
+                if cur.fetchone()[0] is None:
+                    return processed
+                cur.execute(
+                    "SELECT filename, version FROM processed_file_versions WHERE directory = %s",
+                    (directory,),
+                )
+                changed = {
+                    filename
+                    for filename, version in cur.fetchall()
+                    if filename in processed and versions.get(filename, version) != version
+                }
+                for filename in sorted(changed):
+                    logger.info(f"{filename} changed on the server since it was processed; loading it again")
+                return processed - changed
         except Exception as e:
             logger.error(f"Failed to get processed files: {e}")
             raise
 
-    def mark_processed(self, directory: str, filename: str):
-        """Mark a file as processed."""
+    def mark_processed(self, directory: str, filename: str, version: str | None = None):
+        """Mark a file as processed, recording the remote version it was loaded from."""
         self.connect()
         with self.conn.cursor() as cur:
             cur.execute(
@@ -97,8 +292,52 @@ class Database:
                    ON CONFLICT (directory, filename) DO NOTHING""",
                 (directory, filename),
             )
+            if version is not None:
+                self._ensure_processed_versions_table(cur)
+                cur.execute(
+                    """INSERT INTO processed_file_versions (directory, filename, version)
+                       VALUES (%s, %s, %s)
+                       ON CONFLICT (directory, filename) DO UPDATE SET version = EXCLUDED.version""",
+                    (directory, filename, version),
+                )
+            self.conn.commit()
+
+    def record_fingerprint(self, directory: str, filename: str, size: int, content_key: str):
+        """Record the content a processed file was loaded from, for comparison with later months."""
+        self.connect()
+        with self.conn.cursor() as cur:
+            self._ensure_file_fingerprints_table(cur)
+            cur.execute(
+                """INSERT INTO file_fingerprints (directory, filename, size, content_key)
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (directory, filename)
+                   DO UPDATE SET size = EXCLUDED.size, content_key = EXCLUDED.content_key""",
+                (directory, filename, size, content_key),
+            )
             self.conn.commit()
 
+    def get_previous_fingerprints(self, directory: str) -> Dict[str, tuple[str, int, str]]:
+        """Latest fingerprint of each file, as filename -> (directory, size, content_key).
+
+        Only files whose latest fingerprint comes from an earlier directory
+        are returned: when a later month was loaded after it, the tables no
+        longer hold that month's rows and it proves nothing.
+        """
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('file_fingerprints')")
+            if cur.fetchone()[0] is None:
+                self.conn.rollback()
+                return {}
+            cur.execute(
+                """SELECT DISTINCT ON (filename) filename, directory, size, content_key
+                   FROM file_fingerprints
+                   ORDER BY filename, directory DESC"""
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+        return {filename: (source, size, key) for filename, source, size, key in rows if source < directory}
+
     def clear_processed_files(self, directory: str):
         """Clear all processed file records for a directory (for force re-processing)."""
         self.connect()
@@ -123,23 +362,9 @@ class Database:
             return
 
         self.connect()
-        temp_table = f"temp_{table_name}_{id(df)}"
-
         try:
             with self.conn.cursor() as cur:
-                # 1. Create temp table
-                cur.execute(
-                    f"CREATE TEMP TABLE {temp_table} "
-                    f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING STORAGE) ON COMMIT DROP"
-                )
-
-                # 2. COPY to temp
-                self._copy_to_temp(cur, df, temp_table, columns)
-
-                # 3. Upsert from temp to main
-                primary_keys = self._get_primary_keys(cur, table_name)
-                self._upsert_from_temp(cur, temp_table, table_name, columns, primary_keys)
-
+                self._upsert_rows(cur, df, table_name, columns)
                 self.conn.commit()
 
         except Exception as e:
@@ -147,6 +372,26 @@ class Database:
             logger.error(f"Error: {table_name}: {e}")
             raise
 
+    def _upsert_rows(self, cur, df: pl.DataFrame, table_name: str, columns: List[str]):
+        """Temp table + COPY + upsert, inside the caller's transaction."""
+        # Temp tables are per session, so one name per table is safe. Kept
+        # for the session with their rows cleared on commit, so the prepared
+        # upsert's plan stays valid from batch to batch.
+        temp_table = f"temp_{table_name}"
+
+        # 1. Create temp table (first batch of the session)
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {temp_table} "
+            f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING STORAGE) ON COMMIT DELETE ROWS"
+        )
+
+        # 2. COPY to temp
+        self._copy_to_temp(cur, df, temp_table, columns, like_table=table_name)
+
+        # 3. Upsert from temp to main
+        primary_keys = self._get_primary_keys(cur, table_name)
+        self._upsert_from_temp(cur, temp_table, table_name, columns, primary_keys)
+
     def bulk_insert(self, df: pl.DataFrame, table_name: str, columns: List[str]):
         """Bulk insert under LOADING_STRATEGY=replace.
 
@@ -180,10 +425,9 @@ class Database:
                     temp_table = f"{table_name}_tmp_{os.getpid()}"
                     cur.execute(
                         f"CREATE TEMP TABLE IF NOT EXISTS {temp_table} "
-                        f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING STORAGE) ON COMMIT DROP"
+                        f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING STORAGE) ON COMMIT DELETE ROWS"
                     )
-                    cur.execute(f"TRUNCATE {temp_table}")
-                    self._copy_to_temp(cur, df, temp_table, columns)
+                    self._copy_to_temp(cur, df, temp_table, columns, like_table=table_name)
                     primary_keys = self._get_primary_keys(cur, table_name)
                     self._upsert_from_temp(cur, temp_table, table_name, columns, primary_keys)
 
@@ -194,17 +438,515 @@ class Database:
             logger.error(f"Error: {table_name}: {e}")
             raise
 
-    def _copy_to_temp(self, cur, df: pl.DataFrame, temp_table: str, columns: List[str]):
-        """COPY DataFrame to temp table using Polars CSV."""
+    def begin_swap(self, table_name: str):
+        """Create an empty shadow of table_name for LOADING_STRATEGY=swap.
+
+        The shadow is UNLOGGED and has no primary key or indexes, so COPY
+        into it skips WAL and index maintenance. A shadow left behind by a
+        failed run is dropped first; the live table is never touched here.
+        """
+        shadow = f"{table_name}{SHADOW_SUFFIX}"
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {shadow}")
+                cur.execute(
+                    f"CREATE UNLOGGED TABLE {shadow} "
+                    f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)"
+                )
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def bulk_load_shadow(self, df: pl.DataFrame, table_name: str, columns: List[str]):
+        """Bulk load under LOADING_STRATEGY=swap: plain COPY into the shadow.
+
+        No PK exists yet, so rows RFB repeats across shards land twice;
+        finish_swap removes them before the PK is built.
+        """
+        if df.is_empty():
+            return
+
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                self._copy_to_temp(cur, df, f"{table_name}{SHADOW_SUFFIX}", columns, like_table=table_name)
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error: {table_name}: {e}")
+            raise
+
+    def finish_swap(self, table_name: str, index_workers: int = 1, set_logged: bool = False):
+        """Index the loaded shadow and swap it in place of table_name.
+
+        1. With set_logged, SET LOGGED so the table survives a server crash.
+           That rewrites the whole table through WAL, so by default the
+           swapped-in table stays UNLOGGED: it is rebuilt from the RFB files
+           anyway, and after a crash Postgres empties it and a reload with
+           --force brings it back.
+        2. Rebuild every index of the live table (PK included) on the shadow,
+           up to index_workers at a time, each on its own connection.
+           CREATE INDEX only takes a SHARE lock, so builds on the same table
+           run concurrently. If the PK build hits duplicates, the earlier
+           copies are deleted (the last loaded row wins, as with replace)
+           and the build is retried.
+        3. ANALYZE, so the planner has statistics from the first query.
+        4. In one transaction: drop the live table, rename the shadow and
+           its indexes to the live names. Readers wait on the lock for that
+           transaction only and then see the new table.
+
+        Grants and dependent views are not carried over; a view on the
+        table makes the DROP fail and the live table stays as it was.
+        """
+        shadow = f"{table_name}{SHADOW_SUFFIX}"
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                if set_logged:
+                    started = time.monotonic()
+                    cur.execute(f"ALTER TABLE {shadow} SET LOGGED")
+                    self.conn.commit()
+                    logger.info(f"{shadow}: SET LOGGED in {time.monotonic() - started:.1f}s")
+                indexes = self._get_index_definitions(cur, table_name)
+                primary_keys = self._get_primary_keys(cur, table_name)
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        with ThreadPoolExecutor(max_workers=max(1, index_workers)) as executor:
+            futures = [
+                executor.submit(self._build_shadow_index, shadow, name, is_primary, definition, primary_keys)
+                for name, is_primary, definition in indexes
+            ]
+            for future in futures:
+                future.result()
+
+        try:
+            with self.conn.cursor() as cur:
+                for name, is_primary, _ in indexes:
+                    if is_primary:
+                        cur.execute(
+                            f"ALTER TABLE {shadow} ADD CONSTRAINT {name}{SHADOW_SUFFIX} "
+                            f"PRIMARY KEY USING INDEX {name}{SHADOW_SUFFIX}"
+                        )
+                cur.execute(f"ANALYZE {shadow}")
+                self.conn.commit()
+
+                cur.execute(f"DROP TABLE {table_name}")
+                cur.execute(f"ALTER TABLE {shadow} RENAME TO {table_name}")
+                for name, _, _ in indexes:
+                    cur.execute(f"ALTER INDEX {name}{SHADOW_SUFFIX} RENAME TO {name}")
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error: swapping {table_name}: {e}")
+            raise
+
+        self._pk_cache.pop(table_name, None)
+        self._column_type_cache.pop(table_name, None)
+        logger.info(f"Swapped {table_name} ({len(indexes)} indexes rebuilt)")
+
+    def _build_shadow_index(self, shadow: str, name: str, is_primary: bool, definition: str, primary_keys: List[str]):
+        """CREATE one index on the shadow, on a connection of its own."""
+        worker = Database(self.database_url, retry_attempts=self.retry_attempts, retry_delay=self.retry_delay)
+        worker.connect()
+        worker.conn.autocommit = True
+        try:
+            with worker.conn.cursor() as cur:
+                sql = definition.format(name=f"{name}{SHADOW_SUFFIX}", table=shadow)
+                try:
+                    cur.execute(sql)
+                except psycopg2.errors.UniqueViolation:
+                    if not is_primary:
+                        raise
+                    # One sort of the shadow ranks each key's copies; only the
+                    # losers' ctids come back, deleted by TID scan
+                    pk_str = ", ".join(f'"{pk}"' for pk in primary_keys)
+                    cur.execute(
+                        f"DELETE FROM {shadow} WHERE ctid = ANY(ARRAY("
+                        f"SELECT ctid FROM (SELECT ctid, row_number() OVER "
+                        f"(PARTITION BY {pk_str} ORDER BY ctid DESC) AS copy FROM {shadow}) ranked "
+                        f"WHERE copy > 1))"
+                    )
+                    logger.warning(f"{shadow}: removed {cur.rowcount:,} rows with a duplicate primary key")
+                    cur.execute(sql)
+        finally:
+            worker.disconnect()
+
+    def _get_index_definitions(self, cur, table_name: str) -> List[tuple]:
+        """(name, is_primary, CREATE INDEX template) for every index on table_name.
+
+        The template keeps pg_get_indexdef's "USING ..." tail and takes
+        {name} and {table} placeholders.
+        """
+        cur.execute(
+            """
+            SELECT c.relname, i.indisprimary, i.indisunique, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+            ORDER BY i.indisprimary DESC, c.relname
+            """,
+            (table_name,),
+        )
+        indexes = []
+        for name, is_primary, is_unique, indexdef in cur.fetchall():
+            using = indexdef.split(" USING ", 1)[1].replace("{", "{{").replace("}", "}}")
+            indexes.append(
+                (name, is_primary, f"CREATE {'UNIQUE ' if is_unique else ''}INDEX {{name}} ON {{table}} USING {using}")
+            )
+        return indexes
+
+    def begin_delta(self, table_name: str):
+        """Start a LOADING_STRATEGY=delta load of table_name.
+
+        Creates "<table>__fp_new" to collect this load's (PK, fingerprint)
+        pairs, numbered in load order by an identity column; finish_delta
+        turns it into "<table>__fingerprints", the state the next load is
+        compared against.
+        """
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                pk_str = ", ".join(f'"{pk}"' for pk in self._get_primary_keys(cur, table_name))
+                cur.execute(f"DROP TABLE IF EXISTS {table_name}{FP_NEW_SUFFIX}")
+                cur.execute(
+                    f"CREATE UNLOGGED TABLE {table_name}{FP_NEW_SUFFIX} AS "
+                    f"SELECT {pk_str}, 0::bigint AS fingerprint FROM {table_name} WITH NO DATA"
+                )
+                cur.execute(
+                    f"ALTER TABLE {table_name}{FP_NEW_SUFFIX} ADD COLUMN load_seq bigint GENERATED ALWAYS AS IDENTITY"
+                )
+                cur.execute(
+                    "SELECT obj_description(to_regclass(%s), 'pg_class')", (f"{table_name}{FINGERPRINTS_SUFFIX}",)
+                )
+                # Fingerprints from another hasher can't be compared: every
+                # row counts as changed, but vanished keys are still deleted.
+                self._delta_comparable[table_name] = cur.fetchone()[0] == _ROW_HASHER
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._delta_stats[table_name] = [0, 0]
+
+    def bulk_delta(self, df: pl.DataFrame, table_name: str, columns: List[str]):
+        """Bulk load under LOADING_STRATEGY=delta: upsert only changed rows.
+
+        Each row is fingerprinted by hashing its columns. Only the PKs and
+        fingerprints are COPYed to compare against the previous load; rows
+        that are new or whose fingerprint differs go through the usual
+        upsert, the rest are skipped.
+        """
+        if df.is_empty():
+            return
+
+        self.connect()
+        temp_table = f"temp_fp_{table_name}"
+        try:
+            with self.conn.cursor() as cur:
+                primary_keys = self._get_primary_keys(cur, table_name)
+                pk_str = ", ".join(f'"{pk}"' for pk in primary_keys)
+                keys = df.select(
+                    pl.int_range(pl.len(), dtype=pl.Int32).alias("row_nr"),
+                    *primary_keys,
+                    _row_fingerprint(df, columns).alias("fingerprint"),
+                )
+
+                cur.execute(
+                    f"CREATE TEMP TABLE {temp_table} ON COMMIT DROP AS "
+                    f"SELECT 0 AS row_nr, {pk_str}, 0::bigint AS fingerprint FROM {table_name} WITH NO DATA"
+                )
+                self._copy_to_temp(cur, keys, temp_table, keys.columns)
+                cur.execute(
+                    f"INSERT INTO {table_name}{FP_NEW_SUFFIX} ({pk_str}, fingerprint) "
+                    f"SELECT {pk_str}, fingerprint FROM {temp_table} ORDER BY row_nr"
+                )
+
+                if self._delta_comparable.get(table_name):
+                    pk_match = " AND ".join(f'o."{pk}" = n."{pk}"' for pk in primary_keys)
+                    cur.execute(
+                        f"SELECT n.row_nr FROM {temp_table} n "
+                        f"LEFT JOIN {table_name}{FINGERPRINTS_SUFFIX} o ON {pk_match} "
+                        f"WHERE o.fingerprint IS DISTINCT FROM n.fingerprint"
+                    )
+                    df = df[sorted(row[0] for row in cur.fetchall())]
+
+                if not df.is_empty():
+                    self._upsert_rows(cur, df, table_name, columns)
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error: {table_name}: {e}")
+            raise
+
+        stats = self._delta_stats.setdefault(table_name, [0, 0])
+        stats[0] += len(keys)
+        stats[1] += len(df)
+
+    def finish_delta(self, table_name: str, delete_missing: bool = True):
+        """Delete vanished rows and keep this load's fingerprints for the next.
+
+        delete_missing must be False unless every file of the table went
+        through bulk_delta since begin_delta; otherwise rows from the
+        skipped files would look vanished. A partial load's fingerprints are
+        merged into the stored ones instead of replacing them.
+        """
+        fp_new = f"{table_name}{FP_NEW_SUFFIX}"
+        fingerprints = f"{table_name}{FINGERPRINTS_SUFFIX}"
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                primary_keys = self._get_primary_keys(cur, table_name)
+                pk_str = ", ".join(f'"{pk}"' for pk in primary_keys)
+                deleted = 0
+                # A key repeated across shards keeps its last fingerprint,
+                # matching the row the upsert left in the table.
+                latest = (
+                    f"SELECT DISTINCT ON ({pk_str}) {pk_str}, fingerprint FROM {fp_new} "
+                    f"ORDER BY {pk_str}, load_seq DESC"
+                )
+                cur.execute("SELECT to_regclass(%s)", (fingerprints,))
+                exists = cur.fetchone()[0] is not None
+                if exists and not delete_missing:
+                    # Files not loaded this time keep their fingerprints, so
+                    # the next full load still finds the rows they lose
+                    cur.execute(
+                        f"INSERT INTO {fingerprints} {latest} "
+                        f"ON CONFLICT ({pk_str}) DO UPDATE SET fingerprint = EXCLUDED.fingerprint"
+                    )
+                else:
+                    if exists:
+                        pk_match = " AND ".join(f't."{pk}" = gone."{pk}"' for pk in primary_keys)
+                        cur.execute(
+                            f"DELETE FROM {table_name} t USING "
+                            f"(SELECT {pk_str} FROM {fingerprints} EXCEPT SELECT {pk_str} FROM {fp_new}) gone "
+                            f"WHERE {pk_match}"
+                        )
+                        deleted = cur.rowcount
+                        cur.execute(f"DROP TABLE {fingerprints}")
+                    cur.execute(f"CREATE TABLE {fingerprints} AS {latest}")
+                    cur.execute(f"ALTER TABLE {fingerprints} ADD PRIMARY KEY ({pk_str})")
+                    cur.execute(f"COMMENT ON TABLE {fingerprints} IS %s", (_ROW_HASHER,))
+                cur.execute(f"DROP TABLE {fp_new}")
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error: finishing delta for {table_name}: {e}")
+            raise
+
+        seen, changed = self._delta_stats.pop(table_name, [0, 0])
+        logger.info(f"Delta {table_name}: {changed:,} of {seen:,} rows upserted, {deleted:,} deleted")
+
+    def table_is_empty(self, table_name: str) -> bool:
+        """True when table_name has no rows (a first load)."""
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table_name})")
+            empty = cur.fetchone()[0]
+        self.conn.rollback()
+        return empty
+
+    def get_table_dependencies(self) -> Dict[str, Set[str]]:
+        """Map each table to the tables its foreign keys reference (self-references excluded)."""
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.conrelid::regclass::text, c.confrelid::regclass::text
+                FROM pg_constraint c
+                JOIN pg_namespace n ON n.oid = c.connamespace
+                WHERE c.contype = 'f' AND n.nspname = current_schema() AND c.conrelid <> c.confrelid
+                """
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        dependencies: Dict[str, Set[str]] = {}
+        for table, referenced in rows:
+            dependencies.setdefault(table, set()).add(referenced)
+        return dependencies
+
+    def drop_secondary_indexes(self, table_name: str) -> List[str]:
+        """Drop the plain (non-unique, non-constraint) indexes of table_name.
+
+        Their definitions go to deferred_indexes in the same transaction,
+        so rebuild_deferred_indexes restores them even after a crashed run.
+        PK and unique indexes stay: the upsert path relies on them.
+        """
+        self.connect()
+        try:
+            with self.conn.cursor() as cur:
+                self._ensure_deferred_indexes_table(cur)
+                cur.execute(
+                    """
+                    SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE i.indrelid = %s::regclass
+                      AND NOT i.indisunique
+                      AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+                    ORDER BY c.relname
+                    """,
+                    (table_name,),
+                )
+                indexes = cur.fetchall()
+                for name, indexdef in indexes:
+                    cur.execute(
+                        """INSERT INTO deferred_indexes (index_name, table_name, definition)
+                           VALUES (%s, %s, %s)
+                           ON CONFLICT (index_name) DO NOTHING""",
+                        (name, table_name, indexdef.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)),
+                    )
+                    cur.execute(f"DROP INDEX {name}")
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        names = [name for name, _ in indexes]
+        if names:
+            logger.info(f"Dropped {len(names)} indexes on {table_name} until the load finishes")
+        return names
+
+    def rebuild_deferred_indexes(
+        self, workers: int = 2, maintenance_work_mem: str = "512MB", parallel_workers: int = 2
+    ) -> List[str]:
+        """Recreate every index recorded by drop_secondary_indexes.
+
+        Up to workers indexes build at once, each on its own connection with
+        maintenance_work_mem raised for the session so the sort stays in
+        memory, and max_parallel_maintenance_workers set to parallel_workers
+        so each build's sort can also run in parallel (capped server-side by
+        max_parallel_workers). An index leaves deferred_indexes only once it
+        exists again.
+        """
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('deferred_indexes')")
+            if cur.fetchone()[0] is None:
+                self.conn.rollback()
+                return []
+            cur.execute("SELECT index_name, definition FROM deferred_indexes ORDER BY table_name, index_name")
+            indexes = cur.fetchall()
+        self.conn.rollback()
+
+        if not indexes:
+            return []
+
+        logger.info(f"Rebuilding {len(indexes)} deferred indexes ({workers} at a time)")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(self._build_deferred_index, name, definition, maintenance_work_mem, parallel_workers)
+                for name, definition in indexes
+            ]
+            for future in futures:
+                future.result()
+        return [name for name, _ in indexes]
+
+    def _build_deferred_index(self, name: str, definition: str, maintenance_work_mem: str, parallel_workers: int):
+        """CREATE one deferred index on a connection of its own."""
+        worker = Database(self.database_url, retry_attempts=self.retry_attempts, retry_delay=self.retry_delay)
+        worker.connect()
+        worker.conn.autocommit = True
+        try:
+            with worker.conn.cursor() as cur:
+                cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+                cur.execute("SET max_parallel_maintenance_workers = %s", (parallel_workers,))
+                start = time.monotonic()
+                cur.execute(definition)
+                cur.execute("DELETE FROM deferred_indexes WHERE index_name = %s", (name,))
+                logger.info(f"  {name}: rebuilt in {time.monotonic() - start:.1f}s")
+        finally:
+            worker.disconnect()
+
+    @staticmethod
+    def _ensure_file_fingerprints_table(cur):
+        # Databases created before unchanged files were carried forward lack this table
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS file_fingerprints (
+                   directory VARCHAR(50) NOT NULL,
+                   filename VARCHAR(255) NOT NULL,
+                   size BIGINT NOT NULL,
+                   content_key TEXT NOT NULL,
+                   PRIMARY KEY (directory, filename)
+               )"""
+        )
+
+    @staticmethod
+    def _ensure_processed_versions_table(cur):
+        # Databases created before listing versions were recorded lack this table
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS processed_file_versions (
+                   directory VARCHAR(50) NOT NULL,
+                   filename VARCHAR(255) NOT NULL,
+                   version TEXT NOT NULL,
+                   PRIMARY KEY (directory, filename)
+               )"""
+        )
+
+    @staticmethod
+    def _ensure_deferred_indexes_table(cur):
+        # Databases created before deferred index builds lack this table
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS deferred_indexes (
+                   index_name TEXT PRIMARY KEY,
+                   table_name TEXT NOT NULL,
+                   definition TEXT NOT NULL,
+                   dropped_at TIMESTAMP DEFAULT NOW()
+               )"""
+        )
+
+    def _copy_to_temp(self, cur, df: pl.DataFrame, temp_table: str, columns: List[str], like_table: str = ""):
+        """COPY DataFrame to temp table, streamed COPY_SLICE_ROWS rows at a time.
+
+        copy_format "csv" (default) writes each slice with Polars' CSV
+        writer; "binary" encodes it from the Arrow buffers in Postgres
+        binary format (see _binary_copy_chunks), so the server skips text
+        parsing at the cost of more client CPU. Either way only the slice
+        being sent is serialized, never the whole batch. Binary needs the
+        column types of like_table (the table temp_table was created LIKE,
+        defaulting to temp_table itself); a type without a binary encoder
+        here falls back to CSV.
+        """
         columns_str = ", ".join([f'"{col}"' for col in columns])
-        csv_bytes = df.write_csv(include_header=False).encode("utf-8", errors="replace")
-        csv_bytes = csv_bytes.replace(b"\x00", b"")
+
+        if self.copy_format == "binary":
+            column_types = self._get_column_types(cur, like_table or temp_table)
+            pg_types = [column_types.get(col, "text") for col in columns]
+            if all(pg_type in _BINARY_TYPES for pg_type in pg_types):
+                cur.copy_expert(
+                    f"COPY {temp_table} ({columns_str}) FROM STDIN WITH (FORMAT binary)",
+                    _ChunkStream(_binary_copy_chunks(df.select(columns), pg_types)),
+                    size=COPY_READ_BYTES,
+                )
+                return
 
         cur.copy_expert(
             f"COPY {temp_table} ({columns_str}) FROM STDIN WITH CSV ENCODING 'UTF8'",
-            io.BytesIO(csv_bytes),
+            _ChunkStream(_csv_copy_chunks(df)),
+            size=COPY_READ_BYTES,
+        )
+
+    def _get_column_types(self, cur, table_name: str) -> Dict[str, str]:
+        """Get column name -> type (as regtype text) for a table with caching."""
+        if table_name in self._column_type_cache:
+            return self._column_type_cache[table_name]
+
+        cur.execute(
+            """
+            SELECT a.attname, a.atttypid::regtype::text
+            FROM pg_attribute a
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+            """,
+            (table_name,),
         )
 
+        column_types = {name: pg_type for name, pg_type in cur.fetchall()}
+        self._column_type_cache[table_name] = column_types
+        return column_types
+
     def _get_primary_keys(self, cur, table_name: str) -> List[str]:
         """Get primary key columns for a table with caching."""
         if table_name in self._pk_cache:
@@ -226,7 +968,24 @@ class Database:
         return primary_keys
 
     def _upsert_from_temp(self, cur, temp_table: str, target_table: str, columns: List[str], primary_keys: List[str]):
-        """Upsert from temp to target table."""
+        """Upsert from temp to target table with a statement prepared once per connection.
+
+        The first batch for a (temp, target, columns) PREPAREs the INSERT ...
+        ON CONFLICT; every batch EXECUTEs it, so it is parsed and planned
+        once per connection instead of once per batch. Prepared statements
+        outlive rolled-back transactions, and Postgres re-plans one whose
+        temp table was dropped and recreated.
+        """
+        key = (temp_table, target_table, tuple(columns), tuple(primary_keys))
+        name = self._prepared_upserts.get(key)
+        if name is None:
+            name = f"upsert_{len(self._prepared_upserts)}"
+            cur.execute(f"PREPARE {name} AS {self._build_upsert_sql(temp_table, target_table, columns, primary_keys)}")
+            self._prepared_upserts[key] = name
+        cur.execute(f"EXECUTE {name}")
+
+    @staticmethod
+    def _build_upsert_sql(temp_table: str, target_table: str, columns: List[str], primary_keys: List[str]) -> str:
         columns_str = ", ".join([f'"{col}"' for col in columns])
         pk_str = ", ".join([f'"{pk}"' for pk in primary_keys])
 
@@ -235,9 +994,69 @@ class Database:
         if update_clause:
             update_clause += ", data_atualizacao = CURRENT_TIMESTAMP"
 
-        sql = f"""
+        return f"""
             INSERT INTO {target_table} ({columns_str})
             SELECT DISTINCT ON ({pk_str}) {columns_str} FROM {temp_table} ORDER BY {pk_str}
             ON CONFLICT ({pk_str}) {"DO UPDATE SET " + update_clause if update_clause else "DO NOTHING"}
         """
-        cur.execute(sql)
+
+
+class DatabasePool:
+    """Bounded pool of Database handles lent to worker threads.
+
+    A handle keeps its connection and its per-connection caches (primary
+    keys, column types, prepared upserts) across loans, so connection setup and
+    catalog lookups happen once per pool slot instead of once per file.
+    Handles are health-checked with Database.ping before each loan; a dead
+    one is disconnected and reconnects lazily.
+    """
+
+    def __init__(self, size: int, database_url: str, **database_kwargs):
+        self.database_url = database_url
+        self._database_kwargs = database_kwargs
+        self._slots = threading.BoundedSemaphore(size)
+        # LIFO so the most recently used (warmest) connection is lent first.
+        self._idle: queue.LifoQueue[Database] = queue.LifoQueue()
+        self._all: List[Database] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, pre_truncated: Set[str] | None = None) -> Iterator[Database]:
+        """Borrow a Database; blocks while all `size` handles are in use.
+
+        pre_truncated tables are added to the handle's truncated set, the
+        same contract as Database(pre_truncated=...).
+        """
+        self._slots.acquire()
+        try:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                db = Database(self.database_url, **self._database_kwargs)
+                with self._lock:
+                    self._all.append(db)
+
+            if not db.ping():
+                logger.warning("Pooled connection failed health check, reconnecting")
+                try:
+                    db.disconnect()
+                except psycopg2.Error:
+                    db.conn = None
+            if pre_truncated:
+                db._truncated_tables.update(pre_truncated)
+
+            try:
+                yield db
+            finally:
+                self._idle.put(db)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Disconnect every handle the pool has created."""
+        with self._lock:
+            for db in self._all:
+                db.disconnect()
+            self._all.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
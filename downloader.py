@@ -1,24 +1,30 @@
 """Download and extract CNPJ data files from Receita Federal."""
 
+import io
+import json
 import logging
 import os
 import re
+import struct
 import time
 import zipfile
+import zlib
+from collections import deque
 from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass
 from pathlib import Path
 from threading import Condition, Lock
 from time import monotonic
-from typing import Callable, Iterator, List, Mapping, Tuple
+from typing import BinaryIO, Callable, Dict, Iterator, List, Mapping, Tuple
 from xml.etree import ElementTree
 
 import requests
 import urllib3.exceptions
 from tqdm import tqdm
 
-from config import Config
+from config import Config, parse_size
+from zip_cache import ZIP_TAIL_BYTES, ZipCache, ZipTail, zip_content_key
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +69,44 @@ class DownloadStalledError(DownloadIncompleteError):
 # Ceiling for the exponential no-progress retry backoff in _download_zip.
 MAX_RETRY_BACKOFF_SECONDS = 120
 
+# Segmented downloads (DOWNLOAD_SEGMENTS > 1): no segment is smaller than
+# this, so small files keep a single stream.
+MIN_SEGMENT_BYTES = 16 * 1024 * 1024
+# A segment's progress is written to the resume state at least this often.
+SEGMENT_STATE_INTERVAL = 8 * 1024 * 1024
+
+# Sidecar written next to a kept ZIP once its CRCs have been checked:
+# {"size", "mtime_ns", "crc32": {member: crc}}. A cached ZIP whose stat
+# and central directory still match is reused without decompressing it.
+ZIP_MANIFEST_SUFFIX = ".crc.json"
+
+# Parsed PROPFIND listings kept in temp_dir across runs (LISTING_CACHE):
+# {url: {"etag": collection etag, "entries": {href: [size, etag, last_modified]}}}.
+# A Depth: 0 PROPFIND revalidates one against the collection's ETag.
+LISTING_CACHE_FILE = ".listing-cache.json"
+
+# Bytes per read while streaming a download: one Python-level write per
+# chunk, so larger chunks cost less CPU per GB than requests' 8 KiB default.
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class RemoteFile:
+    """WebDAV properties of one listed entry."""
+
+    size: int | None
+    etag: str | None
+    last_modified: str | None
+
+    @property
+    def version(self) -> str | None:
+        """Changes whenever the remote bytes do: the ETag, else size and Last-Modified."""
+        if self.etag:
+            return self.etag
+        if self.size is not None and self.last_modified:
+            return f"{self.size}@{self.last_modified}"
+        return None
+
 
 @dataclass(frozen=True)
 class ConcurrencyDegradation:
@@ -147,35 +191,442 @@ class AdaptiveDownloadConcurrency:
         return current_concurrency
 
 
+class _SegmentState:
+    """Byte ranges of one ZIP fetched over separate connections, with resume state.
+
+    Data goes straight to its offset in a preallocated data file; the state
+    file records each segment's [start, end] and how many of its bytes are
+    on disk, so a retry (or the next run) requests only what is missing.
+    A segment's count is saved only after its bytes are flushed.
+    """
+
+    def __init__(self, data_path: Path, state_path: Path, total: int, segments: List[List[int]]):
+        self.data_path = data_path
+        self.state_path = state_path
+        self.total = total
+        self.segments = segments  # [start, end, done]
+        self._lock = Lock()
+        self._discarded = False
+
+    @classmethod
+    def create(cls, data_path: Path, state_path: Path, total: int, count: int) -> "_SegmentState":
+        size = -(-total // count)
+        segments = [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+        with data_path.open("wb") as f:
+            f.truncate(total)
+        state = cls(data_path, state_path, total, segments)
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, data_path: Path, state_path: Path) -> "_SegmentState | None":
+        """The saved state, or None (and nothing on disk) if it is missing or unusable."""
+        try:
+            saved = json.loads(state_path.read_text())
+            state = cls(data_path, state_path, saved["total"], saved["segments"])
+            if data_path.stat().st_size == state.total:
+                return state
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        state = cls(data_path, state_path, 0, [])
+        state.discard()
+        return None
+
+    @classmethod
+    def done_bytes_on_disk(cls, state_path: Path) -> int:
+        try:
+            return sum(done for _, _, done in json.loads(state_path.read_text())["segments"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    @property
+    def pending(self) -> List[int]:
+        return [i for i, (start, end, done) in enumerate(self.segments) if start + done <= end]
+
+    def update(self, index: int, done: int) -> None:
+        with self._lock:
+            self.segments[index][2] = done
+            if not self._discarded:
+                self.save()
+
+    def save(self) -> None:
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"total": self.total, "segments": self.segments}))
+        tmp_path.replace(self.state_path)
+
+    def discard(self) -> None:
+        with self._lock:
+            self._discarded = True
+            self.state_path.unlink(missing_ok=True)
+            self.data_path.unlink(missing_ok=True)
+
+
+class ZipMember:
+    """A CSV inside a downloaded ZIP, read in place instead of extracted.
+
+    Quacks like the extracted CSV Path for everything the workers use
+    (name, open("rb"), exists, unlink), so process_file and the cleanup
+    logic in main don't need to know which mode produced it. Members of
+    one archive share a pending set; the ZIP is deleted only when the
+    last of them is unlinked.
+    """
+
+    def __init__(self, zip_path: Path, member: str, pending: set[str]):
+        self.zip_path = zip_path
+        self.member = member
+        self.name = Path(member).name
+        self._pending = pending
+
+    def open(self, mode: str = "rb") -> BinaryIO:
+        """Open a decompressing stream over the member.
+
+        The returned stream keeps its own reference to the archive file,
+        so closing the ZipFile here does not cut it off.
+        """
+        if mode != "rb":
+            raise ValueError(f"ZipMember only supports mode 'rb', got {mode!r}")
+        with zipfile.ZipFile(self.zip_path, "r") as zip_ref:
+            return zip_ref.open(self.member)
+
+    def exists(self) -> bool:
+        return self.member in self._pending and self.zip_path.exists()
+
+    def unlink(self, missing_ok: bool = False) -> None:
+        self._pending.discard(self.member)
+        if not self._pending:
+            self.zip_path.unlink(missing_ok=True)
+
+    def __repr__(self) -> str:
+        return f"ZipMember({self.zip_path.name}!{self.member})"
+
+
+# Fixed part of a ZIP local file header (APPNOTE 4.3.7), before name and extra
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class _GrowingDownload:
+    """How much of a ZIP is on disk while it downloads, for readers following it.
+
+    The downloader reports the size of the contiguous prefix in the .part
+    file after every chunk; a smaller size means the .part was restarted
+    from byte 0 (a new file, hence a new generation). finish() points
+    readers at the completed ZIP; fail() hands them the download error.
+    """
+
+    def __init__(self, zip_path: Path, part_path: Path):
+        self.zip_path = zip_path
+        self.part_path = part_path
+        self._changed = Condition()
+        self._size = 0
+        self._generation = 0
+        self._done = False
+        self._error: BaseException | None = None
+
+    def wrote(self, size: int) -> None:
+        with self._changed:
+            if size < self._size:
+                self._generation += 1
+            self._size = size
+            self._changed.notify_all()
+
+    def finish(self) -> None:
+        with self._changed:
+            self._size = self.zip_path.stat().st_size
+            self._done = True
+            self._changed.notify_all()
+
+    def fail(self, error: BaseException) -> None:
+        with self._changed:
+            self._error = error
+            self._changed.notify_all()
+
+    def wait_done(self) -> None:
+        """Block until the download ends; raises its error."""
+        with self._changed:
+            while not self._done and self._error is None:
+                self._changed.wait()
+            if self._error is not None:
+                raise self._error
+
+    def wait_beyond(self, offset: int) -> tuple[Path, int, int, bool]:
+        """Block until bytes past offset are on disk or the download ends.
+
+        Returns (path, generation, size, done); raises the download's error.
+        """
+        with self._changed:
+            while self._size <= offset and not self._done and self._error is None:
+                self._changed.wait()
+            if self._error is not None:
+                raise self._error
+            path = self.zip_path if self._done else self.part_path
+            return path, self._generation, self._size, self._done
+
+
+class _GrowingZipReader(io.RawIOBase):
+    """Inflate the first member of a ZIP while the ZIP is still downloading.
+
+    Reads the local file header, then feeds the member's deflate (or
+    stored) data through zlib as the .part file grows. At the end of the
+    member it waits for the download to finish and checks the CRC-32 and
+    size against the central directory; that is the member's CRC check.
+    """
+
+    def __init__(self, download: _GrowingDownload):
+        self._download = download
+        self._file: BinaryIO | None = None
+        self._source: tuple[Path, int] | None = None
+        self._offset = 0
+        self._crc = 0
+        self._size = 0
+        self._eof = False
+
+        signature, _, flags, method, _, _, _, compressed_size, _, name_length, extra_length = LOCAL_HEADER.unpack(
+            self._read_exact(LOCAL_HEADER.size)
+        )
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"{download.zip_path.name} does not start with a local file header")
+        self.member = self._read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        self._read_exact(extra_length)
+        if flags & 0x1:
+            raise zipfile.BadZipFile(f"{self.member} in {download.zip_path.name} is encrypted")
+        if method == zipfile.ZIP_DEFLATED:
+            self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif method == zipfile.ZIP_STORED and not flags & 0x8 and compressed_size != 0xFFFFFFFF:
+            self._inflater = None
+            self._stored_left = compressed_size
+        else:
+            raise zipfile.BadZipFile(f"Cannot stream {self.member}: compression method {method}, flags {flags:#x}")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._eof:
+            if self._inflater is None:
+                data = self._read_compressed(min(len(buffer), self._stored_left)) if self._stored_left else b""
+                self._stored_left -= len(data)
+                ended = self._stored_left == 0
+            else:
+                data = b""
+                if not self._inflater.eof:
+                    compressed = self._inflater.unconsumed_tail or self._read_compressed(DOWNLOAD_CHUNK_BYTES)
+                    data = self._inflater.decompress(compressed, len(buffer))
+                ended = self._inflater.eof
+            if data:
+                self._crc = zlib.crc32(data, self._crc)
+                self._size += len(data)
+                buffer[: len(data)] = data
+                return len(data)
+            if ended:
+                self._verify()
+        return 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        super().close()
+
+    def _read_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            data += self._read_compressed(size - len(data))
+        return data
+
+    def _read_compressed(self, size: int) -> bytes:
+        """Up to size bytes of the ZIP from the current offset, waiting for the download."""
+        while True:
+            path, generation, available, done = self._download.wait_beyond(self._offset)
+            if self._offset >= available:
+                raise zipfile.BadZipFile(f"{self._download.zip_path.name} ends inside its first member")
+            if self._source != (path, generation):
+                try:
+                    new_file = path.open("rb")
+                except FileNotFoundError:
+                    # Renamed to the ZIP, or restarted, between the wait and the open
+                    time.sleep(0.01)
+                    continue
+                if self._file is not None:
+                    self._file.close()
+                self._file, self._source = new_file, (path, generation)
+            self._file.seek(self._offset)
+            data = self._file.read(min(size, available - self._offset))
+            self._offset += len(data)
+            return data
+
+    def _verify(self) -> None:
+        self._download.wait_beyond(float("inf"))
+        with zipfile.ZipFile(self._download.zip_path) as zip_ref:
+            info = zip_ref.getinfo(self.member)
+        if (info.CRC, info.file_size) != (self._crc, self._size):
+            raise zipfile.BadZipFile(
+                f"Bad CRC-32 for {self.member}: read {self._size} bytes with CRC {self._crc:08x}, "
+                f"central directory says {info.file_size} bytes with CRC {info.CRC:08x}"
+            )
+        self._eof = True
+
+
+class GrowingZipMember(ZipMember):
+    """The first CSV of a ZIP that is still downloading, inflated as bytes arrive.
+
+    Used by download_files with config.extract_while_downloading, so
+    process_file parses a file while the rest of it is still in flight.
+    Constructing one blocks until the local header (the member name) is
+    on disk; each open() starts a new reader from the top of the member.
+    """
+
+    def __init__(self, download: _GrowingDownload, pending: set[str]):
+        with _GrowingZipReader(download) as reader:
+            member = reader.member
+        pending.add(member)
+        super().__init__(download.zip_path, member, pending)
+        self._download = download
+
+    def open(self, mode: str = "rb") -> BinaryIO:
+        if mode != "rb":
+            raise ValueError(f"GrowingZipMember only supports mode 'rb', got {mode!r}")
+        return io.BufferedReader(_GrowingZipReader(self._download), buffer_size=DOWNLOAD_CHUNK_BYTES)
+
+    def exists(self) -> bool:
+        return self.member in self._pending
+
+
 class Downloader:
     """Download and extract CNPJ data files with parallel support."""
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, listings: Dict[str, Dict[str, RemoteFile]] | None = None):
+        """listings: another Downloader's fetched_listings(), reused instead of listing again."""
         self.config = config
         self.temp_path = Path(config.temp_dir)
         self.temp_path.mkdir(exist_ok=True)
         self.auth = (config.share_token, "")
+        self.session = self._new_session(config)
+        # ZIPs being read while they download (extract_while_downloading)
+        self._growing: dict[Path, _GrowingDownload] = {}
+        # Listings already fetched or revalidated this run, by URL
+        self._listings: dict[str, Dict[str, RemoteFile]] = dict(listings or {})
+        self._listings_lock = Lock()
+        # Content key (zip_cache.zip_content_key) of each ZIP fetched this run
+        self._content_keys: dict[tuple[str, str], str] = {}
+        self.zip_cache = (
+            ZipCache(Path(config.zip_cache_dir), parse_size(config.zip_cache_size)) if config.zip_cache_dir else None
+        )
+
+    @staticmethod
+    def _new_session(config: Config) -> requests.Session:
+        """One keep-alive connection pool for every request of the run.
 
-    def _propfind(self, path: str = "") -> ElementTree.Element:
+        Sized for every stream that can be open at once (each file, or each
+        segment of one), so PROPFINDs, retries and later files reuse warm
+        TCP/TLS connections instead of opening a new one per request.
+        """
+        session = requests.Session()
+        pool_size = max(1, config.download_workers) * max(1, config.download_segments)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _propfind(self, path: str = "", depth: str = "1") -> ElementTree.Element:
         """Execute a WebDAV PROPFIND request and return parsed XML."""
-        url = f"{self.config.base_url}/{path}".rstrip("/") + "/"
-        response = requests.request(
+        url = self._listing_url(path)
+        if self.config.download_engine == "asyncio":
+            from async_downloader import AsyncDownloadEngine
+
+            return ElementTree.fromstring(AsyncDownloadEngine(self).propfind(url, depth))
+        response = self.session.request(
             "PROPFIND",
             url,
             auth=self.auth,
-            headers={"Depth": "1"},
+            headers={"Depth": depth},
             timeout=(self.config.connect_timeout, self.config.read_timeout),
         )
         response.raise_for_status()
         return ElementTree.fromstring(response.content)
 
+    def _listing_url(self, path: str) -> str:
+        return f"{self.config.base_url}/{path}".rstrip("/") + "/"
+
+    def _listing(self, path: str = "") -> Dict[str, RemoteFile]:
+        """Entries of a WebDAV collection by href, fetched at most once per run.
+
+        With LISTING_CACHE, a listing saved by an earlier run is reused when
+        a Depth: 0 PROPFIND shows the collection's ETag unchanged, instead
+        of fetching every entry's properties again.
+        """
+        url = self._listing_url(path)
+        with self._listings_lock:
+            if url in self._listings:
+                return self._listings[url]
+
+            cached = self._load_listing_cache().get(url) if self.config.listing_cache else None
+            if (
+                cached
+                and cached.get("etag")
+                and self._collection_etag(self._propfind(path, depth="0")) == cached["etag"]
+            ):
+                logger.debug(f"Listing of {url} unchanged (ETag {cached['etag']})")
+                entries = {href: RemoteFile(*props) for href, props in cached["entries"].items()}
+            else:
+                root = self._propfind(path)
+                entries = {
+                    response.find("d:href", DAV_NS).text: self._remote_file(response)
+                    for response in root.findall("d:response", DAV_NS)
+                }
+                if self.config.listing_cache:
+                    self._save_listing_cache(url, self._collection_etag(root), entries)
+
+            self._listings[url] = entries
+            return entries
+
+    def fetched_listings(self) -> Dict[str, Dict[str, RemoteFile]]:
+        """The listings fetched so far this run, by URL; see __init__."""
+        with self._listings_lock:
+            return dict(self._listings)
+
+    @staticmethod
+    def _remote_file(response: ElementTree.Element) -> RemoteFile:
+        def prop(name: str) -> str | None:
+            element = response.find(f"d:propstat/d:prop/d:{name}", DAV_NS)
+            return element.text if element is not None and element.text else None
+
+        length = prop("getcontentlength")
+        return RemoteFile(int(length) if length else None, prop("getetag"), prop("getlastmodified"))
+
+    @staticmethod
+    def _collection_etag(root: ElementTree.Element) -> str | None:
+        """ETag of the listed collection itself: its href prefixes every other entry's."""
+        responses = root.findall("d:response", DAV_NS)
+        if not responses:
+            return None
+        collection = min(responses, key=lambda response: len(response.find("d:href", DAV_NS).text))
+        return Downloader._remote_file(collection).etag
+
+    def _load_listing_cache(self) -> dict:
+        try:
+            return json.loads((self.temp_path / LISTING_CACHE_FILE).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _save_listing_cache(self, url: str, etag: str | None, entries: Dict[str, RemoteFile]) -> None:
+        listings = self._load_listing_cache()
+        if etag:
+            listings[url] = {
+                "etag": etag,
+                "entries": {href: [e.size, e.etag, e.last_modified] for href, e in entries.items()},
+            }
+        else:
+            # Nothing to revalidate against
+            listings.pop(url, None)
+        cache_path = self.temp_path / LISTING_CACHE_FILE
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(listings))
+        tmp_path.replace(cache_path)
+
     def get_available_directories(self) -> List[str]:
         """Get all available data directories from Receita Federal."""
-        root = self._propfind()
-
         directories = []
-        for response in root.findall("d:response", DAV_NS):
-            href = response.find("d:href", DAV_NS).text
+        for href in self._listing():
             # Match YYYY-MM directory pattern from href path
             match = re.search(r"(\d{4}-\d{2})/?$", href)
             if match:
@@ -192,24 +643,34 @@ class Downloader:
 
     def get_directory_files(self, directory: str) -> List[str]:
         """Get list of ZIP files in a directory."""
-        root = self._propfind(directory)
+        return list(self.get_remote_files(directory))
+
+    def get_file_sizes(self, directory: str) -> Dict[str, int]:
+        """Get the size in bytes of each ZIP file in a directory, where the server reports it."""
+        return {name: info.size for name, info in self.get_remote_files(directory).items() if info.size is not None}
 
-        files = []
-        for response in root.findall("d:response", DAV_NS):
-            href = response.find("d:href", DAV_NS).text
+    def get_file_versions(self, directory: str) -> Dict[str, str]:
+        """Get a version token (ETag, else size and Last-Modified) of each ZIP file in a directory."""
+        return {name: info.version for name, info in self.get_remote_files(directory).items() if info.version}
+
+    def get_remote_files(self, directory: str) -> Dict[str, RemoteFile]:
+        """Get the listed WebDAV properties of each ZIP file in a directory."""
+        files = {}
+        for href, info in self._listing(directory).items():
             # Extract .zip filenames from href
             match = re.search(r"/([^/]+\.zip)$", href, re.IGNORECASE)
             if match:
-                files.append(match.group(1))
+                files[match.group(1)] = info
 
         return files
 
-    def download_file(self, directory: str, filename: str) -> List[Path]:
-        """Download and extract a single ZIP file. Returns list of extracted CSV paths."""
+    def download_file(self, directory: str, filename: str) -> List[Path | ZipMember]:
+        """Download and extract a single ZIP file. Returns list of extracted CSV paths
+        (ZipMember handles instead when config.stream_from_zip is set)."""
         self._prune_stale_partials(directory)
         return self._download_and_extract(directory, filename)
 
-    def download_files(self, directory: str, files: List[str]) -> Iterator[Tuple[Path, str]]:
+    def download_files(self, directory: str, files: List[str]) -> Iterator[Tuple[Path | ZipMember, str]]:
         """
         Download files with parallel support.
 
@@ -224,6 +685,12 @@ class Downloader:
 
         self._prune_stale_partials(directory)
 
+        if self.config.download_engine == "asyncio":
+            from async_downloader import AsyncDownloadEngine
+
+            yield from AsyncDownloadEngine(self).download_files(directory, files)
+            return
+
         # Split into reference and data files
         reference_files = [f for f in files if f in REFERENCE_FILES]
         data_files = [f for f in files if f not in REFERENCE_FILES]
@@ -232,6 +699,10 @@ class Downloader:
             self.config.stall_degrade_threshold,
         )
 
+        if self.config.extract_while_downloading:
+            yield from self._download_while_extracting(directory, reference_files, data_files, adaptive_concurrency)
+            return
+
         # Process reference files first (sequentially)
         for filename in reference_files:
             for csv_path in self._download_and_extract(directory, filename, adaptive_concurrency):
@@ -246,11 +717,11 @@ class Downloader:
         directory: str,
         files: List[str],
         adaptive_concurrency: AdaptiveDownloadConcurrency,
-    ) -> Iterator[Tuple[Path, str]]:
+    ) -> Iterator[Tuple[Path | ZipMember, str]]:
         """Download data files in parallel using ThreadPoolExecutor."""
         with ThreadPoolExecutor(max_workers=self.config.download_workers) as executor:
             next_file_index = 0
-            future_to_filename: dict[Future[List[Path]], str] = {}
+            future_to_filename: dict[Future[List[Path | ZipMember]], str] = {}
 
             def submit_until_limit() -> None:
                 nonlocal next_file_index
@@ -270,7 +741,7 @@ class Downloader:
             submit_until_limit()
             while future_to_filename:
                 completed_futures, _ = wait(future_to_filename, return_when=FIRST_COMPLETED)
-                completed_downloads: list[tuple[str, List[Path]]] = []
+                completed_downloads: list[tuple[str, List[Path | ZipMember]]] = []
                 for future in completed_futures:
                     filename = future_to_filename.pop(future)
                     extracted_files = future.result()
@@ -281,13 +752,138 @@ class Downloader:
                     for csv_path in extracted_files:
                         yield csv_path, filename
 
+    def _download_while_extracting(
+        self,
+        directory: str,
+        reference_files: List[str],
+        data_files: List[str],
+        adaptive_concurrency: AdaptiveDownloadConcurrency,
+    ) -> Iterator[Tuple[Path | ZipMember, str]]:
+        """download_files for config.extract_while_downloading.
+
+        Each ZIP's CSV is yielded as a GrowingZipMember once its local header
+        is on disk, so parsing overlaps the download. ZIPs are yielded in the
+        order they start; reference files one at a time, then up to the
+        current concurrency of data files downloading at once.
+        """
+        slug = self._directory_slug(directory)
+        with ThreadPoolExecutor(max_workers=self.config.download_workers) as executor:
+            for phase_files, limit in (
+                (reference_files, lambda: 1),
+                (data_files, lambda: adaptive_concurrency.current_concurrency),
+            ):
+                started: deque[tuple[str, _GrowingDownload, Future[Path]]] = deque()
+                next_file_index = 0
+                while next_file_index < len(phase_files) or started:
+                    while next_file_index < len(phase_files) and len(started) < limit():
+                        filename = phase_files[next_file_index]
+                        next_file_index += 1
+                        zip_path = self.temp_path / filename
+                        download = _GrowingDownload(zip_path, zip_path.with_name(f"{zip_path.name}.{slug}.part"))
+                        self._growing[zip_path] = download
+                        future = executor.submit(self._fetch_growing, directory, filename, adaptive_concurrency)
+                        started.append((filename, download, future))
+
+                    filename, download, future = started.popleft()
+                    try:
+                        yield from self._growing_members(filename, download, future)
+                    finally:
+                        self._growing.pop(download.zip_path, None)
+
+    def _fetch_growing(self, directory: str, filename: str, adaptive: AdaptiveDownloadConcurrency) -> Path:
+        download = self._growing[self.temp_path / filename]
+        try:
+            zip_path = self._fetch_zip(directory, filename, adaptive)
+        except BaseException as exc:
+            download.fail(exc)
+            raise
+        download.finish()
+        return zip_path
+
+    def _growing_members(
+        self, filename: str, download: _GrowingDownload, future: Future[Path]
+    ) -> Iterator[Tuple[ZipMember, str]]:
+        zip_path = download.zip_path
+        # The ZIP's own name holds it until every member is known; members
+        # past the first are only listed once the central directory is in.
+        pending = {zip_path.name}
+        member = GrowingZipMember(download, pending)
+        if self._is_cnpj_member(member.member):
+            yield member, filename
+        else:
+            pending.discard(member.member)
+
+        future.result()
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            others = [m for m in zip_ref.namelist() if m != member.member and self._is_cnpj_member(m)]
+        pending.update(others)
+        for other in others:
+            yield ZipMember(zip_path, other, pending), filename
+        pending.discard(zip_path.name)
+        if not pending and not self.config.keep_files:
+            zip_path.unlink(missing_ok=True)
+
+    def refetch(self, directory: str, filename: str, member: ZipMember) -> ZipMember:
+        """Download filename again after member failed its CRC check while being read.
+
+        For members read while their ZIP downloads, which can only be
+        checked at their end. The new ZIP replaces the corrupt one at the
+        same path and is CRC-checked before member is handed back, to be
+        read again in place.
+        """
+        download = self._growing.get(member.zip_path)
+        if download is not None:
+            download.wait_done()
+        member.zip_path.unlink(missing_ok=True)
+        self._manifest_path(member.zip_path).unlink(missing_ok=True)
+        if self.zip_cache is not None:
+            self.zip_cache.forget(f"{directory}/{filename}")
+        zip_path = self._fetch_zip(directory, filename)
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            bad_member = zip_ref.testzip()
+        if bad_member is not None:
+            zip_path.unlink(missing_ok=True)
+            raise zipfile.BadZipFile(f"{filename} is still corrupt after downloading it again: {bad_member}")
+        if self.config.keep_files:
+            self._write_manifest(zip_path)
+        return ZipMember(zip_path, member.member, member._pending)
+
+    def download_zip(
+        self,
+        directory: str,
+        filename: str,
+        adaptive: AdaptiveDownloadConcurrency | None = None,
+    ) -> Path:
+        """Download a single ZIP file without extracting it; see extract_zip."""
+        self._prune_stale_partials(directory)
+        return self._fetch_zip(directory, filename, adaptive)
+
     def _download_and_extract(
         self,
         directory: str,
         filename: str,
         adaptive: AdaptiveDownloadConcurrency | None = None,
-    ) -> List[Path]:
-        """Download a single ZIP file and extract CSV files."""
+    ) -> List[Path | ZipMember]:
+        """Download a single ZIP file and extract CSV files.
+
+        Extraction is the ZIP's one decompression pass and checks every
+        CRC; a mismatch means a corrupt download, fetched again once.
+        """
+        zip_path = self._fetch_zip(directory, filename, adaptive)
+        try:
+            return self.extract_zip(zip_path)
+        except zipfile.BadZipFile as exc:
+            logger.warning(f"{filename} failed its CRC check while extracting ({exc}); downloading it again")
+            if self.zip_cache is not None:
+                self.zip_cache.forget(f"{directory}/{filename}")
+            return self.extract_zip(self._fetch_zip(directory, filename, adaptive))
+
+    def _fetch_zip(
+        self,
+        directory: str,
+        filename: str,
+        adaptive: AdaptiveDownloadConcurrency | None = None,
+    ) -> Path:
         url = f"{self.config.base_url}/{directory}/{filename}"
         zip_path = self.temp_path / filename
 
@@ -295,24 +891,134 @@ class Downloader:
         # Use info logging when tqdm is disabled (e.g., Docker, CI)
         log = logger.info if os.environ.get("TQDM_DISABLE") else logger.debug
 
-        if self.config.keep_files and zip_path.exists() and self._cached_zip_is_valid(zip_path):
+        if self._restore_from_zip_cache(directory, filename, zip_path):
+            log(f"Using ZIP cache: {filename}")
+        elif (
+            self.zip_cache is None
+            and self.config.keep_files
+            and zip_path.exists()
+            and self._cached_zip_is_valid(zip_path)
+        ):
             log(f"Using cached: {filename}")
         else:
+            self._manifest_path(zip_path).unlink(missing_ok=True)
             self._download_zip(url, directory, filename, zip_path, log, adaptive)
+            self._store_in_zip_cache(directory, filename, zip_path)
+        self._content_keys[(directory, filename)] = zip_content_key(zip_path)
+        return zip_path
+
+    def get_content_key(self, directory: str, filename: str) -> str | None:
+        """Content key (zip_cache.zip_content_key) of a listed ZIP.
+
+        Taken from this run's download when there was one, else from a
+        ranged GET of the remote central directory; None when the server
+        cannot serve it.
+        """
+        key = self._content_keys.get((directory, filename))
+        if key is None:
+            remote = self.get_remote_files(directory).get(filename)
+            if remote is not None and remote.size:
+                key = self._remote_zip_key(f"{self.config.base_url}/{directory}/{filename}", remote.size)
+            if key is not None:
+                self._content_keys[(directory, filename)] = key
+        return key
+
+    def remember_content_key(self, directory: str, filename: str, key: str) -> None:
+        """Record the content key of a ZIP another process downloaded, for get_content_key."""
+        self._content_keys[(directory, filename)] = key
+
+    def _restore_from_zip_cache(self, directory: str, filename: str, zip_path: Path) -> bool:
+        """Place filename from the ZIP cache at zip_path, when an identical ZIP is cached.
+
+        A file already seen at its listed version is found from the index
+        alone; otherwise the remote ZIP's tail is fetched to compute its
+        content key, which matches the same file from another month.
+        """
+        if self.zip_cache is None:
+            return False
+        source = f"{directory}/{filename}"
+        remote = self.get_remote_files(directory).get(filename)
+        version = remote.version if remote else None
+        key = self.zip_cache.lookup(source, version)
+        if key is None and remote is not None and remote.size and self.zip_cache.holds_size(remote.size):
+            key = self._remote_zip_key(f"{self.config.base_url}/{directory}/{filename}", remote.size)
+        return key is not None and self.zip_cache.restore(key, zip_path, source, version)
+
+    def _store_in_zip_cache(self, directory: str, filename: str, zip_path: Path) -> None:
+        if self.zip_cache is None:
+            return
+        remote = self.get_remote_files(directory).get(filename)
+        self.zip_cache.store(f"{directory}/{filename}", remote.version if remote else None, zip_path)
+
+    def _remote_zip_key(self, url: str, size: int) -> str | None:
+        """Content key of a remote ZIP from a ranged GET of its central directory; None when unavailable."""
+        start = max(0, size - ZIP_TAIL_BYTES)
+        try:
+            response = self.session.get(
+                url,
+                auth=self.auth,
+                headers={"Range": f"bytes={start}-{size - 1}"},
+                timeout=(self.config.connect_timeout, self.config.read_timeout),
+            )
+            response.raise_for_status()
+            if self._status_code(response) != 206 and start > 0:
+                return None
+            return zip_content_key(ZipTail(size, response.content[-(size - start) :]))
+        except (requests.exceptions.RequestException, zipfile.BadZipFile, OSError) as exc:
+            logger.debug(f"Could not read the central directory of {url}: {exc}")
+            return None
+
+    def extract_zip(self, zip_path: Path) -> List[Path | ZipMember]:
+        """Extract the CSV files of a downloaded ZIP and return their paths.
+
+        With config.stream_from_zip the CSVs are not extracted: the ZIP is
+        kept and a ZipMember per CSV is returned, so the largest shards are
+        parsed straight from the decompressing stream and never hit disk
+        uncompressed. The ZIP is then deleted by the last ZipMember.unlink().
+        Its CRCs are still checked here, in a decompression pass that
+        writes nothing, so a corrupt download fails before any of its rows
+        is loaded; the pass is skipped when the manifest already vouches
+        for the ZIP.
+        """
+        if self.config.stream_from_zip:
+            try:
+                with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                    members = [m for m in zip_ref.namelist() if self._is_cnpj_member(m)]
+                    if not self._manifest_matches(zip_path):
+                        bad_member = zip_ref.testzip()
+                        if bad_member is not None:
+                            raise zipfile.BadZipFile(f"Bad CRC-32 for {bad_member}")
+            except (zipfile.BadZipFile, zlib.error) as exc:
+                zip_path.unlink(missing_ok=True)
+                self._manifest_path(zip_path).unlink(missing_ok=True)
+                raise zipfile.BadZipFile(str(exc)) from exc
+            if self.config.keep_files:
+                self._write_manifest(zip_path)
+            pending = set(members)
+            if not pending and not self.config.keep_files:
+                zip_path.unlink()
+            return [ZipMember(zip_path, member, pending) for member in members]
 
-        # Extract CSV files
+        # Extract CSV files; zipfile checks each member's CRC as it reaches
+        # the end, so this pass doubles as the integrity check
         extracted_files = []
         try:
             with zipfile.ZipFile(zip_path, "r") as zip_ref:
                 for member in zip_ref.namelist():
-                    member_upper = member.upper()
-                    is_cnpj_file = any(pattern in member_upper for pattern in CNPJ_FILE_PATTERNS)
-
-                    if is_cnpj_file:
+                    if self._is_cnpj_member(member):
                         extract_path = self.temp_path / member
-                        zip_ref.extract(member, self.temp_path)
                         extracted_files.append(extract_path)
+                        zip_ref.extract(member, self.temp_path)
                         logger.debug(f"Extracted: {member}")
+            if self.config.keep_files:
+                self._write_manifest(zip_path)
+
+        except zipfile.BadZipFile:
+            for extract_path in extracted_files:
+                extract_path.unlink(missing_ok=True)
+            zip_path.unlink(missing_ok=True)
+            self._manifest_path(zip_path).unlink(missing_ok=True)
+            raise
 
         finally:
             # Cleanup ZIP file unless keeping files
@@ -321,6 +1027,11 @@ class Downloader:
 
         return extracted_files
 
+    @staticmethod
+    def _is_cnpj_member(member: str) -> bool:
+        member_upper = member.upper()
+        return any(pattern in member_upper for pattern in CNPJ_FILE_PATTERNS)
+
     @staticmethod
     def _directory_slug(directory: str) -> str:
         return re.sub(r"[^A-Za-z0-9_-]", "_", directory) or "root"
@@ -352,7 +1063,16 @@ class Downloader:
         # The .part name carries the source directory (month): CNPJ file names
         # repeat across monthly directories, and resuming (or 416-finalizing)
         # a partial that belongs to another month would corrupt the dataset.
-        part_path = zip_path.with_name(f"{zip_path.name}.{self._directory_slug(directory)}.part")
+        slug = self._directory_slug(directory)
+        part_path = zip_path.with_name(f"{zip_path.name}.{slug}.part")
+        # Segmented downloads keep their data and resume state in their own
+        # .part files (same month suffix, so pruning and cleanup treat them alike)
+        segment_path = zip_path.with_name(f"{zip_path.name}.seg.{slug}.part")
+        segment_state_path = zip_path.with_name(f"{zip_path.name}.segstate.{slug}.part")
+        # A ZIP read while downloading needs its bytes in order: one stream
+        segmented = segment_state_path.exists() or (
+            self.config.download_segments > 1 and not part_path.exists() and zip_path not in self._growing
+        )
 
         if zip_path.exists():
             zip_path.unlink()
@@ -364,11 +1084,22 @@ class Downloader:
         # against a fixed budget makes big files structurally undownloadable.
         # Only a retry that adds no bytes (server wedged, restart-from-zero)
         # burns an attempt.
-        progress_marker = part_path.stat().st_size if part_path.exists() else 0
+        def partial_bytes() -> int:
+            part_size = part_path.stat().st_size if part_path.exists() else 0
+            return part_size + _SegmentState.done_bytes_on_disk(segment_state_path)
+
+        progress_marker = partial_bytes()
         failures_without_progress = 0
         while True:
             try:
                 log(f"Downloading {filename}...")
+                if segmented:
+                    # False when the file is too small or the server ignores Range
+                    segmented = self._download_zip_segmented(
+                        url, filename, zip_path, segment_path, segment_state_path, adaptive
+                    )
+                    if segmented:
+                        return
                 with adaptive.stream_permit() if adaptive is not None else nullcontext():
                     try:
                         self._download_zip_once(url, filename, zip_path, part_path)
@@ -390,7 +1121,7 @@ class Downloader:
                 if not isinstance(e, DownloadStalledError):
                     logger.warning(f"Download attempt failed: {e}")
 
-                part_size = part_path.stat().st_size if part_path.exists() else 0
+                part_size = partial_bytes()
                 if part_size > progress_marker:
                     progress_marker = part_size
                     failures_without_progress = 0
@@ -412,7 +1143,7 @@ class Downloader:
             headers["Range"] = f"bytes={offset}-"
 
         try:
-            response = requests.get(
+            response = self.session.get(
                 url,
                 auth=self.auth,
                 headers=headers,
@@ -443,6 +1174,9 @@ class Downloader:
         response.raise_for_status()
 
         expected_total, write_offset = self._prepare_download_response(response, filename, part_path, offset)
+        growing = self._growing.get(zip_path)
+        if growing is not None:
+            growing.wrote(write_offset)
 
         tqdm_disabled = bool(os.environ.get("TQDM_DISABLE"))
         progress_log_interval = self.config.progress_log_interval if tqdm_disabled else 0
@@ -462,7 +1196,7 @@ class Downloader:
         ) as pbar:
             with part_path.open("ab") as f:
                 try:
-                    for chunk in response.iter_content(chunk_size=8192):
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
                         now = monotonic()
                         if not chunk:
                             # Keep-alive chunks carry no data; only here can
@@ -476,6 +1210,9 @@ class Downloader:
                         chunk_size = len(chunk)
                         f.write(chunk)
                         downloaded_bytes += chunk_size
+                        if growing is not None:
+                            f.flush()
+                            growing.wrote(downloaded_bytes)
                         last_byte_at = now
                         pbar.update(chunk_size)
 
@@ -509,6 +1246,147 @@ class Downloader:
         part_path.replace(zip_path)
         self._validate_zip_file(zip_path)
 
+    def _download_zip_segmented(
+        self,
+        url: str,
+        filename: str,
+        zip_path: Path,
+        data_path: Path,
+        state_path: Path,
+        adaptive: AdaptiveDownloadConcurrency | None,
+    ) -> bool:
+        """Fetch a ZIP as config.download_segments byte ranges over concurrent connections.
+
+        Each segment stream holds its own adaptive permit, so segments share
+        the run's concurrency limit (and its stall degradation) with whole
+        files. Returns False, having downloaded nothing, when the file is too
+        small to split or the server does not honor Range requests.
+        """
+        state = _SegmentState.load(data_path, state_path)
+        if state is None:
+            total = self._probe_range_total(url, filename)
+            count = min(self.config.download_segments, (total or 0) // MIN_SEGMENT_BYTES)
+            if count < 2:
+                return False
+            state = _SegmentState.create(data_path, state_path, total, count)
+
+        pending = state.pending
+        done = sum(done for _, _, done in state.segments)
+        with (
+            tqdm(
+                total=state.total,
+                initial=done,
+                unit="B",
+                unit_scale=True,
+                desc=f"Downloading {filename} ({len(state.segments)} segments)",
+                leave=False,
+                disable=bool(os.environ.get("TQDM_DISABLE")),
+            ) as pbar,
+            ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor,
+        ):
+            futures = [
+                executor.submit(self._download_segment, url, filename, state, i, adaptive, pbar) for i in pending
+            ]
+            errors = [exc for exc in (future.exception() for future in futures) if exc is not None]
+        if errors:
+            raise errors[0]
+
+        state_path.unlink()
+        data_path.replace(zip_path)
+        self._validate_zip_file(zip_path)
+        return True
+
+    def _probe_range_total(self, url: str, filename: str) -> int | None:
+        """Remote size from a one-byte Range request; None if the server ignores Range."""
+        response = self.session.get(
+            url,
+            auth=self.auth,
+            headers={"Accept-Encoding": "identity", "Range": "bytes=0-0"},
+            stream=True,
+            timeout=(self.config.connect_timeout, self.config.stall_timeout),
+        )
+        try:
+            response.raise_for_status()
+            if self._status_code(response) != 206:
+                return None
+            return self._required_content_range(response.headers, filename)[2]
+        finally:
+            response.close()
+
+    def _download_segment(
+        self,
+        url: str,
+        filename: str,
+        state: _SegmentState,
+        index: int,
+        adaptive: AdaptiveDownloadConcurrency | None,
+        pbar: tqdm,
+    ) -> None:
+        start, end, done = state.segments[index]
+        offset = start + done
+        with adaptive.stream_permit() if adaptive is not None else nullcontext():
+            try:
+                try:
+                    response = self.session.get(
+                        url,
+                        auth=self.auth,
+                        headers={"Accept-Encoding": "identity", "Range": f"bytes={offset}-{end}"},
+                        stream=True,
+                        timeout=(self.config.connect_timeout, self.config.stall_timeout),
+                    )
+                except requests.exceptions.ReadTimeout as exc:
+                    raise self._stalled_error(filename, offset) from exc
+
+                response.raise_for_status()
+                if self._status_code(response) != 206:
+                    raise DownloadIncompleteError(f"Server ignored Range for segment {index} of {filename}")
+                sent_start, sent_end, sent_total = self._required_content_range(response.headers, filename)
+                if (sent_start, sent_end, sent_total) != (offset, end, state.total):
+                    # The remote file changed under us: its saved segments are worthless
+                    state.discard()
+                    raise DownloadIncompleteError(
+                        f"Cannot resume segment {index} of {filename}: server sent bytes "
+                        f"{sent_start}-{sent_end}/{sent_total}, expected {offset}-{end}/{state.total}"
+                    )
+
+                saved = done
+                last_byte_at = monotonic()
+                with state.data_path.open("r+b") as f:
+                    f.seek(offset)
+                    try:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                            now = monotonic()
+                            if not chunk:
+                                if now - last_byte_at > self.config.stall_timeout:
+                                    raise self._stalled_error(filename, start + done)
+                                continue
+                            f.write(chunk[: end - start + 1 - done])
+                            done += len(chunk)
+                            last_byte_at = now
+                            pbar.update(len(chunk))
+                            if done - saved >= SEGMENT_STATE_INTERVAL:
+                                f.flush()
+                                state.update(index, done)
+                                saved = done
+                    except requests.exceptions.Timeout as exc:
+                        raise self._stalled_error(filename, start + done) from exc
+                    except requests.exceptions.ConnectionError as exc:
+                        if self._is_read_timeout(exc):
+                            raise self._stalled_error(filename, start + done) from exc
+                        raise
+                    finally:
+                        f.flush()
+                        state.update(index, min(done, end - start + 1))
+
+                if start + done <= end:
+                    raise DownloadIncompleteError(
+                        f"Incomplete segment {index} of {filename}: {done}/{end - start + 1} bytes"
+                    )
+            except (DownloadStalledError, requests.exceptions.ConnectTimeout):
+                if adaptive is not None:
+                    adaptive.record_stall()
+                raise
+
     def _stalled_error(self, filename: str, resume_offset: int) -> DownloadStalledError:
         message = f"{filename} stalled: no bytes for {self.config.stall_timeout}s, resuming from offset {resume_offset}"
         logger.warning(message)
@@ -585,11 +1463,18 @@ class Downloader:
         return self._required_content_length(response.headers, filename), 0
 
     def _validate_zip_file(self, zip_path: Path) -> None:
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            bad_member = zip_ref.testzip()
+        """Structural check of a finished download: the central directory
+        parses and every member's data lies inside the file.
 
-        if bad_member is not None:
-            raise zipfile.BadZipFile(f"Corrupt ZIP member: {bad_member}")
+        CRCs are left to the single decompression pass that follows
+        (extract_zip, or a ZipMember/GrowingZipMember read to its end), so
+        a large ZIP is not inflated once here and again to be used.
+        """
+        size = zip_path.stat().st_size
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            for info in zip_ref.infolist():
+                if info.header_offset + info.compress_size > size:
+                    raise zipfile.BadZipFile(f"Truncated ZIP member: {info.filename}")
 
     def _required_content_length(self, headers: Mapping[str, str], filename: str) -> int:
         content_length = self._content_length(headers, filename, required=True)
@@ -651,15 +1536,56 @@ class Downloader:
         return status_code if isinstance(status_code, int) else 200
 
     def _cached_zip_is_valid(self, zip_path: Path) -> bool:
-        """CRC-validate a cached ZIP; delete it when corrupt so it is re-downloaded."""
+        """Check a cached ZIP; delete it when corrupt so it is re-downloaded.
+
+        O(1) when its manifest still matches; otherwise every CRC is checked
+        with testzip() and the manifest rewritten for the next run.
+        """
+        if self._manifest_matches(zip_path):
+            return True
         try:
-            self._validate_zip_file(zip_path)
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                bad_member = zip_ref.testzip()
+            if bad_member is not None:
+                raise zipfile.BadZipFile(f"Corrupt ZIP member: {bad_member}")
         except (zipfile.BadZipFile, OSError) as exc:
             logger.warning(f"Cached ZIP {zip_path.name} is invalid ({exc}); re-downloading")
             zip_path.unlink(missing_ok=True)
+            self._manifest_path(zip_path).unlink(missing_ok=True)
             return False
+        self._write_manifest(zip_path)
         return True
 
+    @staticmethod
+    def _manifest_path(zip_path: Path) -> Path:
+        return zip_path.with_name(zip_path.name + ZIP_MANIFEST_SUFFIX)
+
+    def _write_manifest(self, zip_path: Path) -> None:
+        """Record that zip_path, as it is on disk now, passed a full CRC check."""
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            crcs = {info.filename: info.CRC for info in zip_ref.infolist()}
+        stat = zip_path.stat()
+        manifest_path = self._manifest_path(zip_path)
+        tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "crc32": crcs}))
+        tmp_path.replace(manifest_path)
+
+    def _manifest_matches(self, zip_path: Path) -> bool:
+        try:
+            saved = json.loads(self._manifest_path(zip_path).read_text())
+            stat = zip_path.stat()
+            if (saved["size"], saved["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                return False
+            # Reads only the central directory at the end of the file
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                return {info.filename: info.CRC for info in zip_ref.infolist()} == saved["crc32"]
+        except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile):
+            return False
+
+    def close(self):
+        """Close the pooled HTTP connections."""
+        self.session.close()
+
     def cleanup(self):
         """Clean up temporary files, preserving .part resume state.
 
@@ -672,5 +1598,6 @@ class Downloader:
             return
 
         for file in self.temp_path.glob("*"):
-            if file.is_file() and file.suffix != ".part":
+            # The listing cache outlives the run so the next one can revalidate it
+            if file.is_file() and file.suffix != ".part" and file.name != LISTING_CACHE_FILE:
                 file.unlink()
@@ -139,6 +139,35 @@ CREATE TABLE IF NOT EXISTS processed_files (
     PRIMARY KEY (directory, filename)
 );
 
+-- Remote version (WebDAV ETag, else size and Last-Modified) each processed
+-- file was loaded from, so a file republished under the same month is
+-- detected from the listing alone and loaded again.
+CREATE TABLE IF NOT EXISTS processed_file_versions (
+    directory VARCHAR(50) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (directory, filename)
+);
+
+-- Content key (members' names, CRC-32s and sizes) of each processed ZIP, so
+-- a file identical to the previous month's is carried forward unloaded.
+CREATE TABLE IF NOT EXISTS file_fingerprints (
+    directory VARCHAR(50) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    size BIGINT NOT NULL,
+    content_key TEXT NOT NULL,
+    PRIMARY KEY (directory, filename)
+);
+
+-- Indexes dropped for the duration of a large load (DEFER_INDEXES), kept here
+-- until they are rebuilt so an interrupted run can still restore them.
+CREATE TABLE IF NOT EXISTS deferred_indexes (
+    index_name TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    dropped_at TIMESTAMP DEFAULT NOW()
+);
+
 -- ============================================================================
 -- Indexes
 -- ============================================================================
@@ -12,16 +12,26 @@ Usage:
 
 import argparse
 import logging
+import multiprocessing
+import os
+import queue
 import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import polars as pl
+import pyarrow as pa
 from tqdm import tqdm
 
 from config import config
-from downloader import Downloader
-from processor import FILE_MAPPINGS, get_file_type, process_file
+from downloader import AdaptiveDownloadConcurrency, Downloader, GrowingZipMember
+from memory_budget import MemoryBudget, log_memory_report
+from pipeline import Pipeline, Stage
+from processor import FILE_MAPPINGS, get_file_type, process_file, start_hash_pool, stop_hash_pool
 
 # Configure logging
 logging.basicConfig(
@@ -31,17 +41,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Dependency groups — files within the same group have no inter-dependencies
-# and can be processed in parallel. Groups must be processed in order.
-DEPENDENCY_GROUPS = [
-    ["CNAECSV", "MOTICSV", "MUNICCSV", "NATJUCSV", "PAISCSV", "QUALSCSV"],  # references
-    ["EMPRECSV"],  # empresas
-    ["ESTABELE", "SOCIOCSV", "SIMPLESCSV"],  # depends on empresas
+# Table → tables that must be fully loaded before it starts. initial.sql
+# declares no foreign keys, so no table waits on another and every file is
+# schedulable at once; in database mode the foreign keys found in the target
+# schema are added to this map at runtime (see _table_dependencies).
+TABLE_DEPENDENCIES: dict[str, set[str]] = {}
+
+# Strategies that finish a table only after all its files are loaded, so a
+# file is marked processed at the end of its dependency group, not on its own.
+GROUP_COMMIT_STRATEGIES = ("swap", "delta")
+
+# Batches a WORKER_MODE=process child may spill ahead of the parent loading
+# them; past that it waits, so spilled files don't pile up on disk.
+PROCESS_SPILL_AHEAD = 4
+
+# Tie-break order for files of equal or unknown size
+PROCESSING_ORDER = [
+    "CNAECSV",
+    "MOTICSV",
+    "MUNICCSV",
+    "NATJUCSV",
+    "PAISCSV",
+    "QUALSCSV",
+    "EMPRECSV",
+    "ESTABELE",
+    "SOCIOCSV",
+    "SIMPLESCSV",
 ]
 
-# Flat processing order derived from dependency groups (for sorting)
-PROCESSING_ORDER = [ft for group in DEPENDENCY_GROUPS for ft in group]
-
 # ZIP filename prefix → file type (zip names differ from CSV names inside)
 ZIP_PREFIX_MAP = [
     ("SIMPLES", "SIMPLESCSV"),
@@ -83,36 +110,105 @@ def parse_args():
     return parser.parse_args()
 
 
-def group_files_by_dependency(files: list[str]) -> list[list[str]]:
-    """Group pending files by dependency level. Returns ordered list of groups."""
-    groups: list[list[str]] = [[] for _ in DEPENDENCY_GROUPS]
+def group_files_by_dependency(
+    files: list[str], dependencies: dict[str, set[str]] | None = None, sizes: dict[str, int] | None = None
+) -> list[list[str]]:
+    """Group files into dependency levels, to be processed in order; largest files first.
+
+    A table's level is one past the deepest level of the tables it depends
+    on (TABLE_DEPENDENCIES by default), so tables without dependencies all
+    land in level 0 and nothing waits for a barrier it doesn't need.
+    Within a level, files are ordered by sizes (bytes), largest first:
+    longest-processing-time scheduling, so the biggest shards don't start
+    last and leave the other workers idle at the end. Files of unknown size
+    go after, in get_file_priority order.
+    """
+    dependencies = TABLE_DEPENDENCIES if dependencies is None else dependencies
+    sizes = sizes or {}
+    levels: dict[str, int] = {}
+
+    def level(table: str, path: tuple[str, ...] = ()) -> int:
+        if table in path:
+            raise ValueError(f"Circular table dependency: {' -> '.join((*path, table))}")
+        if table not in levels:
+            levels[table] = 1 + max((level(dep, (*path, table)) for dep in dependencies.get(table, ())), default=-1)
+        return levels[table]
+
+    groups: list[list[str]] = []
     for f in files:
         file_type = get_zip_file_type(f)
-        if not file_type:
+        if not file_type or file_type not in FILE_MAPPINGS:
             continue
-        for i, dep_types in enumerate(DEPENDENCY_GROUPS):
-            if file_type in dep_types:
-                groups[i].append(f)
-                break
+        i = level(FILE_MAPPINGS[file_type])
+        while len(groups) <= i:
+            groups.append([])
+        groups[i].append(f)
+
+    for group in groups:
+        group.sort(key=lambda f: (-sizes.get(f, 0), get_file_priority(f)))
     return groups
 
 
-def _pg_worker(zip_filename, directory, downloader, cfg, pre_truncated=None):
-    """Worker: download, process, and load one file to PostgreSQL."""
+def _table_dependencies(db) -> dict[str, set[str]]:
+    """TABLE_DEPENDENCIES plus the foreign keys declared in the target schema."""
+    dependencies = {table: set(deps) for table, deps in TABLE_DEPENDENCIES.items()}
+    for table, referenced in db.get_table_dependencies().items():
+        dependencies.setdefault(table, set()).update(referenced)
+    return dependencies
+
+
+def _pg_worker(zip_filename, directory, downloader, cfg, pre_truncated=None, pool=None, memory=None):
+    """Worker: download, process, and load one file to PostgreSQL.
+
+    With a pool (a database.DatabasePool owned by main), the worker borrows
+    a pooled connection instead of opening and closing its own. memory is
+    the MemoryBudget shared by all workers, if MEMORY_BUDGET is set.
+    """
+    if pool is not None:
+        with pool.lease(pre_truncated) as db:
+            _pg_load_file(zip_filename, directory, downloader, cfg, db, memory)
+        return
+
     from database import Database
 
     db = Database(
-        cfg.database_url, pre_truncated=pre_truncated, retry_attempts=cfg.retry_attempts, retry_delay=cfg.retry_delay
+        cfg.database_url,
+        pre_truncated=pre_truncated,
+        retry_attempts=cfg.retry_attempts,
+        retry_delay=cfg.retry_delay,
+        copy_format=cfg.copy_format,
     )
+    try:
+        _pg_load_file(zip_filename, directory, downloader, cfg, db, memory)
+    finally:
+        db.disconnect()
+
+
+def _pg_loader(cfg, db):
+    """Database method that loads one batch under cfg.loading_strategy."""
+    if cfg.loading_strategy == "swap":
+        return db.bulk_load_shadow
+    if cfg.loading_strategy == "delta":
+        return db.bulk_delta
+    if cfg.loading_strategy == "replace":
+        return db.bulk_insert
+    return db.bulk_upsert
+
+
+def _pg_load_file(zip_filename, directory, downloader, cfg, db, memory=None):
     try:
         for csv_path in downloader.download_file(directory, zip_filename):
             rows = 0
-            load = db.bulk_insert if cfg.loading_strategy == "replace" else db.bulk_upsert
-            for batch, table_name, columns in process_file(csv_path, cfg.batch_size):
+            load = _pg_loader(cfg, db)
+            for batch, table_name, columns in process_file(
+                csv_path, cfg.batch_size, engine=cfg.processing_engine, memory=memory
+            ):
                 load(batch, table_name, columns)
                 rows += len(batch)
 
-            db.mark_processed(directory, zip_filename)
+            _mark_file_processed(
+                db, cfg, directory, zip_filename, downloader.get_file_versions(directory).get(zip_filename)
+            )
             logger.info(f"  {csv_path.name}: {rows:,} rows")
 
             if csv_path.exists() and not cfg.keep_files:
@@ -120,16 +216,137 @@ def _pg_worker(zip_filename, directory, downloader, cfg, pre_truncated=None):
     except Exception as e:
         logger.error(f"Error processing {zip_filename}: {e}")
         raise
-    finally:
-        db.disconnect()
 
 
-def _parquet_worker(zip_filename, directory, downloader, parquet, cfg):
+def _process_refetching(csv_path, zip_filename, directory, downloader, cfg, memory=None):
+    """process_file for a Postgres load, reading a member again if it fails its CRC.
+
+    A member read while its ZIP downloads (EXTRACT_WHILE_DOWNLOADING) is
+    only checked at its end, after its batches were loaded. Every loading
+    strategy keys rows on the primary key, so the re-downloaded member's
+    rows overwrite whatever the corrupt read left behind.
+    """
+    try:
+        yield from process_file(csv_path, cfg.batch_size, engine=cfg.processing_engine, memory=memory)
+    except zipfile.BadZipFile as exc:
+        if not isinstance(csv_path, GrowingZipMember):
+            raise
+        logger.warning(f"{csv_path.name} failed its CRC check ({exc}); downloading {zip_filename} again")
+        member = downloader.refetch(directory, zip_filename, csv_path)
+        yield from process_file(member, cfg.batch_size, engine=cfg.processing_engine, memory=memory)
+
+
+def _tables_of(files):
+    """Tables loaded by a set of ZIP files."""
+    return {FILE_MAPPINGS[ft] for f in files if (ft := get_zip_file_type(f)) and ft in FILE_MAPPINGS}
+
+
+def _begin_group(db, cfg, tables):
+    """Prepare a dependency group's tables for loading under cfg.loading_strategy."""
+    if cfg.loading_strategy == "swap":
+        # Load into empty shadow tables; the live ones keep serving reads
+        for table in sorted(tables):
+            db.begin_swap(table)
+    elif cfg.loading_strategy == "delta":
+        for table in sorted(tables):
+            db.begin_delta(table)
+
+
+def _mark_file_processed(db, cfg, directory, zip_filename, version):
+    # Under swap and delta, files count as processed only once their table is finished
+    if cfg.loading_strategy not in GROUP_COMMIT_STRATEGIES:
+        db.mark_processed(directory, zip_filename, version)
+
+
+def _finish_group(db, cfg, directory, files, tables, partial_tables, versions):
+    """Finish a loaded dependency group's tables and, under swap/delta, mark its files."""
+    if cfg.loading_strategy == "swap":
+        for table in sorted(tables):
+            db.finish_swap(table, index_workers=cfg.process_workers, set_logged=cfg.swap_set_logged)
+    elif cfg.loading_strategy == "delta":
+        for table in sorted(tables):
+            # Deleting vanished rows needs this month's full file set
+            db.finish_delta(table, delete_missing=table not in partial_tables)
+    if cfg.loading_strategy in GROUP_COMMIT_STRATEGIES:
+        for f in files:
+            db.mark_processed(directory, f, versions.get(f))
+
+
+def _pending_files(db, cfg, directory, all_files, versions):
+    """Files of the directory still to load, in listing order.
+
+    A processed file whose listed version changed is loaded again. Under
+    upsert it is reloaded alone; the other strategies rebuild a table from
+    this month's files, so there every file of its table is re-queued, or
+    the table would end up holding only the republished file's rows.
+    """
+    processed = db.get_processed_files(directory, versions)
+    pending_files = [f for f in all_files if f not in processed]
+    if cfg.loading_strategy != "upsert" and pending_files:
+        loaded = db.get_processed_files(directory)
+        republished = {f for f in pending_files if f in loaded}
+        tables = _tables_of(republished)
+        if tables:
+            pending_files = [f for f in all_files if f not in processed or _tables_of([f]) & tables]
+    return pending_files
+
+
+def _carry_forward_unchanged(db, downloader, cfg, directory, all_files, pending_files, versions):
+    """Mark pending files identical to the last month loaded as processed, without loading them.
+
+    Only the size from the listing and, when it matches, a ranged GET of the
+    ZIP's central directory are needed per file. Under upsert each file
+    stands alone; the other strategies rebuild a table from this month's
+    files, so there a file is skipped only if every file of its table is.
+    Returns the files carried forward.
+    """
+    previous = db.get_previous_fingerprints(directory)
+    sizes = downloader.get_file_sizes(directory)
+    unchanged = {
+        f
+        for f in pending_files
+        if f in previous
+        and sizes.get(f) == previous[f][1]
+        and downloader.get_content_key(directory, f) == previous[f][2]
+    }
+    if cfg.loading_strategy != "upsert":
+        changed_tables = _tables_of(f for f in all_files if f not in unchanged)
+        unchanged = {f for f in unchanged if not _tables_of([f]) & changed_tables}
+
+    for f in sorted(unchanged):
+        source, size, key = previous[f]
+        db.mark_processed(directory, f, versions.get(f))
+        db.record_fingerprint(directory, f, size, key)
+        logger.info(f"  {f}: unchanged since {source}, not loaded again")
+    return unchanged
+
+
+def _record_fingerprints(db, downloader, directory, files):
+    """Record what each file loaded this run contained, for the next month's comparison."""
+    sizes = downloader.get_file_sizes(directory)
+    for f in files:
+        key = downloader.get_content_key(directory, f)
+        if key is not None and f in sizes:
+            db.record_fingerprint(directory, f, sizes[f], key)
+
+
+def _rebuild_deferred_indexes(db, cfg):
+    """Recreate the indexes dropped for a large load, if any."""
+    db.rebuild_deferred_indexes(
+        workers=cfg.index_build_workers,
+        maintenance_work_mem=cfg.index_build_memory,
+        parallel_workers=cfg.index_build_parallel_workers,
+    )
+
+
+def _parquet_worker(zip_filename, directory, downloader, parquet, cfg, memory=None):
     """Worker: download, process, and write one file to Parquet."""
     for csv_path in downloader.download_file(directory, zip_filename):
         try:
             rows = 0
-            for batch, table_name, columns in process_file(csv_path, cfg.batch_size, typed=cfg.parquet_typed_output):
+            for batch, table_name, columns in process_file(
+                csv_path, cfg.batch_size, typed=cfg.parquet_typed_output, engine=cfg.processing_engine, memory=memory
+            ):
                 parquet.write_batch(batch, table_name, columns)
                 rows += len(batch)
 
@@ -142,6 +359,233 @@ def _parquet_worker(zip_filename, directory, downloader, parquet, cfg):
             raise
 
 
+def _parquet_pending(group_files, parquet):
+    """Files of a group still to export, and their tables; skips tables already exported (resume)."""
+    files_to_process = []
+    tables_in_group = set()
+    skipped_tables = set()
+    for f in group_files:
+        ft = get_zip_file_type(f)
+        if not ft or ft not in FILE_MAPPINGS:
+            continue
+        table_name = FILE_MAPPINGS[ft]
+        if parquet.output_path(table_name).exists():
+            if table_name not in skipped_tables:
+                logger.info(f"Skipping {table_name} (already exported)")
+                skipped_tables.add(table_name)
+            continue
+        files_to_process.append(f)
+        tables_in_group.add(table_name)
+    return files_to_process, tables_in_group
+
+
+def _flush_parquet_tables(parquet, tables, cfg):
+    """Flush a finished group's tables and run the post-file command on each."""
+    for table_name in tables:
+        parquet_path = parquet.flush_table(table_name)
+        if parquet_path:
+            logger.info(f"  {table_name}: flushed → {parquet_path.name}")
+            if cfg.post_file_command:
+                logger.info(f"  Running post-file command for {parquet_path.name}")
+                subprocess.run(
+                    [*cfg.post_file_command.split(), str(parquet_path)],
+                    check=True,
+                )
+
+
+def _transform_worker(zip_filename, directory, cfg, typed, spill_dir, spilled, listings=None):
+    """Process-pool worker: download and transform one file, spilling its batches.
+
+    Runs in a child process (WORKER_MODE=process), so decoding, validation
+    and hashing are not bound by this process's GIL. Each batch is written
+    to spill_dir as an LZ4-compressed Arrow IPC file and put on the spilled
+    queue as (path, table_name, columns) right away, so the parent loads it
+    while this child reads on; None marks the end. The queue is bounded:
+    a child more than PROCESS_SPILL_AHEAD batches ahead of the parent
+    waits. listings is the parent's Downloader.fetched_listings(), so the
+    child doesn't list the directory again. Returns the ZIP's content key.
+    """
+    downloader = Downloader(cfg, listings=listings)
+    # Each child sizes its own batches from its share of the budget
+    memory = MemoryBudget.from_config(cfg)
+    for csv_path in downloader.download_file(directory, zip_filename):
+        for i, (batch, table_name, columns) in enumerate(
+            process_file(csv_path, cfg.batch_size, typed=typed, engine=cfg.processing_engine, memory=memory)
+        ):
+            path = Path(spill_dir) / f"{zip_filename}.{csv_path.name}.{i:05d}.arrow"
+            arrow_table = batch.to_arrow()
+            options = pa.ipc.IpcWriteOptions(compression="lz4")
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, arrow_table.schema, options=options) as w:
+                w.write_table(arrow_table)
+            spilled.put((str(path), table_name, columns))
+
+        if csv_path.exists() and not cfg.keep_files:
+            csv_path.unlink()
+    spilled.put(None)
+    return downloader.get_content_key(directory, zip_filename)
+
+
+def _read_spilled(spilled, future):
+    """Yield (batch, table_name, columns) as _transform_worker spills them, removing each file.
+
+    Stops at the end marker, or raises the child's error if it failed first.
+    """
+    while True:
+        try:
+            item = spilled.get(timeout=0.1)
+        except queue.Empty:
+            if future.done():
+                future.result()
+                return
+            continue
+        if item is None:
+            return
+        path, table_name, columns = item
+        with pa.memory_map(path) as source:
+            batch = pl.from_arrow(pa.ipc.open_file(source).read_all())
+        Path(path).unlink()
+        yield batch, table_name, columns
+
+
+def _run_process_pool(files, directory, downloader, cfg, typed, consume):
+    """Transform files in worker processes and pass each one's batches to consume.
+
+    consume(zip_filename, batches) runs in this process, one file at a
+    time in submission order, and receives each batch as soon as the
+    child has spilled it. Content keys of the children's downloads are
+    recorded on downloader. The first failure cancels the files not
+    started yet and aborts, like the thread pool path.
+    """
+    spill_dir = Path(cfg.temp_dir) / "batches"
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    listings = downloader.fetched_listings()
+    # spawn, not fork: children must not inherit open connections or locks
+    context = multiprocessing.get_context("spawn")
+    with (
+        context.Manager() as manager,
+        ProcessPoolExecutor(max_workers=cfg.process_workers, mp_context=context) as executor,
+    ):
+        queues = {f: manager.Queue(maxsize=PROCESS_SPILL_AHEAD) for f in files}
+        futures = {
+            f: executor.submit(_transform_worker, f, directory, cfg, typed, str(spill_dir), queues[f], listings)
+            for f in files
+        }
+        with tqdm(total=len(futures), desc="Processing", unit="file") as pbar:
+            for filename, future in futures.items():
+                pbar.set_postfix_str(filename[:30])
+                try:
+                    consume(filename, _read_spilled(queues[filename], future))
+                    key = future.result()
+                except Exception as e:
+                    logger.error(f"Error processing {filename}: {e}")
+                    # Children blocked on a full queue fail once it is gone
+                    manager.shutdown()
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    for path in spill_dir.glob("*.arrow"):
+                        path.unlink()
+                    raise RuntimeError("One or more workers failed, aborting to prevent data corruption") from e
+                if key is not None:
+                    downloader.remember_content_key(directory, filename, key)
+                pbar.update(1)
+
+
+def _run_pipeline(
+    file_groups, directory, downloader, cfg, typed, sink, on_file_done, on_group_start, on_group_done, memory=None
+):
+    """Download, extract, transform and sink files as overlapping stages.
+
+    Stages are connected by bounded queues (see pipeline.Pipeline), so the
+    network, the CPU and the sink are busy at once while at most a few
+    ZIPs, CSVs and batches are in flight. sink(batch, table_name, columns)
+    and the on_* callbacks run in a single thread, in dependency order:
+    no file of group i is transformed before group i - 1 is fully sunk
+    and on_group_done(i - 1) has returned, but its download may already
+    be running. Downloads of group i start once group i - 1's are queued,
+    which keeps the extract queue in group order.
+    """
+    groups = [list(files) for files in file_groups]
+    downloaded = [threading.Event() for _ in groups]
+    sunk = [threading.Event() for _ in groups]
+    downloads_left = [len(files) for files in groups]
+    files_left = [len(files) for files in groups]
+    for i, files in enumerate(groups):
+        if not files:
+            downloaded[i].set()
+            sunk[i].set()
+
+    lock = threading.Lock()
+    adaptive = AdaptiveDownloadConcurrency(cfg.download_workers, cfg.stall_degrade_threshold)
+    started = set()
+    csvs_done = defaultdict(int)
+    rows = defaultdict(int)
+
+    def download(item):
+        group, zip_filename = item
+        for event in downloaded[:group]:
+            pipeline.wait(event)
+        yield group, zip_filename, downloader.download_zip(directory, zip_filename, adaptive)
+        # Only after the ZIP is queued, so no later group's ZIP can overtake it
+        with lock:
+            downloads_left[group] -= 1
+            if not downloads_left[group]:
+                downloaded[group].set()
+
+    def extract(item):
+        group, zip_filename, zip_path = item
+        csv_paths = downloader.extract_zip(zip_path)
+        if not csv_paths:
+            yield group, zip_filename, None, 0
+        for csv_path in csv_paths:
+            yield group, zip_filename, csv_path, len(csv_paths)
+
+    def transform(item):
+        group, zip_filename, csv_path, csv_count = item
+        for event in sunk[:group]:
+            pipeline.wait(event)
+        if csv_path is not None:
+            for batch in process_file(
+                csv_path, cfg.batch_size, typed=typed, engine=cfg.processing_engine, memory=memory
+            ):
+                yield group, zip_filename, csv_path, csv_count, batch
+        # End-of-CSV marker
+        yield group, zip_filename, csv_path, csv_count, None
+
+    def load(item):
+        group, zip_filename, csv_path, csv_count, batch = item
+        if group not in started:
+            started.add(group)
+            on_group_start(group)
+        if batch is not None:
+            sink(*batch)
+            rows[csv_path.name] += len(batch[0])
+            return ()
+
+        if csv_path is not None:
+            logger.info(f"  {csv_path.name}: {rows.pop(csv_path.name, 0):,} rows")
+            if csv_path.exists() and not cfg.keep_files:
+                csv_path.unlink()
+        csvs_done[zip_filename] += 1
+        if csvs_done[zip_filename] >= csv_count:
+            on_file_done(zip_filename)
+            files_left[group] -= 1
+            if not files_left[group]:
+                on_group_done(group)
+                sunk[group].set()
+        return ()
+
+    workers = cfg.process_workers
+    pipeline = Pipeline(
+        [
+            Stage("download", download, workers=cfg.download_workers, queue_size=cfg.download_workers),
+            # One extractor keeps ZIPs in the order they were downloaded
+            Stage("extract", extract, workers=1, queue_size=cfg.download_workers),
+            Stage("transform", transform, workers=workers, queue_size=workers),
+            Stage("sink", load, workers=1, queue_size=workers),
+        ]
+    )
+    pipeline.run((i, f) for i, files in enumerate(groups) for f in files)
+
+
 def main():
     """Main pipeline entry point."""
     args = parse_args()
@@ -163,17 +607,36 @@ def main():
         sys.exit(1)
 
     db = None
+    pool = None
     parquet = None
+    memory = MemoryBudget.from_config(config)
+    if memory:
+        logger.info(
+            f"Memory budget: {memory.total_bytes / 1024**2:,.0f} MB over {memory.concurrency} concurrent batches"
+        )
+    if config.worker_mode != "process" or config.process_workers <= 1:
+        # Worker processes already hash in parallel; threads share one pool
+        start_hash_pool(os.cpu_count() or 1)
 
     if is_parquet:
-        from parquet_writer import ParquetWriter
-
-        parquet = ParquetWriter(config.parquet_output_dir)
+        from parquet_writer import ParquetWriter, parse_partition_by
+
+        parquet = ParquetWriter(
+            config.parquet_output_dir,
+            partition_by=parse_partition_by(config.parquet_partition_by),
+            sort=config.parquet_sorted,
+            part_per_thread=config.parquet_part_per_worker,
+        )
         logger.info(f"Parquet mode: output to {config.parquet_output_dir}")
     else:
-        from database import Database
-
-        db = Database(config.database_url, retry_attempts=config.retry_attempts, retry_delay=config.retry_delay)
+        from database import Database, DatabasePool
+
+        db = Database(
+            config.database_url,
+            retry_attempts=config.retry_attempts,
+            retry_delay=config.retry_delay,
+            copy_format=config.copy_format,
+        )
         db.ensure_schema()
 
     try:
@@ -187,6 +650,9 @@ def main():
         else:
             directory = downloader.get_latest_directory()
 
+        if parquet:
+            parquet.source_month = directory
+
         # Handle --force mode (database only)
         if args.force and db:
             logger.info(f"Force mode: clearing processed files for {directory}")
@@ -195,164 +661,240 @@ def main():
         all_files = downloader.get_directory_files(directory)
 
         if db:
-            processed = db.get_processed_files(directory)
-            pending_files = [f for f in all_files if f not in processed]
+            # A processed file whose listed version changed is loaded again
+            versions = downloader.get_file_versions(directory)
+            pending_files = _pending_files(db, config, directory, all_files, versions)
+            if config.skip_unchanged_files and not args.force:
+                carried = _carry_forward_unchanged(
+                    db, downloader, config, directory, all_files, pending_files, versions
+                )
+                pending_files = [f for f in pending_files if f not in carried]
         else:
             pending_files = list(all_files)
 
         if not pending_files:
             logger.info("All files already processed!")
+            if db:
+                # Indexes left dropped by an interrupted run
+                _rebuild_deferred_indexes(db, config)
             return
 
         logger.info(f"Processing {len(pending_files)} files from {directory}")
 
-        # Sort files by processing order
-        pending_files.sort(key=get_file_priority)
+        # ZIP sizes for largest-first scheduling
+        sizes = downloader.get_file_sizes(directory)
 
         if is_parquet:
-            file_groups = group_files_by_dependency(pending_files)
+            file_groups = group_files_by_dependency(pending_files, sizes=sizes)
             workers = config.process_workers
 
-            for group_files in file_groups:
-                if not group_files:
-                    continue
-
-                # Filter out files whose tables are already exported (resume)
-                files_to_process = []
-                tables_in_group = set()
-                skipped_tables = set()
-                for f in group_files:
-                    ft = get_zip_file_type(f)
-                    if not ft or ft not in FILE_MAPPINGS:
+            if workers > 1 and config.worker_mode == "pipeline":
+                pending = [_parquet_pending(group_files, parquet) for group_files in file_groups]
+
+                _run_pipeline(
+                    [files for files, _ in pending],
+                    directory,
+                    downloader,
+                    config,
+                    config.parquet_typed_output,
+                    parquet.write_batch,
+                    on_file_done=lambda zip_filename: None,
+                    on_group_start=lambda i: None,
+                    on_group_done=lambda i: _flush_parquet_tables(parquet, pending[i][1], config),
+                    memory=memory,
+                )
+            else:
+                for group_files in file_groups:
+                    if not group_files:
                         continue
-                    table_name = FILE_MAPPINGS[ft]
-                    parquet_path = Path(config.parquet_output_dir) / f"{table_name}.parquet"
-                    if parquet_path.exists():
-                        if table_name not in skipped_tables:
-                            logger.info(f"Skipping {table_name} (already exported)")
-                            skipped_tables.add(table_name)
+
+                    files_to_process, tables_in_group = _parquet_pending(group_files, parquet)
+                    if not files_to_process:
                         continue
-                    files_to_process.append(f)
-                    tables_in_group.add(table_name)
-
-                if not files_to_process:
-                    continue
-
-                logger.info(f"Processing {len(files_to_process)} files ({', '.join(sorted(tables_in_group))})...")
-
-                if workers > 1:
-                    failed = False
-                    with ThreadPoolExecutor(max_workers=workers) as executor:
-                        futures = {
-                            executor.submit(_parquet_worker, f, directory, downloader, parquet, config): f
-                            for f in files_to_process
-                        }
-                        with tqdm(total=len(futures), desc="Processing", unit="file") as pbar:
-                            for future in as_completed(futures):
-                                filename = futures[future]
-                                pbar.set_postfix_str(filename[:30])
+
+                    logger.info(f"Processing {len(files_to_process)} files ({', '.join(sorted(tables_in_group))})...")
+
+                    if workers > 1 and config.worker_mode == "process":
+
+                        def write_parquet(zip_filename, batches):
+                            for batch, tname, columns in batches:
+                                parquet.write_batch(batch, tname, columns)
+
+                        _run_process_pool(
+                            files_to_process, directory, downloader, config, config.parquet_typed_output, write_parquet
+                        )
+                    elif workers > 1:
+                        failed = False
+                        with ThreadPoolExecutor(max_workers=workers) as executor:
+                            futures = {
+                                executor.submit(_parquet_worker, f, directory, downloader, parquet, config, memory): f
+                                for f in files_to_process
+                            }
+                            with tqdm(total=len(futures), desc="Processing", unit="file") as pbar:
+                                for future in as_completed(futures):
+                                    filename = futures[future]
+                                    pbar.set_postfix_str(filename[:30])
+                                    try:
+                                        future.result()
+                                    except Exception:
+                                        failed = True
+                                    pbar.update(1)
+                        if failed:
+                            raise RuntimeError("One or more workers failed, aborting to prevent incomplete export")
+                    else:
+                        for zip_filename in files_to_process:
+                            for csv_path, _ in downloader.download_files(directory, [zip_filename]):
                                 try:
-                                    future.result()
-                                except Exception:
-                                    failed = True
-                                pbar.update(1)
-                    if failed:
-                        raise RuntimeError("One or more workers failed, aborting to prevent incomplete export")
-                else:
-                    for zip_filename in files_to_process:
-                        for csv_path, _ in downloader.download_files(directory, [zip_filename]):
-                            try:
-                                rows = 0
-                                for batch, tname, columns in process_file(
-                                    csv_path, config.batch_size, typed=config.parquet_typed_output
-                                ):
-                                    parquet.write_batch(batch, tname, columns)
-                                    rows += len(batch)
-                                    if rows % 1_000_000 == 0:
-                                        logger.info(f"  {csv_path.name}: {rows:,} rows")
-
-                                logger.info(f"  {csv_path.name}: {rows:,} rows total")
-
-                                if csv_path.exists() and not config.keep_files:
-                                    csv_path.unlink()
-
-                            except Exception as e:
-                                logger.error(f"Error: {csv_path.name}: {e}")
-                                raise
-
-                # Flush tables in this group and run post-file commands
-                for table_name in tables_in_group:
-                    parquet_path = parquet.flush_table(table_name)
-                    if parquet_path:
-                        logger.info(f"  {table_name}: flushed → {parquet_path.name}")
-                        if config.post_file_command:
-                            logger.info(f"  Running post-file command for {parquet_path.name}")
-                            subprocess.run(
-                                [*config.post_file_command.split(), str(parquet_path)],
-                                check=True,
-                            )
+                                    rows = 0
+                                    for batch, tname, columns in process_file(
+                                        csv_path,
+                                        config.batch_size,
+                                        typed=config.parquet_typed_output,
+                                        engine=config.processing_engine,
+                                        memory=memory,
+                                    ):
+                                        parquet.write_batch(batch, tname, columns)
+                                        rows += len(batch)
+                                        if rows % 1_000_000 == 0:
+                                            logger.info(f"  {csv_path.name}: {rows:,} rows")
+
+                                    logger.info(f"  {csv_path.name}: {rows:,} rows total")
+
+                                    if csv_path.exists() and not config.keep_files:
+                                        csv_path.unlink()
+
+                                except Exception as e:
+                                    logger.error(f"Error: {csv_path.name}: {e}")
+                                    raise
+
+                    _flush_parquet_tables(parquet, tables_in_group, config)
 
         else:
             # Database mode: process files by dependency group
-            file_groups = group_files_by_dependency(pending_files)
+            file_groups = group_files_by_dependency(pending_files, _table_dependencies(db), sizes)
+            # Tables with some of this month's files already processed
+            partial_tables = {
+                FILE_MAPPINGS[ft]
+                for f in all_files
+                if f not in pending_files and (ft := get_zip_file_type(f)) and ft in FILE_MAPPINGS
+            }
             workers = config.process_workers
+            if workers > 1 and config.worker_mode not in ("process", "pipeline"):
+                # One bounded set of connections lent to workers for the
+                # whole run, instead of a connect/disconnect per file.
+                pool = DatabasePool(
+                    workers,
+                    config.database_url,
+                    retry_attempts=config.retry_attempts,
+                    retry_delay=config.retry_delay,
+                    copy_format=config.copy_format,
+                )
+
+            if config.defer_indexes == "auto" and config.loading_strategy != "swap":
+                # Maintaining secondary indexes row by row dominates a full
+                # load; drop them and build each once at the end instead.
+                load_tables = {
+                    FILE_MAPPINGS[ft] for f in pending_files if (ft := get_zip_file_type(f)) and ft in FILE_MAPPINGS
+                }
+                for table in sorted(load_tables):
+                    if config.loading_strategy == "replace" or db.table_is_empty(table):
+                        db.drop_secondary_indexes(table)
+
+            if workers > 1 and config.worker_mode == "pipeline":
+                # Stages overlap across groups; this process's connection loads
+                _run_pipeline(
+                    file_groups,
+                    directory,
+                    downloader,
+                    config,
+                    False,
+                    _pg_loader(config, db),
+                    on_file_done=lambda zip_filename: _mark_file_processed(
+                        db, config, directory, zip_filename, versions.get(zip_filename)
+                    ),
+                    on_group_start=lambda i: _begin_group(db, config, _tables_of(file_groups[i])),
+                    on_group_done=lambda i: _finish_group(
+                        db, config, directory, file_groups[i], _tables_of(file_groups[i]), partial_tables, versions
+                    ),
+                    memory=memory,
+                )
+            else:
+                for group_files in file_groups:
+                    if not group_files:
+                        continue
 
-            for group_files in file_groups:
-                if not group_files:
-                    continue
-
-                if workers > 1:
-                    # Pre-truncate for replace strategy before spawning workers
-                    pre_truncated = set()
-                    if config.loading_strategy == "replace":
-                        pre_truncated = {
-                            FILE_MAPPINGS[ft]
-                            for f in group_files
-                            if (ft := get_zip_file_type(f)) and ft in FILE_MAPPINGS
-                        }
-                        for table in pre_truncated:
-                            db.truncate_table(table)
-
-                    logger.info(f"Processing {len(group_files)} files with {workers} workers...")
-                    failed = False
-                    with ThreadPoolExecutor(max_workers=workers) as executor:
-                        futures = {
-                            executor.submit(_pg_worker, f, directory, downloader, config, pre_truncated): f
-                            for f in group_files
-                        }
-                        with tqdm(total=len(futures), desc="Processing", unit="file") as pbar:
-                            for future in as_completed(futures):
-                                filename = futures[future]
-                                pbar.set_postfix_str(filename[:30])
+                    group_tables = _tables_of(group_files)
+                    _begin_group(db, config, group_tables)
+
+                    if workers > 1 and config.worker_mode == "process":
+                        # Child processes transform; this process's connection loads
+                        load = _pg_loader(config, db)
+
+                        def load_file(zip_filename, batches):
+                            for batch, table_name, columns in batches:
+                                load(batch, table_name, columns)
+                            _mark_file_processed(db, config, directory, zip_filename, versions.get(zip_filename))
+
+                        _run_process_pool(group_files, directory, downloader, config, False, load_file)
+                    elif workers > 1:
+                        # Pre-truncate for replace strategy before spawning workers
+                        pre_truncated = set()
+                        if config.loading_strategy == "replace":
+                            pre_truncated = group_tables
+                            for table in pre_truncated:
+                                db.truncate_table(table)
+
+                        logger.info(f"Processing {len(group_files)} files with {workers} workers...")
+                        failed = False
+                        with ThreadPoolExecutor(max_workers=workers) as executor:
+                            futures = {
+                                executor.submit(
+                                    _pg_worker, f, directory, downloader, config, pre_truncated, pool, memory
+                                ): f
+                                for f in group_files
+                            }
+                            with tqdm(total=len(futures), desc="Processing", unit="file") as pbar:
+                                for future in as_completed(futures):
+                                    filename = futures[future]
+                                    pbar.set_postfix_str(filename[:30])
+                                    try:
+                                        future.result()
+                                    except Exception:
+                                        failed = True
+                                    pbar.update(1)
+                        if failed:
+                            raise RuntimeError("One or more workers failed, aborting to prevent data corruption")
+                    else:
+                        # Sequential: download in parallel, process one at a time
+                        file_iterator = downloader.download_files(directory, group_files)
+                        with tqdm(file_iterator, total=len(group_files), desc="Processing", unit="file") as pbar:
+                            for csv_path, zip_filename in pbar:
+                                pbar.set_postfix_str(csv_path.name[:30])
                                 try:
-                                    future.result()
-                                except Exception:
-                                    failed = True
-                                pbar.update(1)
-                    if failed:
-                        raise RuntimeError("One or more workers failed, aborting to prevent data corruption")
-                else:
-                    # Sequential: download in parallel, process one at a time
-                    file_iterator = downloader.download_files(directory, group_files)
-                    with tqdm(file_iterator, total=len(group_files), desc="Processing", unit="file") as pbar:
-                        for csv_path, zip_filename in pbar:
-                            pbar.set_postfix_str(csv_path.name[:30])
-                            try:
-                                rows = 0
-                                load = db.bulk_insert if config.loading_strategy == "replace" else db.bulk_upsert
-                                for batch, table_name, columns in process_file(csv_path, config.batch_size):
-                                    load(batch, table_name, columns)
-                                    rows += len(batch)
-                                    pbar.set_postfix_str(f"{csv_path.name[:20]} {rows:,} rows")
-
-                                db.mark_processed(directory, zip_filename)
-
-                                if csv_path.exists() and not config.keep_files:
-                                    csv_path.unlink()
-
-                            except Exception as e:
-                                logger.error(f"Error: {csv_path.name}: {e}")
-                                raise
+                                    rows = 0
+                                    load = _pg_loader(config, db)
+                                    for batch, table_name, columns in _process_refetching(
+                                        csv_path, zip_filename, directory, downloader, config, memory
+                                    ):
+                                        load(batch, table_name, columns)
+                                        rows += len(batch)
+                                        pbar.set_postfix_str(f"{csv_path.name[:20]} {rows:,} rows")
+
+                                    _mark_file_processed(
+                                        db, config, directory, zip_filename, versions.get(zip_filename)
+                                    )
+
+                                    if csv_path.exists() and not config.keep_files:
+                                        csv_path.unlink()
+
+                                except Exception as e:
+                                    logger.error(f"Error: {csv_path.name}: {e}")
+                                    raise
+
+                    _finish_group(db, config, directory, group_files, group_tables, partial_tables, versions)
+
+            _rebuild_deferred_indexes(db, config)
+            _record_fingerprints(db, downloader, directory, pending_files)
 
         if is_parquet:
             parquet.close()
@@ -368,9 +910,14 @@ def main():
         sys.exit(1)
 
     finally:
+        stop_hash_pool()
+        log_memory_report(memory)
+        if pool:
+            pool.close()
         if db:
             db.disconnect()
         downloader.cleanup()
+        downloader.close()
 
 
 if __name__ == "__main__":
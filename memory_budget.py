@@ -0,0 +1,119 @@
+"""Batch sizes per file type that keep the rows in flight under a RAM budget."""
+
+import logging
+import math
+import resource
+import sys
+from threading import Lock
+
+import polars as pl
+
+from config import parse_size
+
+logger = logging.getLogger(__name__)
+
+# In-memory bytes per row of each file type once transformed, measured on
+# the test fixtures (DataFrame.estimated_size() / rows). A starting point:
+# observe() raises a type's figure when real batches turn out wider.
+BYTES_PER_ROW = {
+    "CNAECSV": 62,
+    "MOTICSV": 41,
+    "MUNICCSV": 16,
+    "NATJUCSV": 42,
+    "PAISCSV": 15,
+    "QUALSCSV": 30,
+    "EMPRECSV": 57,
+    "ESTABELE": 144,
+    "SOCIOCSV": 105,
+    "SIMPLESCSV": 42,
+}
+
+# Copies of a batch alive at once while it is built: the UTF-8 chunk (about
+# 1.6x the frame for ESTABELE), the parsed frame and its transformed copy.
+PEAK_FACTOR = 4
+
+# Below this, per-batch overhead (COPY round trips, Parquet row groups)
+# outweighs the memory saved; the floor wins over a too-small budget.
+MIN_BATCH_ROWS = 10_000
+
+
+def concurrent_batches(cfg) -> int:
+    """Batches that may be held in memory at once under cfg's worker mode."""
+    workers = cfg.process_workers
+    if workers <= 1:
+        return 1
+    if cfg.worker_mode == "pipeline":
+        # One per transform thread, a full queue in front of the sink, and
+        # the batch being loaded
+        return 2 * workers + 1
+    if cfg.worker_mode == "process":
+        # One per child, plus the spilled batch this process reads back
+        return workers + 1
+    return workers
+
+
+class MemoryBudget:
+    """Rows per batch for each file type, sized so concurrent batches fit total_bytes.
+
+    Each of the concurrency batches gets an equal share of the budget,
+    divided by PEAK_FACTOR and the file type's bytes per row; the result is
+    clamped to [MIN_BATCH_ROWS, max_rows]. Thread-safe: workers share one
+    instance and feed it the batches they produce.
+    """
+
+    def __init__(self, total_bytes: int, concurrency: int = 1, max_rows: int = 500000):
+        self.total_bytes = total_bytes
+        self.concurrency = max(1, concurrency)
+        self.max_rows = max_rows
+        self._bytes_per_row = dict(BYTES_PER_ROW)
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, cfg) -> "MemoryBudget | None":
+        """Budget for cfg.memory_budget, or None when unset (fixed cfg.batch_size)."""
+        if not cfg.memory_budget:
+            return None
+        return cls(parse_size(cfg.memory_budget), concurrent_batches(cfg), cfg.batch_size)
+
+    @property
+    def batch_bytes(self) -> int:
+        """Estimated in-memory size one batch may reach."""
+        return self.total_bytes // (self.concurrency * PEAK_FACTOR)
+
+    def batch_rows(self, file_type: str) -> int:
+        """Rows per batch for file_type under the current bytes-per-row estimate."""
+        with self._lock:
+            bytes_per_row = self._bytes_per_row.get(file_type, max(self._bytes_per_row.values()))
+        return max(MIN_BATCH_ROWS, min(self.max_rows, self.batch_bytes // bytes_per_row))
+
+    def observe(self, file_type: str, df: pl.DataFrame) -> None:
+        """Raise file_type's bytes-per-row estimate if df is wider than assumed."""
+        if df.is_empty():
+            return
+        bytes_per_row = math.ceil(df.estimated_size() / len(df))
+        with self._lock:
+            if bytes_per_row <= self._bytes_per_row.get(file_type, 0):
+                return
+            self._bytes_per_row[file_type] = bytes_per_row
+        logger.debug(f"{file_type}: {bytes_per_row} bytes/row, batches of {self.batch_rows(file_type):,} rows")
+
+
+def peak_rss() -> tuple[int, int]:
+    """High-water resident set size of this process and of its largest finished child, in bytes."""
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    )
+
+
+def log_memory_report(budget: "MemoryBudget | None") -> None:
+    """Log the run's memory high-water mark, against the budget when one is set."""
+    own, child = peak_rss()
+    report = f"Peak memory: {own / 1024**2:,.0f} MB"
+    if child:
+        report += f" (largest worker process: {child / 1024**2:,.0f} MB)"
+    if budget:
+        report += f", budget {budget.total_bytes / 1024**2:,.0f} MB"
+    logger.info(report)
@@ -16,16 +16,44 @@ Output structure:
 
 One file per table. DuckDB reads them directly:
     SELECT * FROM 'empresas.parquet' WHERE cnpj_basico = '12345678'
+
+Tables listed in partition_by are written Hive-style instead, one directory
+level per partition column (the column itself is not stored in the files):
+    output_dir/
+        estabelecimentos/
+            uf=SP/part-0000.parquet
+            uf=RJ/part-0000.parquet
+            ...
+
+    SELECT * FROM read_parquet('estabelecimentos/*/*.parquet', hive_partitioning = true)
+    WHERE uf = 'SP'
+
+"source_month" can be used as a partition column on any table; its value is
+the Receita Federal directory being exported.
+
+With part_per_thread=True every table is a directory too, holding one
+part-NNNN.parquet per writer thread (inside each partition, if partitioned):
+threads encode and compress in parallel instead of queueing on one file.
+
+With sort=True each table is written ordered by its key (see SORT_KEYS),
+with page indexes and a bloom filter on cnpj_basico, so a point lookup
+reads one row group. Batches are spilled to disk as they arrive and sorted
+on flush, one key prefix at a time.
 """
 
+import inspect
 import json
 import logging
+import shutil
 import threading
 import time
 import tomllib
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from urllib.parse import quote
 
+import polars as pl
+import pyarrow as pa
 import pyarrow.parquet as pq
 
 logger = logging.getLogger(__name__)
@@ -39,6 +67,55 @@ COMPRESSION = "zstd"
 # v2: socios gains socio_id (UUID), deterministic primary key (issue #78).
 SCHEMA_VERSION = "2"
 
+# Sorted output (PARQUET_SORTED): each table is ordered by these columns
+# (its primary key, led by cnpj_basico) so row-group and page statistics
+# let lookups skip everything but the matching range. Tables not listed
+# sort by "codigo".
+SORT_KEYS = {
+    "empresas": ["cnpj_basico"],
+    "estabelecimentos": ["cnpj_basico", "cnpj_ordem", "cnpj_dv"],
+    "socios": ["cnpj_basico", "socio_id"],
+    "dados_simples": ["cnpj_basico"],
+}
+# Rows are spilled into one file per this many leading characters of the
+# first sort column (100 files for cnpj_basico), each sorted in memory.
+SORT_PREFIX_CHARS = 2
+BLOOM_FILTER_COLUMNS = ["cnpj_basico"]
+BLOOM_FILTER_FPP = 0.01
+# Bloom filter writing arrived in later pyarrow releases than our floor
+_SUPPORTS_BLOOM_FILTERS = "bloom_filter_options" in inspect.signature(pq.ParquetWriter.__init__).parameters
+
+SOURCE_MONTH_COLUMN = "source_month"
+# Directory name for a NULL partition value (Hive/Arrow convention)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def parse_partition_by(spec: str) -> dict[str, list[str]]:
+    """Parse PARQUET_PARTITION_BY ("table:col[,col];table:col") into a dict."""
+    partition_by = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        table_name, _, columns = entry.partition(":")
+        cols = [c.strip() for c in columns.split(",") if c.strip()]
+        if not cols:
+            raise ValueError(f"PARQUET_PARTITION_BY entry {entry!r} has no columns (expected table:col[,col])")
+        partition_by[table_name.strip()] = cols
+    return partition_by
+
+
+def _sort_key(table_name: str, columns: list[str]) -> list[str]:
+    """Sort columns for a table, limited to those present."""
+    return [col for col in SORT_KEYS.get(table_name, ["codigo"]) if col in columns]
+
+
+def _partition_dir(columns: list[str], values: tuple) -> str:
+    """Hive path segment for one partition, e.g. "uf=SP/source_month=2024-11"."""
+    return "/".join(
+        f"{col}={NULL_PARTITION if value is None else quote(str(value), safe='')}"
+        for col, value in zip(columns, values)
+    )
+
 
 def _read_pipeline_version() -> str:
     """Read the pipeline version from pyproject.toml. Returns 'unknown' if
@@ -60,46 +137,260 @@ class TableStats:
     rows: int = 0
     size_bytes: int = 0
     file: str = ""
+    files: list[str] = field(default_factory=list)
+
+
+class _RowGroupWriter:
+    """A pq.ParquetWriter that only writes full ROW_GROUP_SIZE row groups.
+
+    Batches, and a batch's pieces once split by partition, are usually
+    smaller than a row group; written as they come, each would end in a
+    short row group of its own. Rows are buffered until a full group is
+    in, and close() writes what is left as the file's one short group.
+    Holds up to ROW_GROUP_SIZE rows per open file.
+    """
+
+    def __init__(self, path: str, schema, **options):
+        self._writer = pq.ParquetWriter(path, schema, **options)
+        self._pending: list[pa.Table] = []
+        self._pending_rows = 0
+
+    def write_table(self, table: pa.Table) -> None:
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows < ROW_GROUP_SIZE:
+            return
+        buffered = pa.concat_tables(self._pending)
+        full = buffered.num_rows - buffered.num_rows % ROW_GROUP_SIZE
+        self._writer.write_table(buffered.slice(0, full), row_group_size=ROW_GROUP_SIZE)
+        rest = buffered.slice(full)
+        self._pending = [rest] if rest.num_rows else []
+        self._pending_rows = rest.num_rows
+
+    def close(self) -> None:
+        if self._pending_rows:
+            self._writer.write_table(pa.concat_tables(self._pending), row_group_size=ROW_GROUP_SIZE)
+        self._pending = []
+        self._pending_rows = 0
+        self._writer.close()
 
 
 class ParquetWriter:
-    """Streams DataFrames to single Parquet files per table."""
+    """Streams DataFrames to one Parquet file per table, or one per partition."""
 
-    def __init__(self, output_dir: str | Path):
+    def __init__(
+        self,
+        output_dir: str | Path,
+        partition_by: dict[str, list[str]] | None = None,
+        source_month: str | None = None,
+        sort: bool = False,
+        part_per_thread: bool = False,
+    ):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.partition_by = partition_by or {}
+        self.source_month = source_month
+        self.sort = sort
+        self.part_per_thread = part_per_thread
         self.stats: dict[str, TableStats] = {}
-        self._writers: dict[str, pq.ParquetWriter] = {}
+        self._writers: dict[str, _RowGroupWriter] = {}
+        # table -> (partition values, part number) -> writer, for tables
+        # written as a directory (partitioned, or part_per_thread)
+        self._partition_writers: dict[str, dict[tuple, _RowGroupWriter]] = {}
+        # (table, thread id) -> part number, with part_per_thread
+        self._thread_parts: dict[tuple[str, int], int] = {}
+        # table -> key prefix -> (spill path, writer), while sorting
+        self._spills: dict[str, dict[str | None, tuple[Path, pa.ipc.RecordBatchFileWriter]]] = {}
+        # Tables already warned that this pyarrow can't write bloom filters
+        self._bloom_warned: set[str] = set()
         self._lock = threading.Lock()
 
-    def _get_writer(self, table_name: str, schema) -> pq.ParquetWriter:
+    def output_path(self, table_name: str) -> Path:
+        """Final location of a table: its .parquet file, or its directory of parts."""
+        if self._is_directory(table_name):
+            return self.output_dir / table_name
+        return self.output_dir / f"{table_name}.parquet"
+
+    def _is_directory(self, table_name: str) -> bool:
+        return table_name in self.partition_by or self.part_per_thread
+
+    def _staging_dir(self, table_name: str) -> Path:
+        # Directory tables are written here and renamed into place on
+        # flush, so a crashed export never leaves a directory that resume
+        # would take for a finished table.
+        return self.output_dir / f".{table_name}.partial"
+
+    def _spill_dir(self, table_name: str) -> Path:
+        return self.output_dir / f".{table_name}.sort"
+
+    def _writer_options(self, table_name: str, schema) -> dict:
+        """pq.ParquetWriter options; sorted output adds what lookups prune with."""
+        options = {"compression": COMPRESSION}
+        if not self.sort:
+            return options
+
+        options["write_page_index"] = True
+        options["sorting_columns"] = [
+            pq.SortingColumn(schema.get_field_index(col)) for col in _sort_key(table_name, schema.names)
+        ]
+        bloom_columns = [col for col in BLOOM_FILTER_COLUMNS if col in schema.names]
+        if bloom_columns and _SUPPORTS_BLOOM_FILTERS:
+            options["bloom_filter_options"] = {
+                col: {"ndv": ROW_GROUP_SIZE, "fpp": BLOOM_FILTER_FPP} for col in bloom_columns
+            }
+        elif bloom_columns and table_name not in self._bloom_warned:
+            self._bloom_warned.add(table_name)
+            logger.warning(
+                f"{table_name}: pyarrow {pa.__version__} can't write bloom filters; "
+                f"{', '.join(bloom_columns)} written without one"
+            )
+        return options
+
+    def _get_writer(self, table_name: str, schema) -> _RowGroupWriter:
         """Get or create a ParquetWriter for a table."""
         if table_name not in self._writers:
             path = self.output_dir / f"{table_name}.parquet"
-            self._writers[table_name] = pq.ParquetWriter(
-                str(path),
-                schema,
-                compression=COMPRESSION,
-            )
+            self._writers[table_name] = _RowGroupWriter(str(path), schema, **self._writer_options(table_name, schema))
         return self._writers[table_name]
 
+    def _get_part_writer(self, table_name: str, values: tuple, part: int, schema) -> _RowGroupWriter:
+        """Get or create the writer for one part file of a directory table."""
+        writers = self._partition_writers.get(table_name)
+        if writers is None:
+            staging = self._staging_dir(table_name)
+            shutil.rmtree(staging, ignore_errors=True)
+            staging.mkdir(parents=True)
+            writers = self._partition_writers[table_name] = {}
+
+        if (values, part) not in writers:
+            directory = self._staging_dir(table_name)
+            if values:
+                directory = directory / _partition_dir(self.partition_by[table_name], values)
+            directory.mkdir(parents=True, exist_ok=True)
+            writers[(values, part)] = _RowGroupWriter(
+                str(directory / f"part-{part:04d}.parquet"), schema, **self._writer_options(table_name, schema)
+            )
+        return writers[(values, part)]
+
+    def _to_arrow(self, df, table_name: str) -> list[tuple[tuple, pa.Table]]:
+        """(partition values, rows) per partition; one () entry when unpartitioned."""
+        partition_columns = self.partition_by.get(table_name)
+        if not partition_columns:
+            return [((), df.to_arrow())]
+
+        if SOURCE_MONTH_COLUMN in partition_columns and SOURCE_MONTH_COLUMN not in df.columns:
+            df = df.with_columns(pl.lit(self.source_month, dtype=pl.Utf8).alias(SOURCE_MONTH_COLUMN))
+        parts = df.partition_by(partition_columns, as_dict=True, include_key=False)
+        return [(values, part.to_arrow()) for values, part in parts.items()]
+
+    def _write_arrow(self, tables: list[tuple[tuple, pa.Table]], table_name: str, part: int = 0):
+        """Append rows to the table's file(s). Caller holds the lock."""
+        for values, arrow_table in tables:
+            if self._is_directory(table_name):
+                writer = self._get_part_writer(table_name, values, part, arrow_table.schema)
+            else:
+                writer = self._get_writer(table_name, arrow_table.schema)
+            writer.write_table(arrow_table)
+
+    def _write_rows(self, df, table_name: str):
+        """Append rows to the table's file(s). Caller holds the lock."""
+        self._write_arrow(self._to_arrow(df, table_name), table_name)
+
+    def _write_own_part(self, tables: list[tuple[tuple, pa.Table]], table_name: str):
+        """Append rows to the calling thread's own part file(s).
+
+        Only creating a writer takes the lock: no other thread ever writes
+        this part, so encoding and ZSTD compression run in parallel.
+        """
+        for values, arrow_table in tables:
+            with self._lock:
+                part = self._thread_parts.setdefault(
+                    (table_name, threading.get_ident()),
+                    sum(1 for t, _ in self._thread_parts if t == table_name),
+                )
+                writer = self._get_part_writer(table_name, values, part, arrow_table.schema)
+            writer.write_table(arrow_table)
+
+    def _spill(self, df, table_name: str):
+        """Distribute rows into one spill file per sort-key prefix. Caller holds the lock.
+
+        Prefixes order the same way as the keys they start, so sorting each
+        spill file on its own and writing them in prefix order yields the
+        whole table sorted while holding only one prefix in memory.
+        """
+        key = _sort_key(table_name, df.columns)
+        if not key:
+            self._write_rows(df, table_name)
+            return
+
+        spills = self._spills.get(table_name)
+        if spills is None:
+            shutil.rmtree(self._spill_dir(table_name), ignore_errors=True)
+            self._spill_dir(table_name).mkdir(parents=True)
+            spills = self._spills[table_name] = {}
+
+        prefix = pl.col(key[0]).cast(pl.Utf8).str.slice(0, SORT_PREFIX_CHARS).alias("__prefix")
+        for (value,), part in df.with_columns(prefix).partition_by("__prefix", as_dict=True).items():
+            arrow_table = part.drop("__prefix").to_arrow()
+            if value not in spills:
+                path = self._spill_dir(table_name) / f"{len(spills):05d}.arrow"
+                spills[value] = (path, pa.ipc.new_file(str(path), arrow_table.schema))
+            spills[value][1].write_table(arrow_table)
+
+    def _drain_spills(self, table_name: str):
+        """Sort each spill file in prefix order and write it out."""
+        spills = self._spills.pop(table_name)
+        for _, writer in spills.values():
+            writer.close()
+
+        # The writers buffer rows into full row groups, so small prefixes
+        # share row groups instead of each ending in a short one.
+        for value in sorted(spills, key=lambda v: (v is None, v or "")):
+            path = spills[value][0]
+            with pa.memory_map(str(path)) as source:
+                df = pl.from_arrow(pa.ipc.open_file(source).read_all())
+            self._write_rows(df.sort(_sort_key(table_name, df.columns), nulls_last=True), table_name)
+            path.unlink()
+        shutil.rmtree(self._spill_dir(table_name), ignore_errors=True)
+
     def write_batch(self, df, table_name: str, columns: list[str]) -> int:
-        """Write a batch of data to Parquet. Thread-safe. Returns the number of rows written."""
-        arrow_table = df.to_arrow()
+        """Write a batch of data to Parquet. Thread-safe. Returns the number of rows written.
+
+        With sort, rows are only spilled here; flush_table writes them.
+        With part_per_thread, each thread appends to a part file of its own
+        and the shared lock is never held while writing.
+        """
         rows = len(df)
 
+        if self.part_per_thread and not self.sort:
+            self._write_own_part(self._to_arrow(df, table_name), table_name)
+            with self._lock:
+                self.stats.setdefault(table_name, TableStats()).rows += rows
+            return rows
+
+        tables = None if self.sort else self._to_arrow(df, table_name)
         with self._lock:
             if table_name not in self.stats:
                 self.stats[table_name] = TableStats()
 
-            writer = self._get_writer(table_name, arrow_table.schema)
-            writer.write_table(arrow_table, row_group_size=ROW_GROUP_SIZE)
+            if self.sort:
+                self._spill(df, table_name)
+            else:
+                self._write_arrow(tables, table_name)
             self.stats[table_name].rows += rows
 
         return rows
 
     def flush_table(self, table_name: str) -> Path | None:
-        """Close the writer for a specific table. Returns the file path."""
+        """Close the writer(s) for a specific table.
+
+        Returns the file path, or the table directory for directory tables.
+        Writes must have stopped: part_per_thread writers are closed here.
+        """
+        if table_name in self._spills:
+            self._drain_spills(table_name)
+        if table_name in self._partition_writers:
+            return self._flush_directory(table_name)
         if table_name not in self._writers:
             return None
 
@@ -111,12 +402,29 @@ class ParquetWriter:
             size = path.stat().st_size
             self.stats[table_name].size_bytes = size
             self.stats[table_name].file = str(path.relative_to(self.output_dir))
+            self.stats[table_name].files = [self.stats[table_name].file]
             return path
         return None
 
+    def _flush_directory(self, table_name: str) -> Path:
+        for writer in self._partition_writers.pop(table_name).values():
+            writer.close()
+        self._thread_parts = {key: part for key, part in self._thread_parts.items() if key[0] != table_name}
+
+        path = self.output_path(table_name)
+        shutil.rmtree(path, ignore_errors=True)
+        self._staging_dir(table_name).rename(path)
+
+        parts = sorted(path.rglob("*.parquet"))
+        stats = self.stats[table_name]
+        stats.size_bytes = sum(part.stat().st_size for part in parts)
+        stats.file = str(path.relative_to(self.output_dir))
+        stats.files = [str(part.relative_to(self.output_dir)) for part in parts]
+        return path
+
     def close(self):
         """Close all open writers."""
-        for table_name in list(self._writers.keys()):
+        for table_name in {*self._spills, *self._writers, *self._partition_writers}:
             self.flush_table(table_name)
 
     def write_manifest(self, source_month: str | None = None) -> dict:
@@ -137,7 +445,7 @@ class ParquetWriter:
             "totals": {
                 "rows": sum(s.rows for s in self.stats.values()),
                 "sizeBytes": sum(s.size_bytes for s in self.stats.values()),
-                "files": len(self.stats),
+                "files": sum(len(s.files) for s in self.stats.values()),
             },
         }
 
@@ -146,7 +454,10 @@ class ParquetWriter:
                 "rows": stats.rows,
                 "sizeBytes": stats.size_bytes,
                 "file": stats.file,
+                "files": stats.files,
             }
+            if table_name in self.partition_by:
+                manifest["tables"][table_name]["partitionBy"] = self.partition_by[table_name]
 
         manifest_path = self.output_dir / "manifest.json"
         manifest_path.write_text(json.dumps(manifest, indent=2))
@@ -0,0 +1,139 @@
+"""Staged pipeline with bounded queues between stages.
+
+Each stage runs in its own threads and hands items to the next stage
+through a bounded queue, so every stage works at the same time and a slow
+stage blocks the ones feeding it (backpressure) instead of letting work
+pile up on disk or in memory:
+
+    items → [download ×4] → q → [extract ×1] → q → [transform ×N] → q → [sink ×1]
+
+The first error in any stage stops all of them and is re-raised by run().
+"""
+
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# How often blocked puts/gets/waits check whether another stage failed
+POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised in a stage's thread when another stage has failed."""
+
+
+@dataclass
+class Stage:
+    """One step of a Pipeline.
+
+    func maps one input item to an iterable of output items (zero, one or
+    many) for the next stage; the last stage's outputs are discarded.
+    queue_size bounds how many items may wait in front of the stage.
+    """
+
+    name: str
+    func: Callable[[Any], Iterable[Any]]
+    workers: int = 1
+    queue_size: int = 1
+
+
+class Pipeline:
+    """Run items through stages connected by bounded queues."""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.failed = threading.Event()
+        self._error: BaseException | None = None
+        self._lock = threading.Lock()
+
+    def wait(self, event: threading.Event) -> None:
+        """Block until event is set; raise PipelineAborted if a stage fails first.
+
+        For stage functions that must wait on each other, so a failure
+        elsewhere can't leave them blocked forever.
+        """
+        while not event.wait(POLL_SECONDS):
+            if self.failed.is_set():
+                raise PipelineAborted
+
+    def run(self, items: Iterable[Any]) -> None:
+        """Feed items through every stage and wait for all of them to finish."""
+        queues: List[queue.Queue] = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        running = [stage.workers for stage in self.stages]
+        threads = []
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work, args=(i, queues, running), name=f"{stage.name}-{n}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                self._put(queues[0], item)
+            for _ in range(self.stages[0].workers):
+                self._put(queues[0], _DONE)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail("source", e)
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _work(self, index: int, queues: List[queue.Queue], running: List[int]) -> None:
+        stage = self.stages[index]
+        outbox = queues[index + 1] if index + 1 < len(self.stages) else None
+        try:
+            while (item := self._get(queues[index])) is not _DONE:
+                for output in stage.func(item):
+                    if outbox is not None:
+                        self._put(outbox, output)
+
+            # The stage's last worker to finish tells every downstream worker
+            with self._lock:
+                running[index] -= 1
+                last = running[index] == 0
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    self._put(outbox, _DONE)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            self._fail(stage.name, e)
+
+    def _fail(self, name: str, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+                logger.error(f"Pipeline stage {name} failed: {error}")
+        self.failed.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> None:
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue) -> Any:
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
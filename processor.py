@@ -2,16 +2,19 @@
 
 import csv
 import hashlib
+import io
 import logging
-import os
-import tempfile
+import multiprocessing
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Generator, List, Optional, Tuple
+from typing import BinaryIO, Generator, Iterator, List, Optional, Tuple
 
 import polars as pl
 
+from memory_budget import MemoryBudget
+
 logger = logging.getLogger(__name__)
 
 # File pattern → table name mapping
@@ -138,7 +141,7 @@ class LayoutDriftError(ValueError):
     fixed new_columns list and would drop extras or null-fill missing fields)."""
 
 
-def _check_layout(utf8_file: Path, file_type: str) -> None:
+def _check_layout(csv_file: Path, file_type: str) -> None:
     """Verify the CSV's column count matches the expected schema.
 
     RFB CSVs are headerless and the pipeline uses Polars' new_columns to
@@ -148,155 +151,252 @@ def _check_layout(utf8_file: Path, file_type: str) -> None:
     raises LayoutDriftError on mismatch so the failure is loud.
 
     A real CSV parser is used (csv.reader with ';' delimiter) instead of a
-    naive split so quoted-field edge cases don't false-positive.
+    naive split so quoted-field edge cases don't false-positive. The file is
+    read as ISO-8859-1 (the RFB encoding); every byte decodes, and the
+    field count is all that matters here. Only the first record is read,
+    so this is cheap for a ZIP member too (see process_file).
     """
     expected = len(COLUMNS[file_type])
-    with open(utf8_file, encoding="utf-8", newline="") as f:
+    with io.TextIOWrapper(csv_file.open("rb"), encoding="ISO-8859-1", newline="") as f:
         reader = csv.reader(f, delimiter=";")
         try:
             first_row = next(reader)
         except StopIteration:
-            return  # empty file; Polars NoDataError handles it cleanly
+            return  # empty file; the reader yields nothing for it
     actual = len(first_row)
     if actual != expected:
         raise LayoutDriftError(
-            f"Layout drift in {utf8_file.name} ({file_type}): "
+            f"Layout drift in {csv_file.name} ({file_type}): "
             f"expected {expected} columns, got {actual}. "
             f"Receita Federal may have changed the file layout - update "
             f"COLUMNS[{file_type!r}] in processor.py before re-running."
         )
 
 
-def _convert_encoding(file_path: Path) -> Path:
-    """Convert ISO-8859-1 to UTF-8. Returns path to converted file."""
-    fd, tmp_path = tempfile.mkstemp(suffix=".utf8.csv")
-    os.close(fd)
-    utf8_file = Path(tmp_path)
-    try:
-        with open(file_path, "r", encoding="ISO-8859-1") as infile:
-            with open(utf8_file, "w", encoding="UTF-8") as outfile:
-                for chunk in iter(lambda: infile.read(50 * 1024 * 1024), ""):  # 50MB chunks
-                    outfile.write(chunk)
-    except Exception:
-        utf8_file.unlink(missing_ok=True)
-        raise
-    return utf8_file
+# Raw bytes pulled from the source per read() call while assembling a batch.
+READ_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Bytes buffered without a single record end before the source is taken to
+# have an unbalanced quote; no RFB record comes close to this.
+MAX_RECORD_BLOCKS = 8
+
+
+class UnbalancedQuoteError(ValueError):
+    """Raised when a CSV stream has no record end within MAX_RECORD_BLOCKS
+    read blocks, i.e. a quote that is never closed. Without this the rest of
+    the file would be buffered waiting for the record to end."""
+
+
+def _last_record_end(buffer: bytearray, start: int, parity: int) -> tuple[int, int]:
+    """Offset just past the last newline in buffer[start:] that ends a record.
+
+    RFB quotes every field, and a quoted field may carry an embedded
+    newline. A newline ends a record only when the quotes before it are
+    balanced; escaped quotes ("") count twice, so parity still holds.
+    parity is that of the quotes in buffer[:start], which the caller has
+    already scanned; each byte is counted once, walking back from the end.
+    Returns (offset or 0 if none, parity of the quotes in the whole buffer).
+    """
+    total = (parity + buffer.count(b'"', start)) % 2
+    after = 0
+    end = len(buffer)
+    while (pos := buffer.rfind(b"\n", start, end)) != -1:
+        after += buffer.count(b'"', pos, end)
+        if (total - after) % 2 == 0:
+            return pos + 1, total
+        end = pos
+    return 0, total
+
+
+def _iter_utf8_chunks(stream: BinaryIO, batch_size: int) -> Iterator[bytes]:
+    """Read an ISO-8859-1 CSV stream and yield UTF-8 chunks of whole records.
+
+    Each chunk holds at least batch_size records (except the last) and is
+    cut on a record boundary, so Polars can parse it on its own. Transcoding
+    happens in memory per chunk - no UTF-8 copy of the file is written.
+    Decoding straight from a memoryview skips a copy of the raw bytes, and
+    pure-ASCII chunks (most of SIMPLES, SOCIOS, EMPRESAS) encode as a memcpy.
+    Raises UnbalancedQuoteError when no record ends within
+    MAX_RECORD_BLOCKS blocks.
+    """
+    buffer = bytearray()
+    newlines = 0
+    # buffer[:scanned] holds no record end; parity is its quote count's
+    scanned = parity = 0
+    while block := stream.read(READ_BLOCK_BYTES):
+        buffer += block
+        newlines += block.count(b"\n")
+        if newlines < batch_size:
+            continue
+        cut, parity = _last_record_end(buffer, scanned, parity)
+        if cut == 0:
+            scanned = len(buffer)
+            if scanned > MAX_RECORD_BLOCKS * READ_BLOCK_BYTES:
+                raise UnbalancedQuoteError(f"No record end in {scanned:,} bytes: unbalanced quote in the CSV")
+            continue
+        with memoryview(buffer) as view:
+            chunk = str(view[:cut], "ISO-8859-1").encode("utf-8")
+        del buffer[:cut]
+        # The cut is balanced, so the rest keeps the whole buffer's parity
+        scanned = len(buffer)
+        newlines = buffer.count(b"\n")
+        yield chunk
+    if buffer:
+        yield buffer.decode("ISO-8859-1").encode("utf-8")
+
+
+def _read_batches(stream: BinaryIO, columns: List[str], batch_size: int) -> Iterator[pl.DataFrame]:
+    """Parse an ISO-8859-1 CSV stream into DataFrames of at most batch_size rows."""
+    for chunk in _iter_utf8_chunks(stream, batch_size):
+        df = pl.read_csv(
+            chunk,
+            separator=";",
+            has_header=False,
+            new_columns=columns,
+            encoding="utf8",
+            infer_schema_length=0,
+            null_values=[""],
+            ignore_errors=True,
+            low_memory=False,
+            raise_if_empty=False,
+        )
+        yield from df.iter_slices(batch_size)
 
 
 def process_file(
-    file_path: Path, batch_size: int = 50000, typed: bool = False
+    file_path: Path,
+    batch_size: int = 50000,
+    typed: bool = False,
+    engine: str = "eager",
+    memory: Optional[MemoryBudget] = None,
 ) -> Generator[Tuple[pl.DataFrame, str, List[str]], None, None]:
     """Process a CSV file and yield batches as Polars DataFrames.
 
+    The ISO-8859-1 source is streamed and transcoded to UTF-8 one batch at
+    a time in memory (see _iter_utf8_chunks); nothing is written to disk.
+
     Args:
-        file_path: CSV file to process.
-        batch_size: Polars batch size for streaming reads.
+        file_path: CSV file to process. Anything with a .name and an
+            .open("rb") works, e.g. a downloader.ZipMember, which streams
+            the CSV out of its ZIP without extracting it.
+        batch_size: Maximum rows per yielded batch.
         typed: When true, cast date/numeric columns to their Polars
             typed forms (Date, Float64, Int32). Postgres mode leaves
             this false because the destination column types coerce
             strings during COPY; Parquet mode opts in via the
             PARQUET_TYPED_OUTPUT flag so the on-disk Parquet has the
             same shape Postgres ends up with.
+        engine: "eager" runs _transform, _validate and _apply_typed_casts
+            on each batch; "streaming" runs them as one LazyFrame plan on
+            Polars' streaming engine (see _scan_batches). Both yield the
+            same batches.
+        memory: When given, batch_size is replaced by the rows this file
+            type may hold under the budget, and every batch is fed back to
+            refine the estimate for the next file (see memory_budget).
     """
     file_type = get_file_type(file_path.name)
     if not file_type:
         logger.warning(f"Unknown file type: {file_path.name}")
         return
+    if memory:
+        batch_size = memory.batch_rows(file_type)
 
     table_name = FILE_MAPPINGS[file_type]
     input_columns = COLUMNS[file_type]
     output_columns = _output_columns(file_type)
 
-    # Convert encoding first (faster for Polars to read UTF-8)
-    utf8_file = _convert_encoding(file_path)
-
-    try:
-        # Verify the CSV layout matches the expected column count before
-        # Polars binds field-by-position to new_columns. Catches RFB schema
-        # changes that would otherwise be silently mis-mapped.
-        _check_layout(utf8_file, file_type)
-
-        try:
-            reader = pl.read_csv_batched(
-                utf8_file,
-                separator=";",
-                has_header=False,
-                new_columns=input_columns,
-                encoding="utf8",
-                infer_schema_length=0,
-                null_values=[""],
-                ignore_errors=True,
-                low_memory=False,
-                batch_size=batch_size,
-            )
-        except pl.exceptions.NoDataError:
+    # Verify the CSV layout matches the expected column count before
+    # Polars binds field-by-position to new_columns. Catches RFB schema
+    # changes that would otherwise be silently mis-mapped.
+    _check_layout(file_path, file_type)
+
+    with file_path.open("rb") as stream:
+        if engine == "streaming":
+            for df in _scan_batches(stream, file_type, batch_size, typed):
+                if not df.is_empty():
+                    if memory:
+                        memory.observe(file_type, df)
+                    yield df, table_name, output_columns
             return
 
-        while (batches := reader.next_batches(1)) is not None:
-            for df in batches:
-                if df.is_empty():
-                    continue
-                df = _transform(df, file_type)
-                df = _validate(df, file_type)
-                if typed:
-                    df = _apply_typed_casts(df, file_type)
-                yield df, table_name, output_columns
-    finally:
-        utf8_file.unlink(missing_ok=True)
+        for df in _read_batches(stream, input_columns, batch_size):
+            if df.is_empty():
+                continue
+            df = _transform(df, file_type)
+            df = _validate(df, file_type)
+            if typed:
+                df = _apply_typed_casts(df, file_type)
+            if memory:
+                memory.observe(file_type, df)
+            yield df, table_name, output_columns
 
 
 def _transform(df: pl.DataFrame, file_type: str) -> pl.DataFrame:
     """Apply transformations based on file type."""
+    cleanup, nulled = _transform_rules(df.columns, file_type)
+    if cleanup:
+        df = df.with_columns(cleanup)
 
-    # Capital social: "1.234,56" → "1234.56", negative → null
-    if file_type == "EMPRECSV" and "capital_social" in df.columns:
-        df = df.with_columns(pl.col("capital_social").str.replace_all(r"\.", "").str.replace(",", "."))
-        is_negative = pl.col("capital_social").str.starts_with("-")
-        invalid_count = df.filter(is_negative).height
+    for col, (mask, message) in nulled.items():
+        invalid_count = df.filter(mask).height
         if invalid_count > 0:
-            logger.warning(f"capital_social: {invalid_count} negative values → null")
-        df = df.with_columns(
-            pl.when(is_negative).then(None).otherwise(pl.col("capital_social")).alias("capital_social")
+            logger.warning(message.format(invalid_count))
+        df = df.with_columns(pl.when(mask).then(None).otherwise(pl.col(col)).alias(col))
+
+    # Socios: deterministic UUID derived from the identity tuple. Lives as
+    # socios.socio_id (PK). nome_socio is normalized for hashing only; the
+    # raw column is left alone. Field separator is U+001F (unit separator)
+    # which does not appear in RFB text.
+    if file_type == "SOCIOCSV":
+        df = _add_socio_id(df)
+
+    return df
+
+
+def _transform_rules(columns: List[str], file_type: str) -> tuple[list[pl.Expr], dict[str, tuple[pl.Expr, str]]]:
+    """Build _transform's rules, except socio_id, for a frame with the given columns.
+
+    Returns the independent per-column cleanups, then per column the mask
+    of cleaned values to null and the warning (with a {} placeholder for
+    the count) to log. Shared by the eager and streaming engines.
+    """
+    cleanup: list[pl.Expr] = []
+    nulled: dict[str, tuple[pl.Expr, str]] = {}
+
+    # Capital social: "1.234,56" → "1234.56", negative → null
+    if file_type == "EMPRECSV" and "capital_social" in columns:
+        cleanup.append(pl.col("capital_social").str.replace_all(r"\.", "").str.replace(",", "."))
+        nulled["capital_social"] = (
+            pl.col("capital_social").str.starts_with("-"),
+            "capital_social: {} negative values → null",
         )
 
     # Date columns: "0" or "00000000" → null (placeholder cleanup only, validation in _validate)
-    if file_type in _DATE_COLS:
-        for col in _DATE_COLS[file_type]:
-            if col in df.columns:
-                df = df.with_columns(
-                    pl.when((pl.col(col) == "0") | (pl.col(col) == "00000000") | (pl.col(col).is_null()))
-                    .then(None)
-                    .otherwise(pl.col(col))
-                    .alias(col)
-                )
+    for col in _DATE_COLS.get(file_type, []):
+        if col in columns:
+            is_placeholder = (pl.col(col) == "0") | (pl.col(col) == "00000000") | pl.col(col).is_null()
+            cleanup.append(pl.when(is_placeholder).then(None).otherwise(pl.col(col)).alias(col))
 
     # Estabelecimentos: pad country code
-    if file_type == "ESTABELE" and "pais" in df.columns:
-        df = df.with_columns(pl.col("pais").str.zfill(3))
+    if file_type == "ESTABELE" and "pais" in columns:
+        cleanup.append(pl.col("pais").str.zfill(3))
 
     # Estabelecimentos: pad 7-digit numeric CEP to 8 (RFB drops the leading
     # zero for ~0.1% of rows, mostly SP CEPs like 1005010 → 01005010).
     # Narrow rule: only when the value is exactly 7 digits, all-numeric.
     # Leaves '0', '       0', letters, '00000000', and other shapes untouched
     # so the data_quality_report keeps surfacing them.
-    if file_type == "ESTABELE" and "cep" in df.columns:
+    if file_type == "ESTABELE" and "cep" in columns:
         needs_pad = pl.col("cep").str.contains(r"^\d{7}$")
-        df = df.with_columns(pl.when(needs_pad).then(pl.col("cep").str.zfill(8)).otherwise(pl.col("cep")).alias("cep"))
+        cleanup.append(pl.when(needs_pad).then(pl.col("cep").str.zfill(8)).otherwise(pl.col("cep")).alias("cep"))
 
     # Socios: backfill the masked CPF so the hash input is total. Foreign
     # partners frequently arrive with blank CPF; without this they would all
     # hash with cpf="" and collapse together.
-    if file_type == "SOCIOCSV" and "cnpj_cpf_do_socio" in df.columns:
-        df = df.with_columns(pl.col("cnpj_cpf_do_socio").fill_null("00000000000000"))
+    if file_type == "SOCIOCSV" and "cnpj_cpf_do_socio" in columns:
+        cleanup.append(pl.col("cnpj_cpf_do_socio").fill_null("00000000000000"))
 
-    # Socios: deterministic UUID derived from the identity tuple. Lives as
-    # socios.socio_id (PK). nome_socio is normalized for hashing only; the
-    # raw column is left alone. Field separator is U+001F (unit separator)
-    # which does not appear in RFB text.
-    if file_type == "SOCIOCSV":
-        df = _add_socio_id(df)
-
-    return df
+    return cleanup, nulled
 
 
 _SOCIO_ID_SEP = "\x1f"
@@ -309,10 +409,75 @@ def _canonical_name_expr(col: str) -> pl.Expr:
 
 
 def _payload_to_uuid(payload: str) -> str:
+    """Reference (per-row) socio_id derivation; _payloads_to_uuids must match it."""
     digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
     return str(uuid.UUID(bytes=digest))
 
 
+# Payloads per task when socio_id hashing runs on the hash pool
+HASH_CHUNK_ROWS = 100_000
+
+_hash_pool: ProcessPoolExecutor | None = None
+
+
+def start_hash_pool(workers: int) -> None:
+    """Hash socio_id payloads on worker processes instead of the calling thread.
+
+    blake2b only releases the GIL for inputs over 2 KB, and payloads are
+    well under 100 bytes, so hashing in-thread serializes every transform
+    thread on the GIL. With a pool, each batch's payloads are split into
+    HASH_CHUNK_ROWS chunks hashed in parallel. No-op for workers <= 1.
+    """
+    global _hash_pool
+    if workers > 1 and _hash_pool is None:
+        # spawn, not fork: the caller may already be running threads
+        _hash_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def stop_hash_pool() -> None:
+    """Shut down the pool started by start_hash_pool, if any."""
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown()
+        _hash_pool = None
+
+
+def _blake2b_digests(payloads: pl.Series) -> pl.Series:
+    """16-byte blake2b digest of each Binary payload (runs on the hash pool)."""
+    blake2b = hashlib.blake2b
+    return pl.Series(payloads.name, [blake2b(p, digest_size=16).digest() for p in payloads.to_list()], pl.Binary)
+
+
+def _payloads_to_uuids(payloads: pl.Series) -> pl.Series:
+    """Batch form of _payload_to_uuid, producing the same UUID strings.
+
+    Casting to Binary hands over the UTF-8 bytes without a per-row
+    str.encode, and the hex/dash formatting runs as Polars expressions
+    instead of a uuid.UUID per row. The blake2b calls themselves run on
+    the hash pool when one is started; chunks travel as Arrow buffers.
+    """
+    binary = payloads.cast(pl.Binary)
+    pool = _hash_pool
+    if pool is not None and len(binary) > HASH_CHUNK_ROWS:
+        chunks = [binary.slice(offset, HASH_CHUNK_ROWS) for offset in range(0, len(binary), HASH_CHUNK_ROWS)]
+        digests = pl.concat(list(pool.map(_blake2b_digests, chunks)))
+    else:
+        digests = _blake2b_digests(binary)
+    hex_digest = digests.bin.encode("hex")
+    return pl.select(
+        pl.concat_str(
+            [
+                hex_digest.str.slice(0, 8),
+                hex_digest.str.slice(8, 4),
+                hex_digest.str.slice(12, 4),
+                hex_digest.str.slice(16, 4),
+                hex_digest.str.slice(20, 12),
+            ],
+            separator="-",
+        )
+    ).to_series()
+
+
 _SOCIO_ID_INPUTS = (
     "cnpj_basico",
     "identificador_de_socio",
@@ -322,13 +487,8 @@ _SOCIO_ID_INPUTS = (
 )
 
 
-def _add_socio_id(df: pl.DataFrame) -> pl.DataFrame:
-    # Partial frames in unit tests may omit identity columns; the full read
-    # path always provides them, so a missing column there is a bug surfaced
-    # elsewhere.
-    if not all(c in df.columns for c in _SOCIO_ID_INPUTS):
-        return df
-    payload = pl.concat_str(
+def _socio_id_payload() -> pl.Expr:
+    return pl.concat_str(
         [
             pl.col("cnpj_basico").fill_null(""),
             pl.col("identificador_de_socio").fill_null(""),
@@ -338,7 +498,15 @@ def _add_socio_id(df: pl.DataFrame) -> pl.DataFrame:
         ],
         separator=_SOCIO_ID_SEP,
     )
-    df = df.with_columns(payload.map_elements(_payload_to_uuid, return_dtype=pl.Utf8).alias("socio_id"))
+
+
+def _add_socio_id(df: pl.DataFrame) -> pl.DataFrame:
+    # Partial frames in unit tests may omit identity columns; the full read
+    # path always provides them, so a missing column there is a bug surfaced
+    # elsewhere.
+    if not all(c in df.columns for c in _SOCIO_ID_INPUTS):
+        return df
+    df = df.with_columns(_payloads_to_uuids(df.select(_socio_id_payload()).to_series()).alias("socio_id"))
     # OUTPUT_COLUMNS["SOCIOCSV"] puts socio_id first; align df so COPY's
     # column list and the CSV stream agree on order.
     return df.select(OUTPUT_COLUMNS["SOCIOCSV"])
@@ -417,45 +585,78 @@ _FORMAT_RULES: dict[str, list[tuple[str, str, str]]] = {
 }
 
 
-def _validate(df: pl.DataFrame, file_type: str) -> pl.DataFrame:
-    """Validate field formats. Log invalid counts, nullify clearly broken values."""
+def _validation_rules(
+    columns: List[str], file_type: str
+) -> tuple[list[tuple[pl.Expr, str]], dict[str, tuple[int, pl.Expr]]]:
+    """Build _validate's rules for a frame with the given columns.
+
+    Returns the checks as (invalid mask, warning with a {} placeholder for
+    the count), and per date column the index of its unparseable check
+    (the out-of-range check follows it) plus the mask of dates to keep.
+    Shared by the eager and streaming engines.
+    """
+    checks: list[tuple[pl.Expr, str]] = []
+    valid_dates: dict[str, tuple[int, pl.Expr]] = {}
 
     # Format rules (regex)
     for col, pattern, desc in _FORMAT_RULES.get(file_type, []):
-        if col not in df.columns:
+        if col not in columns:
             continue
         invalid = pl.col(col).is_not_null() & ~pl.col(col).str.contains(pattern)
-        count = df.filter(invalid).height
-        if count > 0:
-            logger.warning(f"{col}: {count} invalid values (expected {desc})")
+        checks.append((invalid, f"{col}: {{}} invalid values (expected {desc})"))
 
     # UF validation (ESTABELE only)
-    if file_type == "ESTABELE" and "uf" in df.columns:
+    if file_type == "ESTABELE" and "uf" in columns:
         invalid_uf = pl.col("uf").is_not_null() & ~pl.col("uf").is_in(list(_VALID_UFS))
-        count = df.filter(invalid_uf).height
-        if count > 0:
-            logger.warning(f"uf: {count} invalid values (not a valid UF code)")
+        checks.append((invalid_uf, "uf: {} invalid values (not a valid UF code)"))
 
     # Date validation: parse to verify real calendar date, then range check
     if file_type in _DATE_COLS:
         today = datetime.now().strftime("%Y%m%d")
         for col in _DATE_COLS[file_type]:
-            if col not in df.columns:
+            if col not in columns:
                 continue
             # Try parsing as date — catches impossible dates like Feb 30, Apr 31
             parsed = pl.col(col).str.to_date("%Y%m%d", strict=False)
+            in_range = (pl.col(col) <= today) & (pl.col(col) >= "19000101")
+            valid_dates[col] = (len(checks), parsed.is_not_null() & in_range)
             unparseable = pl.col(col).is_not_null() & parsed.is_null()
-            count = df.filter(unparseable).height
-            if count > 0:
-                logger.warning(f"{col}: {count} invalid dates → null (unparseable)")
-                df = df.with_columns(pl.when(unparseable).then(None).otherwise(pl.col(col)).alias(col))
-
-            # Range check: future or before 1900
-            out_of_range = pl.col(col).is_not_null() & ((pl.col(col) > today) | (pl.col(col) < "19000101"))
-            count = df.filter(out_of_range).height
-            if count > 0:
-                logger.warning(f"{col}: {count} dates out of range → null (future or before 1900)")
-                df = df.with_columns(pl.when(out_of_range).then(None).otherwise(pl.col(col)).alias(col))
+            checks.append((unparseable, f"{col}: {{}} invalid dates → null (unparseable)"))
+
+            # Range check: future or before 1900. Unparseable values are
+            # nulled first, so they never count as out of range too.
+            out_of_range = parsed.is_not_null() & ~in_range
+            checks.append((out_of_range, f"{col}: {{}} dates out of range → null (future or before 1900)"))
+
+    return checks, valid_dates
+
+
+def _validate(df: pl.DataFrame, file_type: str) -> pl.DataFrame:
+    """Validate field formats. Log invalid counts, nullify clearly broken values.
+
+    Every rule is an invalid-row mask and all of them are summed in one lazy
+    select, so a batch is scanned once instead of once per rule, and the
+    date parse shared by the unparseable and out-of-range masks is computed
+    once (common subexpression elimination). Only date columns with a
+    non-zero count are rewritten, in a single with_columns. Warnings keep
+    the per-rule wording and order.
+    """
+    checks, valid_dates = _validation_rules(df.columns, file_type)
+    if not checks:
+        return df
+
+    counts = df.lazy().select([mask.sum().alias(str(i)) for i, (mask, _) in enumerate(checks)]).collect().row(0)
+    for count, (_, message) in zip(counts, checks):
+        if count > 0:
+            logger.warning(message.format(count))
+
+    fixes = [
+        pl.when(valid).then(pl.col(col)).alias(col)
+        for col, (i, valid) in valid_dates.items()
+        if counts[i] or counts[i + 1]
+    ]
+    if fixes:
+        df = df.with_columns(fixes)
 
     return df
 
@@ -490,10 +691,107 @@ def _apply_typed_casts(df: pl.DataFrame, file_type: str) -> pl.DataFrame:
             elif col_dtype == pl.Null:
                 df = df.with_columns(pl.col(col).cast(pl.Date))
 
-    if file_type == "EMPRECSV" and "capital_social" in df.columns:
-        df = df.with_columns(pl.col("capital_social").cast(pl.Float64, strict=False))
-
-    if file_type == "ESTABELE" and "identificador_matriz_filial" in df.columns:
-        df = df.with_columns(pl.col("identificador_matriz_filial").cast(pl.Int32, strict=False))
+    casts = _typed_casts(df.columns, file_type)
+    if casts:
+        df = df.with_columns(casts)
 
     return df
+
+
+def _typed_casts(columns: List[str], file_type: str) -> list[pl.Expr]:
+    """Numeric casts of _apply_typed_casts, shared by the eager and streaming engines."""
+    casts = []
+    if file_type == "EMPRECSV" and "capital_social" in columns:
+        casts.append(pl.col("capital_social").cast(pl.Float64, strict=False))
+    if file_type == "ESTABELE" and "identificador_matriz_filial" in columns:
+        casts.append(pl.col("identificador_matriz_filial").cast(pl.Int32, strict=False))
+    return casts
+
+
+def _lazy_plan(lf: pl.LazyFrame, file_type: str, typed: bool) -> tuple[pl.LazyFrame, list[tuple[str, str]]]:
+    """Compose _transform, _validate and _apply_typed_casts into one LazyFrame.
+
+    Rules that log a count can't log from inside a plan, so each mask is
+    materialized as a hidden boolean column instead; the caller sums them
+    after collect, logs (name, message) in the eager engine's order, and
+    drops them.
+    """
+    columns = lf.collect_schema().names()
+    checks: list[tuple[str, str]] = []
+
+    # Transform, stage 1: independent per-column cleanups
+    cleanup, nulled = _transform_rules(columns, file_type)
+    if cleanup:
+        lf = lf.with_columns(cleanup)
+
+    # Transform, stage 2: rules that read the cleaned values
+    derived: list[pl.Expr] = []
+    for col, (mask, message) in nulled.items():
+        name = f"__check_{len(checks)}"
+        checks.append((name, message))
+        derived.append(mask.alias(name))
+        derived.append(pl.when(mask).then(None).otherwise(pl.col(col)).alias(col))
+    if file_type == "SOCIOCSV" and all(c in columns for c in _SOCIO_ID_INPUTS):
+        derived.append(
+            _socio_id_payload()
+            .map_batches(_payloads_to_uuids, return_dtype=pl.Utf8, is_elementwise=True)
+            .alias("socio_id")
+        )
+    if derived:
+        lf = lf.with_columns(derived)
+
+    # Validate: masks and date fixes all read the transformed values. With
+    # typed output a kept date is emitted as the already-parsed Date rather
+    # than parsed a second time by the casts below.
+    rules, valid_dates = _validation_rules(columns, file_type)
+    if rules:
+        masks = []
+        for mask, message in rules:
+            name = f"__check_{len(checks)}"
+            checks.append((name, message))
+            masks.append(mask.alias(name))
+        for col, (_, valid) in valid_dates.items():
+            kept = pl.col(col).str.strptime(pl.Date, "%Y%m%d", strict=False) if typed else pl.col(col)
+            masks.append(pl.when(valid).then(kept).alias(col))
+        lf = lf.with_columns(masks)
+
+    casts = _typed_casts(columns, file_type) if typed else []
+    if casts:
+        lf = lf.with_columns(casts)
+
+    output = _output_columns(file_type) if "socio_id" in lf.collect_schema().names() else columns
+    return lf.select(output + [name for name, _ in checks]), checks
+
+
+def _scan_batches(stream: BinaryIO, file_type: str, batch_size: int, typed: bool) -> Iterator[pl.DataFrame]:
+    """Streaming-engine counterpart of _read_batches plus the eager chain.
+
+    Each transcoded chunk is scanned with pl.scan_csv and run through the
+    _lazy_plan query with Polars' streaming engine, so the optimizer fuses
+    the whole chain and spreads it over all cores. scan_csv only decodes
+    UTF-8, hence it reads the in-memory chunks from _iter_utf8_chunks rather
+    than the ISO-8859-1 file itself. Warnings are counted per chunk (up to
+    batch_size rows) instead of per yielded batch.
+    """
+    for chunk in _iter_utf8_chunks(stream, batch_size):
+        lf = pl.scan_csv(
+            chunk,
+            separator=";",
+            has_header=False,
+            new_columns=COLUMNS[file_type],
+            encoding="utf8",
+            infer_schema_length=0,
+            null_values=[""],
+            ignore_errors=True,
+            low_memory=False,
+            raise_if_empty=False,
+        )
+        plan, checks = _lazy_plan(lf, file_type, typed)
+        df = plan.collect(engine="streaming")
+        if checks:
+            counts = df.select([pl.col(name).sum() for name, _ in checks]).row(0)
+            for count, (_, message) in zip(counts, checks):
+                if count > 0:
+                    logger.warning(message.format(count))
+            df = df.drop([name for name, _ in checks])
+        yield from df.iter_slices(batch_size)
@@ -0,0 +1,646 @@
+"""Micro-benchmarks for pipeline hot paths.
+
+Opt-in developer tool. Runs against the CSVs in tests/fixtures, repeated
+--scale times so timings are not dominated by setup, and prints a markdown
+table to stdout. Nothing here touches the network; only the copy benchmark
+needs a database (DATABASE_URL), and it writes to temp tables only.
+
+Usage:
+    uv run python scripts/benchmark.py encoding               # 50x fixtures
+    uv run python scripts/benchmark.py encoding --scale 200
+    uv run python scripts/benchmark.py validate
+    uv run python scripts/benchmark.py engine
+    DATABASE_URL=postgresql://... uv run python scripts/benchmark.py copy
+    uv run python scripts/benchmark.py parquet --threads 8
+    uv run python scripts/benchmark.py download --connect-ms 50
+    uv run python scripts/benchmark.py stream --mbps 20
+
+    just bench encoding                                       # via justfile
+
+Currently measured:
+- encoding: the pre-streaming read path (ISO-8859-1 -> temp UTF-8 file ->
+  pl.read_csv_batched) against processor._read_batches, which transcodes
+  in memory chunk by chunk. Reports wall time, throughput and the bytes
+  each path writes to temp disk.
+- validate: the per-rule _validate (one filter().height scan per rule,
+  one with_columns per nullified date column) against the fused
+  processor._validate, which counts every rule in a single select.
+  Asserts both produce the same frame.
+- engine: process_file(engine="eager") against engine="streaming" (one
+  LazyFrame plan per chunk on Polars' streaming engine), typed output.
+  Asserts both yield the same batches.
+- copy: the previous full-batch write_csv -> BytesIO -> COPY CSV against
+  Database._copy_to_temp streaming CSV and binary (COPY_FORMAT) slices,
+  into temp tables LIKE the real ones (schema applied if missing). Reports
+  wall time and the largest buffer each path serializes at once.
+- parquet: ParquetWriter with one shared file per table (every thread
+  behind one lock) against part_per_thread (PARQUET_PART_PER_WORKER),
+  with --threads threads writing the scaled batches. Checks both export
+  the same row count; only scales with cores the machine actually has.
+- download: Downloader against a local WebDAV stand-in serving the scaled
+  fixtures as ZIPs (one PROPFIND, then each file). The per-request
+  connections and 8 KiB reads of module-level requests.get against the
+  pooled Session and DOWNLOAD_CHUNK_BYTES reads. --connect-ms delays
+  every new connection to stand in for the TCP+TLS handshake. Reports
+  wall time, CPU seconds and connections opened.
+- stream: download_files + process_file over the same stand-in throttled
+  to --mbps, one file at a time: download, testzip and extract before
+  parsing, against EXTRACT_WHILE_DOWNLOADING (parse as bytes arrive).
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+
+import polars as pl
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = REPO_ROOT / "tests" / "fixtures"
+
+# scripts/ isn't a package; make the pipeline modules importable.
+sys.path.insert(0, str(REPO_ROOT))
+
+import downloader as downloader_module  # noqa: E402
+from config import Config  # noqa: E402
+from database import Database, _binary_copy_chunks, _csv_copy_chunks  # noqa: E402
+from parquet_writer import ParquetWriter  # noqa: E402
+from processor import (  # noqa: E402
+    _DATE_COLS,
+    _FORMAT_RULES,
+    _VALID_UFS,
+    COLUMNS,
+    _read_batches,
+    _validate,
+    get_file_type,
+    process_file,
+)
+
+
+def scaled_fixtures(work_dir: Path, scale: int) -> list[Path]:
+    """Write each fixture CSV repeated `scale` times into work_dir."""
+    paths = []
+    for fixture in sorted(FIXTURES_DIR.glob("*.csv")):
+        data = fixture.read_bytes()
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        path = work_dir / fixture.name
+        with open(path, "wb") as f:
+            for _ in range(scale):
+                f.write(data)
+        paths.append(path)
+    return paths
+
+
+def _time(fn: Callable[[], int], repeat: int) -> tuple[float, int]:
+    """Best-of-`repeat` wall time for fn; returns (seconds, fn's result)."""
+    best = float("inf")
+    result = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _legacy_read(path: Path, batch_size: int) -> tuple[int, int]:
+    """The pre-streaming path: full UTF-8 temp copy, then read_csv_batched.
+
+    Returns (rows, bytes written to temp disk).
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".utf8.csv")
+    os.close(fd)
+    utf8_file = Path(tmp_path)
+    try:
+        with open(path, "r", encoding="ISO-8859-1") as infile:
+            with open(utf8_file, "w", encoding="UTF-8") as outfile:
+                for chunk in iter(lambda: infile.read(50 * 1024 * 1024), ""):
+                    outfile.write(chunk)
+        temp_bytes = utf8_file.stat().st_size
+        reader = pl.read_csv_batched(
+            utf8_file,
+            separator=";",
+            has_header=False,
+            new_columns=COLUMNS[get_file_type(path.name)],
+            encoding="utf8",
+            infer_schema_length=0,
+            null_values=[""],
+            ignore_errors=True,
+            low_memory=False,
+            batch_size=batch_size,
+        )
+        rows = 0
+        while (batches := reader.next_batches(1)) is not None:
+            rows += sum(len(df) for df in batches)
+        return rows, temp_bytes
+    finally:
+        utf8_file.unlink(missing_ok=True)
+
+
+def _streaming_read(path: Path, batch_size: int) -> int:
+    with open(path, "rb") as stream:
+        return sum(len(df) for df in _read_batches(stream, COLUMNS[get_file_type(path.name)], batch_size))
+
+
+def bench_encoding(paths: list[Path], batch_size: int, repeat: int) -> list[dict]:
+    results = []
+    for path in paths:
+        size = path.stat().st_size
+        legacy_s, (legacy_rows, temp_bytes) = _time(lambda: _legacy_read(path, batch_size), repeat)
+        stream_s, stream_rows = _time(lambda: _streaming_read(path, batch_size), repeat)
+        if legacy_rows != stream_rows:
+            raise AssertionError(f"{path.name}: row count mismatch ({legacy_rows} vs {stream_rows})")
+        results.append(
+            {
+                "file": path.name,
+                "mb": size / 1024 / 1024,
+                "rows": stream_rows,
+                "legacy_s": legacy_s,
+                "stream_s": stream_s,
+                "legacy_temp_mb": temp_bytes / 1024 / 1024,
+            }
+        )
+    return results
+
+
+def format_encoding(results: list[dict], scale: int) -> str:
+    lines = [f"## ISO-8859-1 read path ({scale}x fixtures)", ""]
+    lines.append("| File | MB | Rows | temp copy (s) | streaming (s) | Speedup | Temp MB avoided |")
+    lines.append("|---|---:|---:|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['file']} | {r['mb']:.1f} | {r['rows']:,} | {r['legacy_s']:.3f} | {r['stream_s']:.3f} "
+            f"| {r['legacy_s'] / r['stream_s']:.2f}x | {r['legacy_temp_mb']:.1f} |"
+        )
+    legacy_total = sum(r["legacy_s"] for r in results)
+    stream_total = sum(r["stream_s"] for r in results)
+    mb_total = sum(r["mb"] for r in results)
+    lines.append(
+        f"| **total** | {mb_total:.1f} | {sum(r['rows'] for r in results):,} | {legacy_total:.3f} "
+        f"| {stream_total:.3f} | {legacy_total / stream_total:.2f}x "
+        f"| {sum(r['legacy_temp_mb'] for r in results):.1f} |"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _validate_unfused(df: pl.DataFrame, file_type: str) -> pl.DataFrame:
+    """The pre-fusion _validate: one scan per rule, kept verbatim as the baseline."""
+    for col, pattern, desc in _FORMAT_RULES.get(file_type, []):
+        if col not in df.columns:
+            continue
+        invalid = pl.col(col).is_not_null() & ~pl.col(col).str.contains(pattern)
+        df.filter(invalid).height
+
+    if file_type == "ESTABELE" and "uf" in df.columns:
+        invalid_uf = pl.col("uf").is_not_null() & ~pl.col("uf").is_in(list(_VALID_UFS))
+        df.filter(invalid_uf).height
+
+    if file_type in _DATE_COLS:
+        today = datetime.now().strftime("%Y%m%d")
+        for col in _DATE_COLS[file_type]:
+            if col not in df.columns:
+                continue
+            parsed = pl.col(col).str.to_date("%Y%m%d", strict=False)
+            unparseable = pl.col(col).is_not_null() & parsed.is_null()
+            if df.filter(unparseable).height > 0:
+                df = df.with_columns(pl.when(unparseable).then(None).otherwise(pl.col(col)).alias(col))
+            out_of_range = pl.col(col).is_not_null() & ((pl.col(col) > today) | (pl.col(col) < "19000101"))
+            if df.filter(out_of_range).height > 0:
+                df = df.with_columns(pl.when(out_of_range).then(None).otherwise(pl.col(col)).alias(col))
+
+    return df
+
+
+def bench_validate(paths: list[Path], batch_size: int, repeat: int) -> list[dict]:
+    results = []
+    for path in paths:
+        file_type = get_file_type(path.name)
+        if file_type not in _FORMAT_RULES and file_type not in _DATE_COLS:
+            continue
+        with open(path, "rb") as stream:
+            frames = list(_read_batches(stream, COLUMNS[file_type], batch_size))
+        for old, new in zip(
+            (_validate_unfused(df, file_type) for df in frames), (_validate(df, file_type) for df in frames)
+        ):
+            if not old.equals(new):
+                raise AssertionError(f"{path.name}: fused _validate output differs")
+        unfused_s, _ = _time(lambda: sum(len(_validate_unfused(df, file_type)) for df in frames), repeat)
+        fused_s, rows = _time(lambda: sum(len(_validate(df, file_type)) for df in frames), repeat)
+        results.append({"file": path.name, "rows": rows, "unfused_s": unfused_s, "fused_s": fused_s})
+    return results
+
+
+def format_validate(results: list[dict], scale: int) -> str:
+    lines = [f"## _validate ({scale}x fixtures)", ""]
+    lines.append("| File | Rows | per-rule (s) | fused (s) | Speedup |")
+    lines.append("|---|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['file']} | {r['rows']:,} | {r['unfused_s']:.4f} | {r['fused_s']:.4f} "
+            f"| {r['unfused_s'] / r['fused_s']:.2f}x |"
+        )
+    unfused_total = sum(r["unfused_s"] for r in results)
+    fused_total = sum(r["fused_s"] for r in results)
+    lines.append(
+        f"| **total** | {sum(r['rows'] for r in results):,} | {unfused_total:.4f} | {fused_total:.4f} "
+        f"| {unfused_total / fused_total:.2f}x |"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def bench_engine(paths: list[Path], batch_size: int, repeat: int) -> list[dict]:
+    results = []
+    for path in paths:
+        eager = [df for df, _, _ in process_file(path, batch_size, typed=True)]
+        streaming = [df for df, _, _ in process_file(path, batch_size, typed=True, engine="streaming")]
+        if len(eager) != len(streaming) or not all(e.equals(s) for e, s in zip(eager, streaming)):
+            raise AssertionError(f"{path.name}: streaming engine output differs")
+        eager_s, rows = _time(lambda: sum(len(df) for df, _, _ in process_file(path, batch_size, typed=True)), repeat)
+        streaming_s, _ = _time(
+            lambda: sum(len(df) for df, _, _ in process_file(path, batch_size, typed=True, engine="streaming")),
+            repeat,
+        )
+        results.append({"file": path.name, "rows": rows, "eager_s": eager_s, "streaming_s": streaming_s})
+    return results
+
+
+def format_engine(results: list[dict], scale: int) -> str:
+    lines = [f"## process_file engine ({scale}x fixtures, typed)", ""]
+    lines.append("| File | Rows | eager (s) | streaming (s) | Speedup |")
+    lines.append("|---|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['file']} | {r['rows']:,} | {r['eager_s']:.3f} | {r['streaming_s']:.3f} "
+            f"| {r['eager_s'] / r['streaming_s']:.2f}x |"
+        )
+    eager_total = sum(r["eager_s"] for r in results)
+    streaming_total = sum(r["streaming_s"] for r in results)
+    lines.append(
+        f"| **total** | {sum(r['rows'] for r in results):,} | {eager_total:.3f} | {streaming_total:.3f} "
+        f"| {eager_total / streaming_total:.2f}x |"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _csv_copy(cur, df: pl.DataFrame, table: str, columns: list[str]) -> int:
+    """The pre-binary path: whole batch as one CSV string, bytes, BytesIO."""
+    columns_str = ", ".join(f'"{col}"' for col in columns)
+    csv_bytes = df.write_csv(include_header=False).encode("utf-8", errors="replace").replace(b"\x00", b"")
+    cur.copy_expert(f"COPY {table} ({columns_str}) FROM STDIN WITH CSV ENCODING 'UTF8'", io.BytesIO(csv_bytes))
+    return len(csv_bytes)
+
+
+def bench_copy(paths: list[Path], batch_size: int, repeat: int, database_url: str) -> list[dict]:
+    db = Database(database_url)
+    db.ensure_schema()
+    results = []
+    try:
+        for path in paths:
+            batches = list(process_file(path, batch_size))
+            table, columns = batches[0][1], batches[0][2]
+
+            def run(copy) -> int:
+                with db.conn.cursor() as cur:
+                    cur.execute(f"CREATE TEMP TABLE bench_copy (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+                    for df, _, _ in batches:
+                        copy(cur, df)
+                db.conn.rollback()
+                return 0
+
+            def streamed(copy_format: str) -> int:
+                db.copy_format = copy_format
+                return run(lambda cur, df: db._copy_to_temp(cur, df, "bench_copy", columns, like_table=table))
+
+            csv_s, _ = _time(lambda: run(lambda cur, df: _csv_copy(cur, df, "bench_copy", columns)), repeat)
+            streamed_s, _ = _time(lambda: streamed("csv"), repeat)
+            binary_s, _ = _time(lambda: streamed("binary"), repeat)
+
+            with db.conn.cursor() as cur:
+                pg_types = [db._get_column_types(cur, table)[col] for col in columns]
+            csv_peak = max(len(df.write_csv(include_header=False).encode("utf-8")) for df, _, _ in batches)
+            streamed_peak = max(len(chunk) for df, _, _ in batches for chunk in _csv_copy_chunks(df))
+            binary_peak = max(len(chunk) for df, _, _ in batches for chunk in _binary_copy_chunks(df, pg_types))
+            results.append(
+                {
+                    "file": path.name,
+                    "rows": sum(len(df) for df, _, _ in batches),
+                    "csv_s": csv_s,
+                    "streamed_s": streamed_s,
+                    "binary_s": binary_s,
+                    "csv_peak_mb": csv_peak / 1024 / 1024,
+                    "streamed_peak_mb": streamed_peak / 1024 / 1024,
+                    "binary_peak_mb": binary_peak / 1024 / 1024,
+                }
+            )
+    finally:
+        db.disconnect()
+    return results
+
+
+def format_copy(results: list[dict], scale: int) -> str:
+    lines = [f"## COPY into Postgres ({scale}x fixtures)", ""]
+    lines.append("Seconds per file; MB is the largest buffer serialized at once.")
+    lines.append("")
+    lines.append(
+        "| File | Rows | full CSV (s) | streamed CSV (s) | binary (s) | full CSV MB | streamed MB | binary MB |"
+    )
+    lines.append("|---|---:|---:|---:|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['file']} | {r['rows']:,} | {r['csv_s']:.3f} | {r['streamed_s']:.3f} | {r['binary_s']:.3f} "
+            f"| {r['csv_peak_mb']:.1f} | {r['streamed_peak_mb']:.1f} | {r['binary_peak_mb']:.1f} |"
+        )
+    lines.append(
+        f"| **total** | {sum(r['rows'] for r in results):,} | {sum(r['csv_s'] for r in results):.3f} "
+        f"| {sum(r['streamed_s'] for r in results):.3f} | {sum(r['binary_s'] for r in results):.3f} | | | |"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def bench_parquet(paths: list[Path], batch_size: int, repeat: int, threads: int, work_dir: Path) -> list[dict]:
+    results = []
+    for path in paths:
+        batches = list(process_file(path, min(batch_size, 100_000)))
+        table = batches[0][1]
+
+        def export(part_per_thread: bool) -> int:
+            out = work_dir / f"parquet-{part_per_thread}"
+            shutil.rmtree(out, ignore_errors=True)
+            writer = ParquetWriter(out, part_per_thread=part_per_thread)
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                rows = sum(executor.map(lambda b: writer.write_batch(*b), batches))
+            writer.close()
+            exported = writer.output_path(table)
+            if exported.is_dir():
+                exported = exported / "*.parquet"
+            if pl.scan_parquet(exported).select(pl.len()).collect().item() != rows:
+                raise AssertionError(f"{path.name}: exported row count differs")
+            return rows
+
+        shared_s, rows = _time(lambda: export(False), repeat)
+        parts_s, _ = _time(lambda: export(True), repeat)
+        results.append({"file": path.name, "rows": rows, "shared_s": shared_s, "parts_s": parts_s})
+    return results
+
+
+def format_parquet(results: list[dict], scale: int, threads: int) -> str:
+    lines = [f"## Parquet export ({scale}x fixtures, {threads} threads, {os.cpu_count()} CPUs)", ""]
+    lines.append("| File | Rows | shared file (s) | part per thread (s) | Speedup |")
+    lines.append("|---|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['file']} | {r['rows']:,} | {r['shared_s']:.3f} | {r['parts_s']:.3f} "
+            f"| {r['shared_s'] / r['parts_s']:.2f}x |"
+        )
+    shared_total = sum(r["shared_s"] for r in results)
+    parts_total = sum(r["parts_s"] for r in results)
+    lines.append(
+        f"| **total** | {sum(r['rows'] for r in results):,} | {shared_total:.3f} | {parts_total:.3f} "
+        f"| {shared_total / parts_total:.2f}x |"
+    )
+    return "\n".join(lines) + "\n"
+
+
+class _WebDavStandIn(BaseHTTPRequestHandler):
+    """Serves server.files (name -> bytes) over GET with Range, and a PROPFIND listing."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+    def setup(self):
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_delay)
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def do_PROPFIND(self):
+        entries = "".join(
+            f"<d:response><d:href>/bench/{name}</d:href><d:propstat><d:prop>"
+            f"<d:getcontentlength>{len(data)}</d:getcontentlength></d:prop></d:propstat></d:response>"
+            for name, data in self.server.files.items()
+        )
+        body = f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">{entries}</d:multistatus>'.encode()
+        self.send_response(207)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        data = self.server.files[self.path.rsplit("/", 1)[-1]]
+        start, end = 0, len(data) - 1
+        if "Range" in self.headers:
+            first, last = self.headers["Range"].removeprefix("bytes=").split("-")
+            start, end = int(first), int(last) if last else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        rate = getattr(self.server, "bytes_per_second", 0)
+        if not rate:
+            self.wfile.write(data[start : end + 1])
+            return
+        piece = 256 * 1024
+        for offset in range(start, end + 1, piece):
+            self.wfile.write(data[offset : min(offset + piece, end + 1)])
+            time.sleep(piece / rate)
+
+
+class _PerRequestHttp:
+    """The pre-Session Downloader: module-level requests calls, one connection each."""
+
+    get = staticmethod(requests.get)
+    request = staticmethod(requests.request)
+
+    def close(self):
+        pass
+
+
+def bench_download(paths: list[Path], repeat: int, connect_ms: int, work_dir: Path) -> list[dict]:
+    files = {}
+    for path in paths:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(path, path.name)
+        files[f"{path.stem}.zip"] = buffer.getvalue()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WebDavStandIn)
+    server.files, server.connect_delay, server.connections, server.lock = files, connect_ms / 1000, 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    temp_dir = work_dir / "downloads"
+    config = Config(database_url="", temp_dir=str(temp_dir), base_url=f"http://127.0.0.1:{server.server_port}")
+    default_chunk = downloader_module.DOWNLOAD_CHUNK_BYTES
+
+    def run(pooled: bool) -> dict:
+        best = None
+        for _ in range(repeat):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            downloader_module.DOWNLOAD_CHUNK_BYTES = default_chunk if pooled else 8192
+            downloader = downloader_module.Downloader(config)
+            if not pooled:
+                downloader.session = _PerRequestHttp()
+            server.connections = 0
+            wall, cpu = time.perf_counter(), time.process_time()
+            for name in downloader.get_directory_files("bench"):
+                downloader.download_zip("bench", name).unlink()
+            result = {
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "connections": server.connections,
+            }
+            downloader.close()
+            if best is None or result["wall_s"] < best["wall_s"]:
+                best = result
+        return best
+
+    try:
+        per_request, pooled = run(False), run(True)
+    finally:
+        downloader_module.DOWNLOAD_CHUNK_BYTES = default_chunk
+        server.shutdown()
+    size = sum(len(data) for data in files.values())
+    return [
+        {"mode": "per-request, 8 KiB reads", "files": len(files), "bytes": size, **per_request},
+        {"mode": f"pooled Session, {default_chunk // 1024} KiB reads", "files": len(files), "bytes": size, **pooled},
+    ]
+
+
+def bench_stream(paths: list[Path], repeat: int, batch_size: int, mbps: float, work_dir: Path) -> list[dict]:
+    files = {}
+    for path in paths:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(path, path.name)
+        files[f"{path.stem}.zip"] = buffer.getvalue()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WebDavStandIn)
+    server.files, server.connect_delay, server.connections, server.lock = files, 0, 0, threading.Lock()
+    server.bytes_per_second = mbps * 1e6
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    temp_dir = work_dir / "downloads"
+
+    def run(extract_while_downloading: bool) -> dict:
+        config = Config(
+            database_url="",
+            temp_dir=str(temp_dir),
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            download_workers=1,
+            extract_while_downloading=extract_while_downloading,
+        )
+        best = None
+        for _ in range(repeat):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            downloader = downloader_module.Downloader(config)
+            rows = 0
+            wall = time.perf_counter()
+            for csv_path, _ in downloader.download_files("bench", sorted(files)):
+                rows += sum(len(df) for df, _, _ in process_file(csv_path, batch_size))
+                csv_path.unlink()
+            result = {"wall_s": time.perf_counter() - wall, "rows": rows}
+            downloader.close()
+            if best is None or result["wall_s"] < best["wall_s"]:
+                best = result
+        return best
+
+    try:
+        after, during = run(False), run(True)
+    finally:
+        server.shutdown()
+    size = sum(len(data) for data in files.values())
+    return [
+        {"mode": "download, testzip, extract, parse", "bytes": size, **after},
+        {"mode": "parse while downloading", "bytes": size, **during},
+    ]
+
+
+def format_stream(results: list[dict], scale: int, mbps: float) -> str:
+    lines = [f"## Extract while downloading ({scale}x fixtures, one file at a time, {mbps:g} MB/s)", ""]
+    lines.append("| Mode | MB | Rows | Wall (s) |")
+    lines.append("|---|---:|---:|---:|")
+    for r in results:
+        lines.append(f"| {r['mode']} | {r['bytes'] / 1e6:.1f} | {r['rows']:,} | {r['wall_s']:.3f} |")
+    return "\n".join(lines) + "\n"
+
+
+def format_download(results: list[dict], scale: int, connect_ms: int) -> str:
+    lines = [f"## Download ({scale}x fixtures, local server, {connect_ms} ms per new connection)", ""]
+    lines.append("| Mode | Files | MB | Wall (s) | CPU (s) | CPU s/GB | Connections |")
+    lines.append("|---|---:|---:|---:|---:|---:|---:|")
+    for r in results:
+        lines.append(
+            f"| {r['mode']} | {r['files']} | {r['bytes'] / 1e6:.1f} | {r['wall_s']:.3f} | {r['cpu_s']:.3f} "
+            f"| {r['cpu_s'] / (r['bytes'] / 1e9):.2f} | {r['connections']} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--scale", type=int, default=50, help="Times each fixture is repeated. Default: 50.")
+    common.add_argument("--batch-size", type=int, default=500_000, help="Rows per batch. Default: 500000.")
+    common.add_argument("--repeat", type=int, default=3, help="Runs per measurement; best is kept. Default: 3.")
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+    sub.add_parser("encoding", parents=[common], help="Temp UTF-8 copy vs in-memory streaming transcoding.")
+    sub.add_parser("validate", parents=[common], help="Per-rule vs single-pass _validate.")
+    sub.add_parser("engine", parents=[common], help="Eager per-batch chain vs streaming LazyFrame plan.")
+    copy = sub.add_parser("copy", parents=[common], help="Full-batch CSV COPY vs streamed binary COPY.")
+    copy.add_argument(
+        "--database-url", default=os.getenv("DATABASE_URL", ""), help="Target database. Default: $DATABASE_URL."
+    )
+    parquet = sub.add_parser("parquet", parents=[common], help="Shared Parquet file vs one part per thread.")
+    parquet.add_argument(
+        "--threads", type=int, default=os.cpu_count() or 1, help="Writer threads. Default: number of CPUs."
+    )
+    download = sub.add_parser("download", parents=[common], help="Per-request connections vs pooled Session.")
+    download.add_argument(
+        "--connect-ms", type=int, default=20, help="Delay per new connection (handshake). Default: 20."
+    )
+    stream = sub.add_parser("stream", parents=[common], help="Parse after download vs while downloading.")
+    stream.add_argument("--mbps", type=float, default=20, help="Server rate in MB/s. Default: 20.")
+    args = parser.parse_args(argv)
+    if args.bench == "copy" and not args.database_url:
+        parser.error("copy needs --database-url or DATABASE_URL")
+
+    with tempfile.TemporaryDirectory(prefix="cnpj-bench-") as work_dir:
+        print(f"Scaling fixtures {args.scale}x...", file=sys.stderr)
+        paths = scaled_fixtures(Path(work_dir), args.scale)
+
+        if args.bench == "encoding":
+            print(format_encoding(bench_encoding(paths, args.batch_size, args.repeat), args.scale))
+        elif args.bench == "validate":
+            print(format_validate(bench_validate(paths, args.batch_size, args.repeat), args.scale))
+        elif args.bench == "engine":
+            print(format_engine(bench_engine(paths, args.batch_size, args.repeat), args.scale))
+        elif args.bench == "copy":
+            print(format_copy(bench_copy(paths, args.batch_size, args.repeat, args.database_url), args.scale))
+        elif args.bench == "parquet":
+            results = bench_parquet(paths, args.batch_size, args.repeat, args.threads, Path(work_dir))
+            print(format_parquet(results, args.scale, args.threads))
+        elif args.bench == "download":
+            results = bench_download(paths, args.repeat, args.connect_ms, Path(work_dir))
+            print(format_download(results, args.scale, args.connect_ms))
+        elif args.bench == "stream":
+            results = bench_stream(paths, args.repeat, args.batch_size, args.mbps, Path(work_dir))
+            print(format_stream(results, args.scale, args.mbps))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
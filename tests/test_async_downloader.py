@@ -0,0 +1,376 @@
+"""Tests for the asyncio download engine against a local WebDAV share."""
+
+import io
+import json
+import logging
+import random
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from config import Config
+from downloader import Downloader
+
+
+def _zip_bytes(files: dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+class _ShareHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_PROPFIND(self):
+        share = self.server
+        share.log.append(("PROPFIND", self.path, None))
+        entries = "".join(
+            f"<d:response><d:href>/public.php/webdav/{share.directory}/{name}</d:href>"
+            f"<d:propstat><d:prop><d:getcontentlength>{len(data)}</d:getcontentlength></d:prop></d:propstat>"
+            "</d:response>"
+            for name, data in share.files.items()
+        )
+        body = f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">{entries}</d:multistatus>'.encode()
+        # Nextcloud answers PROPFIND with a chunked body
+        self.send_response(207)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(body), 100):
+            piece = body[i : i + 100]
+            self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        share = self.server
+        name = self.path.rsplit("/", 1)[-1]
+        header = self.headers.get("Range")
+        with share.lock:
+            share.log.append(("GET", name, header))
+            share.in_flight += 1
+            share.peak_in_flight = max(share.peak_in_flight, share.in_flight)
+        try:
+            self._send_file(share, name, header)
+        finally:
+            with share.lock:
+                share.in_flight -= 1
+
+    def _send_file(self, share, name, header):
+        authorization = self.headers.get("Authorization")
+        share.authorizations.append((self.path, authorization))
+        if authorization is None and not share.public:
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path in share.redirects:
+            self.send_response(302)
+            self.send_header("Location", share.redirects[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if name not in share.files:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        time.sleep(share.first_byte_delay)
+        data = share.files[name]
+        start, end = 0, len(data) - 1
+        if header is None:
+            self.send_response(200)
+        else:
+            first, last = header.removeprefix("bytes=").split("-")
+            start, end = int(first), int(last) if last else end
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        body = data[start : end + 1]
+        with share.lock:
+            stall_at = share.stall_at.pop((name, start), None) if end > start else None
+        if stall_at is not None:
+            # Send part of the body, then go silent past the client's stall timeout
+            self.wfile.write(body[:stall_at])
+            self.wfile.flush()
+            time.sleep(share.stall_seconds)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class _WebDavShare(ThreadingHTTPServer):
+    """Stand-in for the Receita share: PROPFIND listing plus ranged GETs."""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, directory: str, files: dict[str, bytes]):
+        super().__init__(("127.0.0.1", 0), _ShareHandler)
+        self.directory = directory
+        self.files = files
+        self.lock = threading.Lock()
+        self.log: list[tuple[str, str, str | None]] = []
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.stall_at: dict[tuple[str, int], int] = {}
+        self.stall_seconds = 1.0
+        self.first_byte_delay = 0.0
+        self.public = False
+        self.redirects: dict[str, str] = {}
+        self.authorizations: list[tuple[str, str | None]] = []
+
+    def handle_error(self, request, client_address):
+        pass  # the client hangs up on stalled responses
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/public.php/webdav"
+
+    def gets(self, name: str) -> list[str | None]:
+        return [header for method, path, header in self.log if method == "GET" and path == name]
+
+
+_rng = random.Random(0)
+EMPRESAS_CSV = "".join(
+    f"{_rng.randrange(10**8):08d};EMPRESA {_rng.randrange(10**9)};2062;49;1000,00;05;\n" for _ in range(400)
+)
+CNAES = _zip_bytes({"F.K03200$Z.D51213.CNAECSV": "0111301;Cultivo de arroz\n" * 50})
+EMPRESAS = _zip_bytes({"K3241.K03200Y0.D51213.EMPRECSV": EMPRESAS_CSV})
+SOCIOS = _zip_bytes({"K3241.K03200Y0.D51213.SOCIOCSV": "00000000;2;SOCIO;***000000**;49;20200101;;;;;4\n" * 300})
+
+
+@pytest.fixture
+def share():
+    server = _WebDavShare("2024-03", {"Cnaes.zip": CNAES, "Empresas0.zip": EMPRESAS, "Socios0.zip": SOCIOS})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mirror():
+    server = _WebDavShare("2024-03", {"Cnaes.zip": CNAES})
+    server.public = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader(share, tmp_path):
+    config = Config(
+        database_url="postgresql://test",
+        temp_dir=str(tmp_path),
+        retry_attempts=3,
+        retry_delay=0,
+        connect_timeout=5,
+        read_timeout=10,
+        stall_timeout=0.2,
+        download_engine="asyncio",
+        base_url=share.base_url,
+    )
+    downloader = Downloader(config)
+    yield downloader
+    downloader.close()
+
+
+class TestAsyncListing:
+    def test_lists_files_and_sizes_from_chunked_propfind(self, downloader, share):
+        assert sorted(downloader.get_directory_files("2024-03")) == ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]
+        assert downloader.get_file_sizes("2024-03")["Empresas0.zip"] == len(EMPRESAS)
+        assert share.log[0] == ("PROPFIND", "/public.php/webdav/2024-03/", None)
+
+
+class TestAsyncDownloadFiles:
+    def test_yields_extracted_csvs_reference_files_first(self, downloader):
+        result = list(downloader.download_files("2024-03", ["Empresas0.zip", "Socios0.zip", "Cnaes.zip"]))
+
+        assert result[0][1] == "Cnaes.zip"
+        assert sorted(zip_name for _, zip_name in result) == ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]
+        by_zip = {zip_name: path for path, zip_name in result}
+        assert by_zip["Empresas0.zip"].read_text() == EMPRESAS_CSV
+        assert not list(downloader.temp_path.glob("*.zip*"))
+
+    def test_same_results_as_thread_engine(self, downloader, tmp_path):
+        files = ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]
+        async_result = {zip_name: path.read_bytes() for path, zip_name in downloader.download_files("2024-03", files)}
+
+        downloader.config.download_engine = "thread"
+        thread_result = {zip_name: path.read_bytes() for path, zip_name in downloader.download_files("2024-03", files)}
+
+        assert async_result == thread_result
+
+    def test_connections_are_reused(self, downloader, share):
+        list(downloader.download_files("2024-03", ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]))
+
+        # Reference file first, then both data files at once
+        assert share.connections <= 2
+
+    def test_stalled_stream_resumes_from_part_file(self, downloader, share, caplog):
+        caplog.set_level(logging.WARNING, logger="downloader")
+        share.stall_at[("Empresas0.zip", 0)] = 500
+
+        result = list(downloader.download_files("2024-03", ["Empresas0.zip"]))
+
+        assert result[0][0].read_text() == EMPRESAS_CSV
+        assert share.gets("Empresas0.zip") == [None, "bytes=500-"]
+        assert "Empresas0.zip stalled" in caplog.text
+
+    def test_stalls_degrade_concurrency(self, downloader, share, caplog):
+        caplog.set_level(logging.WARNING, logger="downloader")
+        downloader.config.download_workers = 4
+        downloader.config.stall_degrade_threshold = 1
+        share.stall_at[("Empresas0.zip", 0)] = 100
+        share.stall_at[("Empresas0.zip", 100)] = 100
+
+        list(downloader.download_files("2024-03", ["Empresas0.zip"]))
+
+        assert "1 stalls at concurrency 4, degrading to 2" in caplog.text
+        assert "2 stalls at concurrency 2, degrading to 1" in caplog.text
+        assert share.gets("Empresas0.zip") == [None, "bytes=100-", "bytes=200-"]
+
+    def test_completes_partial_already_at_full_size(self, downloader, share):
+        (downloader.temp_path / "Cnaes.zip.2024-03.part").write_bytes(CNAES)
+
+        result = list(downloader.download_files("2024-03", ["Cnaes.zip"]))
+
+        assert result[0][0].name == "F.K03200$Z.D51213.CNAECSV"
+        assert share.gets("Cnaes.zip") == [f"bytes={len(CNAES)}-"]
+
+    def test_missing_file_fails_after_retry_budget(self, downloader):
+        downloader.config.retry_attempts = 2
+
+        with pytest.raises(requests.exceptions.HTTPError, match="404"):
+            list(downloader.download_files("2024-03", ["Estabelecimentos0.zip"]))
+
+    def test_cross_origin_redirect_drops_authorization(self, downloader, share, mirror):
+        share.redirects["/public.php/webdav/2024-03/Cnaes.zip"] = f"{mirror.base_url}/2024-03/Cnaes.zip"
+
+        result = list(downloader.download_files("2024-03", ["Cnaes.zip"]))
+
+        assert result[0][0].name == "F.K03200$Z.D51213.CNAECSV"
+        assert share.authorizations[0][1] is not None
+        assert mirror.authorizations == [("/public.php/webdav/2024-03/Cnaes.zip", None)]
+
+    def test_same_origin_redirect_keeps_authorization(self, downloader, share):
+        share.redirects["/public.php/webdav/2024-03/Cnaes.zip"] = "/public.php/webdav/2024-03/moved/Cnaes.zip"
+
+        result = list(downloader.download_files("2024-03", ["Cnaes.zip"]))
+
+        assert result[0][0].name == "F.K03200$Z.D51213.CNAECSV"
+        assert [path for path, authorization in share.authorizations if authorization] == [
+            "/public.php/webdav/2024-03/Cnaes.zip",
+            "/public.php/webdav/2024-03/moved/Cnaes.zip",
+        ]
+
+    def test_consumer_stopping_early_ends_the_run(self, downloader, share):
+        files = downloader.download_files("2024-03", ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"])
+        next(files)
+        files.close()
+
+        assert not any(t.name == "async-downloader" for t in threading.enumerate())
+
+
+class TestAsyncSegmentedDownload:
+    @pytest.fixture
+    def segmented(self, downloader, monkeypatch):
+        import downloader as downloader_module
+
+        monkeypatch.setattr(downloader_module, "MIN_SEGMENT_BYTES", 64)
+        monkeypatch.setattr(downloader_module, "SEGMENT_STATE_INTERVAL", 16)
+        downloader.config.download_segments = 4
+        return downloader
+
+    def test_ranges_are_coroutines_not_threads(self, segmented, share):
+        segmented.config.download_workers = 16
+        segmented.config.download_segments = 16
+        # Headers arrive late enough for all 16 ranges to be in flight at
+        # once, but well inside the stall timeout
+        segmented.config.stall_timeout = 2
+        share.first_byte_delay = 0.2
+
+        def client_threads():
+            # The share's handler threads run process_request_thread
+            return {t for t in threading.enumerate() if "process_request_thread" not in t.name}
+
+        threads_before = client_threads()
+        peak_new_threads = 0
+        watcher_done = threading.Event()
+
+        def watch():
+            nonlocal peak_new_threads
+            while not watcher_done.is_set():
+                peak_new_threads = max(peak_new_threads, len(client_threads() - threads_before))
+                time.sleep(0.01)
+
+        watcher = threading.Thread(target=watch)
+        threads_before.add(watcher)
+        watcher.start()
+        try:
+            result = list(segmented.download_files("2024-03", ["Empresas0.zip"]))
+        finally:
+            watcher_done.set()
+            watcher.join()
+
+        assert result[0][0].read_text() == EMPRESAS_CSV
+        assert share.peak_in_flight == 16
+        # The event loop thread plus executor threads for validation/extraction, not one per range
+        assert peak_new_threads <= 4
+
+    def test_stalled_segment_resumes_from_its_own_offset(self, segmented, share):
+        size = -(-len(EMPRESAS) // 4)
+        share.stall_at[("Empresas0.zip", size)] = 40
+
+        result = list(segmented.download_files("2024-03", ["Empresas0.zip"]))
+
+        assert result[0][0].read_text() == EMPRESAS_CSV
+        ranges = share.gets("Empresas0.zip")
+        assert ranges[0] == "bytes=0-0"
+        assert ranges[-1] == f"bytes={size + 40}-{2 * size - 1}"
+        assert len(ranges) == 6
+
+    def test_resumes_segment_state_left_by_thread_engine(self, segmented, share, monkeypatch):
+        # A thread-engine run that lost its first segment after 20 bytes
+        size = -(-len(EMPRESAS) // 4)
+        segments = [[i * size, min((i + 1) * size, len(EMPRESAS)) - 1, 0] for i in range(4)]
+        for segment in segments[1:]:
+            segment[2] = segment[1] - segment[0] + 1
+        segments[0][2] = 20
+        data = bytearray(EMPRESAS)
+        data[20:size] = bytes(size - 20)
+        (segmented.temp_path / "Empresas0.zip.seg.2024-03.part").write_bytes(bytes(data))
+        (segmented.temp_path / "Empresas0.zip.segstate.2024-03.part").write_text(
+            json.dumps({"total": len(EMPRESAS), "segments": segments})
+        )
+
+        result = list(segmented.download_files("2024-03", ["Empresas0.zip"]))
+
+        assert result[0][0].read_text() == EMPRESAS_CSV
+        assert share.gets("Empresas0.zip") == [f"bytes=20-{size - 1}"]
@@ -4,7 +4,7 @@ from unittest.mock import patch
 
 import pytest
 
-from config import Config
+from config import Config, parse_size
 
 
 class TestFromEnv:
@@ -17,6 +17,7 @@ class TestFromEnv:
 
         assert cfg.database_url == ""
         assert cfg.batch_size == 500000
+        assert cfg.memory_budget == ""
         assert cfg.temp_dir == "./temp"
         assert cfg.download_workers == 4
         assert cfg.process_workers == 1
@@ -28,10 +29,29 @@ class TestFromEnv:
         assert cfg.stall_degrade_threshold == 3
         assert cfg.progress_log_interval == 30
         assert cfg.keep_files is False
+        assert cfg.listing_cache is True
+        assert cfg.zip_cache_dir == ""
+        assert cfg.zip_cache_size == "20GB"
+        assert cfg.stream_from_zip is False
+        assert cfg.skip_unchanged_files is True
         assert cfg.loading_strategy == "upsert"
+        assert cfg.swap_set_logged is False
+        assert cfg.processing_engine == "eager"
+        assert cfg.copy_format == "csv"
+        assert cfg.defer_indexes == "auto"
+        assert cfg.index_build_workers == 2
+        assert cfg.index_build_memory == "512MB"
+        assert cfg.index_build_parallel_workers == 2
         assert cfg.output_format == "postgres"
         assert cfg.parquet_output_dir == "./parquet"
         assert cfg.parquet_typed_output is False
+        assert cfg.parquet_partition_by == ""
+        assert cfg.parquet_sorted is False
+        assert cfg.parquet_part_per_worker is False
+        assert cfg.worker_mode == "thread"
+        assert cfg.download_segments == 1
+        assert cfg.download_engine == "thread"
+        assert cfg.extract_while_downloading is False
         assert cfg.post_file_command == ""
 
     def test_env_vars_override_defaults(self):
@@ -40,7 +60,10 @@ class TestFromEnv:
             "DATABASE_URL": "postgres://custom:5432/db",
             "BATCH_SIZE": "100000",
             "DOWNLOAD_WORKERS": "8",
+            "DOWNLOAD_SEGMENTS": "4",
+            "DOWNLOAD_ENGINE": "AsyncIO",
             "PROCESS_WORKERS": "4",
+            "WORKER_MODE": "Process",
             "RETRY_ATTEMPTS": "5",
             "STALL_TIMEOUT": "12",
             "STALL_DEGRADE_THRESHOLD": "2",
@@ -52,7 +75,10 @@ class TestFromEnv:
         assert cfg.database_url == "postgres://custom:5432/db"
         assert cfg.batch_size == 100000
         assert cfg.download_workers == 8
+        assert cfg.download_segments == 4
+        assert cfg.download_engine == "asyncio"
         assert cfg.process_workers == 4
+        assert cfg.worker_mode == "process"
         assert cfg.retry_attempts == 5
         assert cfg.stall_timeout == 12
         assert cfg.stall_degrade_threshold == 2
@@ -78,6 +104,10 @@ class TestFromEnv:
         assert cfg.stall_degrade_threshold == 4
         assert cfg.progress_log_interval == 0
 
+    def test_memory_budget(self):
+        with patch.dict("os.environ", {"MEMORY_BUDGET": "4GB"}, clear=True):
+            assert Config.from_env().memory_budget == "4GB"
+
     def test_invalid_int_raises(self):
         """Non-numeric integer env vars should raise ValueError."""
         with patch.dict("os.environ", {"BATCH_SIZE": "abc"}, clear=True):
@@ -124,6 +154,61 @@ class TestFromEnv:
         with patch.dict("os.environ", {"PARQUET_TYPED_OUTPUT": "yes"}, clear=True):
             assert Config.from_env().parquet_typed_output is False  # only "true" is truthy
 
+    def test_stream_from_zip_boolean_parsing(self):
+        """STREAM_FROM_ZIP should parse 'true' case-insensitively."""
+        with patch.dict("os.environ", {"STREAM_FROM_ZIP": "TRUE"}, clear=True):
+            assert Config.from_env().stream_from_zip is True
+
+        with patch.dict("os.environ", {"STREAM_FROM_ZIP": "yes"}, clear=True):
+            assert Config.from_env().stream_from_zip is False  # only "true" is truthy
+
+    def test_extract_while_downloading_boolean_parsing(self):
+        """EXTRACT_WHILE_DOWNLOADING should parse 'true' case-insensitively."""
+        with patch.dict("os.environ", {"EXTRACT_WHILE_DOWNLOADING": "True"}, clear=True):
+            assert Config.from_env().extract_while_downloading is True
+
+    def test_listing_cache_can_be_disabled(self):
+        with patch.dict("os.environ", {"LISTING_CACHE": "False"}, clear=True):
+            assert Config.from_env().listing_cache is False
+
+    def test_parse_size(self):
+        assert parse_size("512MB") == 512 * 1024**2
+        assert parse_size("1.5gb") == 3 * 1024**3 // 2
+        assert parse_size("4096") == 4096
+        with pytest.raises(ValueError):
+            parse_size("lots")
+
+    def test_skip_unchanged_files_can_be_disabled(self):
+        with patch.dict("os.environ", {"SKIP_UNCHANGED_FILES": "false"}, clear=True):
+            assert Config.from_env().skip_unchanged_files is False
+
+    def test_processing_engine_is_lowercased(self):
+        with patch.dict("os.environ", {"PROCESSING_ENGINE": "Streaming"}, clear=True):
+            assert Config.from_env().processing_engine == "streaming"
+
+    def test_copy_format_is_lowercased(self):
+        with patch.dict("os.environ", {"COPY_FORMAT": "BINARY"}, clear=True):
+            assert Config.from_env().copy_format == "binary"
+
+    def test_swap_set_logged(self):
+        with patch.dict("os.environ", {"SWAP_SET_LOGGED": "True"}, clear=True):
+            assert Config.from_env().swap_set_logged is True
+
+    def test_index_build_settings(self):
+        env = {
+            "DEFER_INDEXES": "Never",
+            "INDEX_BUILD_WORKERS": "4",
+            "INDEX_BUILD_MEMORY": "2GB",
+            "INDEX_BUILD_PARALLEL_WORKERS": "0",
+        }
+        with patch.dict("os.environ", env, clear=True):
+            cfg = Config.from_env()
+
+        assert cfg.defer_indexes == "never"
+        assert cfg.index_build_workers == 4
+        assert cfg.index_build_memory == "2GB"
+        assert cfg.index_build_parallel_workers == 0
+
     def test_base_url_and_share_token_override(self):
         """BASE_URL and SHARE_TOKEN should be overridable via env."""
         env = {"BASE_URL": "https://custom.server/webdav", "SHARE_TOKEN": "custom_token"}
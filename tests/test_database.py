@@ -1,12 +1,15 @@
 """Tests for database module."""
 
+import struct
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import polars as pl
 import psycopg2
 import pytest
 
-from database import Database
+from database import Database, DatabasePool, _row_fingerprint
 
 
 @pytest.fixture
@@ -168,6 +171,32 @@ class TestGetProcessedFiles:
         with pytest.raises(psycopg2.OperationalError):
             connected_db.get_processed_files("2024-01")
 
+    def test_leaves_out_files_whose_version_changed(self, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchall.side_effect = [
+            [("Cnaes.zip",), ("Empresas0.zip",), ("Socios0.zip",)],
+            [("Cnaes.zip", '"a"'), ("Empresas0.zip", '"b"')],
+        ]
+        mock_cur.fetchone.return_value = ("processed_file_versions",)
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        # Empresas0 was republished; Socios0 has no recorded version
+        versions = {"Cnaes.zip": '"a"', "Empresas0.zip": '"c"', "Socios0.zip": '"d"'}
+        result = connected_db.get_processed_files("2024-01", versions)
+
+        assert result == {"Cnaes.zip", "Socios0.zip"}
+
+    def test_versions_ignored_before_any_were_recorded(self, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("Cnaes.zip",)]
+        mock_cur.fetchone.return_value = (None,)
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        assert connected_db.get_processed_files("2024-01", {"Cnaes.zip": '"a"'}) == {"Cnaes.zip"}
+        assert mock_cur.execute.call_count == 2
+
 
 class TestMarkProcessed:
     """Test marking files as processed."""
@@ -183,6 +212,55 @@ class TestMarkProcessed:
         assert "INSERT INTO processed_files" in mock_cur.execute.call_args[0][0]
         connected_db.conn.commit.assert_called_once()
 
+    def test_records_version(self, connected_db):
+        mock_cur = MagicMock()
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        connected_db.mark_processed("2024-01", "file.zip", '"etag-1"')
+
+        statements = [c[0][0] for c in mock_cur.execute.call_args_list]
+        assert "CREATE TABLE IF NOT EXISTS processed_file_versions" in statements[1]
+        assert "INSERT INTO processed_file_versions" in statements[2]
+        assert mock_cur.execute.call_args_list[2][0][1] == ("2024-01", "file.zip", '"etag-1"')
+        connected_db.conn.commit.assert_called_once()
+
+
+class TestFileFingerprints:
+    """Content keys recorded per processed file, compared against later months."""
+
+    def _cursor(self, db):
+        mock_cur = MagicMock()
+        db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+        return mock_cur
+
+    def test_record_upserts_and_commits(self, connected_db):
+        mock_cur = self._cursor(connected_db)
+
+        connected_db.record_fingerprint("2024-01", "Cnaes.zip", 100, "key")
+
+        assert "CREATE TABLE IF NOT EXISTS file_fingerprints" in mock_cur.execute.call_args_list[0][0][0]
+        assert mock_cur.execute.call_args_list[1][0][1] == ("2024-01", "Cnaes.zip", 100, "key")
+        connected_db.conn.commit.assert_called_once()
+
+    def test_previous_ignores_files_loaded_from_a_later_month(self, connected_db):
+        mock_cur = self._cursor(connected_db)
+        mock_cur.fetchone.return_value = ("file_fingerprints",)
+        mock_cur.fetchall.return_value = [
+            ("Cnaes.zip", "2024-01", 100, "key-c"),
+            ("Paises.zip", "2024-03", 50, "key-p"),
+        ]
+
+        assert connected_db.get_previous_fingerprints("2024-02") == {"Cnaes.zip": ("2024-01", 100, "key-c")}
+
+    def test_previous_empty_before_any_were_recorded(self, connected_db):
+        mock_cur = self._cursor(connected_db)
+        mock_cur.fetchone.return_value = (None,)
+
+        assert connected_db.get_previous_fingerprints("2024-02") == {}
+        assert mock_cur.execute.call_count == 1
+
 
 class TestClearProcessedFiles:
     """Test clearing processed file records."""
@@ -220,6 +298,135 @@ class TestTruncateTable:
         assert db._truncated_tables == {"empresas", "socios"}
 
 
+class TestGetTableDependencies:
+    """Test reading table dependencies from foreign keys."""
+
+    def test_groups_referenced_tables(self, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [
+            ("socios", "empresas"),
+            ("estabelecimentos", "empresas"),
+            ("socios", "paises"),
+        ]
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        assert connected_db.get_table_dependencies() == {
+            "socios": {"empresas", "paises"},
+            "estabelecimentos": {"empresas"},
+        }
+        assert "contype = 'f'" in mock_cur.execute.call_args[0][0]
+        connected_db.conn.rollback.assert_called_once()
+
+
+class TestDeferredIndexes:
+    """Test dropping secondary indexes for a large load and rebuilding them."""
+
+    def test_drop_records_definition_before_dropping(self, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [
+            ("idx_socios_cnpj_basico", "CREATE INDEX idx_socios_cnpj_basico ON public.socios USING btree (cnpj_basico)")
+        ]
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        assert connected_db.drop_secondary_indexes("socios") == ["idx_socios_cnpj_basico"]
+
+        statements = [c[0][0] for c in mock_cur.execute.call_args_list]
+        assert "NOT i.indisunique" in statements[1]
+        assert "INSERT INTO deferred_indexes" in statements[2]
+        assert mock_cur.execute.call_args_list[2][0][1] == (
+            "idx_socios_cnpj_basico",
+            "socios",
+            "CREATE INDEX IF NOT EXISTS idx_socios_cnpj_basico ON public.socios USING btree (cnpj_basico)",
+        )
+        assert statements[3] == "DROP INDEX idx_socios_cnpj_basico"
+        connected_db.conn.commit.assert_called_once()
+
+    def test_rebuild_noop_without_tracking_table(self, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchone.return_value = (None,)
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        assert connected_db.rebuild_deferred_indexes() == []
+        mock_cur.execute.assert_called_once_with("SELECT to_regclass('deferred_indexes')")
+
+    @patch("database.psycopg2.connect")
+    def test_rebuild_uses_one_session_per_index(self, mock_connect, connected_db):
+        mock_cur = MagicMock()
+        mock_cur.fetchone.return_value = ("deferred_indexes",)
+        mock_cur.fetchall.return_value = [
+            ("idx_a", "CREATE INDEX IF NOT EXISTS idx_a ON t USING btree (a)"),
+            ("idx_b", "CREATE INDEX IF NOT EXISTS idx_b ON t USING btree (b)"),
+        ]
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        worker_cur = MagicMock()
+        mock_connect.return_value.cursor.return_value.__enter__.return_value = worker_cur
+
+        assert connected_db.rebuild_deferred_indexes(workers=2, maintenance_work_mem="1GB", parallel_workers=4) == [
+            "idx_a",
+            "idx_b",
+        ]
+
+        assert mock_connect.call_count == 2
+        assert mock_connect.return_value.autocommit is True
+        statements = [c[0] for c in worker_cur.execute.call_args_list]
+        assert statements.count(("SET maintenance_work_mem = %s", ("1GB",))) == 2
+        assert statements.count(("SET max_parallel_maintenance_workers = %s", (4,))) == 2
+        assert ("CREATE INDEX IF NOT EXISTS idx_a ON t USING btree (a)",) in statements
+        assert ("DELETE FROM deferred_indexes WHERE index_name = %s", ("idx_b",)) in statements
+        assert mock_connect.return_value.close.call_count == 2
+
+
+class TestBulkDelta:
+    """Test fingerprint-filtered upserts under LOADING_STRATEGY=delta."""
+
+    def _setup(self, connected_db, changed_row_nrs):
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [(n,) for n in changed_row_nrs]
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+        connected_db._pk_cache["cnaes"] = ["codigo"]
+        return mock_cur
+
+    def test_upserts_only_changed_rows(self, connected_db):
+        self._setup(connected_db, [2, 0])
+        connected_db._delta_comparable["cnaes"] = True
+        df = pl.DataFrame({"codigo": ["1", "2", "3"], "descricao": ["a", "b", "c"]})
+
+        with (
+            patch.object(connected_db, "_copy_to_temp") as mock_copy,
+            patch.object(connected_db, "_upsert_rows") as mock_upsert,
+        ):
+            connected_db.bulk_delta(df, "cnaes", ["codigo", "descricao"])
+
+        assert mock_copy.call_args[0][2:] == ("temp_fp_cnaes", ["row_nr", "codigo", "fingerprint"])
+        assert mock_upsert.call_args[0][1]["codigo"].to_list() == ["1", "3"]
+        assert connected_db._delta_stats["cnaes"] == [3, 2]
+        connected_db.conn.commit.assert_called_once()
+
+    def test_upserts_everything_without_comparable_fingerprints(self, connected_db):
+        mock_cur = self._setup(connected_db, [])
+        df = pl.DataFrame({"codigo": ["1", "2"], "descricao": ["a", "b"]})
+
+        with patch.object(connected_db, "_copy_to_temp"), patch.object(connected_db, "_upsert_rows") as mock_upsert:
+            connected_db.bulk_delta(df, "cnaes", ["codigo", "descricao"])
+
+        assert len(mock_upsert.call_args[0][1]) == 2
+        assert not any("LEFT JOIN" in c[0][0] for c in mock_cur.execute.call_args_list)
+
+    def test_fingerprint_depends_on_every_column(self):
+        df = pl.DataFrame({"codigo": ["1", "1"], "descricao": ["a", "b"]})
+        fingerprint = _row_fingerprint(df, ["codigo", "descricao"])
+
+        assert fingerprint.dtype == pl.Int64
+        assert fingerprint[0] != fingerprint[1]
+        assert fingerprint.to_list() == _row_fingerprint(df, ["codigo", "descricao"]).to_list()
+
+
 class TestBulkUpsert:
     """Test bulk upsert with temp table strategy."""
 
@@ -254,6 +461,26 @@ class TestBulkUpsert:
         # 5. Commit
         connected_db.conn.commit.assert_called_once()
 
+    def test_binary_copy_looks_up_target_column_types(self, connected_db):
+        """COPY_FORMAT=binary: create temp → column types of the target → binary COPY."""
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"codigo": ["001"], "descricao": ["Test"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.side_effect = [
+            [("codigo", "character varying"), ("descricao", "text")],
+            [("codigo",)],
+        ]
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        connected_db.bulk_upsert(df, "cnaes", ["codigo", "descricao"])
+
+        calls = mock_cur.execute.call_args_list
+        assert "pg_attribute" in calls[1][0][0]
+        assert calls[1][0][1] == ("cnaes",)
+        assert "FORMAT binary" in mock_cur.copy_expert.call_args[0][0]
+        assert "pg_index" in calls[2][0][0]
+
     def test_rollback_on_error(self, connected_db):
         df = pl.DataFrame({"codigo": ["001"]})
         mock_cur = MagicMock()
@@ -359,6 +586,121 @@ class TestCopyToTemp:
         assert b"\x00" not in content
         assert b"helloworld" in content
 
+    def test_csv_is_streamed_in_slices(self, connected_db, monkeypatch):
+        """Only one slice is serialized at a time; copy_expert pulls bounded reads."""
+        monkeypatch.setattr("database.COPY_SLICE_ROWS", 2)
+        df = pl.DataFrame({"col": ["a", "b", "c", "d", "e"]})
+        mock_cur = MagicMock()
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_table", ["col"])
+
+        stream = mock_cur.copy_expert.call_args[0][1]
+        assert stream.read(3) == b"a\nb"
+        assert stream.read(100) == b"\n"
+        assert stream.read(100) == b"c\nd\n"
+        assert stream.read() == b"e\n"
+        assert stream.read(100) == b""
+
+    def test_binary_strips_null_bytes(self, connected_db):
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"col": ["hello\x00world"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("col", "text")]
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_table", ["col"])
+
+        content = mock_cur.copy_expert.call_args[0][1].read()
+        assert b"hello\x00world" not in content
+        assert struct.pack("!i", 10) + b"helloworld" in content
+
+    def test_encodes_typed_columns_natively(self, connected_db):
+        """Strings headed for DATE/DOUBLE/INTEGER/UUID columns are sent as
+        their binary wire values, NULL as length -1."""
+        socio_id = "0123abcd-0000-4000-8000-00000000ffee"
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame(
+            {
+                "d": ["20000102", None],
+                "f": ["1234.5", None],
+                "i": ["2", None],
+                "u": [socio_id, None],
+                "t": ["SP", None],
+            }
+        )
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [
+            ("d", "date"),
+            ("f", "double precision"),
+            ("i", "integer"),
+            ("u", "uuid"),
+            ("t", "character varying"),
+        ]
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_table", list(df.columns))
+
+        content = mock_cur.copy_expert.call_args[0][1].read()
+        first_row = (
+            struct.pack("!h", 5)
+            + struct.pack("!ii", 4, 1)
+            + struct.pack("!id", 8, 1234.5)
+            + struct.pack("!ii", 4, 2)
+            + struct.pack("!i", 16)
+            + bytes.fromhex(socio_id.replace("-", ""))
+            + struct.pack("!i", 2)
+            + b"SP"
+        )
+        null_row = struct.pack("!h", 5) + struct.pack("!i", -1) * 5
+        assert content == b"PGCOPY\n\xff\r\n\x00" + bytes(8) + first_row + null_row + b"\xff\xff"
+
+    def test_rejects_value_postgres_would_reject(self, connected_db):
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"d": ["not-a-date"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("d", "date")]
+
+        with pytest.raises(pl.exceptions.InvalidOperationError):
+            connected_db._copy_to_temp(mock_cur, df, "temp_table", ["d"])
+            mock_cur.copy_expert.call_args[0][1].read()
+
+    def test_unsupported_type_falls_back_to_csv(self, connected_db):
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"ts": ["2024-01-01 00:00:00"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("ts", "timestamp without time zone")]
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_table", ["ts"])
+
+        sql, stream = mock_cur.copy_expert.call_args[0][:2]
+        assert "WITH CSV" in sql
+        assert stream.read() == b"2024-01-01 00:00:00\n"
+
+    def test_column_types_cached_per_table(self, connected_db):
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"col": ["a"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("col", "text")]
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_1", ["col"], like_table="cnaes")
+        connected_db._copy_to_temp(mock_cur, df, "temp_2", ["col"], like_table="cnaes")
+
+        assert mock_cur.execute.call_count == 1
+
+    def test_binary_is_encoded_in_slices(self, connected_db, monkeypatch):
+        """Binary rows are encoded per slice and read in bounded pieces."""
+        monkeypatch.setattr("database.COPY_SLICE_ROWS", 2)
+        connected_db.copy_format = "binary"
+        df = pl.DataFrame({"col": ["a", "b", "c", "d", "e"]})
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [("col", "text")]
+
+        connected_db._copy_to_temp(mock_cur, df, "temp_table", ["col"])
+
+        stream = mock_cur.copy_expert.call_args[0][1]
+        pieces = list(iter(lambda: stream.read(7), b""))
+        assert all(len(p) <= 7 for p in pieces)
+        content = b"".join(pieces)
+        assert content.endswith(struct.pack("!h", 1) + struct.pack("!i", 1) + b"e" + b"\xff\xff")
+
 
 class TestUpsertFromTemp:
     """Test SQL generation for upsert."""
@@ -368,16 +710,168 @@ class TestUpsertFromTemp:
 
         connected_db._upsert_from_temp(mock_cur, "temp_tbl", "cnaes", ["codigo", "descricao"], ["codigo"])
 
-        sql = mock_cur.execute.call_args[0][0]
+        sql = mock_cur.execute.call_args_list[0][0][0]
+        assert sql.startswith("PREPARE upsert_0 AS")
         assert 'ON CONFLICT ("codigo")' in sql
         assert '"descricao" = EXCLUDED."descricao"' in sql
         assert "data_atualizacao = CURRENT_TIMESTAMP" in sql
+        mock_cur.execute.assert_called_with("EXECUTE upsert_0")
 
     def test_do_nothing_when_all_columns_are_pks(self, connected_db):
         mock_cur = MagicMock()
 
         connected_db._upsert_from_temp(mock_cur, "temp_tbl", "test", ["id"], ["id"])
 
-        sql = mock_cur.execute.call_args[0][0]
+        sql = mock_cur.execute.call_args_list[0][0][0]
         assert "DO NOTHING" in sql
         assert "DO UPDATE" not in sql
+
+    def test_prepared_once_per_table_and_columns(self, connected_db):
+        mock_cur = MagicMock()
+
+        connected_db._upsert_from_temp(mock_cur, "temp_cnaes", "cnaes", ["codigo", "descricao"], ["codigo"])
+        connected_db._upsert_from_temp(mock_cur, "temp_cnaes", "cnaes", ["codigo", "descricao"], ["codigo"])
+        connected_db._upsert_from_temp(mock_cur, "temp_cnaes", "cnaes", ["codigo"], ["codigo"])
+
+        statements = [c[0][0].split(" AS ")[0] for c in mock_cur.execute.call_args_list]
+        assert statements == [
+            "PREPARE upsert_0",
+            "EXECUTE upsert_0",
+            "EXECUTE upsert_0",
+            "PREPARE upsert_1",
+            "EXECUTE upsert_1",
+        ]
+
+    def test_prepared_again_after_reconnect(self, connected_db):
+        mock_cur = MagicMock()
+        connected_db._upsert_from_temp(mock_cur, "temp_cnaes", "cnaes", ["codigo"], ["codigo"])
+
+        connected_db.disconnect()
+        connected_db._upsert_from_temp(mock_cur, "temp_cnaes", "cnaes", ["codigo"], ["codigo"])
+
+        assert mock_cur.execute.call_args_list[2][0][0].startswith("PREPARE upsert_0 AS")
+
+
+class TestPing:
+    """Test the pre-reuse health check."""
+
+    def test_true_without_connection(self, db):
+        assert db.ping() is True
+
+    def test_false_when_closed(self, connected_db):
+        connected_db.conn.closed = 1
+        assert connected_db.ping() is False
+
+    def test_rolls_back_then_selects(self, connected_db):
+        connected_db.conn.closed = 0
+        mock_cur = MagicMock()
+        connected_db.conn.cursor.return_value.__enter__ = MagicMock(return_value=mock_cur)
+        connected_db.conn.cursor.return_value.__exit__ = MagicMock(return_value=False)
+
+        assert connected_db.ping() is True
+        mock_cur.execute.assert_called_once_with("SELECT 1")
+        assert connected_db.conn.rollback.call_count == 2
+
+    def test_false_when_query_fails(self, connected_db):
+        connected_db.conn.closed = 0
+        connected_db.conn.cursor.side_effect = psycopg2.OperationalError("server closed the connection")
+        assert connected_db.ping() is False
+
+
+class TestDatabasePool:
+    """Test connection pool shared by worker threads."""
+
+    @patch("database.psycopg2.connect")
+    def test_reuses_connection_and_caches_across_leases(self, mock_connect):
+        mock_connect.return_value.closed = 0
+        pool = DatabasePool(2, "postgresql://test", retry_attempts=1)
+
+        with pool.lease() as first:
+            first.connect()
+            first._pk_cache["cnaes"] = ["codigo"]
+        with pool.lease() as second:
+            second.connect()
+
+        assert second is first
+        assert second._pk_cache == {"cnaes": ["codigo"]}
+        mock_connect.assert_called_once_with("postgresql://test")
+
+    @patch("database.psycopg2.connect")
+    def test_passes_database_options(self, mock_connect):
+        pool = DatabasePool(1, "postgresql://test", retry_attempts=7, copy_format="binary")
+
+        with pool.lease() as db:
+            assert db.retry_attempts == 7
+            assert db.copy_format == "binary"
+
+    def test_never_lends_more_than_size(self):
+        pool = DatabasePool(2, "postgresql://test")
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal active, peak
+            with pool.lease():
+                with lock:
+                    active += 1
+                    peak = max(peak, active)
+                time.sleep(0.01)
+                with lock:
+                    active -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert peak <= 2
+        assert len(pool._all) <= 2
+
+    @patch("database.psycopg2.connect")
+    def test_replaces_connection_failing_health_check(self, mock_connect):
+        dead, fresh = MagicMock(closed=0), MagicMock(closed=0)
+        mock_connect.side_effect = [dead, fresh]
+        pool = DatabasePool(1, "postgresql://test")
+
+        with pool.lease() as db:
+            db.connect()
+        dead.closed = 2  # server went away between loans
+        with pool.lease() as db:
+            assert db.conn is None
+            db.connect()
+
+        dead.close.assert_called_once()
+        assert db.conn is fresh
+
+    def test_merges_pre_truncated(self):
+        pool = DatabasePool(1, "postgresql://test")
+
+        with pool.lease({"empresas"}) as db:
+            pass
+        with pool.lease({"socios"}) as db:
+            assert db._truncated_tables == {"empresas", "socios"}
+
+    def test_returns_handle_when_borrower_raises(self):
+        pool = DatabasePool(1, "postgresql://test")
+
+        with pytest.raises(RuntimeError):
+            with pool.lease():
+                raise RuntimeError("worker failed")
+
+        with pool.lease() as db:
+            assert db is pool._all[0]
+
+    @patch("database.psycopg2.connect")
+    def test_close_disconnects_all(self, mock_connect):
+        conn = MagicMock(closed=0)
+        mock_connect.return_value = conn
+        pool = DatabasePool(1, "postgresql://test")
+        with pool.lease() as db:
+            db.connect()
+
+        pool.close()
+
+        conn.close.assert_called_once()
+        assert pool._all == []
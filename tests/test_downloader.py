@@ -1,6 +1,11 @@
 """Tests for downloader module."""
 
+import io
+import json
 import logging
+import os
+import struct
+import threading
 import zipfile
 from unittest.mock import MagicMock, patch
 
@@ -15,7 +20,10 @@ from downloader import (
     Downloader,
     DownloadIncompleteError,
     DownloadStalledError,
+    RemoteFile,
+    ZipMember,
 )
+from zip_cache import ZIP_TAIL_BYTES
 
 
 def _webdav_xml(entries: list[str]) -> bytes:
@@ -135,7 +143,7 @@ class TestGetAvailableDirectories:
                 "/public.php/webdav/2024-03/",
             ]
         )
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock(content=xml, status_code=207)
             mock_req.return_value.raise_for_status = MagicMock()
 
@@ -147,7 +155,7 @@ class TestGetAvailableDirectories:
         """Discovery calls should keep the longer metadata read timeout."""
         config.stall_timeout = 2
         xml = _webdav_xml(["/public.php/webdav/", "/public.php/webdav/2024-03/"])
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock(content=xml, status_code=207)
             mock_req.return_value.raise_for_status = MagicMock()
 
@@ -157,7 +165,7 @@ class TestGetAvailableDirectories:
 
     def test_raises_on_network_error(self, downloader):
         """Test that network errors are propagated."""
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.side_effect = requests.exceptions.ConnectionError("Network error")
 
             with pytest.raises(requests.exceptions.ConnectionError):
@@ -166,7 +174,7 @@ class TestGetAvailableDirectories:
     def test_raises_on_empty_response(self, downloader):
         """Test that empty listing raises ValueError."""
         xml = _webdav_xml(["/public.php/webdav/"])
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock(content=xml, status_code=207)
             mock_req.return_value.raise_for_status = MagicMock()
 
@@ -175,7 +183,7 @@ class TestGetAvailableDirectories:
 
     def test_raises_on_http_error(self, downloader):
         """Test that HTTP errors (404, 500) are propagated."""
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock()
             mock_req.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("404")
 
@@ -209,7 +217,7 @@ class TestGetDirectoryFiles:
                 "/public.php/webdav/2024-03/Cnaes.zip",
             ]
         )
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock(content=xml, status_code=207)
             mock_req.return_value.raise_for_status = MagicMock()
 
@@ -220,13 +228,118 @@ class TestGetDirectoryFiles:
 
     def test_raises_on_http_error(self, downloader):
         """Test that HTTP errors are propagated."""
-        with patch("requests.request") as mock_req:
+        with patch("requests.Session.request") as mock_req:
             mock_req.return_value = MagicMock()
             mock_req.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("404")
 
             with pytest.raises(requests.exceptions.HTTPError):
                 downloader.get_directory_files("2024-03")
 
+    def test_file_sizes_from_content_length(self, downloader):
+        """Sizes come from getcontentlength; entries without one are left out."""
+        xml = (
+            '<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">'
+            "<d:response><d:href>/public.php/webdav/2024-03/</d:href></d:response>"
+            "<d:response><d:href>/public.php/webdav/2024-03/Empresas0.zip</d:href>"
+            "<d:propstat><d:prop><d:getcontentlength>1048576</d:getcontentlength></d:prop></d:propstat>"
+            "</d:response>"
+            "<d:response><d:href>/public.php/webdav/2024-03/Cnaes.zip</d:href></d:response>"
+            "</d:multistatus>"
+        ).encode()
+        with patch("requests.Session.request") as mock_req:
+            mock_req.return_value = MagicMock(content=xml, status_code=207)
+
+            assert downloader.get_file_sizes("2024-03") == {"Empresas0.zip": 1048576}
+            assert downloader.get_directory_files("2024-03") == ["Empresas0.zip", "Cnaes.zip"]
+
+
+def _webdav_props_xml(entries: dict[str, dict[str, str]]) -> bytes:
+    """PROPFIND XML whose entries carry the given DAV properties."""
+    responses = ""
+    for href, props in entries.items():
+        prop = "".join(f"<d:{name}>{value}</d:{name}>" for name, value in props.items())
+        responses += f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{prop}</d:prop></d:propstat></d:response>"
+    return f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">{responses}</d:multistatus>'.encode()
+
+
+class TestListingCache:
+    """Listings are fetched once per run and revalidated across runs by ETag."""
+
+    LISTING = {
+        "/public.php/webdav/2024-03/": {"getetag": '"dir-1"'},
+        "/public.php/webdav/2024-03/Cnaes.zip": {
+            "getcontentlength": "1024",
+            "getetag": '"cnaes-1"',
+            "getlastmodified": "Mon, 10 Mar 2024 10:00:00 GMT",
+        },
+        "/public.php/webdav/2024-03/Socios0.zip": {
+            "getcontentlength": "2048",
+            "getlastmodified": "Mon, 10 Mar 2024 11:00:00 GMT",
+        },
+    }
+
+    def _serve(self, *bodies: bytes):
+        responses = [MagicMock(content=body, status_code=207) for body in bodies]
+        return patch("requests.Session.request", side_effect=responses)
+
+    def test_one_propfind_per_run(self, downloader):
+        with self._serve(_webdav_props_xml(self.LISTING)) as mock_req:
+            assert downloader.get_directory_files("2024-03") == ["Cnaes.zip", "Socios0.zip"]
+            assert downloader.get_file_sizes("2024-03") == {"Cnaes.zip": 1024, "Socios0.zip": 2048}
+            assert downloader.get_file_versions("2024-03") == {
+                "Cnaes.zip": '"cnaes-1"',
+                "Socios0.zip": "2048@Mon, 10 Mar 2024 11:00:00 GMT",
+            }
+
+        assert mock_req.call_count == 1
+
+    def test_unchanged_collection_reuses_saved_listing(self, config):
+        with self._serve(_webdav_props_xml(self.LISTING)):
+            Downloader(config).get_directory_files("2024-03")
+
+        revalidation = _webdav_props_xml({"/public.php/webdav/2024-03/": {"getetag": '"dir-1"'}})
+        with self._serve(revalidation) as mock_req:
+            files = Downloader(config).get_remote_files("2024-03")
+
+        assert mock_req.call_count == 1
+        assert mock_req.call_args.kwargs["headers"] == {"Depth": "0"}
+        assert files["Cnaes.zip"] == RemoteFile(1024, '"cnaes-1"', "Mon, 10 Mar 2024 10:00:00 GMT")
+
+    def test_changed_collection_is_listed_again(self, config):
+        with self._serve(_webdav_props_xml(self.LISTING)):
+            Downloader(config).get_directory_files("2024-03")
+
+        changed = dict(self.LISTING)
+        changed["/public.php/webdav/2024-03/"] = {"getetag": '"dir-2"'}
+        changed["/public.php/webdav/2024-03/Cnaes.zip"] = {"getcontentlength": "4096", "getetag": '"cnaes-2"'}
+        revalidation = _webdav_props_xml({"/public.php/webdav/2024-03/": {"getetag": '"dir-2"'}})
+        with self._serve(revalidation, _webdav_props_xml(changed)) as mock_req:
+            versions = Downloader(config).get_file_versions("2024-03")
+
+        assert [c.kwargs["headers"] for c in mock_req.call_args_list] == [{"Depth": "0"}, {"Depth": "1"}]
+        assert versions["Cnaes.zip"] == '"cnaes-2"'
+
+    def test_cache_survives_cleanup(self, config, tmp_path):
+        """cleanup() after a run without KEEP_DOWNLOADED_FILES leaves the listing cache in place."""
+        downloader = Downloader(config)
+        with self._serve(_webdav_props_xml(self.LISTING)):
+            downloader.get_directory_files("2024-03")
+        downloader.cleanup()
+
+        revalidation = _webdav_props_xml({"/public.php/webdav/2024-03/": {"getetag": '"dir-1"'}})
+        with self._serve(revalidation) as mock_req:
+            Downloader(config).get_directory_files("2024-03")
+
+        assert (tmp_path / ".listing-cache.json").exists()
+        assert mock_req.call_args.kwargs["headers"] == {"Depth": "0"}
+
+    def test_disabled_cache_writes_nothing(self, config, tmp_path):
+        config.listing_cache = False
+        with self._serve(_webdav_props_xml(self.LISTING)):
+            Downloader(config).get_directory_files("2024-03")
+
+        assert not (tmp_path / ".listing-cache.json").exists()
+
 
 class TestDownloadAndExtract:
     """Test download and ZIP extraction functionality."""
@@ -236,7 +349,7 @@ class TestDownloadAndExtract:
         # Create a valid ZIP with a CNPJ file
         zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
 
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             # Fail twice, succeed on third
             mock_response = MagicMock()
             mock_response.headers = {"content-length": str(len(zip_content))}
@@ -254,9 +367,29 @@ class TestDownloadAndExtract:
             assert len(result) == 1
             assert "CNAECSV" in result[0].name
 
+    def test_download_zip_leaves_extraction_to_extract_zip(self, downloader, tmp_path):
+        """The pipeline downloads and extracts in separate stages."""
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+
+        with patch("requests.Session.get") as mock_get:
+            mock_response = MagicMock()
+            mock_response.headers = {"content-length": str(len(zip_content))}
+            mock_response.iter_content = MagicMock(return_value=[zip_content])
+            mock_get.return_value = mock_response
+
+            zip_path = downloader.download_zip("2024-03", "Cnaes.zip")
+
+        assert zip_path.exists()
+        assert not list(downloader.temp_path.glob("CNAECSV*"))
+
+        result = downloader.extract_zip(zip_path)
+
+        assert [p.name for p in result] == ["CNAECSV.D51213"]
+        assert not zip_path.exists()
+
     def test_raises_after_max_retries(self, downloader):
         """Test that exception is raised after all retries exhausted."""
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             mock_get.side_effect = requests.exceptions.Timeout("Timeout")
 
             with pytest.raises(requests.exceptions.Timeout):
@@ -269,7 +402,7 @@ class TestDownloadAndExtract:
         """Test that corrupt ZIP files raise appropriate error."""
         corrupt_content = b"not a zip file"
 
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             mock_response = MagicMock()
             mock_response.headers = {"content-length": str(len(corrupt_content))}
             mock_response.iter_content = MagicMock(return_value=[corrupt_content])
@@ -290,7 +423,7 @@ class TestDownloadAndExtract:
             },
         )
 
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             mock_response = MagicMock()
             mock_response.headers = {"content-length": str(len(zip_content))}
             mock_response.iter_content = MagicMock(return_value=[zip_content])
@@ -311,7 +444,7 @@ class TestDownloadAndExtract:
         config.stall_timeout = 7
         zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
 
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             mock_response = MagicMock()
             mock_response.headers = {"content-length": str(len(zip_content))}
             mock_response.iter_content = MagicMock(return_value=[zip_content])
@@ -345,7 +478,7 @@ class TestDownloadAndExtract:
                 ),
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -377,7 +510,7 @@ class TestDownloadAndExtract:
                 ),
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadStalledError, match=f"resuming from offset {split_at}"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -386,7 +519,9 @@ class TestDownloadAndExtract:
         """A data request read timeout before the body is still a resumable stall."""
         downloader.config.retry_attempts = 1
         downloader.config.stall_timeout = 7
-        monkeypatch.setattr(requests, "get", MagicMock(side_effect=requests.exceptions.ReadTimeout("slow stream")))
+        monkeypatch.setattr(
+            requests.Session, "get", MagicMock(side_effect=requests.exceptions.ReadTimeout("slow stream"))
+        )
 
         with pytest.raises(DownloadStalledError, match="resuming from offset 0"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -410,7 +545,7 @@ class TestDownloadAndExtract:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -432,7 +567,7 @@ class TestDownloadAndExtract:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -478,7 +613,7 @@ class TestDownloadAndExtract:
                 for _ in range(2)
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(RuntimeError, match="Incomplete download"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -503,7 +638,7 @@ class TestDownloadAndExtract:
                 ),
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(zipfile.BadZipFile):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -524,7 +659,7 @@ class TestDownloadFiles:
 
     def test_reference_download_failure_propagates(self, downloader, tmp_path):
         """A reference file download failure should propagate to the caller."""
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             mock_get.side_effect = requests.exceptions.Timeout("Timeout")
 
             with pytest.raises(requests.exceptions.Timeout):
@@ -618,7 +753,7 @@ class TestAdaptiveDownloadIntegration:
                 ),
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = list(downloader.download_files("2024-03", ["Empresas0.zip"]))
 
@@ -679,13 +814,247 @@ class TestCachedDownload:
 
         downloader = Downloader(config)
 
-        with patch("requests.get") as mock_get:
+        with patch("requests.Session.get") as mock_get:
             result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
             # Should not have made any HTTP requests
             mock_get.assert_not_called()
             assert len(result) == 1
 
+    def _cached(self, tmp_path):
+        config = Config(database_url="postgresql://test", temp_dir=str(tmp_path), keep_files=True)
+        zip_path = tmp_path / "Cnaes.zip"
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr("CNAECSV.D51213", "0111301;Test")
+        return Downloader(config), zip_path
+
+    def test_extraction_writes_manifest(self, tmp_path):
+        downloader, zip_path = self._cached(tmp_path)
+        downloader.extract_zip(zip_path)
+
+        manifest = json.loads((tmp_path / "Cnaes.zip.crc.json").read_text())
+        assert manifest["size"] == zip_path.stat().st_size
+        assert manifest["mtime_ns"] == zip_path.stat().st_mtime_ns
+        assert list(manifest["crc32"]) == ["CNAECSV.D51213"]
+
+    def test_matching_manifest_skips_crc_check(self, tmp_path):
+        downloader, zip_path = self._cached(tmp_path)
+        assert downloader._cached_zip_is_valid(zip_path)
+        assert (tmp_path / "Cnaes.zip.crc.json").exists()
+
+        with patch.object(zipfile.ZipFile, "testzip") as testzip:
+            assert downloader._cached_zip_is_valid(zip_path)
+        testzip.assert_not_called()
+
+    def test_changed_zip_is_checked_again(self, tmp_path):
+        downloader, zip_path = self._cached(tmp_path)
+        downloader._write_manifest(zip_path)
+        stat = zip_path.stat()
+        os.utime(zip_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        with patch.object(zipfile.ZipFile, "testzip", return_value=None) as testzip:
+            assert downloader._cached_zip_is_valid(zip_path)
+        testzip.assert_called_once()
+
+    def test_corrupt_cached_zip_removes_manifest(self, tmp_path):
+        downloader, zip_path = self._cached(tmp_path)
+        (tmp_path / "Cnaes.zip.crc.json").write_text("{}")
+
+        with patch.object(zipfile.ZipFile, "testzip", return_value="CNAECSV.D51213"):
+            assert not downloader._cached_zip_is_valid(zip_path)
+        assert not zip_path.exists()
+        assert not (tmp_path / "Cnaes.zip.crc.json").exists()
+
+
+class TestZipCache:
+    """ZIP_CACHE_DIR: identical ZIPs are fetched once across months and runs."""
+
+    def _listing(self, month: str, etag: str, size: int) -> bytes:
+        return _webdav_props_xml(
+            {
+                f"/public.php/webdav/{month}/": {"getetag": f'"{month}"'},
+                f"/public.php/webdav/{month}/Cnaes.zip": {"getcontentlength": str(size), "getetag": etag},
+            }
+        )
+
+    def _downloader(self, config, tmp_path):
+        config.zip_cache_dir = str(tmp_path / "cache")
+        config.listing_cache = False
+        return Downloader(config)
+
+    def _tail(self, content: bytes):
+        return MagicMock(status_code=206, content=content[-ZIP_TAIL_BYTES:])
+
+    def test_unchanged_file_in_another_month_is_not_downloaded(self, config, tmp_path, monkeypatch):
+        content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+        march = _ScriptedGet([_ScriptedResponse(chunks=[content], headers={"content-length": str(len(content))})])
+        monkeypatch.setattr(requests.Session, "get", march)
+        with patch(
+            "requests.Session.request", return_value=MagicMock(content=self._listing("2024-03", '"m"', len(content)))
+        ):
+            self._downloader(config, tmp_path)._download_and_extract("2024-03", "Cnaes.zip")
+
+        april = _ScriptedGet([self._tail(content)])
+        monkeypatch.setattr(requests.Session, "get", april)
+        with patch(
+            "requests.Session.request", return_value=MagicMock(content=self._listing("2024-04", '"a"', len(content)))
+        ):
+            extracted = self._downloader(config, tmp_path)._download_and_extract("2024-04", "Cnaes.zip")
+
+        assert extracted[0].read_text() == "0111301;Test"
+        assert [call["headers"] for call in april.calls] == [{"Range": "bytes=0-%d" % (len(content) - 1)}]
+
+    def test_same_month_again_needs_no_request(self, config, tmp_path, monkeypatch):
+        content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+        listing = MagicMock(content=self._listing("2024-03", '"m"', len(content)))
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet([_ScriptedResponse(chunks=[content], headers={"content-length": str(len(content))})]),
+        )
+        with patch("requests.Session.request", return_value=listing):
+            self._downloader(config, tmp_path)._download_and_extract("2024-03", "Cnaes.zip")
+
+        rerun = _ScriptedGet([])
+        monkeypatch.setattr(requests.Session, "get", rerun)
+        with patch("requests.Session.request", return_value=listing):
+            extracted = self._downloader(config, tmp_path)._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert extracted[0].read_text() == "0111301;Test"
+        assert rerun.calls == []
+
+    def test_changed_file_is_downloaded(self, config, tmp_path, monkeypatch):
+        old = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+        new = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Changed"})
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet([_ScriptedResponse(chunks=[old], headers={"content-length": str(len(old))})]),
+        )
+        with patch(
+            "requests.Session.request", return_value=MagicMock(content=self._listing("2024-03", '"m"', len(old)))
+        ):
+            self._downloader(config, tmp_path)._download_and_extract("2024-03", "Cnaes.zip")
+
+        april = _ScriptedGet(
+            [self._tail(new), _ScriptedResponse(chunks=[new], headers={"content-length": str(len(new))})]
+        )
+        monkeypatch.setattr(requests.Session, "get", april)
+        with patch(
+            "requests.Session.request", return_value=MagicMock(content=self._listing("2024-04", '"a"', len(new)))
+        ):
+            extracted = self._downloader(config, tmp_path)._download_and_extract("2024-04", "Cnaes.zip")
+
+        assert extracted[0].read_text() == "0111301;Changed"
+        assert len(april.calls) == 2
+        assert len(list((tmp_path / "cache" / "objects").glob("*.zip"))) == 2
+
+    def test_extract_while_downloading_reads_cached_zip(self, config, tmp_path, monkeypatch):
+        content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+        listing = MagicMock(content=self._listing("2024-03", '"m"', len(content)))
+        config.extract_while_downloading = True
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet([_ScriptedResponse(chunks=[content], headers={"content-length": str(len(content))})]),
+        )
+        with patch("requests.Session.request", return_value=listing):
+            ((member, _),) = list(self._downloader(config, tmp_path).download_files("2024-03", ["Cnaes.zip"]))
+            with member.open() as stream:
+                stream.read()
+
+        monkeypatch.setattr(requests.Session, "get", _ScriptedGet([]))
+        with patch("requests.Session.request", return_value=listing):
+            ((member, _),) = list(self._downloader(config, tmp_path).download_files("2024-03", ["Cnaes.zip"]))
+            with member.open() as stream:
+                assert stream.read() == b"0111301;Test"
+
+
+class TestStreamFromZip:
+    """STREAM_FROM_ZIP: CSVs are read in place from the ZIP, never extracted."""
+
+    def _download(self, downloader, tmp_path, monkeypatch, files: dict):
+        downloader.config.stream_from_zip = True
+        zip_content = _create_test_zip(tmp_path, files)
+        scripted_get = _ScriptedGet(
+            [_ScriptedResponse(chunks=[zip_content], headers={"content-length": str(len(zip_content))})]
+        )
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
+        return downloader._download_and_extract("2024-03", "Cnaes.zip")
+
+    def test_returns_members_without_extracting(self, downloader, tmp_path, monkeypatch):
+        result = self._download(downloader, tmp_path, monkeypatch, {"CNAECSV.D51213": "0111301;Test"})
+
+        assert len(result) == 1
+        assert isinstance(result[0], ZipMember)
+        assert result[0].name == "CNAECSV.D51213"
+        assert not (tmp_path / "CNAECSV.D51213").exists()
+        assert (tmp_path / "Cnaes.zip").exists()
+        with result[0].open("rb") as stream:
+            assert stream.read() == b"0111301;Test"
+
+    def test_skips_non_cnpj_members(self, downloader, tmp_path, monkeypatch):
+        result = self._download(
+            downloader, tmp_path, monkeypatch, {"CNAECSV.D51213": "data", "README.txt": "ignore this"}
+        )
+
+        assert [m.name for m in result] == ["CNAECSV.D51213"]
+
+    def test_zip_deleted_only_after_last_member_unlinked(self, downloader, tmp_path, monkeypatch):
+        first, second = self._download(
+            downloader, tmp_path, monkeypatch, {"CNAECSV.D51213": "a", "MOTICSV.D51213": "b"}
+        )
+        zip_path = tmp_path / "Cnaes.zip"
+
+        first.unlink()
+        assert zip_path.exists()
+        assert not first.exists()
+        assert second.exists()
+
+        second.unlink()
+        assert not zip_path.exists()
+
+    def test_crc_mismatch_downloads_again_before_returning_members(self, downloader, tmp_path, monkeypatch):
+        downloader.config.stream_from_zip = True
+        good_zip = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test-payload-long-enough"})
+        corrupt_zip = bytearray(good_zip)
+        corrupt_zip[corrupt_zip.find(b"0111301")] ^= 0xFF
+        scripted_get = _ScriptedGet(
+            [
+                _ScriptedResponse(chunks=[bytes(corrupt_zip)], headers={"content-length": str(len(corrupt_zip))}),
+                _ScriptedResponse(chunks=[good_zip], headers={"content-length": str(len(good_zip))}),
+            ]
+        )
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
+
+        (member,) = downloader._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert len(scripted_get.calls) == 2
+        with member.open("rb") as stream:
+            assert stream.read() == b"0111301;Test-payload-long-enough"
+
+    def test_writes_manifest_when_keeping_files(self, downloader, tmp_path, monkeypatch):
+        downloader.config.keep_files = True
+        self._download(downloader, tmp_path, monkeypatch, {"CNAECSV.D51213": "0111301;Test"})
+
+        assert downloader._manifest_matches(tmp_path / "Cnaes.zip")
+        with patch.object(zipfile.ZipFile, "testzip") as testzip:
+            downloader.extract_zip(tmp_path / "Cnaes.zip")
+        testzip.assert_not_called()
+
+    def test_process_file_reads_member_stream(self, downloader, tmp_path, monkeypatch):
+        """process_file accepts a ZipMember and decodes ISO-8859-1 from the stream."""
+        from processor import process_file
+
+        content = "0111301;Cultivo de arroz\n0111302;Cultivo de milho em várzea\n".encode("ISO-8859-1")
+        (member,) = self._download(downloader, tmp_path, monkeypatch, {"CNAECSV.D51213": content})
+
+        results = list(process_file(member, batch_size=100))
+
+        df, table_name, _ = results[0]
+        assert table_name == "cnaes"
+        assert df["descricao"].to_list() == ["Cultivo de arroz", "Cultivo de milho em várzea"]
+
 
 class TestProgressLogging:
     """Test periodic progress logs when tqdm output is disabled."""
@@ -709,7 +1078,7 @@ class TestProgressLogging:
         scripted_get = _ScriptedGet(
             [_ScriptedResponse(chunks=chunks, headers={"content-length": str(len(zip_content))})]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -742,7 +1111,7 @@ class TestProgressLogging:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -762,7 +1131,7 @@ class TestProgressLogging:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -801,7 +1170,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -823,7 +1192,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="differs from remote size"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -835,7 +1204,7 @@ class TestResumeEdgeCases:
         part_path = tmp_path / "Cnaes.zip.2024-03.part"
         part_path.write_bytes(zip_content[:10])
         scripted_get = _ScriptedGet([_ScriptedResponse(chunks=[], headers={}, status_code=416)])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="did not report the remote size"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -855,7 +1224,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="server resumed at byte"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -874,7 +1243,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="exceeds remote size"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -896,7 +1265,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Content-Length mismatch"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -915,7 +1284,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Invalid Content-Range"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -925,7 +1294,7 @@ class TestResumeEdgeCases:
         zip_content = self._zip(tmp_path)
         (tmp_path / "Cnaes.zip.2024-03.part").write_bytes(zip_content[:10])
         scripted_get = _ScriptedGet([_ScriptedResponse(chunks=[], headers={}, status_code=204)])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="server returned HTTP 204"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -934,7 +1303,7 @@ class TestResumeEdgeCases:
         downloader.config.retry_attempts = 1
         zip_content = self._zip(tmp_path)
         scripted_get = _ScriptedGet([_ScriptedResponse(chunks=[zip_content], headers={})])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Missing Content-Length"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -943,7 +1312,7 @@ class TestResumeEdgeCases:
         downloader.config.retry_attempts = 1
         zip_content = self._zip(tmp_path)
         scripted_get = _ScriptedGet([_ScriptedResponse(chunks=[zip_content], headers={"content-length": "many"})])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Invalid Content-Length"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -959,7 +1328,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="expected"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -978,7 +1347,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1000,7 +1369,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1020,7 +1389,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1031,7 +1400,7 @@ class TestResumeEdgeCases:
         zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
         (tmp_path / "Cnaes.zip.2024-03.part").write_bytes(zip_content[:10])
         scripted_get = _ScriptedGet([_ScriptedResponse(chunks=[], headers={}, status_code=206)])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Missing Content-Range"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1049,7 +1418,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="Invalid Content-Range"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1068,7 +1437,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadIncompleteError, match="did not report the remote size"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1078,7 +1447,7 @@ class TestResumeEdgeCases:
         downloader.config.retry_attempts = 1
         zip_content = bytearray(_create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test-payload-long-enough"}))
         # Flip a byte inside the member payload: the archive structure stays
-        # readable, but testzip() reports the CRC mismatch.
+        # readable, but extraction reports the CRC mismatch.
         marker = zip_content.find(b"0111301")
         zip_content[marker] ^= 0xFF
         scripted_get = _ScriptedGet(
@@ -1087,13 +1456,49 @@ class TestResumeEdgeCases:
                     chunks=[bytes(zip_content)],
                     headers={"content-length": str(len(zip_content))},
                 )
+                for _ in range(2)
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
-        with pytest.raises(zipfile.BadZipFile, match="Corrupt ZIP member"):
+        with pytest.raises(zipfile.BadZipFile, match="Bad CRC-32"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
 
+        assert len(scripted_get.calls) == 2
+        assert not (tmp_path / "Cnaes.zip").exists()
+        assert not (tmp_path / "CNAECSV.D51213").exists()
+
+    def test_crc_mismatch_during_extraction_downloads_again(self, downloader, tmp_path, monkeypatch):
+        downloader.config.retry_attempts = 1
+        good_zip = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test-payload-long-enough"})
+        corrupt_zip = bytearray(good_zip)
+        corrupt_zip[corrupt_zip.find(b"0111301")] ^= 0xFF
+        scripted_get = _ScriptedGet(
+            [
+                _ScriptedResponse(chunks=[bytes(corrupt_zip)], headers={"content-length": str(len(corrupt_zip))}),
+                _ScriptedResponse(chunks=[good_zip], headers={"content-length": str(len(good_zip))}),
+            ]
+        )
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
+
+        with patch.object(zipfile.ZipFile, "testzip") as testzip:
+            extracted = downloader._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert [path.name for path in extracted] == ["CNAECSV.D51213"]
+        assert extracted[0].read_text() == "0111301;Test-payload-long-enough"
+        testzip.assert_not_called()
+
+    def test_truncated_member_fails_the_structural_check(self, downloader, tmp_path):
+        zip_content = bytearray(_create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"}))
+        # Point the central directory's local-header offset past the end of the file
+        entry = zip_content.find(b"PK\x01\x02")
+        zip_content[entry + 42 : entry + 46] = struct.pack("<I", len(zip_content))
+        zip_path = tmp_path / "Cnaes.zip"
+        zip_path.write_bytes(bytes(zip_content))
+
+        with pytest.raises(zipfile.BadZipFile, match="Truncated ZIP member"):
+            downloader._validate_zip_file(zip_path)
+
     def test_corrupt_cached_zip_is_redownloaded(self, downloader, tmp_path, monkeypatch):
         downloader.config.keep_files = True
         zip_content = bytearray(_create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test-payload-long-enough"}))
@@ -1109,7 +1514,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1143,7 +1548,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadStalledError, match="stalled: no bytes"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1170,7 +1575,7 @@ class TestResumeEdgeCases:
                 ),
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1188,7 +1593,7 @@ class TestResumeEdgeCases:
                 )
             ]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(requests.exceptions.ConnectionError, match="reset by peer"):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1229,7 +1634,7 @@ class TestStalePartialPruning:
         scripted_get = _ScriptedGet(
             [_ScriptedResponse(chunks=[zip_content], headers={"content-length": str(len(zip_content))})]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         downloader.download_file("2026-06", "Cnaes.zip")
 
@@ -1245,7 +1650,7 @@ class TestStalePartialPruning:
         scripted_get = _ScriptedGet(
             [_ScriptedResponse(chunks=[zip_content], headers={"content-length": str(len(zip_content))})]
         )
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         results = list(downloader.download_files("2026-06", ["Cnaes.zip"]))
 
@@ -1277,7 +1682,7 @@ class TestRetryBudgetResetsOnProgress:
                 status = 206
             responses.append(_ScriptedResponse(chunks=chunks, headers=headers, status_code=status))
         scripted_get = _ScriptedGet(responses)
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         result = downloader._download_and_extract("2024-03", "Cnaes.zip")
 
@@ -1295,7 +1700,7 @@ class TestRetryBudgetResetsOnProgress:
             )
 
         scripted_get = _ScriptedGet([stall(), stall()])
-        monkeypatch.setattr(requests, "get", scripted_get)
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
 
         with pytest.raises(DownloadStalledError):
             downloader._download_and_extract("2024-03", "Cnaes.zip")
@@ -1346,7 +1751,7 @@ class TestAttemptLevelConcurrency:
         downloader.config.retry_attempts = 1
         adaptive = AdaptiveDownloadConcurrency(4, 3)
         monkeypatch.setattr(
-            requests,
+            requests.Session,
             "get",
             MagicMock(side_effect=requests.exceptions.ConnectTimeout("refused")),
         )
@@ -1371,7 +1776,7 @@ class TestAttemptLevelConcurrency:
         sleeps = []
         monkeypatch.setattr(downloader_module.time, "sleep", sleeps.append)
         monkeypatch.setattr(
-            requests,
+            requests.Session,
             "get",
             MagicMock(side_effect=requests.exceptions.ConnectTimeout("refused")),
         )
@@ -1402,7 +1807,7 @@ class TestAttemptLevelConcurrency:
 
         monkeypatch.setattr(adaptive, "record_stall", spy)
         monkeypatch.setattr(
-            requests,
+            requests.Session,
             "get",
             MagicMock(side_effect=requests.exceptions.ConnectTimeout("refused")),
         )
@@ -1418,3 +1823,395 @@ class TestAttemptLevelConcurrency:
             )
 
         assert active_at_record == [1]
+
+
+class _RangeServer:
+    """requests.get double serving one file with HTTP Range support.
+
+    fail_after maps a range start to a byte count: that request stalls
+    after sending so many bytes, once. After max_requests requests the
+    server refuses connections.
+    """
+
+    def __init__(
+        self,
+        content: bytes,
+        honor_range: bool = True,
+        fail_after: dict[int, int] | None = None,
+        max_requests: int | None = None,
+    ):
+        self.content = content
+        self.honor_range = honor_range
+        self.fail_after = dict(fail_after or {})
+        self.max_requests = max_requests
+        self.ranges: list[str | None] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str, **kwargs):
+        header = (kwargs.get("headers") or {}).get("Range")
+        with self._lock:
+            if self.max_requests is not None and len(self.ranges) >= self.max_requests:
+                raise requests.exceptions.ConnectTimeout("refused")
+            self.ranges.append(header)
+        total = len(self.content)
+        response = MagicMock()
+        if header is None or not self.honor_range:
+            response.status_code = 200
+            response.headers = {"content-length": str(total)}
+            response.iter_content.return_value = [self.content]
+            return response
+
+        start, end = header.removeprefix("bytes=").split("-")
+        start, end = int(start), int(end) if end else total - 1
+        body = self.content[start : end + 1]
+        chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+        cut = self.fail_after.pop(start, None) if end > start else None
+        if cut is not None:
+            chunks = [body[:cut], requests.exceptions.Timeout("stalled")]
+        response.status_code = 206
+        response.headers = {"content-length": str(len(body)), "content-range": f"bytes {start}-{end}/{total}"}
+        response.iter_content.side_effect = lambda chunk_size: _iter_chunks(chunks)
+        return response
+
+
+def _iter_chunks(chunks):
+    for chunk in chunks:
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+
+class TestSegmentedDownload:
+    """DOWNLOAD_SEGMENTS > 1: one ZIP fetched as concurrent byte ranges."""
+
+    @pytest.fixture
+    def segmented(self, downloader, monkeypatch):
+        import downloader as downloader_module
+
+        monkeypatch.setattr(downloader_module, "MIN_SEGMENT_BYTES", 64)
+        monkeypatch.setattr(downloader_module, "SEGMENT_STATE_INTERVAL", 16)
+        downloader.config.download_segments = 4
+        return downloader
+
+    def test_downloads_all_segments_and_extracts(self, segmented, tmp_path, monkeypatch):
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        server = _RangeServer(zip_content)
+        monkeypatch.setattr(requests.Session, "get", server)
+
+        result = segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert [p.name for p in result] == ["CNAECSV.D51213"]
+        assert result[0].read_text() == "0111301;Test\n" * 100
+        # Probe, then 4 ranges covering the file
+        assert server.ranges[0] == "bytes=0-0"
+        assert len(server.ranges) == 5
+        assert not list(segmented.temp_path.glob("*.part"))
+
+    def test_stalled_segment_resumes_from_its_own_offset(self, segmented, tmp_path, monkeypatch):
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        size = -(-len(zip_content) // 4)
+        server = _RangeServer(zip_content, fail_after={size: 40})
+        monkeypatch.setattr(requests.Session, "get", server)
+
+        result = segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert result[0].read_text() == "0111301;Test\n" * 100
+        # Only the stalled segment is requested again, from where it stopped
+        assert server.ranges[-1] == f"bytes={size + 40}-{2 * size - 1}"
+        assert len(server.ranges) == 6
+
+    def test_resume_state_survives_a_failed_run(self, segmented, tmp_path, monkeypatch):
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        segmented.config.retry_attempts = 1
+        monkeypatch.setattr(requests.Session, "get", _RangeServer(zip_content, fail_after={0: 20}, max_requests=5))
+
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            segmented._download_and_extract("2024-03", "Cnaes.zip")
+        segmented.cleanup()
+
+        state_file = segmented.temp_path / "Cnaes.zip.segstate.2024-03.part"
+        assert (segmented.temp_path / "Cnaes.zip.seg.2024-03.part").exists()
+        state = json.loads(state_file.read_text())
+        assert state["segments"][0][2] == 20
+        assert all(done == end - start + 1 for start, end, done in state["segments"][1:])
+
+        server = _RangeServer(zip_content)
+        monkeypatch.setattr(requests.Session, "get", server)
+        result = segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert result[0].read_text() == "0111301;Test\n" * 100
+        assert server.ranges == [f"bytes=20-{state['segments'][0][1]}"]
+
+    def test_changed_remote_file_discards_segments(self, segmented, tmp_path, monkeypatch):
+        old = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Old\n" * 100})
+        new = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Newer\n" * 100})
+        segmented.config.retry_attempts = 1
+        monkeypatch.setattr(requests.Session, "get", _RangeServer(old, fail_after={0: 20}, max_requests=5))
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        segmented.config.retry_attempts = 2
+        server = _RangeServer(new)
+        monkeypatch.setattr(requests.Session, "get", server)
+        result = segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert result[0].read_text() == "0111301;Newer\n" * 100
+        # The mismatched resume is dropped, then the file is probed and split anew
+        assert server.ranges[1] == "bytes=0-0"
+
+    def test_server_without_range_support_uses_one_stream(self, segmented, tmp_path, monkeypatch):
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        server = _RangeServer(zip_content, honor_range=False)
+        monkeypatch.setattr(requests.Session, "get", server)
+
+        result = segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert result[0].read_text() == "0111301;Test\n" * 100
+        assert server.ranges == ["bytes=0-0", None]
+
+    def test_small_file_uses_one_stream(self, segmented, tmp_path, monkeypatch):
+        import downloader as downloader_module
+
+        monkeypatch.setattr(downloader_module, "MIN_SEGMENT_BYTES", 1024 * 1024)
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test"})
+        server = _RangeServer(zip_content)
+        monkeypatch.setattr(requests.Session, "get", server)
+
+        segmented._download_and_extract("2024-03", "Cnaes.zip")
+
+        assert server.ranges == ["bytes=0-0", None]
+
+    def test_segments_hold_adaptive_permits(self, segmented, tmp_path, monkeypatch):
+        zip_content = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        adaptive = AdaptiveDownloadConcurrency(2, 3)
+        peak = []
+        server = _RangeServer(zip_content)
+
+        def get(url, **kwargs):
+            peak.append(adaptive._active_streams)
+            return server(url, **kwargs)
+
+        monkeypatch.setattr(requests.Session, "get", MagicMock(side_effect=get))
+
+        segmented._download_and_extract("2024-03", "Cnaes.zip", adaptive)
+
+        assert max(peak[1:]) <= 2
+
+
+class _GatedResponse(_ScriptedResponse):
+    """A response whose chunks may include threading.Events it waits on before going on."""
+
+    def iter_content(self, chunk_size: int):
+        for chunk in self._chunks:
+            if isinstance(chunk, threading.Event):
+                assert chunk.wait(5)
+                continue
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def _deflated_zip(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+class TestExtractWhileDownloading:
+    """EXTRACT_WHILE_DOWNLOADING: the CSV is inflated while its ZIP is still downloading."""
+
+    CSV = "".join(f"{i:07d};Atividade {i * 7919 % 100003}\n" for i in range(20000)).encode("ISO-8859-1")
+
+    @pytest.fixture
+    def streaming(self, downloader):
+        downloader.config.extract_while_downloading = True
+        return downloader
+
+    def test_member_is_readable_before_download_finishes(self, streaming, tmp_path, monkeypatch):
+        zip_content = _deflated_zip({"CNAECSV.D51213": self.CSV})
+        half = len(zip_content) // 2
+        gate = threading.Event()
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet(
+                [
+                    _GatedResponse(
+                        chunks=[zip_content[:half], gate, zip_content[half:]],
+                        headers={"content-length": str(len(zip_content))},
+                    )
+                ]
+            ),
+        )
+
+        files = streaming.download_files("2024-03", ["Cnaes.zip"])
+        member, zip_filename = next(files)
+        with member.open("rb") as stream:
+            head = stream.read(16)
+            assert not (tmp_path / "Cnaes.zip").exists()  # still downloading
+            gate.set()
+            rest = stream.read()
+
+        assert (member.name, zip_filename) == ("CNAECSV.D51213", "Cnaes.zip")
+        assert head + rest == self.CSV
+        member.unlink()
+        assert list(files) == []
+        assert not (tmp_path / "Cnaes.zip").exists()
+
+    def test_process_file_parses_while_downloading_without_testzip(self, streaming, tmp_path, monkeypatch):
+        from processor import process_file
+
+        zip_content = _deflated_zip({"CNAECSV.D51213": self.CSV})
+        gate = threading.Event()
+        chunks = [zip_content[i : i + 4096] for i in range(0, len(zip_content), 4096)]
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet(
+                [
+                    _GatedResponse(
+                        chunks=[chunks[0], gate, *chunks[1:]], headers={"content-length": str(len(zip_content))}
+                    )
+                ]
+            ),
+        )
+        threading.Timer(0.1, gate.set).start()
+
+        with patch.object(zipfile.ZipFile, "testzip") as testzip:
+            ((member, _),) = list(streaming.download_files("2024-03", ["Cnaes.zip"]))
+            rows = sum(len(df) for df, _, _ in process_file(member, batch_size=5000))
+
+        assert rows == 20000
+        testzip.assert_not_called()
+
+    def test_crc_mismatch_fails_the_read(self, streaming, tmp_path, monkeypatch):
+        zip_content = bytearray(_create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100}))
+        zip_content[60] ^= 0xFF  # inside the stored member's data
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet(
+                [_ScriptedResponse(chunks=[bytes(zip_content)], headers={"content-length": str(len(zip_content))})]
+            ),
+        )
+
+        ((member, _),) = list(streaming.download_files("2024-03", ["Cnaes.zip"]))
+        with pytest.raises(zipfile.BadZipFile, match="Bad CRC-32"), member.open("rb") as stream:
+            stream.read()
+
+    def test_refetch_after_crc_mismatch_reads_a_good_copy(self, streaming, tmp_path, monkeypatch):
+        good_zip = _create_test_zip(tmp_path, {"CNAECSV.D51213": "0111301;Test\n" * 100})
+        corrupt_zip = bytearray(good_zip)
+        corrupt_zip[60] ^= 0xFF
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet(
+                [
+                    _ScriptedResponse(chunks=[bytes(corrupt_zip)], headers={"content-length": str(len(corrupt_zip))}),
+                    _ScriptedResponse(chunks=[good_zip], headers={"content-length": str(len(good_zip))}),
+                ]
+            ),
+        )
+
+        files = streaming.download_files("2024-03", ["Cnaes.zip"])
+        member, _ = next(files)
+        with pytest.raises(zipfile.BadZipFile), member.open("rb") as stream:
+            stream.read()
+        retried = streaming.refetch("2024-03", "Cnaes.zip", member)
+
+        with retried.open("rb") as stream:
+            assert stream.read() == b"0111301;Test\n" * 100
+        retried.unlink()
+        assert list(files) == []
+        assert not (tmp_path / "Cnaes.zip").exists()
+
+    def test_stalled_download_resumes_under_the_reader(self, streaming, tmp_path, monkeypatch):
+        zip_content = _deflated_zip({"CNAECSV.D51213": self.CSV})
+        cut = len(zip_content) // 3
+        scripted_get = _ScriptedGet(
+            [
+                _ScriptedResponse(
+                    chunks=[zip_content[:cut], requests.exceptions.Timeout("stalled")],
+                    headers={"content-length": str(len(zip_content))},
+                ),
+                _ScriptedResponse(
+                    chunks=[zip_content[cut:]],
+                    headers={
+                        "content-range": f"bytes {cut}-{len(zip_content) - 1}/{len(zip_content)}",
+                        "content-length": str(len(zip_content) - cut),
+                    },
+                    status_code=206,
+                ),
+            ]
+        )
+        monkeypatch.setattr(requests.Session, "get", scripted_get)
+
+        files = streaming.download_files("2024-03", ["Cnaes.zip"])
+        member, _ = next(files)
+        with member.open("rb") as stream:
+            assert stream.read() == self.CSV
+        assert scripted_get.calls[1]["headers"]["Range"] == f"bytes={cut}-"
+
+    def test_restarted_download_is_followed_from_the_same_offset(self, streaming, tmp_path, monkeypatch):
+        """A server ignoring Range restarts the .part from byte 0; the reader reopens it."""
+        zip_content = _deflated_zip({"CNAECSV.D51213": self.CSV})
+        cut = len(zip_content) // 3
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet(
+                [
+                    _ScriptedResponse(
+                        chunks=[zip_content[:cut], requests.exceptions.Timeout("stalled")],
+                        headers={"content-length": str(len(zip_content))},
+                    ),
+                    _ScriptedResponse(chunks=[zip_content], headers={"content-length": str(len(zip_content))}),
+                ]
+            ),
+        )
+
+        member, _ = next(streaming.download_files("2024-03", ["Cnaes.zip"]))
+        with member.open("rb") as stream:
+            assert stream.read() == self.CSV
+
+    def test_download_failure_reaches_the_consumer(self, streaming, monkeypatch):
+        streaming.config.retry_attempts = 1
+        monkeypatch.setattr(requests.Session, "get", _ScriptedGet([requests.exceptions.ConnectTimeout("refused")]))
+
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            list(streaming.download_files("2024-03", ["Cnaes.zip"]))
+
+    def test_later_members_follow_once_the_zip_is_complete(self, streaming, tmp_path, monkeypatch):
+        zip_content = _deflated_zip({"CNAECSV.D51213": b"a;b\n", "README.txt": b"x", "MOTICSV.D51213": b"c;d\n"})
+        monkeypatch.setattr(
+            requests.Session,
+            "get",
+            _ScriptedGet([_ScriptedResponse(chunks=[zip_content], headers={"content-length": str(len(zip_content))})]),
+        )
+
+        result = []
+        for member, _ in streaming.download_files("2024-03", ["Cnaes.zip"]):
+            with member.open("rb") as stream:
+                result.append((member.name, stream.read()))
+            member.unlink()
+
+        assert result == [("CNAECSV.D51213", b"a;b\n"), ("MOTICSV.D51213", b"c;d\n")]
+        assert not (tmp_path / "Cnaes.zip").exists()
+
+    def test_uses_one_stream_even_with_segments(self, streaming, monkeypatch):
+        import downloader as downloader_module
+
+        monkeypatch.setattr(downloader_module, "MIN_SEGMENT_BYTES", 64)
+        streaming.config.download_segments = 4
+        zip_content = _deflated_zip({"CNAECSV.D51213": self.CSV})
+        server = _RangeServer(zip_content)
+        monkeypatch.setattr(requests.Session, "get", server)
+
+        ((member, _),) = list(streaming.download_files("2024-03", ["Cnaes.zip"]))
+
+        with member.open("rb") as stream:
+            assert stream.read() == self.CSV
+        assert server.ranges == [None]
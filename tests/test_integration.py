@@ -4,12 +4,14 @@ Requires a running PostgreSQL instance (docker compose up -d postgres).
 Skipped automatically in CI if DATABASE_URL is not set.
 """
 
+import io
 from pathlib import Path
 
+import polars as pl
 import psycopg2
 import pytest
 
-from database import Database
+from database import Database, DatabasePool
 from processor import process_file
 
 FIXTURES_DIR = Path(__file__).parent / "fixtures"
@@ -169,6 +171,34 @@ class TestFullPipeline:
             """)
             assert cur.fetchone()[0] == 0, "Found invalid dates in estabelecimentos"
 
+    def test_binary_copy_matches_csv_copy(self, test_db):
+        """COPY_FORMAT=binary must store exactly what CSV COPY stores."""
+        binary_db = Database(DATABASE_URL, copy_format="binary")
+        binary_db.conn = test_db.conn
+        for fixture_name in PROCESSING_ORDER:
+            for batch, table_name, columns in process_file(FIXTURES_DIR / fixture_name, batch_size=500000):
+                columns_str = ", ".join(f'"{c}"' for c in columns)
+                try:
+                    with test_db.conn.cursor() as cur:
+                        cur.execute(
+                            f"CREATE TEMP TABLE via_binary (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+                        )
+                        cur.execute(f"CREATE TEMP TABLE via_csv (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+                        binary_db._copy_to_temp(cur, batch, "via_binary", columns, like_table=table_name)
+                        cur.copy_expert(
+                            f"COPY via_csv ({columns_str}) FROM STDIN WITH CSV",
+                            io.BytesIO(batch.write_csv(include_header=False).encode("utf-8")),
+                        )
+                        cur.execute("SELECT count(*) FROM via_binary")
+                        assert cur.fetchone()[0] == len(batch)
+                        cur.execute(
+                            f"SELECT count(*) FROM (SELECT {columns_str} FROM via_binary "
+                            f"EXCEPT ALL SELECT {columns_str} FROM via_csv) diff"
+                        )
+                        assert cur.fetchone()[0] == 0, f"{table_name}: binary COPY differs from CSV COPY"
+                finally:
+                    test_db.conn.rollback()
+
     def test_replace_strategy(self, test_db):
         """Loading with bulk_insert should truncate and reload cleanly."""
         # Load with replace strategy
@@ -217,6 +247,200 @@ class TestFullPipeline:
             f"cross-batch overlap path changed row count: {count_after_first} -> {count_after_second}"
         )
 
+    def test_delta_strategy(self, test_db, caplog):
+        """Delta upserts only changed rows, deletes vanished ones, then restores."""
+        batches = list(process_file(FIXTURES_DIR / "ESTABELE.csv", batch_size=500000))
+        table_name, columns = batches[0][1], batches[0][2]
+        original = pl.concat([batch for batch, _, _ in batches])
+        count = _count_rows(test_db, table_name)
+        test_db.conn.rollback()
+
+        def run(df):
+            caplog.clear()
+            test_db.begin_delta(table_name)
+            test_db.bulk_delta(df, table_name, columns)
+            with caplog.at_level("INFO", logger="database"):
+                test_db.finish_delta(table_name)
+            return [r.getMessage() for r in caplog.records if r.getMessage().startswith("Delta")]
+
+        # No fingerprints yet: everything is upserted, nothing deleted
+        assert run(original) == [f"Delta {table_name}: {len(original):,} of {len(original):,} rows upserted, 0 deleted"]
+
+        first, second = original.row(0, named=True), original.row(1, named=True)
+        edited = original.slice(1).with_columns(
+            pl.when(pl.col("cnpj_ordem") == second["cnpj_ordem"], pl.col("cnpj_basico") == second["cnpj_basico"])
+            .then(pl.lit("Delta Street"))
+            .otherwise(pl.col("logradouro"))
+            .alias("logradouro")
+        )
+        assert run(edited) == [f"Delta {table_name}: 1 of {len(edited):,} rows upserted, 1 deleted"]
+        with test_db.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT logradouro FROM {table_name} WHERE cnpj_basico = %s AND cnpj_ordem = %s AND cnpj_dv = %s",
+                (second["cnpj_basico"], second["cnpj_ordem"], second["cnpj_dv"]),
+            )
+            assert cur.fetchone()[0] == "Delta Street"
+            cur.execute(
+                f"SELECT count(*) FROM {table_name} WHERE cnpj_basico = %s AND cnpj_ordem = %s AND cnpj_dv = %s",
+                (first["cnpj_basico"], first["cnpj_ordem"], first["cnpj_dv"]),
+            )
+            assert cur.fetchone()[0] == 0
+        test_db.conn.rollback()
+
+        # Back to the fixture: the deleted row is new again, the edit reverts
+        assert run(original) == [f"Delta {table_name}: 2 of {len(original):,} rows upserted, 0 deleted"]
+        assert _count_rows(test_db, table_name) == count
+        test_db.conn.rollback()
+
+    def test_delta_keeps_the_last_loaded_fingerprint_of_a_repeated_key(self, test_db, caplog):
+        """A key in two shards keeps the fingerprint of the copy loaded last, the one left in the table."""
+        batches = list(process_file(FIXTURES_DIR / "ESTABELE.csv", batch_size=500000))
+        table_name, columns = batches[0][1], batches[0][2]
+        original = pl.concat([batch for batch, _, _ in batches])
+        stale = original.head(1).with_columns(pl.lit("Stale Street").alias("logradouro"))
+        test_db.conn.rollback()
+
+        def run(*shards):
+            caplog.clear()
+            test_db.begin_delta(table_name)
+            for shard in shards:
+                test_db.bulk_delta(shard, table_name, columns)
+            with caplog.at_level("INFO", logger="database"):
+                test_db.finish_delta(table_name)
+            return [r.getMessage() for r in caplog.records if r.getMessage().startswith("Delta")]
+
+        run(stale, original)
+
+        assert run(original) == [f"Delta {table_name}: 0 of {len(original):,} rows upserted, 0 deleted"]
+
+    def test_partial_delta_keeps_fingerprints_of_files_not_loaded(self, test_db, caplog):
+        """A row vanishing from a shard skipped by a partial delta is still deleted by the next full one."""
+        batches = list(process_file(FIXTURES_DIR / "ESTABELE.csv", batch_size=500000))
+        table_name, columns = batches[0][1], batches[0][2]
+        original = pl.concat([batch for batch, _, _ in batches])
+        shard_a, shard_b = original.slice(0, 1000), original.slice(1000)
+        count = _count_rows(test_db, table_name)
+        test_db.conn.rollback()
+
+        def run(*shards, delete_missing=True):
+            caplog.clear()
+            test_db.begin_delta(table_name)
+            for shard in shards:
+                test_db.bulk_delta(shard, table_name, columns)
+            with caplog.at_level("INFO", logger="database"):
+                test_db.finish_delta(table_name, delete_missing=delete_missing)
+            return [r.getMessage() for r in caplog.records if r.getMessage().startswith("Delta")]
+
+        run(shard_a, shard_b)
+        # Only shard A reloaded, e.g. after it was republished
+        run(shard_a, delete_missing=False)
+
+        gone = shard_b.row(0, named=True)
+        assert run(shard_a, shard_b.slice(1)) == [
+            f"Delta {table_name}: 0 of {len(original) - 1:,} rows upserted, 1 deleted"
+        ]
+        with test_db.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT count(*) FROM {table_name} WHERE cnpj_basico = %s AND cnpj_ordem = %s AND cnpj_dv = %s",
+                (gone["cnpj_basico"], gone["cnpj_ordem"], gone["cnpj_dv"]),
+            )
+            assert cur.fetchone()[0] == 0
+        test_db.conn.rollback()
+
+        run(shard_a, shard_b)
+        assert _count_rows(test_db, table_name) == count
+        test_db.conn.rollback()
+
+    def test_deferred_indexes_round_trip(self, test_db):
+        """Dropped secondary indexes come back identical; the PK is never dropped."""
+
+        def indexdefs(table):
+            with test_db.conn.cursor() as cur:
+                cur.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s ORDER BY 1", (table,))
+                return cur.fetchall()
+
+        before = indexdefs("socios")
+        test_db.conn.rollback()
+
+        dropped = test_db.drop_secondary_indexes("socios")
+        assert sorted(dropped) == ["idx_socios_cnpj_basico", "idx_socios_lookup"]
+        assert [name for name, _ in indexdefs("socios")] == ["socios_pkey"]
+        test_db.conn.rollback()
+
+        assert sorted(test_db.rebuild_deferred_indexes(workers=2, maintenance_work_mem="64MB")) == dropped
+        assert indexdefs("socios") == before
+        with test_db.conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM deferred_indexes")
+            assert cur.fetchone()[0] == 0
+        test_db.conn.rollback()
+
+    def test_table_dependencies_from_foreign_keys(self, test_db):
+        """initial.sql declares no foreign keys; one added later is picked up."""
+        assert test_db.get_table_dependencies() == {}
+
+        with test_db.conn.cursor() as cur:
+            cur.execute("CREATE TABLE fk_probe (codigo TEXT REFERENCES cnaes (codigo))")
+        try:
+            assert test_db.get_table_dependencies() == {"fk_probe": {"cnaes"}}
+        finally:
+            test_db.conn.rollback()
+
+    def test_swap_strategy(self, test_db):
+        """Swap rebuilds each table from a shadow and keeps its indexes and PK.
+
+        estabelecimentos is loaded twice so the shadow holds duplicate PKs,
+        which finish_swap must drop before building the primary key.
+        """
+
+        def index_names(table):
+            with test_db.conn.cursor() as cur:
+                cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s ORDER BY 1", (table,))
+                return [row[0] for row in cur.fetchall()]
+
+        before = {table: index_names(table) for table in EXPECTED_COUNTS}
+        counts = {table: _count_rows(test_db, table) for table in EXPECTED_COUNTS}
+        test_db.conn.rollback()
+
+        for table in EXPECTED_COUNTS:
+            test_db.begin_swap(table)
+        for fixture_name in PROCESSING_ORDER:
+            repeats = 2 if fixture_name == "ESTABELE.csv" else 1
+            for _ in range(repeats):
+                for batch, table_name, columns in process_file(FIXTURES_DIR / fixture_name, batch_size=500000):
+                    test_db.bulk_load_shadow(batch, table_name, columns)
+        for table in EXPECTED_COUNTS:
+            test_db.finish_swap(table, index_workers=2)
+
+        for table in EXPECTED_COUNTS:
+            assert _count_rows(test_db, table) == counts[table], f"{table} row count changed across swap"
+            assert index_names(table) == before[table], f"{table} indexes not carried over"
+        with test_db.conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM pg_class WHERE relname LIKE '%%\\_\\_next'")
+            assert cur.fetchone()[0] == 0, "shadow table or index left behind"
+            cur.execute("SELECT relpersistence FROM pg_class WHERE relname = 'estabelecimentos'")
+            assert cur.fetchone()[0] == "u"
+            cur.execute(
+                "SELECT count(*) FROM pg_constraint WHERE conrelid = 'estabelecimentos'::regclass AND contype = 'p'"
+            )
+            assert cur.fetchone()[0] == 1
+        test_db.conn.rollback()
+
+    def test_swap_set_logged(self, test_db):
+        """set_logged=True publishes a crash-safe (LOGGED) table."""
+        count = _count_rows(test_db, "cnaes")
+        test_db.conn.rollback()
+
+        test_db.begin_swap("cnaes")
+        for batch, table_name, columns in process_file(FIXTURES_DIR / "CNAECSV.csv", batch_size=500000):
+            test_db.bulk_load_shadow(batch, table_name, columns)
+        test_db.finish_swap("cnaes", set_logged=True)
+
+        assert _count_rows(test_db, "cnaes") == count
+        with test_db.conn.cursor() as cur:
+            cur.execute("SELECT relpersistence FROM pg_class WHERE relname = 'cnaes'")
+            assert cur.fetchone()[0] == "p"
+        test_db.conn.rollback()
+
 
 class TestRecipeReferenceDomainsEnriched:
     """Apply recipes/postgres/reference_domains_enriched.sql against the
@@ -2226,3 +2450,50 @@ class TestRecipeCnaesHierarquia:
         self._apply(test_db)
         after = _count_rows(test_db, "cnaes_hierarquia")
         assert before == after, f"row count changed on re-run: {before} -> {after}"
+
+
+class TestProcessedFileVersions:
+    """Recorded listing versions decide which processed files load again."""
+
+    def test_republished_file_is_pending_again(self, test_db):
+        test_db.mark_processed("versions-test", "Cnaes.zip", '"cnaes-1"')
+        test_db.mark_processed("versions-test", "Paises.zip", '"paises-1"')
+
+        current = {"Cnaes.zip": '"cnaes-1"', "Paises.zip": '"paises-2"'}
+        assert test_db.get_processed_files("versions-test", current) == {"Cnaes.zip"}
+
+        test_db.mark_processed("versions-test", "Paises.zip", '"paises-2"')
+        assert test_db.get_processed_files("versions-test", current) == {"Cnaes.zip", "Paises.zip"}
+
+
+class TestFileFingerprints:
+    def test_latest_earlier_fingerprint_per_file(self, test_db):
+        test_db.record_fingerprint("2023-11", "Motivos.zip", 10, "old")
+        test_db.record_fingerprint("2023-12", "Motivos.zip", 12, "new")
+        test_db.record_fingerprint("2023-12", "Naturezas.zip", 20, "n")
+        test_db.record_fingerprint("2024-02", "Naturezas.zip", 21, "later")
+
+        assert test_db.get_previous_fingerprints("2024-01") == {"Motivos.zip": ("2023-12", 12, "new")}
+
+
+class TestDatabasePool:
+    """Pooled connections against a real server."""
+
+    def test_reuses_backend_and_recovers_from_terminated_connection(self, test_db):
+        pool = DatabasePool(1, DATABASE_URL)
+        try:
+            with pool.lease() as db:
+                assert db.get_processed_files("pool-test") == set()
+                first_pid = db.conn.get_backend_pid()
+            with pool.lease() as db:
+                assert db.conn.get_backend_pid() == first_pid
+
+            with test_db.conn.cursor() as cur:
+                cur.execute("SELECT pg_terminate_backend(%s)", (first_pid,))
+            test_db.conn.commit()
+
+            with pool.lease() as db:
+                assert db.get_processed_files("pool-test") == set()
+                assert db.conn.get_backend_pid() != first_pid
+        finally:
+            pool.close()
@@ -1,11 +1,27 @@
 """Tests for main module."""
 
+import queue
+import threading
+import time
+import zipfile
 from unittest.mock import MagicMock, patch
 
 import polars as pl
+import pyarrow as pa
 import pytest
 
-from main import _parquet_worker, _pg_worker, get_file_priority, group_files_by_dependency, main
+from main import (
+    _carry_forward_unchanged,
+    _parquet_worker,
+    _pg_worker,
+    _process_refetching,
+    _run_pipeline,
+    _run_process_pool,
+    _transform_worker,
+    get_file_priority,
+    group_files_by_dependency,
+    main,
+)
 
 
 class TestGetFilePriority:
@@ -31,37 +47,79 @@ class TestGetFilePriority:
         assert get_file_priority("UNKNOWN.csv") > get_file_priority("SIMPLESCSV.D51213")
 
 
+# The FK layering of earlier schemas: references → empresas → the rest
+LAYERED = {
+    "empresas": {"cnaes", "motivos", "paises"},
+    "estabelecimentos": {"empresas"},
+    "socios": {"empresas"},
+    "dados_simples": {"empresas"},
+}
+
+
 class TestGroupFilesByDependency:
     """Test dependency grouping for parallel processing."""
 
+    def test_no_dependencies_single_group(self):
+        """Without declared dependencies every file is schedulable at once."""
+        files = ["Cnaes.zip", "Empresas0.zip", "Estabelecimentos0.zip", "Socios0.zip"]
+        groups = group_files_by_dependency(files, {})
+        assert len(groups) == 1
+        assert sorted(groups[0]) == sorted(files)
+
+    def test_default_map_has_no_barriers(self):
+        """initial.sql declares no foreign keys, so the default map has no levels."""
+        groups = group_files_by_dependency(["Cnaes.zip", "Empresas0.zip", "Socios0.zip"])
+        assert len(groups) == 1
+
     def test_groups_reference_files(self):
         """Reference files should all be in group 0."""
         files = ["Cnaes.zip", "Motivos.zip", "Paises.zip"]
-        groups = group_files_by_dependency(files)
-        assert len(groups[0]) == 3
-        assert len(groups[1]) == 0
-        assert len(groups[2]) == 0
+        groups = group_files_by_dependency(files, LAYERED)
+        assert groups == [["Cnaes.zip", "Motivos.zip", "Paises.zip"]]
 
     def test_groups_by_dependency_level(self):
         """Files should be grouped by their FK dependency level."""
-        files = ["Cnaes.zip", "Empresas0.zip", "Estabele0.zip", "Socios0.zip"]
-        groups = group_files_by_dependency(files)
+        files = ["Cnaes.zip", "Empresas0.zip", "Estabelecimentos0.zip", "Socios0.zip"]
+        groups = group_files_by_dependency(files, LAYERED)
         assert groups[0] == ["Cnaes.zip"]
         assert groups[1] == ["Empresas0.zip"]
-        assert sorted(groups[2]) == sorted(["Estabele0.zip", "Socios0.zip"])
+        assert sorted(groups[2]) == sorted(["Estabelecimentos0.zip", "Socios0.zip"])
+
+    def test_independent_table_not_held_back(self):
+        """Only tables with a dependency wait; the others start in level 0."""
+        files = ["Cnaes.zip", "Empresas0.zip", "Socios0.zip", "Simples.zip"]
+        groups = group_files_by_dependency(files, {"socios": {"empresas"}})
+        assert sorted(groups[0]) == ["Cnaes.zip", "Empresas0.zip", "Simples.zip"]
+        assert groups[1] == ["Socios0.zip"]
 
     def test_multiple_files_same_type(self):
         """Multiple files of the same type should be in the same group."""
         files = ["Empresas0.zip", "Empresas1.zip", "Empresas2.zip"]
-        groups = group_files_by_dependency(files)
+        groups = group_files_by_dependency(files, LAYERED)
         assert len(groups[1]) == 3
+        assert groups[0] == []
 
     def test_unknown_files_excluded(self):
         """Unknown file types should not appear in any group."""
         files = ["Unknown.zip", "Cnaes.zip"]
-        groups = group_files_by_dependency(files)
-        assert len(groups[0]) == 1
-        assert all(len(g) == 0 for g in groups[1:])
+        groups = group_files_by_dependency(files, LAYERED)
+        assert groups == [["Cnaes.zip"]]
+
+    def test_largest_files_first(self):
+        """Longest-processing-time order: biggest ZIPs are scheduled first."""
+        files = ["Cnaes.zip", "Socios0.zip", "Estabelecimentos0.zip", "Estabelecimentos1.zip"]
+        sizes = {"Cnaes.zip": 20_000, "Socios0.zip": 300_000_000, "Estabelecimentos0.zip": 900_000_000}
+        groups = group_files_by_dependency(files, {}, sizes)
+        # Unknown size goes last, not first
+        assert groups == [["Estabelecimentos0.zip", "Socios0.zip", "Cnaes.zip", "Estabelecimentos1.zip"]]
+
+    def test_unknown_sizes_keep_priority_order(self):
+        groups = group_files_by_dependency(["Socios0.zip", "Empresas0.zip", "Cnaes.zip"], {})
+        assert groups == [["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]]
+
+    def test_circular_dependency_rejected(self):
+        with pytest.raises(ValueError, match="Circular"):
+            group_files_by_dependency(["Empresas0.zip"], {"empresas": {"socios"}, "socios": {"empresas"}})
 
 
 class TestMain:
@@ -103,6 +161,7 @@ class TestMain:
         """Invalid --month should exit with code 1."""
         mock_args.return_value = MagicMock(list=False, month="2099-01", force=False)
         mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
         mock_config.database_url = "postgresql://test"
         mock_downloader = MagicMock()
         mock_downloader.get_available_directories.return_value = ["2024-01", "2024-02"]
@@ -123,6 +182,7 @@ class TestMain:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
 
         mock_downloader = MagicMock()
@@ -147,6 +207,7 @@ class TestMain:
         """When all files are processed, should return without downloading."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
         mock_config.database_url = "postgresql://test"
 
         mock_downloader = MagicMock()
@@ -162,6 +223,79 @@ class TestMain:
 
         mock_downloader.download_files.assert_not_called()
 
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_processed_files_checked_against_listed_versions(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config
+    ):
+        """Skip decisions see the listing's versions, so republished files load again."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Cnaes.zip"]
+        mock_downloader.get_file_versions.return_value = {"Cnaes.zip": '"etag-2"'}
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = {"Cnaes.zip"}
+        mock_db_cls.return_value = mock_db
+
+        main()
+
+        mock_db.get_processed_files.assert_called_once_with("2024-01", {"Cnaes.zip": '"etag-2"'})
+
+    @pytest.mark.parametrize(
+        "strategy, reloaded",
+        [
+            ("replace", ["Empresas0.zip", "Empresas1.zip"]),
+            ("swap", ["Empresas0.zip", "Empresas1.zip"]),
+            ("upsert", ["Empresas1.zip"]),
+        ],
+    )
+    @patch("main.process_file")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_republished_shard_requeues_its_table(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_process_file, strategy, reloaded
+    ):
+        """Rebuilding strategies reload every file of a table with a republished file, not that file alone."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.database_url = "postgresql://test"
+        mock_config.memory_budget = ""
+        mock_config.process_workers = 1
+        mock_config.loading_strategy = strategy
+        mock_config.skip_unchanged_files = False
+
+        files = ["Cnaes.zip", "Empresas0.zip", "Empresas1.zip"]
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = files
+        mock_downloader.get_file_versions.return_value = {f: '"etag-1"' for f in files} | {"Empresas1.zip": '"etag-2"'}
+        mock_downloader.get_file_sizes.return_value = {}
+        mock_downloader.download_files.return_value = iter([])
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        # Empresas1.zip was processed at "etag-1" and is now listed at "etag-2"
+        mock_db.get_processed_files.side_effect = lambda directory, versions=None: (
+            {"Cnaes.zip", "Empresas0.zip"} if versions else set(files)
+        )
+        mock_db_cls.return_value = mock_db
+
+        main()
+
+        downloaded = [f for c in mock_downloader.download_files.call_args_list for f in c.args[1]]
+        assert sorted(downloaded) == reloaded
+
     @patch("main.process_file")
     @patch("main.config")
     @patch("database.Database")
@@ -175,6 +309,7 @@ class TestMain:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 1
         mock_config.loading_strategy = "upsert"
@@ -205,6 +340,46 @@ class TestMain:
         # File should NOT be deleted because mark_processed failed
         assert csv_file.exists()
 
+    @patch("main.log_memory_report")
+    @patch("main.process_file")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_memory_budget_passed_to_processing_and_reported(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_process_file, mock_report, tmp_path
+    ):
+        """MEMORY_BUDGET sizes batches through process_file and the peak is reported at the end."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.database_url = "postgresql://test"
+        mock_config.batch_size = 500000
+        mock_config.memory_budget = "2GB"
+        mock_config.keep_files = False
+        mock_config.process_workers = 1
+        mock_config.loading_strategy = "upsert"
+
+        csv_file = tmp_path / "CNAECSV.D51213"
+        csv_file.write_text("data")
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Cnaes.zip"]
+        mock_downloader.download_files.return_value = iter([(csv_file, "Cnaes.zip")])
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db_cls.return_value = mock_db
+
+        mock_process_file.return_value = iter([(pl.DataFrame({"codigo": ["001"]}), "cnaes", ["codigo"])])
+
+        main()
+
+        memory = mock_process_file.call_args.kwargs["memory"]
+        assert (memory.total_bytes, memory.concurrency, memory.max_rows) == (2 * 1024**3, 1, 500000)
+        mock_report.assert_called_once_with(memory)
+
     @patch("main.config")
     @patch("database.Database")
     @patch("main.Downloader")
@@ -213,6 +388,7 @@ class TestMain:
         """disconnect and cleanup should always be called, even on error."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
         mock_config.database_url = "postgresql://test"
 
         mock_downloader = MagicMock()
@@ -242,9 +418,12 @@ class TestParquetOutput:
         """Parquet mode should write parquet files and manifest without touching database."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 1
 
@@ -278,10 +457,13 @@ class TestParquetOutput:
         """Parquet mode should work without DATABASE_URL."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.database_url = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = True
         mock_config.process_workers = 1
 
@@ -305,9 +487,12 @@ class TestParquetOutput:
         """Estabelecimentos should be written to a single file."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = True
         mock_config.process_workers = 1
 
@@ -338,6 +523,9 @@ class TestParquetOutput:
         """Parquet mode should always call downloader.cleanup on error."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.memory_budget = ""
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
 
@@ -361,9 +549,12 @@ class TestParquetOutput:
         """POST_FILE_COMMAND should run once per table after all its files are processed."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = "echo"
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = True
         mock_config.process_workers = 1
 
@@ -400,6 +591,7 @@ class TestPgWorker:
 
         mock_downloader = MagicMock()
         mock_downloader.download_file.return_value = [csv_file]
+        mock_downloader.get_file_versions.return_value = {"Cnaes.zip": '"etag-1"'}
 
         mock_db = MagicMock()
         mock_db_cls.return_value = mock_db
@@ -415,7 +607,7 @@ class TestPgWorker:
         _pg_worker("Cnaes.zip", "2024-01", mock_downloader, mock_cfg)
 
         mock_db.bulk_upsert.assert_called_once()
-        mock_db.mark_processed.assert_called_once_with("2024-01", "Cnaes.zip")
+        mock_db.mark_processed.assert_called_once_with("2024-01", "Cnaes.zip", '"etag-1"')
         mock_db.disconnect.assert_called_once()
         assert not csv_file.exists()
 
@@ -465,13 +657,14 @@ class TestPgWorker:
         mock_cfg.keep_files = False
         mock_cfg.retry_attempts = 3
         mock_cfg.retry_delay = 5
+        mock_cfg.copy_format = "csv"
 
         mock_process_file.return_value = iter([(pl.DataFrame({"codigo": ["001"]}), "cnaes", ["codigo"])])
 
         _pg_worker("Cnaes.zip", "2024-01", mock_downloader, mock_cfg, pre_truncated={"cnaes"})
 
         mock_db_cls.assert_called_once_with(
-            "postgresql://test", pre_truncated={"cnaes"}, retry_attempts=3, retry_delay=5
+            "postgresql://test", pre_truncated={"cnaes"}, retry_attempts=3, retry_delay=5, copy_format="csv"
         )
 
     @patch("database.Database")
@@ -491,6 +684,71 @@ class TestPgWorker:
 
         mock_db.disconnect.assert_called_once()
 
+    @patch("database.Database")
+    @patch("main.process_file")
+    def test_borrows_from_pool_when_given(self, mock_process_file, mock_db_cls, tmp_path):
+        """With a pool, _pg_worker leases a connection and leaves it open."""
+        csv_file = tmp_path / "CNAECSV.D51213"
+        csv_file.write_text("data")
+
+        mock_downloader = MagicMock()
+        mock_downloader.download_file.return_value = [csv_file]
+        mock_downloader.get_file_versions.return_value = {"Cnaes.zip": '"etag-1"'}
+
+        mock_db = MagicMock()
+        mock_pool = MagicMock()
+        mock_pool.lease.return_value.__enter__.return_value = mock_db
+
+        mock_cfg = MagicMock()
+        mock_cfg.loading_strategy = "upsert"
+        mock_cfg.batch_size = 500000
+        mock_cfg.keep_files = False
+
+        mock_process_file.return_value = iter([(pl.DataFrame({"codigo": ["001"]}), "cnaes", ["codigo"])])
+
+        _pg_worker("Cnaes.zip", "2024-01", mock_downloader, mock_cfg, pre_truncated={"cnaes"}, pool=mock_pool)
+
+        mock_pool.lease.assert_called_once_with({"cnaes"})
+        mock_db_cls.assert_not_called()
+        mock_db.bulk_upsert.assert_called_once()
+        mock_db.mark_processed.assert_called_once_with("2024-01", "Cnaes.zip", '"etag-1"')
+        mock_db.disconnect.assert_not_called()
+
+
+class TestProcessRefetching:
+    """Test _process_refetching function."""
+
+    @patch("main.process_file")
+    def test_growing_member_with_bad_crc_is_read_again(self, mock_process_file):
+        from downloader import GrowingZipMember
+
+        def corrupt_read():
+            yield pl.DataFrame({"codigo": ["bad"]}), "cnaes", ["codigo"]
+            raise zipfile.BadZipFile("Bad CRC-32 for CNAECSV.D51213")
+
+        member = MagicMock(spec=GrowingZipMember)
+        member.name = "CNAECSV.D51213"
+        retried = MagicMock()
+        mock_downloader = MagicMock()
+        mock_downloader.refetch.return_value = retried
+        good_read = iter([(pl.DataFrame({"codigo": ["001"]}), "cnaes", ["codigo"])])
+        mock_process_file.side_effect = [corrupt_read(), good_read]
+
+        batches = list(_process_refetching(member, "Cnaes.zip", "2024-01", mock_downloader, MagicMock()))
+
+        assert [batch["codigo"][0] for batch, _, _ in batches] == ["bad", "001"]
+        mock_downloader.refetch.assert_called_once_with("2024-01", "Cnaes.zip", member)
+        assert mock_process_file.call_args.args[0] is retried
+
+    @patch("main.process_file")
+    def test_bad_crc_of_an_extracted_file_is_raised(self, mock_process_file, tmp_path):
+        mock_process_file.side_effect = zipfile.BadZipFile("Bad CRC-32")
+        mock_downloader = MagicMock()
+
+        with pytest.raises(zipfile.BadZipFile):
+            list(_process_refetching(tmp_path / "CNAECSV", "Cnaes.zip", "2024-01", mock_downloader, MagicMock()))
+        mock_downloader.refetch.assert_not_called()
+
 
 class TestParquetWorker:
     """Test _parquet_worker function."""
@@ -550,9 +808,12 @@ class TestParallelProcessing:
         """With workers > 1 in parquet mode, files should still be processed correctly."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
 
@@ -587,6 +848,7 @@ class TestParallelProcessing:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
         mock_config.loading_strategy = "upsert"
@@ -605,6 +867,10 @@ class TestParallelProcessing:
         main()
 
         assert mock_pg_worker.call_count == 2
+        # Both workers share the one pool main created
+        pools = {id(call[0][5]) for call in mock_pg_worker.call_args_list}
+        assert len(pools) == 1
+        assert type(mock_pg_worker.call_args[0][5]).__name__ == "DatabasePool"
 
     @patch("main._pg_worker")
     @patch("main.config")
@@ -619,6 +885,7 @@ class TestParallelProcessing:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
         mock_config.loading_strategy = "upsert"
@@ -654,6 +921,7 @@ class TestPreTruncation:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
         mock_config.loading_strategy = "replace"
@@ -690,6 +958,7 @@ class TestPreTruncation:
         mock_config.output_format = "postgres"
         mock_config.database_url = "postgresql://test"
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
         mock_config.loading_strategy = "upsert"
@@ -709,6 +978,677 @@ class TestPreTruncation:
         mock_db.truncate_table.assert_not_called()
 
 
+class TestDependencyScheduling:
+    """Test fine-grained dependencies and largest-first ordering in main."""
+
+    @patch("main._pg_worker")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_schema_foreign_keys_split_groups(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_pg_worker
+    ):
+        """A foreign key in the target schema holds back only its own table; big files go first."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+        mock_config.process_workers = 2
+        mock_config.worker_mode = "thread"
+        mock_config.loading_strategy = "upsert"
+        mock_config.defer_indexes = "never"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = [
+            "Cnaes.zip",
+            "Socios0.zip",
+            "Empresas0.zip",
+            "Empresas1.zip",
+        ]
+        mock_downloader.get_file_sizes.return_value = {"Cnaes.zip": 1, "Empresas0.zip": 10, "Empresas1.zip": 20}
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db.get_table_dependencies.return_value = {"socios": {"empresas"}}
+        mock_db_cls.return_value = mock_db
+
+        submitted = []
+        mock_pg_worker.side_effect = lambda f, *args: submitted.append(f)
+
+        with patch("main.ThreadPoolExecutor", _serial_pool):
+            main()
+
+        assert submitted == ["Empresas1.zip", "Empresas0.zip", "Cnaes.zip", "Socios0.zip"]
+
+
+def _serial_pool(max_workers):
+    """ThreadPoolExecutor with one thread, so submission order is run order."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def _thread_pool(max_workers, mp_context):
+    """Stand-in for ProcessPoolExecutor so mocks reach the workers."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+class TestProcessPool:
+    """Test WORKER_MODE=process: transform in workers, consume in the parent."""
+
+    @patch("main.process_file")
+    @patch("main.Downloader")
+    def test_transform_worker_spills_batches_round_trip(self, mock_downloader_cls, mock_process_file, tmp_path):
+        csv_file = tmp_path / "CNAECSV.D51213"
+        csv_file.write_text("data")
+        mock_downloader_cls.return_value.download_file.return_value = [csv_file]
+        mock_downloader_cls.return_value.get_content_key.return_value = "key-1"
+        batches = [pl.DataFrame({"codigo": ["001"], "descricao": ["a"]}), pl.DataFrame({"codigo": ["002"]})]
+        mock_process_file.return_value = iter([(b, "cnaes", b.columns) for b in batches])
+        cfg = MagicMock(batch_size=10, keep_files=False, memory_budget="")
+        spilled = queue.Queue()
+        listings = {"https://example/2024-01/": {}}
+
+        key = _transform_worker("Cnaes.zip", "2024-01", cfg, True, str(tmp_path), spilled, listings)
+
+        assert key == "key-1"
+        mock_downloader_cls.assert_called_once_with(cfg, listings=listings)
+        assert mock_process_file.call_args.kwargs["typed"] is True
+        assert not csv_file.exists()
+
+        from main import _read_spilled
+
+        done = MagicMock()
+        done.done.return_value = True
+        read = list(_read_spilled(spilled, done))
+        assert [(table, columns) for _, table, columns in read] == [
+            ("cnaes", ["codigo", "descricao"]),
+            ("cnaes", ["codigo"]),
+        ]
+        assert all(a.equals(b) for (a, _, _), b in zip(read, batches))
+        assert not list(tmp_path.glob("*.arrow"))
+
+    @patch("main.ProcessPoolExecutor", _thread_pool)
+    @patch("main._transform_worker")
+    def test_consumes_every_file_in_parent(self, mock_transform, tmp_path):
+        def transform(f, directory, cfg, typed, spill_dir, spilled, listings):
+            spilled.put(None)
+            return f"key-{f}"
+
+        mock_transform.side_effect = transform
+        cfg = MagicMock(temp_dir=str(tmp_path), process_workers=2)
+        downloader = MagicMock()
+        downloader.fetched_listings.return_value = {"listing": {}}
+        consumed = []
+
+        _run_process_pool(["a.zip", "b.zip"], "2024-01", downloader, cfg, False, lambda f, b: consumed.append(f))
+
+        assert consumed == ["a.zip", "b.zip"]
+        assert all(c.args[6] == {"listing": {}} for c in mock_transform.call_args_list)
+        assert [c.args for c in downloader.remember_content_key.call_args_list] == [
+            ("2024-01", "a.zip", "key-a.zip"),
+            ("2024-01", "b.zip", "key-b.zip"),
+        ]
+
+    @patch("main.ProcessPoolExecutor", _thread_pool)
+    @patch("main._transform_worker")
+    def test_batches_are_consumed_while_the_child_runs(self, mock_transform, tmp_path):
+        first_loaded = threading.Event()
+
+        def transform(f, directory, cfg, typed, spill_dir, spilled, listings):
+            path = tmp_path / "batch.arrow"
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, pa.schema([("codigo", pa.string())])) as w:
+                w.write_table(pa.table({"codigo": ["001"]}))
+            spilled.put((str(path), "cnaes", ["codigo"]))
+            # Finishes only once the parent has loaded the first batch
+            assert first_loaded.wait(timeout=10)
+            spilled.put(None)
+
+        mock_transform.side_effect = transform
+        cfg = MagicMock(temp_dir=str(tmp_path), process_workers=1)
+
+        def consume(f, batches):
+            for _ in batches:
+                first_loaded.set()
+
+        _run_process_pool(["a.zip"], "2024-01", MagicMock(), cfg, False, consume)
+
+        assert first_loaded.is_set()
+
+    @patch("main.ProcessPoolExecutor", _thread_pool)
+    @patch("main._transform_worker")
+    def test_failure_aborts(self, mock_transform, tmp_path):
+        def transform(f, directory, cfg, typed, spill_dir, spilled, listings):
+            if f == "bad.zip":
+                raise ValueError("corrupt")
+            # Keep the one worker busy until the failure has cancelled the queue
+            time.sleep(0.2)
+            spilled.put(None)
+
+        mock_transform.side_effect = transform
+        cfg = MagicMock(temp_dir=str(tmp_path), process_workers=1)
+
+        with pytest.raises(RuntimeError, match="workers failed"):
+            _run_process_pool(["bad.zip", "b.zip", "c.zip"], "2024-01", MagicMock(), cfg, False, lambda f, b: list(b))
+
+        assert "c.zip" not in [c.args[0] for c in mock_transform.call_args_list]
+
+    @patch.dict("main.TABLE_DEPENDENCIES", {"empresas": {"cnaes"}, "socios": {"empresas"}})
+    @patch("main._run_process_pool")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_database_mode_loads_in_parent_and_keeps_group_order(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_run
+    ):
+        """Each dependency group goes through the pool in order; the parent's db loads."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+        mock_config.process_workers = 2
+        mock_config.worker_mode = "process"
+        mock_config.loading_strategy = "upsert"
+        mock_config.defer_indexes = "never"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Socios0.zip", "Empresas0.zip", "Cnaes.zip"]
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db_cls.return_value = mock_db
+
+        batch = pl.DataFrame({"codigo": ["001"]})
+
+        def run(files, directory, downloader, cfg, typed, consume):
+            for f in files:
+                consume(f, iter([(batch, "cnaes", ["codigo"])]))
+
+        mock_run.side_effect = run
+
+        main()
+
+        assert [c[0][0] for c in mock_run.call_args_list] == [["Cnaes.zip"], ["Empresas0.zip"], ["Socios0.zip"]]
+        assert mock_db.bulk_upsert.call_count == 3
+        assert [c[0][1] for c in mock_db.mark_processed.call_args_list] == ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]
+        mock_db.truncate_table.assert_not_called()
+
+
+def _pipeline_downloader(members, delays=None):
+    """Downloader double for _run_pipeline: ZIP name → CSV names inside it."""
+    import time
+
+    downloader = MagicMock()
+
+    def download_zip(directory, zip_filename, adaptive=None):
+        time.sleep((delays or {}).get(zip_filename, 0))
+        return zip_filename
+
+    def extract_zip(zip_path):
+        csvs = []
+        for name in members[zip_path]:
+            csv = MagicMock()
+            csv.name = name
+            csv.exists.return_value = False
+            csvs.append(csv)
+        return csvs
+
+    downloader.download_zip.side_effect = download_zip
+    downloader.extract_zip.side_effect = extract_zip
+    return downloader
+
+
+class TestPipelineMode:
+    """Test WORKER_MODE=pipeline: overlapping download/extract/transform/sink stages."""
+
+    @staticmethod
+    def _cfg():
+        return MagicMock(
+            download_workers=2,
+            process_workers=2,
+            stall_degrade_threshold=3,
+            batch_size=10,
+            keep_files=False,
+            processing_engine="eager",
+        )
+
+    @patch("main.process_file")
+    def test_groups_are_sunk_in_dependency_order(self, mock_process_file):
+        def batches(csv_path, *args, **kwargs):
+            yield pl.DataFrame({"codigo": [csv_path.name]}), "t", ["codigo"]
+            yield pl.DataFrame({"codigo": [csv_path.name]}), "t", ["codigo"]
+
+        mock_process_file.side_effect = batches
+        members = {
+            "Cnaes.zip": ["CNAECSV"],
+            "Motivos.zip": ["MOTICSV"],
+            "Empresas0.zip": ["EMPRECSV0"],
+            "Empresas1.zip": ["EMPRECSV1a", "EMPRECSV1b"],
+            "Socios0.zip": ["SOCIOCSV0"],
+        }
+        # The slow reference file must not let group 1 overtake it
+        downloader = _pipeline_downloader(members, delays={"Cnaes.zip": 0.05})
+        events = []
+
+        _run_pipeline(
+            [["Cnaes.zip", "Motivos.zip"], ["Empresas0.zip", "Empresas1.zip"], ["Socios0.zip"]],
+            "2024-01",
+            downloader,
+            self._cfg(),
+            False,
+            lambda batch, table, columns: events.append(("sink", batch["codigo"][0])),
+            on_file_done=lambda f: events.append(("file", f)),
+            on_group_start=lambda i: events.append(("start", i)),
+            on_group_done=lambda i: events.append(("done", i)),
+        )
+
+        group_of = {"CNAECSV": 0, "MOTICSV": 0, "EMPRECSV0": 1, "EMPRECSV1a": 1, "EMPRECSV1b": 1, "SOCIOCSV0": 2}
+        markers = [e for e in events if e[0] in ("start", "done")]
+        assert markers == [("start", 0), ("done", 0), ("start", 1), ("done", 1), ("start", 2), ("done", 2)]
+        for i, event in enumerate(events):
+            if event[0] == "sink":
+                group = group_of[event[1]]
+                assert ("start", group) in events[:i]
+                assert ("done", group) not in events[:i]
+        assert len([e for e in events if e[0] == "sink"]) == 12
+        assert sorted(f for kind, f in events if kind == "file") == sorted(members)
+        # A ZIP counts as done only after all of its CSVs
+        last_1b = max(i for i, e in enumerate(events) if e == ("sink", "EMPRECSV1b"))
+        last_1a = max(i for i, e in enumerate(events) if e == ("sink", "EMPRECSV1a"))
+        assert events.index(("file", "Empresas1.zip")) > max(last_1a, last_1b)
+
+    @patch("main.process_file")
+    def test_zip_without_csvs_still_completes_its_group(self, mock_process_file):
+        mock_process_file.return_value = iter([])
+        downloader = _pipeline_downloader({"Cnaes.zip": []})
+        done = []
+
+        _run_pipeline(
+            [["Cnaes.zip"], [], []],
+            "2024-01",
+            downloader,
+            self._cfg(),
+            False,
+            MagicMock(),
+            on_file_done=done.append,
+            on_group_start=MagicMock(),
+            on_group_done=done.append,
+        )
+
+        assert done == ["Cnaes.zip", 0]
+
+    @patch("main.process_file")
+    def test_transform_failure_aborts(self, mock_process_file):
+        mock_process_file.side_effect = ValueError("layout drift")
+        downloader = _pipeline_downloader({"Cnaes.zip": ["CNAECSV"], "Motivos.zip": ["MOTICSV"]})
+        on_group_done = MagicMock()
+
+        with pytest.raises(ValueError, match="layout drift"):
+            _run_pipeline(
+                [["Cnaes.zip", "Motivos.zip"]],
+                "2024-01",
+                downloader,
+                self._cfg(),
+                False,
+                MagicMock(),
+                on_file_done=MagicMock(),
+                on_group_start=MagicMock(),
+                on_group_done=on_group_done,
+            )
+
+        on_group_done.assert_not_called()
+
+    @patch.dict("main.TABLE_DEPENDENCIES", {"empresas": {"cnaes"}, "socios": {"empresas"}})
+    @patch("main.process_file")
+    @patch("main.config")
+    @patch("database.DatabasePool")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_database_mode_loads_on_main_connection(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_pool_cls, mock_config, mock_process_file
+    ):
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.database_url = "postgresql://test"
+        mock_config.process_workers = 2
+        mock_config.download_workers = 2
+        mock_config.stall_degrade_threshold = 3
+        mock_config.batch_size = 10
+        mock_config.memory_budget = ""
+        mock_config.keep_files = False
+        mock_config.worker_mode = "pipeline"
+        mock_config.loading_strategy = "swap"
+
+        mock_downloader = _pipeline_downloader(
+            {"Cnaes.zip": ["CNAECSV"], "Empresas0.zip": ["EMPRECSV0"], "Socios0.zip": ["SOCIOCSV0"]}
+        )
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Socios0.zip", "Empresas0.zip", "Cnaes.zip"]
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db_cls.return_value = mock_db
+
+        tables = {"CNAECSV": "cnaes", "EMPRECSV0": "empresas", "SOCIOCSV0": "socios"}
+        mock_process_file.side_effect = lambda csv_path, *a, **kw: iter(
+            [(pl.DataFrame({"x": [1]}), tables[csv_path.name], ["x"])]
+        )
+
+        main()
+
+        mock_pool_cls.assert_not_called()
+        assert [c[0][1] for c in mock_db.bulk_load_shadow.call_args_list] == ["cnaes", "empresas", "socios"]
+        assert [c[0][0] for c in mock_db.finish_swap.call_args_list] == ["cnaes", "empresas", "socios"]
+        assert [c[0][1] for c in mock_db.mark_processed.call_args_list] == ["Cnaes.zip", "Empresas0.zip", "Socios0.zip"]
+        calls = [c[0] for c in mock_db.method_calls if c[0] in ("begin_swap", "finish_swap", "bulk_load_shadow")]
+        assert calls[:3] == ["begin_swap", "bulk_load_shadow", "finish_swap"]
+
+
+class TestSwapStrategy:
+    """Test LOADING_STRATEGY=swap: shadow load, swap after the group, then mark."""
+
+    @patch("main.process_file")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_swaps_group_tables_before_marking_files(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_process_file, tmp_path
+    ):
+        """Files are marked processed only after their table is swapped in."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.database_url = "postgresql://test"
+        mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
+        mock_config.keep_files = False
+        mock_config.process_workers = 1
+        mock_config.loading_strategy = "swap"
+        mock_config.swap_set_logged = False
+
+        csv_files = [tmp_path / "EMPRECSV0", tmp_path / "EMPRECSV1"]
+        for csv_file in csv_files:
+            csv_file.write_text("data")
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Empresas0.zip", "Empresas1.zip"]
+        mock_downloader.download_files.return_value = iter(zip(csv_files, ["Empresas0.zip", "Empresas1.zip"]))
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db_cls.return_value = mock_db
+
+        batch = pl.DataFrame({"cnpj_basico": ["00000000"]})
+        mock_process_file.side_effect = lambda *a, **k: iter([(batch, "empresas", ["cnpj_basico"])])
+
+        main()
+
+        calls = [
+            c for c in mock_db.mock_calls if c[0] in ("begin_swap", "bulk_load_shadow", "finish_swap", "mark_processed")
+        ]
+        assert [c[0] for c in calls] == [
+            "begin_swap",
+            "bulk_load_shadow",
+            "bulk_load_shadow",
+            "finish_swap",
+            "mark_processed",
+            "mark_processed",
+        ]
+        mock_db.begin_swap.assert_called_once_with("empresas")
+        mock_db.finish_swap.assert_called_once_with("empresas", index_workers=1, set_logged=False)
+        mock_db.bulk_upsert.assert_not_called()
+        mock_db.bulk_insert.assert_not_called()
+
+    @patch("database.Database")
+    @patch("main.process_file")
+    def test_worker_loads_shadow_without_marking(self, mock_process_file, mock_db_cls, tmp_path):
+        """_pg_worker loads into the shadow and leaves marking to main."""
+        csv_file = tmp_path / "CNAECSV.D51213"
+        csv_file.write_text("data")
+
+        mock_downloader = MagicMock()
+        mock_downloader.download_file.return_value = [csv_file]
+
+        mock_db = MagicMock()
+        mock_db_cls.return_value = mock_db
+
+        mock_cfg = MagicMock()
+        mock_cfg.loading_strategy = "swap"
+        mock_cfg.batch_size = 500000
+        mock_cfg.keep_files = False
+
+        mock_process_file.return_value = iter([(pl.DataFrame({"codigo": ["001"]}), "cnaes", ["codigo"])])
+
+        _pg_worker("Cnaes.zip", "2024-01", mock_downloader, mock_cfg)
+
+        mock_db.bulk_load_shadow.assert_called_once()
+        mock_db.mark_processed.assert_not_called()
+        assert not csv_file.exists()
+
+
+class TestDeltaStrategy:
+    """Test LOADING_STRATEGY=delta in main."""
+
+    @patch("main._pg_worker")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_deletes_only_for_tables_loaded_in_full(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_pg_worker
+    ):
+        """A table with files processed by an earlier run must not delete vanished rows."""
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+        mock_config.process_workers = 2
+        mock_config.loading_strategy = "delta"
+        mock_config.defer_indexes = "never"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Empresas0.zip", "Socios0.zip", "Socios1.zip"]
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = {"Socios0.zip"}
+        mock_db_cls.return_value = mock_db
+
+        main()
+
+        assert [c[0][0] for c in mock_db.begin_delta.call_args_list] == ["empresas", "socios"]
+        mock_db.finish_delta.assert_any_call("empresas", delete_missing=True)
+        mock_db.finish_delta.assert_any_call("socios", delete_missing=False)
+        assert [c[0][1] for c in mock_db.mark_processed.call_args_list] == ["Empresas0.zip", "Socios1.zip"]
+
+
+class TestDeferredIndexes:
+    """Test dropping secondary indexes around a large load."""
+
+    def _run(self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, strategy, table_is_empty):
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.database_url = "postgresql://test"
+        mock_config.memory_budget = ""
+        mock_config.process_workers = 2
+        mock_config.loading_strategy = strategy
+        mock_config.defer_indexes = "auto"
+        mock_config.index_build_workers = 3
+        mock_config.index_build_memory = "1GB"
+        mock_config.index_build_parallel_workers = 4
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-01"
+        mock_downloader.get_directory_files.return_value = ["Socios0.zip", "Empresas0.zip"]
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db.table_is_empty.return_value = table_is_empty
+        mock_db_cls.return_value = mock_db
+
+        main()
+        return mock_db
+
+    @patch("main._pg_worker")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_replace_drops_then_rebuilds_after_last_group(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_pg_worker
+    ):
+        """Replace drops every loaded table's indexes and rebuilds once at the end."""
+        mock_db = self._run(mock_args, mock_downloader_cls, mock_db_cls, mock_config, "replace", False)
+
+        assert [c[0][0] for c in mock_db.drop_secondary_indexes.call_args_list] == ["empresas", "socios"]
+        mock_db.rebuild_deferred_indexes.assert_called_once_with(
+            workers=3, maintenance_work_mem="1GB", parallel_workers=4
+        )
+        assert mock_pg_worker.call_count == 2
+
+    @patch("main._pg_worker")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_upsert_into_populated_tables_keeps_indexes(
+        self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_pg_worker
+    ):
+        """An incremental upsert keeps indexes live."""
+        mock_db = self._run(mock_args, mock_downloader_cls, mock_db_cls, mock_config, "upsert", False)
+
+        mock_db.drop_secondary_indexes.assert_not_called()
+
+    @patch("main._pg_worker")
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_first_load_drops_indexes(self, mock_args, mock_downloader_cls, mock_db_cls, mock_config, mock_pg_worker):
+        """An upsert into empty tables counts as a large load."""
+        mock_db = self._run(mock_args, mock_downloader_cls, mock_db_cls, mock_config, "upsert", True)
+
+        assert mock_db.drop_secondary_indexes.call_count == 2
+
+
+class TestCarryForwardUnchanged:
+    """Files identical to the previous month's are marked processed, not loaded."""
+
+    PREVIOUS = {
+        "Cnaes.zip": ("2024-01", 100, "key-cnaes"),
+        "Empresas0.zip": ("2024-01", 500, "key-e0"),
+        "Empresas1.zip": ("2024-01", 600, "key-e1"),
+    }
+
+    def _run(self, strategy, keys, sizes=None):
+        db = MagicMock()
+        db.get_previous_fingerprints.return_value = self.PREVIOUS
+        downloader = MagicMock()
+        downloader.get_file_sizes.return_value = sizes or {"Cnaes.zip": 100, "Empresas0.zip": 500, "Empresas1.zip": 600}
+        downloader.get_content_key.side_effect = lambda directory, f: keys[f]
+        cfg = MagicMock(loading_strategy=strategy)
+        files = ["Cnaes.zip", "Empresas0.zip", "Empresas1.zip"]
+        carried = _carry_forward_unchanged(db, downloader, cfg, "2024-02", files, files, {"Cnaes.zip": '"v2"'})
+        return carried, db, downloader
+
+    def test_upsert_skips_each_unchanged_file(self):
+        keys = {"Cnaes.zip": "key-cnaes", "Empresas0.zip": "key-e0", "Empresas1.zip": "changed"}
+        carried, db, _ = self._run("upsert", keys)
+
+        assert carried == {"Cnaes.zip", "Empresas0.zip"}
+        db.mark_processed.assert_any_call("2024-02", "Cnaes.zip", '"v2"')
+        db.record_fingerprint.assert_any_call("2024-02", "Empresas0.zip", 500, "key-e0")
+        assert db.mark_processed.call_count == 2
+
+    def test_size_mismatch_needs_no_probe(self):
+        keys = {"Cnaes.zip": "key-cnaes", "Empresas0.zip": "key-e0", "Empresas1.zip": "key-e1"}
+        carried, _, downloader = self._run(
+            "upsert", keys, sizes={"Cnaes.zip": 101, "Empresas0.zip": 500, "Empresas1.zip": 600}
+        )
+
+        assert carried == {"Empresas0.zip", "Empresas1.zip"}
+        assert ("2024-02", "Cnaes.zip") not in [c[0] for c in downloader.get_content_key.call_args_list]
+
+    def test_replace_skips_only_fully_unchanged_tables(self):
+        """A changed shard means the whole table is rebuilt, unchanged shards included."""
+        keys = {"Cnaes.zip": "key-cnaes", "Empresas0.zip": "key-e0", "Empresas1.zip": "changed"}
+        carried, db, _ = self._run("replace", keys)
+
+        assert carried == {"Cnaes.zip"}
+        db.mark_processed.assert_called_once_with("2024-02", "Cnaes.zip", '"v2"')
+
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_main_downloads_nothing_when_all_unchanged(self, mock_args, mock_downloader_cls, mock_db_cls, mock_config):
+        mock_args.return_value = MagicMock(list=False, month=None, force=False)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+        mock_config.skip_unchanged_files = True
+        mock_config.loading_strategy = "upsert"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-02"
+        mock_downloader.get_directory_files.return_value = ["Cnaes.zip"]
+        mock_downloader.get_file_sizes.return_value = {"Cnaes.zip": 100}
+        mock_downloader.get_content_key.return_value = "key-cnaes"
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db.get_previous_fingerprints.return_value = {"Cnaes.zip": ("2024-01", 100, "key-cnaes")}
+        mock_db_cls.return_value = mock_db
+
+        main()
+
+        mock_downloader.download_files.assert_not_called()
+        mock_downloader.download_file.assert_not_called()
+        mock_db.mark_processed.assert_called_once()
+
+    @patch("main.config")
+    @patch("database.Database")
+    @patch("main.Downloader")
+    @patch("main.parse_args")
+    def test_force_loads_unchanged_files(self, mock_args, mock_downloader_cls, mock_db_cls, mock_config):
+        mock_args.return_value = MagicMock(list=False, month=None, force=True)
+        mock_config.output_format = "postgres"
+        mock_config.memory_budget = ""
+        mock_config.database_url = "postgresql://test"
+        mock_config.skip_unchanged_files = True
+        mock_config.process_workers = 1
+        mock_config.loading_strategy = "upsert"
+
+        mock_downloader = MagicMock()
+        mock_downloader.get_latest_directory.return_value = "2024-02"
+        mock_downloader.get_directory_files.return_value = ["Cnaes.zip"]
+        mock_downloader.download_files.return_value = iter([])
+        mock_downloader_cls.return_value = mock_downloader
+
+        mock_db = MagicMock()
+        mock_db.get_processed_files.return_value = set()
+        mock_db_cls.return_value = mock_db
+
+        main()
+
+        mock_db.get_previous_fingerprints.assert_not_called()
+
+
 class TestParquetResume:
     """Test parquet resume/skip logic for already-exported tables."""
 
@@ -727,9 +1667,12 @@ class TestParquetResume:
 
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(parquet_dir)
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 1
 
@@ -759,9 +1702,12 @@ class TestParquetResume:
 
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(parquet_dir)
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = True
         mock_config.process_workers = 1
 
@@ -794,9 +1740,12 @@ class TestParquetResume:
         """Parallel parquet worker failure should abort the pipeline."""
         mock_args.return_value = MagicMock(list=False, month=None, force=False)
         mock_config.output_format = "parquet"
+        mock_config.parquet_sorted = False
+        mock_config.parquet_part_per_worker = False
         mock_config.post_file_command = ""
         mock_config.parquet_output_dir = str(tmp_path / "parquet")
         mock_config.batch_size = 500000
+        mock_config.memory_budget = ""
         mock_config.keep_files = False
         mock_config.process_workers = 2
 
@@ -0,0 +1,92 @@
+"""Tests for RAM-budgeted batch sizing."""
+
+import logging
+
+import polars as pl
+import pytest
+
+from config import Config
+from memory_budget import (
+    BYTES_PER_ROW,
+    MIN_BATCH_ROWS,
+    PEAK_FACTOR,
+    MemoryBudget,
+    concurrent_batches,
+    log_memory_report,
+    peak_rss,
+)
+
+GB = 1024**3
+
+
+class TestConcurrentBatches:
+    @pytest.mark.parametrize(
+        "workers, mode, expected",
+        [(1, "pipeline", 1), (4, "thread", 4), (4, "process", 5), (4, "pipeline", 9)],
+    )
+    def test_batches_in_flight_per_worker_mode(self, workers, mode, expected):
+        cfg = Config(database_url="", process_workers=workers, worker_mode=mode)
+
+        assert concurrent_batches(cfg) == expected
+
+
+class TestMemoryBudget:
+    def test_wide_file_types_get_fewer_rows(self):
+        budget = MemoryBudget(1 * GB, max_rows=10**9)
+
+        assert budget.batch_rows("ESTABELE") < budget.batch_rows("EMPRECSV") < budget.batch_rows("MUNICCSV")
+        assert budget.batch_rows("ESTABELE") == GB // PEAK_FACTOR // BYTES_PER_ROW["ESTABELE"]
+
+    def test_budget_shared_across_concurrent_batches(self):
+        alone = MemoryBudget(2 * GB, concurrency=1, max_rows=10**9)
+        shared = MemoryBudget(2 * GB, concurrency=4, max_rows=10**9)
+
+        assert shared.batch_rows("ESTABELE") == pytest.approx(alone.batch_rows("ESTABELE") / 4, abs=1)
+
+    def test_clamped_to_batch_size_and_floor(self):
+        assert MemoryBudget(64 * GB, max_rows=500000).batch_rows("CNAECSV") == 500000
+        assert MemoryBudget(1024, max_rows=500000).batch_rows("ESTABELE") == MIN_BATCH_ROWS
+
+    def test_unknown_type_assumes_widest(self):
+        budget = MemoryBudget(1 * GB, max_rows=10**9)
+
+        assert budget.batch_rows("NEWTYPE") == budget.batch_rows("ESTABELE")
+
+    def test_observe_only_raises_estimate(self):
+        budget = MemoryBudget(1 * GB, max_rows=10**9)
+        before = budget.batch_rows("CNAECSV")
+        narrow = pl.DataFrame({"codigo": ["1"] * 100})
+        wide = pl.DataFrame({"codigo": ["x" * 500] * 100})
+
+        budget.observe("CNAECSV", narrow)
+        assert budget.batch_rows("CNAECSV") == before
+
+        budget.observe("CNAECSV", wide)
+        assert budget.batch_rows("CNAECSV") < before
+
+    def test_from_config(self):
+        assert MemoryBudget.from_config(Config(database_url="")) is None
+
+        budget = MemoryBudget.from_config(
+            Config(database_url="", memory_budget="4GB", batch_size=1000, process_workers=2)
+        )
+        assert (budget.total_bytes, budget.concurrency, budget.max_rows) == (4 * GB, 2, 1000)
+
+    def test_invalid_budget_raises(self):
+        with pytest.raises(ValueError):
+            MemoryBudget.from_config(Config(database_url="", memory_budget="lots"))
+
+
+class TestMemoryReport:
+    def test_peak_rss_of_this_process(self):
+        own, child = peak_rss()
+
+        assert own > 0
+        assert child >= 0
+
+    def test_report_includes_budget(self, caplog):
+        with caplog.at_level(logging.INFO, logger="memory_budget"):
+            log_memory_report(MemoryBudget(2 * GB))
+
+        assert "Peak memory:" in caplog.text
+        assert "budget 2,048 MB" in caplog.text
@@ -6,7 +6,8 @@ import polars as pl
 import pyarrow.parquet as pq
 import pytest
 
-from parquet_writer import ParquetWriter
+import parquet_writer
+from parquet_writer import ParquetWriter, parse_partition_by
 
 
 @pytest.fixture
@@ -180,6 +181,168 @@ class TestWriteManifest:
         assert manifest["sourceMonth"] is None
 
 
+class TestPartitionedOutput:
+    COLUMNS = ["cnpj_basico", "cnpj_ordem", "uf", "municipio"]
+
+    def test_parse_partition_by(self):
+        assert parse_partition_by("") == {}
+        assert parse_partition_by("estabelecimentos:uf; empresas:source_month,porte_empresa") == {
+            "estabelecimentos": ["uf"],
+            "empresas": ["source_month", "porte_empresa"],
+        }
+        with pytest.raises(ValueError, match="no columns"):
+            parse_partition_by("estabelecimentos")
+
+    def test_writes_one_directory_per_value(self, output_dir, sample_estabelecimentos):
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]})
+        writer.write_batch(sample_estabelecimentos, "estabelecimentos", self.COLUMNS)
+        path = writer.flush_table("estabelecimentos")
+
+        assert path == output_dir / "estabelecimentos"
+        assert sorted(p.name for p in path.iterdir()) == ["uf=MG", "uf=RJ", "uf=SP"]
+        sp = pq.read_table(str(path / "uf=SP" / "part-0000.parquet"))
+        assert sp.num_rows == 2
+        assert "uf" not in sp.column_names
+        assert not (output_dir / ".estabelecimentos.partial").exists()
+
+        table = pl.read_parquet(output_dir / "estabelecimentos" / "**" / "*.parquet", hive_partitioning=True)
+        assert sorted(table["uf"].to_list()) == ["MG", "RJ", "SP", "SP"]
+
+    def test_small_batches_fill_whole_row_groups(self, output_dir, monkeypatch):
+        """Each partition's rows are buffered into full row groups, not one per batch piece."""
+        monkeypatch.setattr("parquet_writer.ROW_GROUP_SIZE", 200)
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]})
+        batch = pl.DataFrame({"cnpj_basico": [f"{i:08d}" for i in range(100)], "uf": ["SP", "RJ"] * 50})
+        for _ in range(10):
+            writer.write_batch(batch, "estabelecimentos", ["cnpj_basico", "uf"])
+        writer.close()
+
+        for uf in ("SP", "RJ"):
+            meta = pq.read_metadata(str(output_dir / "estabelecimentos" / f"uf={uf}" / "part-0000.parquet"))
+            assert [meta.row_group(i).num_rows for i in range(meta.num_row_groups)] == [200, 200, 100]
+
+    def test_source_month_and_null_partitions(self, output_dir):
+        writer = ParquetWriter(
+            output_dir, partition_by={"estabelecimentos": ["source_month", "uf"]}, source_month="2024-11"
+        )
+        df = pl.DataFrame({"cnpj_basico": ["1", "2"], "uf": ["SP", None]})
+        writer.write_batch(df, "estabelecimentos", ["cnpj_basico", "uf"])
+        writer.close()
+
+        month = output_dir / "estabelecimentos" / "source_month=2024-11"
+        assert (month / "uf=SP" / "part-0000.parquet").exists()
+        assert (month / "uf=__HIVE_DEFAULT_PARTITION__" / "part-0000.parquet").exists()
+
+    def test_manifest_lists_every_part(self, output_dir, sample_estabelecimentos, sample_empresas):
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]})
+        writer.write_batch(sample_estabelecimentos, "estabelecimentos", self.COLUMNS)
+        writer.write_batch(sample_estabelecimentos, "estabelecimentos", self.COLUMNS)
+        writer.write_batch(sample_empresas, "empresas", ["cnpj_basico", "razao_social", "capital_social"])
+        writer.close()
+        manifest = writer.write_manifest()
+
+        table = manifest["tables"]["estabelecimentos"]
+        assert table["rows"] == 8
+        assert table["partitionBy"] == ["uf"]
+        assert table["files"] == [
+            "estabelecimentos/uf=MG/part-0000.parquet",
+            "estabelecimentos/uf=RJ/part-0000.parquet",
+            "estabelecimentos/uf=SP/part-0000.parquet",
+        ]
+        assert table["sizeBytes"] == sum((output_dir / f).stat().st_size for f in table["files"])
+        assert manifest["tables"]["empresas"]["files"] == ["empresas.parquet"]
+        assert manifest["totals"]["files"] == 4
+
+    def test_output_path_only_exists_after_flush(self, output_dir, sample_estabelecimentos):
+        """Resume treats an existing output_path as a finished export."""
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]})
+        writer.write_batch(sample_estabelecimentos, "estabelecimentos", self.COLUMNS)
+
+        assert not writer.output_path("estabelecimentos").exists()
+        writer.close()
+        assert writer.output_path("estabelecimentos").exists()
+        assert writer.output_path("empresas") == output_dir / "empresas.parquet"
+
+
+class TestSortedOutput:
+    COLUMNS = ["cnpj_basico", "cnpj_ordem", "uf", "municipio"]
+
+    @pytest.fixture
+    def shuffled(self):
+        keys = [f"{(i * 7919) % 1000:03d}{i % 7:05d}" for i in range(1000)]
+        return pl.DataFrame(
+            {"cnpj_basico": keys, "cnpj_ordem": ["0001"] * 1000, "uf": ["SP", "RJ"] * 500, "municipio": ["1"] * 1000}
+        )
+
+    def test_table_is_sorted_across_batches(self, output_dir, shuffled, monkeypatch):
+        monkeypatch.setattr("parquet_writer.ROW_GROUP_SIZE", 100)
+        writer = ParquetWriter(output_dir, sort=True)
+        for batch in shuffled.iter_slices(300):
+            writer.write_batch(batch, "estabelecimentos", self.COLUMNS)
+
+        assert not (output_dir / "estabelecimentos.parquet").exists()  # spilled until flush
+        writer.flush_table("estabelecimentos")
+
+        table = pl.read_parquet(output_dir / "estabelecimentos.parquet")
+        assert table["cnpj_basico"].to_list() == sorted(shuffled["cnpj_basico"].to_list())
+        assert not (output_dir / ".estabelecimentos.sort").exists()
+        assert writer.stats["estabelecimentos"].rows == 1000
+
+    def test_point_lookup_hits_one_row_group(self, output_dir, shuffled, monkeypatch):
+        monkeypatch.setattr("parquet_writer.ROW_GROUP_SIZE", 100)
+        writer = ParquetWriter(output_dir, sort=True)
+        for batch in shuffled.iter_slices(300):
+            writer.write_batch(batch, "estabelecimentos", self.COLUMNS)
+        writer.close()
+
+        meta = pq.read_metadata(str(output_dir / "estabelecimentos.parquet"))
+        key = shuffled["cnpj_basico"][500]
+        matching = [
+            i
+            for i in range(meta.num_row_groups)
+            if meta.row_group(i).column(0).statistics.min <= key <= meta.row_group(i).column(0).statistics.max
+        ]
+        assert len(matching) == 1
+
+        row_group = meta.row_group(0)
+        assert row_group.sorting_columns == (pq.SortingColumn(0), pq.SortingColumn(1))
+        assert row_group.column(0).has_column_index
+        assert row_group.column(0).has_offset_index
+        if parquet_writer._SUPPORTS_BLOOM_FILTERS:
+            assert row_group.column(0).bloom_filter_length > 0
+            assert row_group.column(1).bloom_filter_length in (None, 0)
+
+    def test_warns_when_bloom_filter_unsupported(self, output_dir, shuffled, monkeypatch, caplog):
+        monkeypatch.setattr("parquet_writer._SUPPORTS_BLOOM_FILTERS", False)
+        writer = ParquetWriter(output_dir, sort=True)
+        with caplog.at_level("WARNING", logger="parquet_writer"):
+            for batch in shuffled.iter_slices(300):
+                writer.write_batch(batch, "estabelecimentos", self.COLUMNS)
+            writer.close()
+
+        warnings = [r.getMessage() for r in caplog.records if "bloom" in r.getMessage()]
+        assert len(warnings) == 1
+        assert warnings[0].startswith("estabelecimentos: pyarrow")
+        assert pq.read_table(str(output_dir / "estabelecimentos.parquet")).num_rows == len(shuffled)
+
+    def test_sorted_partitions(self, output_dir, shuffled):
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]}, sort=True)
+        writer.write_batch(shuffled, "estabelecimentos", self.COLUMNS)
+        writer.close()
+
+        for uf in ("SP", "RJ"):
+            part = pl.read_parquet(output_dir / "estabelecimentos" / f"uf={uf}" / "part-0000.parquet")
+            expected = sorted(shuffled.filter(pl.col("uf") == uf)["cnpj_basico"].to_list())
+            assert part["cnpj_basico"].to_list() == expected
+
+    def test_reference_tables_sort_by_codigo(self, output_dir):
+        writer = ParquetWriter(output_dir, sort=True)
+        writer.write_batch(pl.DataFrame({"codigo": ["3", "1", "2"], "descricao": ["c", "a", "b"]}), "cnaes", [])
+        writer.close()
+
+        assert pl.read_parquet(output_dir / "cnaes.parquet")["descricao"].to_list() == ["a", "b", "c"]
+
+
 class TestThreadSafety:
     def test_concurrent_writes_produce_correct_row_count(self, writer, output_dir):
         """Multiple threads writing simultaneously should not lose data."""
@@ -214,6 +377,46 @@ class TestThreadSafety:
         assert writer.stats["cnaes"].rows == 1000
 
 
+class TestPartPerThread:
+    def test_each_thread_writes_its_own_part(self, output_dir):
+        import threading
+
+        writer = ParquetWriter(output_dir, part_per_thread=True)
+        barrier = threading.Barrier(4)
+
+        def write(thread_id):
+            barrier.wait()
+            for i in range(3):
+                df = pl.DataFrame({"codigo": [f"{thread_id}{i}{j:03d}" for j in range(100)], "descricao": ["x"] * 100})
+                writer.write_batch(df, "cnaes", ["codigo", "descricao"])
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        path = writer.flush_table("cnaes")
+
+        assert path == output_dir / "cnaes"
+        parts = sorted(p.name for p in path.iterdir())
+        assert parts == ["part-0000.parquet", "part-0001.parquet", "part-0002.parquet", "part-0003.parquet"]
+        assert all(pq.read_metadata(str(path / p)).num_rows == 300 for p in parts)
+        assert writer.stats["cnaes"].rows == 1200
+
+        manifest = writer.write_manifest()
+        assert manifest["tables"]["cnaes"]["files"] == [f"cnaes/{p}" for p in parts]
+
+    def test_parts_inside_partitions(self, output_dir, sample_estabelecimentos):
+        writer = ParquetWriter(output_dir, partition_by={"estabelecimentos": ["uf"]}, part_per_thread=True)
+        writer.write_batch(
+            sample_estabelecimentos, "estabelecimentos", ["cnpj_basico", "cnpj_ordem", "uf", "municipio"]
+        )
+        writer.close()
+
+        assert (output_dir / "estabelecimentos" / "uf=SP" / "part-0000.parquet").exists()
+        assert writer.output_path("estabelecimentos") == output_dir / "estabelecimentos"
+
+
 class TestZstdCompression:
     def test_output_uses_zstd(self, writer, sample_empresas, output_dir):
         writer.write_batch(sample_empresas, "empresas", ["cnpj_basico", "razao_social", "capital_social"])
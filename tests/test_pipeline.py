@@ -0,0 +1,112 @@
+"""Tests for the bounded staged pipeline."""
+
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+class TestPipeline:
+    def test_items_flow_through_every_stage(self):
+        results = []
+
+        pipeline = Pipeline(
+            [
+                Stage("double", lambda x: [x, x], workers=3),
+                Stage("square", lambda x: [x * x], workers=2),
+                Stage("collect", lambda x: results.append(x) or (), workers=1),
+            ]
+        )
+        pipeline.run(range(5))
+
+        assert sorted(results) == sorted([x * x for x in range(5) for _ in range(2)])
+
+    def test_single_worker_stages_keep_order(self):
+        results = []
+
+        pipeline = Pipeline([Stage("pass", lambda x: [x]), Stage("collect", lambda x: results.append(x) or ())])
+        pipeline.run(range(50))
+
+        assert results == list(range(50))
+
+    def test_bounded_queues_apply_backpressure(self):
+        """A slow sink holds the producer back instead of letting items pile up."""
+        in_flight = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def produce(x):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            yield x
+
+        def consume(x):
+            nonlocal in_flight
+            time.sleep(0.005)
+            with lock:
+                in_flight -= 1
+            return ()
+
+        Pipeline([Stage("produce", produce), Stage("consume", consume, queue_size=2)]).run(range(30))
+
+        # queue_size waiting + one being consumed + one blocked on put
+        assert peak <= 4
+
+    def test_stages_overlap(self):
+        """A later stage starts before an earlier one has seen every item."""
+        events = []
+
+        def first(x):
+            events.append(("first", x))
+            time.sleep(0.01)
+            yield x
+
+        def second(x):
+            events.append(("second", x))
+            return ()
+
+        Pipeline([Stage("first", first), Stage("second", second)]).run(range(5))
+
+        assert events.index(("second", 0)) < events.index(("first", 4))
+
+    def test_failure_stops_all_stages_and_is_raised(self):
+        consumed = []
+
+        def explode(x):
+            if x == 3:
+                raise ValueError("bad item")
+            yield x
+
+        pipeline = Pipeline(
+            [Stage("explode", explode, workers=2), Stage("collect", lambda x: consumed.append(x) or ())]
+        )
+        with pytest.raises(ValueError, match="bad item"):
+            pipeline.run(range(1000))
+
+        assert len(consumed) < 1000
+
+    def test_failure_unblocks_waiting_stage(self):
+        never = threading.Event()
+
+        def wait_forever(x):
+            pipeline.wait(never)
+            return ()
+
+        def explode(x):
+            raise RuntimeError("boom")
+
+        pipeline = Pipeline([Stage("explode", explode), Stage("wait", wait_forever)])
+        with pytest.raises(RuntimeError, match="boom"):
+            pipeline.run([1])
+
+    def test_source_failure_is_raised(self):
+        def items():
+            yield 1
+            raise OSError("listing failed")
+
+        with pytest.raises(OSError, match="listing failed"):
+            Pipeline([Stage("pass", lambda x: ())]).run(items())
@@ -1,24 +1,31 @@
 """Tests for processor module."""
 
-import os
+import io
 import tempfile
 from pathlib import Path
-from unittest.mock import patch
 
 import polars as pl
 import pytest
 
 from processor import (
     LayoutDriftError,
+    UnbalancedQuoteError,
     _apply_typed_casts,
     _check_layout,
-    _convert_encoding,
+    _iter_utf8_chunks,
+    _payload_to_uuid,
+    _payloads_to_uuids,
+    _read_batches,
     _transform,
     _validate,
     get_file_type,
     process_file,
+    start_hash_pool,
+    stop_hash_pool,
 )
 
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
 
 class TestGetFileType:
     """Test get_file_type function."""
@@ -374,6 +381,51 @@ class TestSocioId:
 
         uuid.UUID(result["socio_id"][0])  # raises if not a valid UUID string
 
+    def test_batch_hash_matches_per_row_reference(self):
+        """_payloads_to_uuids must reproduce _payload_to_uuid byte for byte:
+        socio_id is the PK of rows already loaded, so any drift would orphan
+        them on the next upsert."""
+        payloads = [
+            "",
+            "12345678\x1f2\x1f***123456**\x1falice silva\x1f20200101",
+            "12345678\x1f1\x1f00000000000000\x1f\x1f",
+            "ABCD1234\x1f3\x1f***000000**\x1fjoão da conceição\x1f19991231",
+            "99999999\x1f2\x1f***999999**\x1fmüller ñandú ßtraße 😀\x1f20240229",
+        ] + [f"{i:08d}\x1f2\x1f***{i:06d}**\x1fsocio {i}\x1f20200101" for i in range(500)]
+
+        result = _payloads_to_uuids(pl.Series("payload", payloads))
+
+        assert result.to_list() == [_payload_to_uuid(p) for p in payloads]
+
+    def test_hash_pool_matches_per_row_reference(self, monkeypatch):
+        """Chunks hashed on the pool come back in order, byte-identical."""
+        monkeypatch.setattr("processor.HASH_CHUNK_ROWS", 64)
+        payloads = [f"{i:08d}\x1f2\x1f***{i:06d}**\x1fsócio {i}\x1f20200101" for i in range(500)]
+
+        start_hash_pool(2)
+        try:
+            result = _payloads_to_uuids(pl.Series("payload", payloads))
+        finally:
+            stop_hash_pool()
+
+        assert result.to_list() == [_payload_to_uuid(p) for p in payloads]
+
+    def test_transform_socio_id_matches_per_row_reference(self):
+        """End to end through _transform, including name canonicalization."""
+        df = self._make_df(
+            [
+                ("12345678", "2", "  JOSÉ   DA SILVA ", "***123456**", "20200101"),
+                ("12345678", "1", None, None, None),
+            ]
+        )
+
+        result = _transform(df, "SOCIOCSV")
+
+        assert result["socio_id"].to_list() == [
+            _payload_to_uuid("12345678\x1f2\x1f***123456**\x1fjosé da silva\x1f20200101"),
+            _payload_to_uuid("12345678\x1f1\x1f00000000000000\x1f\x1f"),
+        ]
+
 
 class TestValidate:
     """Test _validate function for format validation."""
@@ -517,57 +569,107 @@ class TestValidate:
 
         assert result.equals(df)
 
+    def test_validate_logs_every_rule_in_order(self, caplog):
+        """All rules are counted in one pass, but warnings keep the per-rule
+        wording and the rule order (formats, UF, then each date column)."""
+        df = pl.DataFrame(
+            {
+                "cnpj_basico": ["1234", "12345678"],
+                "situacao_cadastral": ["99", "02"],
+                "uf": ["XX", "SP"],
+                "data_situacao_cadastral": ["20230230", "18000101"],
+                "data_inicio_atividade": ["20200101", "20200101"],
+            }
+        )
 
-class TestConvertEncoding:
-    """Test encoding conversion from ISO-8859-1 to UTF-8."""
+        with caplog.at_level("WARNING", logger="processor"):
+            result = _validate(df, "ESTABELE")
 
-    def test_converts_iso_to_utf8(self, tmp_path):
-        """Test that ISO-8859-1 content is correctly converted to UTF-8."""
-        # Create a file with ISO-8859-1 content (Brazilian characters)
-        iso_content = "São Paulo;Empresa Ltda;Açúcar\nRio de Janeiro;Comércio;Café"
-        iso_file = tmp_path / "test.csv"
-        iso_file.write_text(iso_content, encoding="ISO-8859-1")
+        assert [r.message for r in caplog.records] == [
+            "cnpj_basico: 1 invalid values (expected 8 caracteres alfanuméricos)",
+            "situacao_cadastral: 1 invalid values (expected 01, 02, 03, 04 ou 08)",
+            "uf: 1 invalid values (not a valid UF code)",
+            "data_situacao_cadastral: 1 invalid dates → null (unparseable)",
+            "data_situacao_cadastral: 1 dates out of range → null (future or before 1900)",
+        ]
+        assert result["data_situacao_cadastral"].to_list() == [None, None]
+        assert result["data_inicio_atividade"].to_list() == ["20200101", "20200101"]
 
-        utf8_file = _convert_encoding(iso_file)
+    def test_validate_unparseable_date_not_also_counted_out_of_range(self, caplog):
+        """'99999999' is both unparseable and > today; it is nulled as
+        unparseable and must not show up in the out-of-range count."""
+        df = pl.DataFrame({"data_entrada_sociedade": ["99999999", "20200101"]})
 
-        try:
-            # Read as UTF-8 and verify content
-            result = utf8_file.read_text(encoding="UTF-8")
-            assert "São Paulo" in result
-            assert "Açúcar" in result
-            assert "Café" in result
-        finally:
-            utf8_file.unlink(missing_ok=True)
+        with caplog.at_level("WARNING", logger="processor"):
+            result = _validate(df, "SOCIOCSV")
 
-    def test_handles_large_file_in_chunks(self, tmp_path):
-        """Test that large files are processed correctly (chunked reading)."""
-        # Create a file larger than the 50MB chunk size would normally handle
-        # We'll use a smaller test but verify the chunking logic works
-        iso_file = tmp_path / "large.csv"
-        content = "data;value\n" * 10000
-        iso_file.write_text(content, encoding="ISO-8859-1")
+        assert "data_entrada_sociedade: 1 invalid dates → null (unparseable)" in caplog.text
+        assert "out of range" not in caplog.text
+        assert result["data_entrada_sociedade"].to_list() == [None, "20200101"]
 
-        utf8_file = _convert_encoding(iso_file)
 
-        try:
-            result = utf8_file.read_text(encoding="UTF-8")
-            assert result.count("\n") == 10000
-        finally:
-            utf8_file.unlink(missing_ok=True)
+class TestStreamingRead:
+    """ISO-8859-1 source is transcoded in memory, chunk by chunk, on record boundaries."""
+
+    def test_decodes_iso_8859_1(self):
+        """Latin-1 bytes must come out as the right UTF-8 characters."""
+        raw = "São Paulo;Açúcar\nRio de Janeiro;Café\n".encode("ISO-8859-1")
+
+        frames = list(_read_batches(io.BytesIO(raw), ["a", "b"], batch_size=100))
+
+        df = pl.concat(frames)
+        assert df["a"].to_list() == ["São Paulo", "Rio de Janeiro"]
+        assert df["b"].to_list() == ["Açúcar", "Café"]
+
+    def test_chunks_are_cut_on_record_boundaries(self, monkeypatch):
+        """Small read blocks must never split a record across two parses."""
+        monkeypatch.setattr("processor.READ_BLOCK_BYTES", 7)
+        rows = [f'"{i:07d}";"Descrição {i}"' for i in range(40)]
+        raw = "\n".join(rows).encode("ISO-8859-1")
+
+        frames = list(_read_batches(io.BytesIO(raw), ["codigo", "descricao"], batch_size=10))
+
+        df = pl.concat(frames)
+        assert df["codigo"].to_list() == [f"{i:07d}" for i in range(40)]
+        assert df["descricao"][39] == "Descrição 39"
+        assert all(len(f) <= 10 for f in frames)
+
+    def test_quoted_newline_is_not_a_record_boundary(self, monkeypatch):
+        """A newline inside a quoted field must stay inside its record."""
+        monkeypatch.setattr("processor.READ_BLOCK_BYTES", 4)
+        raw = b'"1";"linha\nquebrada"\n"2";"ok"\n"3";"aspas ""dentro"""\n'
+
+        frames = list(_read_batches(io.BytesIO(raw), ["codigo", "descricao"], batch_size=1))
+
+        df = pl.concat(frames)
+        assert df["codigo"].to_list() == ["1", "2", "3"]
+        assert df["descricao"].to_list() == ["linha\nquebrada", "ok", 'aspas "dentro"']
+
+    def test_unbalanced_quote_raises_instead_of_buffering_the_file(self, monkeypatch):
+        """A quote that never closes fails after MAX_RECORD_BLOCKS blocks, not at end of file."""
+        monkeypatch.setattr("processor.READ_BLOCK_BYTES", 16)
+        monkeypatch.setattr("processor.MAX_RECORD_BLOCKS", 4)
+        rows = b"".join(b'"%d";"ok"\n' % i for i in range(200))
+        stream = io.BytesIO(b'"0";"ok"\n"1";"aberta\n' + rows)
+
+        chunks = _iter_utf8_chunks(stream, batch_size=1)
+
+        assert next(chunks) == b'"0";"ok"\n'
+        with pytest.raises(UnbalancedQuoteError):
+            next(chunks)
+        assert stream.tell() < len(stream.getvalue())
 
-    def test_cleans_up_temp_file_on_read_error(self, tmp_path):
-        """Temp file should be deleted if the source file can't be read."""
-        missing_file = tmp_path / "nonexistent.csv"
-        temp_file = tmp_path / "leaked.utf8.csv"
+    def test_last_record_without_trailing_newline(self):
+        chunks = list(_iter_utf8_chunks(io.BytesIO(b"a;b\nc;d"), batch_size=1))
 
-        with patch(
-            "processor.tempfile.mkstemp",
-            return_value=(os.open(str(temp_file), os.O_CREAT | os.O_WRONLY), str(temp_file)),
-        ):
-            with pytest.raises(FileNotFoundError):
-                _convert_encoding(missing_file)
+        assert b"".join(chunks) == b"a;b\nc;d"
 
-        assert not temp_file.exists()
+    def test_ascii_chunks_pass_through_unchanged(self):
+        raw = b"0111301;Cultivo de arroz\n"
+
+        chunks = list(_iter_utf8_chunks(io.BytesIO(raw), batch_size=100))
+
+        assert chunks == [raw]
 
 
 class TestProcessFile:
@@ -621,21 +723,18 @@ class TestProcessFile:
         # Verify date transformation (0 → None)
         assert df["data_exclusao_do_simples"][0] is None
 
-    def test_cleans_up_temp_file(self, tmp_path):
-        """Test that temporary UTF-8 file is deleted after processing."""
+    def test_writes_no_temp_utf8_copy(self, tmp_path):
+        """Transcoding is in memory: no UTF-8 copy of the source is written."""
         cnae_file = tmp_path / "CNAECSV.csv"
-        cnae_file.write_text("0111301;Test", encoding="ISO-8859-1")
+        cnae_file.write_text("0111301;Descrição", encoding="ISO-8859-1")
 
-        # Count .utf8.csv files before
         temp_dir = Path(tempfile.gettempdir())
-        utf8_files_before = len(list(temp_dir.glob("*.utf8.csv")))
+        utf8_files_before = set(temp_dir.glob("*.utf8.csv"))
 
-        # Process file
-        list(process_file(cnae_file))
+        results = list(process_file(cnae_file))
 
-        # Count .utf8.csv files after - should be same (cleaned up)
-        utf8_files_after = len(list(temp_dir.glob("*.utf8.csv")))
-        assert utf8_files_after == utf8_files_before
+        assert set(temp_dir.glob("*.utf8.csv")) == utf8_files_before
+        assert results[0][0]["descricao"][0] == "Descrição"
 
     def test_multiple_batches(self, tmp_path):
         """Test that all rows are processed across batches."""
@@ -648,6 +747,24 @@ class TestProcessFile:
         total_rows = sum(len(df) for df, _, _ in results)
         assert total_rows == 150
         assert len(results) >= 1
+        assert all(len(df) <= 50 for df, _, _ in results)
+
+    @pytest.mark.parametrize("engine", ["eager", "streaming"])
+    def test_memory_budget_sizes_batches_by_file_type(self, monkeypatch, engine):
+        """With a budget, batch_size is replaced by the rows each type's share fits."""
+        import memory_budget
+
+        monkeypatch.setattr(memory_budget, "MIN_BATCH_ROWS", 1)
+        # Room for 500 ESTABELE rows at the seed estimate
+        budget = memory_budget.MemoryBudget(
+            500 * memory_budget.PEAK_FACTOR * memory_budget.BYTES_PER_ROW["ESTABELE"], max_rows=500000
+        )
+
+        results = list(process_file(FIXTURES_DIR / "ESTABELE.csv", batch_size=500000, engine=engine, memory=budget))
+
+        assert sum(len(df) for df, _, _ in results) == 2006
+        assert all(len(df) <= 500 for df, _, _ in results)
+        assert len(results) >= 5
 
 
 class TestTypedCasts:
@@ -751,6 +868,47 @@ class TestProcessFileTypedFlag:
         assert df["data_opcao_pelo_simples"].dtype == pl.Date
 
 
+class TestStreamingEngine:
+    """engine="streaming" must yield exactly what the eager chain yields."""
+
+    @pytest.mark.parametrize("typed", [False, True])
+    @pytest.mark.parametrize("fixture", sorted(p.name for p in FIXTURES_DIR.glob("*.csv")))
+    def test_fixture_output_matches_eager(self, fixture, typed):
+        eager = list(process_file(FIXTURES_DIR / fixture, batch_size=50, typed=typed))
+        streaming = list(process_file(FIXTURES_DIR / fixture, batch_size=50, typed=typed, engine="streaming"))
+
+        assert len(streaming) == len(eager)
+        for (df_s, table_s, cols_s), (df_e, table_e, cols_e) in zip(streaming, eager):
+            assert (table_s, cols_s) == (table_e, cols_e)
+            assert df_s.equals(df_e)
+            assert df_s.schema == df_e.schema
+
+    def test_transform_and_validate_edge_cases_match(self, tmp_path, caplog):
+        """Negative capital, placeholder and impossible dates, short CEP:
+        same values and the same warnings, in the same order."""
+        empresas = tmp_path / "K3241.K03200Y0.D51213.EMPRECSV"
+        empresas.write_text(
+            '"12345678";"ACME";"2062";"49";"-1.000,00";"01";""\n"1234";"X";"2062";"49";"1.234,56";"99";""\n',
+            encoding="ISO-8859-1",
+        )
+        estab = tmp_path / "K3241.K03200Y0.D51213.ESTABELE"
+        estab.write_text(
+            "12345678;0001;00;1;;02;20230230;00;;1;0;20200101;4711302;;R;A;1;;1005010;XX;7107;;;;;;;;;0\n",
+            encoding="ISO-8859-1",
+        )
+
+        for path in (empresas, estab):
+            caplog.clear()
+            eager = list(process_file(path, typed=True))
+            eager_log = [r.message for r in caplog.records]
+            caplog.clear()
+            streaming = list(process_file(path, typed=True, engine="streaming"))
+
+            assert [r.message for r in caplog.records] == eager_log
+            assert eager_log
+            assert streaming[0][0].equals(eager[0][0])
+
+
 class TestLayoutDriftDetection:
     """_check_layout catches RFB schema changes loudly instead of letting
     Polars silently mis-map fields by position."""
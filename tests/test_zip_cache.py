@@ -0,0 +1,119 @@
+"""Tests for the content-addressed ZIP cache."""
+
+import io
+import os
+import zipfile
+
+import pytest
+
+from zip_cache import ZipCache, ZipTail, zip_content_key
+
+
+def _zip_bytes(files: dict, date_time=(2024, 3, 1, 0, 0, 0)) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(zipfile.ZipInfo(name, date_time=date_time), content)
+    return buffer.getvalue()
+
+
+def _write(path, content: bytes):
+    path.write_bytes(content)
+    return path
+
+
+class TestZipContentKey:
+    def test_same_members_same_key_despite_timestamps(self, tmp_path):
+        march = _write(tmp_path / "a.zip", _zip_bytes({"CNAECSV": "0111301;Test"}, (2024, 3, 1, 0, 0, 0)))
+        april = _write(tmp_path / "b.zip", _zip_bytes({"CNAECSV": "0111301;Test"}, (2024, 4, 1, 0, 0, 0)))
+
+        assert zip_content_key(march) == zip_content_key(april)
+
+    def test_changed_content_changes_key(self, tmp_path):
+        before = _write(tmp_path / "a.zip", _zip_bytes({"CNAECSV": "0111301;Test"}))
+        after = _write(tmp_path / "b.zip", _zip_bytes({"CNAECSV": "0111301;Teste"}))
+
+        assert zip_content_key(before) != zip_content_key(after)
+
+    def test_key_from_remote_tail(self, tmp_path):
+        content = _zip_bytes({"CNAECSV": os.urandom(200_000)})
+        tail = content[-1024:]
+
+        assert zip_content_key(ZipTail(len(content), tail)) == zip_content_key(_write(tmp_path / "a.zip", content))
+
+    def test_tail_too_short_raises(self):
+        content = _zip_bytes({"CNAECSV": "0111301;Test"})
+
+        with pytest.raises((OSError, zipfile.BadZipFile)):
+            zip_content_key(ZipTail(len(content), content[-10:]))
+
+
+class TestZipCache:
+    def test_store_then_lookup_and_restore(self, tmp_path):
+        cache = ZipCache(tmp_path / "cache", max_bytes=10**9)
+        zip_path = _write(tmp_path / "Cnaes.zip", _zip_bytes({"CNAECSV": "0111301;Test"}))
+
+        key = cache.store("2024-03/Cnaes.zip", '"v1"', zip_path)
+        zip_path.unlink()
+
+        assert cache.lookup("2024-03/Cnaes.zip", '"v1"') == key
+        assert cache.lookup("2024-03/Cnaes.zip", '"v2"') is None
+        assert cache.restore(key, tmp_path / "Cnaes.zip", "2024-04/Cnaes.zip", '"v9"')
+        assert zip_content_key(tmp_path / "Cnaes.zip") == key
+        assert cache.lookup("2024-04/Cnaes.zip", '"v9"') == key
+
+        # The caller's copy is independent of the cached object
+        (tmp_path / "Cnaes.zip").unlink()
+        assert cache.lookup("2024-03/Cnaes.zip", '"v1"') == key
+
+    def test_identical_files_stored_once(self, tmp_path):
+        cache = ZipCache(tmp_path / "cache", max_bytes=10**9)
+        content = _zip_bytes({"CNAECSV": "0111301;Test"})
+
+        first = cache.store("2024-03/Cnaes.zip", '"a"', _write(tmp_path / "a.zip", content))
+        second = cache.store("2024-04/Cnaes.zip", '"b"', _write(tmp_path / "b.zip", content))
+
+        assert first == second
+        assert len(list((tmp_path / "cache" / "objects").glob("*.zip"))) == 1
+
+    def test_evicts_least_recently_used_over_budget(self, tmp_path):
+        blobs = [_zip_bytes({"CNAECSV": os.urandom(10_000)}) for _ in range(3)]
+        cache = ZipCache(tmp_path / "cache", max_bytes=len(blobs[0]) * 2 + 100)
+
+        keys = [
+            cache.store(f"2024-0{i}/Cnaes.zip", f'"{i}"', _write(tmp_path / f"{i}.zip", blob))
+            for i, blob in enumerate(blobs)
+        ]
+        # Only the two most recent fit
+        assert cache.lookup("2024-00/Cnaes.zip", '"0"') is None
+        assert cache.lookup("2024-01/Cnaes.zip", '"1"') == keys[1]
+
+        # Using the older one makes the newer one the eviction candidate
+        assert cache.restore(keys[1], tmp_path / "restored.zip", "2024-01/Cnaes.zip", '"1"')
+        cache.store("2024-03/Cnaes.zip", '"3"', _write(tmp_path / "3.zip", _zip_bytes({"CNAECSV": os.urandom(10_000)})))
+
+        assert cache.lookup("2024-01/Cnaes.zip", '"1"') == keys[1]
+        assert cache.lookup("2024-02/Cnaes.zip", '"2"') is None
+
+    def test_forget_drops_object(self, tmp_path):
+        cache = ZipCache(tmp_path / "cache", max_bytes=10**9)
+        key = cache.store("2024-03/Cnaes.zip", '"a"', _write(tmp_path / "a.zip", _zip_bytes({"CNAECSV": "x"})))
+
+        cache.forget("2024-03/Cnaes.zip")
+
+        assert cache.lookup("2024-03/Cnaes.zip", '"a"') is None
+        assert not cache.restore(key, tmp_path / "b.zip", "2024-03/Cnaes.zip", '"a"')
+
+    def test_objects_stored_by_another_instance_are_counted(self, tmp_path):
+        blob = _zip_bytes({"CNAECSV": os.urandom(10_000)})
+        first = ZipCache(tmp_path / "cache", max_bytes=len(blob) + 100)
+        second = ZipCache(tmp_path / "cache", max_bytes=len(blob) + 100)
+        first.store("2024-01/Cnaes.zip", '"1"', _write(tmp_path / "1.zip", blob))
+        # Lost index update, as when another process rewrote index.json
+        (tmp_path / "cache" / "index.json").unlink()
+
+        second.store(
+            "2024-02/Cnaes.zip", '"2"', _write(tmp_path / "2.zip", _zip_bytes({"CNAECSV": os.urandom(10_000)}))
+        )
+
+        assert len(list((tmp_path / "cache" / "objects").glob("*.zip"))) == 1
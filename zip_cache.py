@@ -0,0 +1,189 @@
+"""Content-addressed cache of downloaded ZIPs, shared across runs and months."""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+# Bytes fetched from the end of a remote ZIP to read its central directory:
+# the end-of-central-directory record plus its longest possible comment.
+ZIP_TAIL_BYTES = 22 + 65535 + 1024
+
+
+def zip_content_key(source: Path | BinaryIO) -> str:
+    """Digest of a ZIP's members (name, CRC-32, size), read from its central directory.
+
+    ZIPs with the same key hold the same CSV bytes whatever their
+    timestamps, so a remote file's key can be computed from its tail alone.
+    """
+    with zipfile.ZipFile(source) as zip_ref:
+        members = sorted((info.filename, info.CRC, info.file_size) for info in zip_ref.infolist())
+    return hashlib.sha256(json.dumps(members).encode()).hexdigest()
+
+
+class ZipTail(io.RawIOBase):
+    """The last bytes of a remote ZIP, readable at their real offsets so zipfile can parse them."""
+
+    def __init__(self, total: int, tail: bytes):
+        self._total = total
+        self._start = total - len(tail)
+        self._tail = tail
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._total}[whence]
+        self._position = base + offset
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position < self._start:
+            raise OSError("ZIP central directory lies outside the fetched tail")
+        data = self._tail[self._position - self._start : self._position - self._start + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class ZipCache:
+    """ZIPs stored once per content key, with LRU eviction under a byte budget.
+
+    objects/<key>.zip holds the files; index.json maps each source
+    ("directory/filename") to the remote version and key it was last seen
+    with, and each key to its size and last use. ZIPs are handed out as
+    hard links (copies across filesystems), so the caller may delete its
+    copy after extraction without touching the cache.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_path = root / "objects"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+
+    def lookup(self, source: str, version: str | None) -> str | None:
+        """Key of the cached ZIP last stored for source at this remote version, if still cached."""
+        if not version:
+            return None
+        with self._lock:
+            entry = self._load()["sources"].get(source)
+        if entry and entry["version"] == version and self._object_path(entry["key"]).exists():
+            return entry["key"]
+        return None
+
+    def holds_size(self, size: int) -> bool:
+        """Whether any cached ZIP is exactly size bytes.
+
+        The same CSVs zipped again for another month keep their length, so a
+        remote ZIP of any other size is not worth a ranged GET.
+        """
+        with self._lock:
+            return any(entry["size"] == size for entry in self._load()["objects"].values())
+
+    def restore(self, key: str, dest: Path, source: str, version: str | None) -> bool:
+        """Place the ZIP stored under key at dest; False when it is not cached."""
+        with self._lock:
+            object_path = self._object_path(key)
+            if not object_path.exists():
+                return False
+            dest.unlink(missing_ok=True)
+            _link_or_copy(object_path, dest)
+            index = self._load()
+            index["objects"][key] = {"size": object_path.stat().st_size, "last_used": time.time()}
+            if version:
+                index["sources"][source] = {"version": version, "key": key}
+            self._save(index)
+        return True
+
+    def store(self, source: str, version: str | None, zip_path: Path) -> str:
+        """Add a downloaded ZIP to the cache and evict the least recently used beyond the budget."""
+        key = zip_content_key(zip_path)
+        with self._lock:
+            object_path = self._object_path(key)
+            if not object_path.exists():
+                tmp_path = object_path.with_name(f"{object_path.name}.{os.getpid()}.tmp")
+                tmp_path.unlink(missing_ok=True)
+                _link_or_copy(zip_path, tmp_path)
+                tmp_path.replace(object_path)
+            index = self._load()
+            index["objects"][key] = {"size": object_path.stat().st_size, "last_used": time.time()}
+            if version:
+                index["sources"][source] = {"version": version, "key": key}
+            self._evict(index, keep=key)
+            self._save(index)
+        return key
+
+    def forget(self, source: str) -> None:
+        """Drop the ZIP last stored for source, e.g. after it failed its CRC check."""
+        with self._lock:
+            index = self._load()
+            entry = index["sources"].pop(source, None)
+            if entry:
+                self._object_path(entry["key"]).unlink(missing_ok=True)
+                index["objects"].pop(entry["key"], None)
+            self._save(index)
+
+    def _object_path(self, key: str) -> Path:
+        return self.objects_path / f"{key}.zip"
+
+    def _evict(self, index: dict, keep: str) -> None:
+        objects = index["objects"]
+        total = sum(entry["size"] for entry in objects.values())
+        for key in sorted(objects, key=lambda k: objects[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._object_path(key).unlink(missing_ok=True)
+            total -= objects.pop(key)["size"]
+            logger.debug(f"Evicted cached ZIP {key[:12]}")
+        index["sources"] = {source: entry for source, entry in index["sources"].items() if entry["key"] in objects}
+
+    def _load(self) -> dict:
+        try:
+            index = json.loads((self.root / INDEX_FILE).read_text())
+        except (OSError, ValueError):
+            index = {"sources": {}, "objects": {}}
+        # Objects on disk are the truth: another process may have stored or
+        # evicted since this index was written
+        on_disk = {path.stem: path for path in self.objects_path.glob("*.zip")}
+        objects = {key: entry for key, entry in index["objects"].items() if key in on_disk}
+        for key, path in on_disk.items():
+            if key not in objects:
+                stat = path.stat()
+                objects[key] = {"size": stat.st_size, "last_used": stat.st_mtime}
+        index["objects"] = objects
+        return index
+
+    def _save(self, index: dict) -> None:
+        index_path = self.root / INDEX_FILE
+        tmp_path = index_path.with_name(f"{INDEX_FILE}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(index))
+        tmp_path.replace(index_path)
+
+
+def _link_or_copy(source: Path, dest: Path) -> None:
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)